@@ -3,6 +3,7 @@
 # SPDX-License-Identifier: Apache License 2.0
 import sys
 import traceback
+from contextlib import nullcontext
 from http import HTTPStatus
 
 from flask import request as _request
@@ -13,10 +14,15 @@ from zigopt.handlers.base.handler import Handler
 from zigopt.json.builder import JsonBuilder, MissingFieldError
 from zigopt.net.errors import BadParamError, InvalidMethodError, RequestError, ServerError
 from zigopt.net.responses import success_response
+from zigopt.profile.request_stats import current_request_stats
 
 from libsigopt.aux.errors import SigoptValidationError
 
 
+# NOTE: Requests that change data always read from the primary, so that they never act on data that is behind
+READ_REPLICA_METHODS = ("GET",)
+
+
 def handler_registry(app):
   # pylint: disable=too-many-statements
   def resolve_builder(builder, fields):
@@ -48,9 +54,16 @@ def handler_registry(app):
         app.global_services,
         request=request,
       )
-      services.database_service.start_session()
+      services.database_service.start_session(
+        use_replica=handler_cls.use_read_replica and request.method in READ_REPLICA_METHODS,
+      )
+      if request_stats := current_request_stats():
+        request_stats.handler_name = handler_cls.__name__
       handler = handler_cls(services, request, *args, **kwargs)
-      handler.prepare()
+      # NOTE: Authentication and the objects the request acts on are read from the primary, so that a token or
+      # object created by a previous request is never missing because a replica has not caught up yet
+      with services.database_service.use_primary():
+        handler.prepare()
 
       user = handler and handler.auth and handler.auth.current_user
       client = handler and handler.auth and handler.auth.current_client
@@ -63,10 +76,11 @@ def handler_registry(app):
 
       handler_params = handler.parse_params(request)
       fields = request.optional_list_param("fields") if request.method in ["GET", "POST"] else None
-      if handler_params is Handler.NO_PARAMS:
-        response = handler.handle()
-      else:
-        response = handler.handle(handler_params)
+      with services.database_service.transaction() if handler_cls.use_transaction else nullcontext():
+        if handler_params is Handler.NO_PARAMS:
+          response = handler.handle()
+        else:
+          response = handler.handle(handler_params)
       if request.skip_response_content:
         response = None
       elif response is None:
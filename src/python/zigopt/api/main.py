@@ -27,6 +27,11 @@ def _default_app(profiler, tracer):
   return ProdApp(profiler, tracer, config_broker)
 
 
+def _serve_metrics(app):
+  # NOTE: Metrics are served on an internal port rather than by the app, so they are not publicly visible
+  app.global_services.metrics_registry.serve_from_config("API_METRICS_PORT", "metrics.api_port")
+
+
 def run_app():
   parser = argparse.ArgumentParser(
     description=f"{PRODUCT_NAME} API webapp",
@@ -65,6 +70,9 @@ def run_app():
     profiler = Profiler()
 
   app = _default_app(profiler, NullTracer())
+  # NOTE: The debug reloader runs the app in a second process, which could not serve on the same port
+  if not args.debug:
+    _serve_metrics(app)
 
   try:
     app.debug = args.debug
@@ -82,3 +90,4 @@ if __name__ == "__main__":
 elif os.environ.get("GUNICORN_ENABLED"):
   prepare_contracts()
   GUNICORN_ENTRY_POINT = _default_app(NullProfiler(), NullTracer())
+  _serve_metrics(GUNICORN_ENTRY_POINT)
@@ -11,6 +11,7 @@ from zigopt.api.request import Request
 from zigopt.handlers.base.welcome import WelcomeHandler
 from zigopt.net.errors import EndpointNotFoundError, InvalidMethodError, RequestError
 from zigopt.net.responses import success_response
+from zigopt.profile.request_stats import current_request_stats, start_request_stats, stop_request_stats
 
 
 HEALTH_PATH = "/health"
@@ -18,6 +19,7 @@ HEALTH_PATH = "/health"
 
 def log_requests(app):
   def before_request():
+    start_request_stats()
     if request.path != HEALTH_PATH:
       app.global_services.logging_service.with_request(request).getLogger("sigopt.requests").info(
         "%s %s",
@@ -28,13 +30,37 @@ def log_requests(app):
 
   app.before_request(before_request)
 
+  def after_request(response):
+    request_stats = current_request_stats()
+    if request_stats is None:
+      return response
+    config_broker = app.global_services.config_broker
+    if config_broker.get("request_stats.headers", False):
+      response.headers.extend(request_stats.headers())
+    budgets = config_broker.get("request_stats.budgets", {})
+    budget = budgets.get(request_stats.handler_name, budgets.get("default"))
+    if budget and (exceeded := request_stats.exceeded_budget(budget)):
+      app.global_services.exception_logger.soft_exception(
+        f"{request.method} {request.path} ({request_stats.handler_name}) exceeded its request budget: "
+        + "; ".join(exceeded),
+        extra=request_stats.log_extra(),
+      )
+    return response
+
+  app.after_request(after_request)
+
   def teardown_request(exception):
     assert isinstance(request, Request)
+    request_stats = stop_request_stats()
     if request.path != HEALTH_PATH:
       app.global_services.logging_service.with_request(request).getLogger("sigopt.requests").info(
-        "Request time: %dms",
+        "Request time: %dms, %d queries in %dms, %d redis commands, %d max statement repeats",
         (time.time() - request.start_time) * 1000,
-        extra=dict(request=request),
+        request_stats.query_count if request_stats else 0,
+        request_stats.query_time_ms if request_stats else 0,
+        request_stats.redis_command_count if request_stats else 0,
+        request_stats.max_statement_repeats if request_stats else 0,
+        extra=dict(request=request, **(request_stats.log_extra() if request_stats else {})),
       )
 
   app.teardown_request(teardown_request)
@@ -10,6 +10,7 @@ from zigopt.api.v1.routes import initialize_blueprint as initialize_v1_blueprint
 from zigopt.exception.logger import ExceptionLogger
 from zigopt.log.service import LoggingService
 from zigopt.net.responses import success_response
+from zigopt.profile.metrics import MetricsRegistry
 from zigopt.profile.profile import NullProfiler
 from zigopt.profile.tracer import NullTracer
 from zigopt.services.bag import ServiceBag
@@ -24,6 +25,7 @@ class DummyServiceBag(ServiceBag):
     self.exception_logger = ExceptionLogger(self)
     self.immediate_email_sender = DisabledService()
     self.logging_service = LoggingService(self)
+    self.metrics_registry = MetricsRegistry(self)
     self.smtp_email_service = DisabledService()
 
 
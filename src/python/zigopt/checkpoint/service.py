@@ -10,9 +10,16 @@ from zigopt.checkpoint.model import Checkpoint
 from zigopt.services.base import Service
 
 
+CHECKPOINTS_BY_TRAINING_RUN_COUNTER = "checkpoints_by_training_run"
+
+
 class CheckpointService(Service):
   def insert_checkpoints(self, checkpoints: Sequence[Checkpoint]) -> None:
     self.services.database_service.insert_all(checkpoints)
+    self.services.counter_service.increment(
+      CHECKPOINTS_BY_TRAINING_RUN_COUNTER,
+      map_dict(len, as_grouped_dict(checkpoints, lambda c: c.training_run_id)),
+    )
 
   def find_by_id(self, checkpoint_id: int) -> Checkpoint | None:
     return self.services.database_service.one_or_none(
@@ -34,11 +41,16 @@ class CheckpointService(Service):
     return self.services.database_service.all(query)
 
   def count_by_training_run(self, training_run_id: int) -> int:
-    return self.services.database_service.count(
-      self.services.database_service.query(Checkpoint).filter(Checkpoint.training_run_id == training_run_id)
-    )
+    return self.count_by_training_run_ids([training_run_id])[training_run_id]
 
   def count_by_training_run_ids(self, training_run_ids: Sequence[int]) -> dict[int, int]:
+    return self.services.counter_service.get_counts(
+      CHECKPOINTS_BY_TRAINING_RUN_COUNTER,
+      training_run_ids,
+      self._count_by_training_run_ids,
+    )
+
+  def _count_by_training_run_ids(self, training_run_ids: Sequence[int]) -> dict[int, int]:
     return dict(
       self.services.database_service.all(
         self.services.database_service.query(Checkpoint.training_run_id, func.count(1))
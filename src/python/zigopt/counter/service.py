@@ -0,0 +1,145 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import datetime
+from collections.abc import Callable, Hashable, Mapping, Sequence
+from typing import Any, TypeVar
+
+from zigopt.common import *
+from zigopt.services.base import Service
+
+
+TId = TypeVar("TId", bound=Hashable)
+
+DEFAULT_COUNTERS_CACHE_TTL = datetime.timedelta(hours=1)
+
+
+class CounterService(Service):
+  """
+    Caches counts of database rows in Redis, so that they can be read without a COUNT query.
+    A count is identified by a counter name, an optional scope and an id. Missing counts are computed from the
+    database and stored with a TTL, so every count is reconciled with the database when it expires.
+
+    Each count is a versioned cache, see RedisService.SET_IF_VERSION_SCRIPT. Writers call increment once the write is
+    committed, which updates the count if it is stored, or invalidate when the write can not be expressed as an
+    increment, such as moving rows or deleting them in bulk. Either way a count that was computed before the write is
+    never stored after it.
+    """
+
+  @property
+  def enabled(self) -> bool:
+    return self.services.redis_service.enabled and self.services.config_broker.get("features.cacheCounters", True)
+
+  @property
+  def ttl(self) -> datetime.timedelta:
+    return datetime.timedelta(
+      seconds=self.services.config_broker.get(
+        "features.countersCacheTtl",
+        DEFAULT_COUNTERS_CACHE_TTL.total_seconds(),
+      )
+    )
+
+  def _create_key(self, counter_name: str, scope: Sequence[Any], counter_id: Hashable):
+    return self.services.redis_key_service.create_counter_key(counter_name, *scope, counter_id)
+
+  def get_counts(
+    self,
+    counter_name: str,
+    ids: Sequence[TId],
+    count_missing: Callable[[list[TId]], Mapping[TId, int]],
+    scope: Sequence[Any] = (),
+  ) -> dict[TId, int]:
+    """
+        Returns the count for every id, reading all of the stored counts in one round trip.
+        count_missing is called with the ids that have no stored count, and ids that it omits are counted as 0.
+        It reads from the primary database, so that a lagging replica is never cached.
+        """
+    ids = distinct(ids)
+    counts: dict[TId, int] = {}
+    versions: dict[TId, bytes | None] = {}
+    if self.enabled and ids:
+      with self.services.exception_logger.tolerate_exceptions(Exception):
+        with self.services.redis_service.pipeline() as pipeline:
+          for counter_id in ids:
+            redis_key = self._create_key(counter_name, scope, counter_id)
+            pipeline.get(redis_key)
+            pipeline.get(self.services.redis_key_service.create_cache_version_key(redis_key))
+        assert pipeline.results is not None
+        for counter_id, count, version in zip(ids, pipeline.results[::2], pipeline.results[1::2]):
+          if count is None:
+            versions[counter_id] = version
+          else:
+            counts[counter_id] = int(count)
+
+    missing_ids = [counter_id for counter_id in ids if counter_id not in counts]
+    if missing_ids:
+      with self.services.database_service.use_primary():
+        missing_counts = count_missing(missing_ids)
+      computed_counts = {counter_id: int(missing_counts.get(counter_id, 0)) for counter_id in missing_ids}
+      self._set_counts(counter_name, computed_counts, versions, scope)
+      counts.update(computed_counts)
+    return counts
+
+  def _set_counts(
+    self,
+    counter_name: str,
+    counts: Mapping[TId, int],
+    versions: Mapping[TId, bytes | None],
+    scope: Sequence[Any],
+  ) -> None:
+    # NOTE: Only counts whose version was read are stored, since without a version there is no way to tell whether
+    # the count was invalidated while it was being computed.
+    counts = {counter_id: count for counter_id, count in counts.items() if counter_id in versions}
+    if not self.enabled or not counts:
+      return
+    with self.services.exception_logger.tolerate_exceptions(Exception):
+      with self.services.redis_service.pipeline() as pipeline:
+        for counter_id, count in counts.items():
+          redis_key = self._create_key(counter_name, scope, counter_id)
+          pipeline.set_if_version(
+            redis_key,
+            self.services.redis_key_service.create_cache_version_key(redis_key),
+            versions[counter_id],
+            count,
+            expire=self.ttl,
+          )
+
+  def increment(self, counter_name: str, amounts: Mapping[Hashable, int], scope: Sequence[Any] = ()) -> None:
+    """
+        Must be called whenever rows that are counted are inserted, or deleted one at a time. The counts are
+        incremented after the write is committed, so a rolled back write leaves them untouched, and counts that are
+        not stored are left to be computed from the database.
+        """
+    amounts = {counter_id: amount for counter_id, amount in amounts.items() if counter_id is not None and amount}
+    if not self.enabled or not amounts:
+      return
+
+    def increment():
+      with self.services.exception_logger.tolerate_exceptions(Exception):
+        with self.services.redis_service.pipeline() as pipeline:
+          for counter_id, amount in amounts.items():
+            redis_key = self._create_key(counter_name, scope, counter_id)
+            pipeline.increment_versioned(
+              redis_key,
+              self.services.redis_key_service.create_cache_version_key(redis_key),
+              amount,
+              expire=self.ttl,
+            )
+
+    self.services.database_service.after_commit(increment)
+
+  def invalidate(self, counter_name: str, ids: Sequence[Hashable], scope: Sequence[Any] = ()) -> None:
+    """
+        Must be called whenever rows that are counted are moved or deleted in bulk. The counts are invalidated after
+        the write is committed, so a rolled back write leaves them untouched.
+        """
+    ids = distinct(remove_nones_sequence(ids))
+    if not self.enabled or not ids:
+      return
+    redis_keys = [self._create_key(counter_name, scope, counter_id) for counter_id in ids]
+
+    def invalidate():
+      with self.services.exception_logger.tolerate_exceptions(Exception):
+        self.services.redis_service.invalidate_versioned(redis_keys, expire=self.ttl)
+
+    self.services.database_service.after_commit(invalidate)
@@ -22,6 +22,7 @@ from zigopt.common import *
 from zigopt.common.sigopt_datetime import aware_datetime_to_naive_datetime, naive_datetime_to_aware_datetime
 from zigopt.protobuf.dict import protobuf_to_dict
 from zigopt.protobuf.json import ZigoptDescriptor, emit_json_with_descriptor, get_json_key, parse_json_with_descriptor
+from zigopt.protobuf.lazy import LazyProtobuf
 from zigopt.protobuf.lib import copy_protobuf, is_protobuf
 
 
@@ -132,16 +133,19 @@ def _default_value_for_descriptor(descriptor):
 class _ProtobufColumnType(TypeDecorator):
   impl = JSONB
 
-  def __init__(self, descriptor, proxy=None, with_default=True):
+  def __init__(self, descriptor, proxy=None, with_default=True, lazy=False):
     self._descriptor = descriptor
     self._proxy = proxy
     self._with_default = with_default
+    # NOTE: Only whole protobuf messages can be parsed lazily, not scalars, lists or maps
+    self._lazy = lazy and isinstance(descriptor, google.protobuf.descriptor.Descriptor)
     super().__init__(none_as_null=True)
 
   def __repr__(self):
     descriptor_name = getattr(self._descriptor, "full_name", getattr(self._descriptor, "__name__", self._descriptor))
     return (
-      f"{self.__class__.__name__}(descriptor={descriptor_name}, proxy={self._proxy}, with_default={self._with_default})"
+      f"{self.__class__.__name__}(descriptor={descriptor_name}, proxy={self._proxy},"
+      f" with_default={self._with_default}, lazy={self._lazy})"
     )
 
   def process_bind_param(self, value, dialect):
@@ -152,6 +156,8 @@ class _ProtobufColumnType(TypeDecorator):
   def process_result_value(self, value, dialect):
     if value is None:
       result = _default_value_for_descriptor(self._descriptor)
+    elif self._lazy and is_mapping(value):
+      result = LazyProtobuf(GetMessageClass(self._descriptor), value)
     else:
       result = parse_json_with_descriptor(
         value,
@@ -168,7 +174,7 @@ class _ProtobufColumnType(TypeDecorator):
     return self.process_result_value(value, dialect)
 
   def copy(self, **kw):
-    return _ProtobufColumnType(self._descriptor, self._proxy, self._with_default)
+    return _ProtobufColumnType(self._descriptor, self._proxy, self._with_default, self._lazy)
 
   # pylint: disable=invalid-overridden-method
   def comparator_factory(self, *args, **kwargs):
@@ -301,6 +307,22 @@ class _ProtobufColumnType(TypeDecorator):
     def HasField(self, key):
       return self._get_value_from_descriptor(key, with_default=False).real_isnot(None)
 
+    def with_only_fields(self, *field_names):
+      """
+            Selects a protobuf that only has the given fields set, so that the rest of the JSON is neither sent by the
+            database nor parsed. Fields that are missing from the JSON are selected as null, which leaves them unset.
+            """
+      if not isinstance(self._descriptor, google.protobuf.descriptor.Descriptor):
+        raise ValueError(f"Can only select the fields of a protobuf message, not {self._descriptor}")
+      arguments = []
+      for field_name in field_names:
+        try:
+          json_name = self._get_field_descriptor(field_name).json_name
+        except KeyError as e:
+          raise AttributeError(f"Invalid descriptor attribute: {field_name}") from e
+        arguments.extend([sqlalchemy.literal(json_name), self[json_name]])
+      return sqlalchemy.func.jsonb_build_object(*arguments, type_=self.type)
+
     def is_(self, other):
       _raise_for_is_usage()
 
@@ -353,12 +375,15 @@ class ProtobufColumn(sqlalchemy.Column):
 
       - field acceses (including returning default values for unset fields)
       - HasField
+
+    Columns with lazy=True load their values as LazyProtobufs, which only parse the fields that are read. This is
+    worthwhile for columns with large fields that are rarely used.
     """
 
   _constructor = sqlalchemy.Column
 
-  def __init__(self, cls, proxy=None, **kwargs):
-    super().__init__(type_=_ProtobufColumnType(cls.DESCRIPTOR, proxy=proxy), **kwargs)
+  def __init__(self, cls, proxy=None, lazy=False, **kwargs):
+    super().__init__(type_=_ProtobufColumnType(cls.DESCRIPTOR, proxy=proxy, lazy=lazy), **kwargs)
     self._cls = cls
     self._proxy = proxy
 
@@ -2,9 +2,13 @@
 #
 # SPDX-License-Identifier: Apache License 2.0
 import logging
+import math
+import random
 import ssl
+import threading
 import time
-from collections.abc import Callable, Generator, Iterable, Iterator, Mapping, Sequence
+from collections.abc import Callable, Generator, Hashable, Iterable, Iterator, Mapping, Sequence
+from contextlib import contextmanager
 from datetime import timedelta
 from functools import wraps
 from typing import Any, ParamSpec, TypeVar
@@ -14,6 +18,7 @@ from sqlalchemy.dialects.postgresql import insert as postgresql_insert
 from sqlalchemy.engine import Connection, Engine, ResultProxy
 from sqlalchemy.engine.url import URL
 from sqlalchemy.exc import DatabaseError, OperationalError, StatementError
+from sqlalchemy.ext.baked import BakedQuery, Result, bakery
 from sqlalchemy.orm import Mapper, Query, Session, sessionmaker
 from sqlalchemy.orm.attributes import instance_state
 from sqlalchemy.orm.exc import NO_STATE, MultipleResultsFound, NoResultFound
@@ -24,6 +29,7 @@ from sqlalchemy.sql.elements import ClauseElement
 import zigopt.db.all_models as _all_models  # pylint: disable=unused-import
 from zigopt.common import *
 from zigopt.db.declarative import Base
+from zigopt.profile.request_stats import current_request_stats
 from zigopt.services.base import GlobalService, Service
 
 
@@ -31,24 +37,63 @@ del _all_models
 
 
 DEFAULT_POOL_RECYCLE_TIME = timedelta(minutes=5).total_seconds()
+DEFAULT_REPLICA_MAX_LAG = timedelta(seconds=1).total_seconds()
+DEFAULT_REPLICA_LAG_CHECK_INTERVAL = timedelta(seconds=5).total_seconds()
+DEFAULT_QUERY_CACHE_SIZE = 500
 _TOLERATED_ERRORS = tuple([DatabaseError, OperationalError])
 
+SQL_READ_LOGGER = "sigopt.sql.read"
+SQL_WRITE_LOGGER = "sigopt.sql"
+SQL_SENSITIVE_LOGGER = "sigopt.rawsql"
+
+QUERY_CACHE_LOOKUPS = "sigopt_db_query_cache_lookups_total"
+QUERY_CACHE_MISSES = "sigopt_db_query_cache_misses_total"
+
+PRIMARY_WAL_LSN_QUERY = text("SELECT pg_current_wal_lsn()::text AS primary_lsn")
+
+# NOTE: The replica is compared with the position of the primary, since a replica that has lost its connection to the
+# primary has replayed everything it has received. A replica that has replayed up to the position of the primary is
+# not lagging, even if the primary has been idle since the last replayed transaction. Otherwise the lag is the age of
+# the last replayed transaction, and it is NULL (unknown) if no transaction has been replayed since the replica
+# started. A database that is not in recovery is not a replica, so it never lags.
+REPLICA_LAG_QUERY = text(
+  "SELECT CASE"
+  " WHEN NOT pg_is_in_recovery() THEN 0"
+  " WHEN pg_last_wal_replay_lsn() >= CAST(:primary_lsn AS pg_lsn) THEN 0"
+  " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+  " END AS replica_lag"
+)
+
 
 class DatabaseConnection:
-  def __init__(self, engine, logger_factory=None):
+  def __init__(
+    self,
+    engine,
+    logger_factory=None,
+    replicas: Sequence["DatabaseReplica"] = (),
+    query_cache_size: int = DEFAULT_QUERY_CACHE_SIZE,
+  ):
     self.engine = engine
+    self.replicas = list(replicas)
+    # NOTE: Shared by every session of this process, including the sessions on replicas
+    self.query_cache = bakery(size=query_cache_size)
     self._logger_factory = logger_factory or logging
+    # NOTE: The cursor hooks run for every statement, so they check that a logger is enabled before doing any work
+    # to log to it. Loggers cache their effective levels, so the checks are cheap.
+    self._level_loggers = {
+      name: logging.getLogger(name) for name in (SQL_READ_LOGGER, SQL_WRITE_LOGGER, SQL_SENSITIVE_LOGGER)
+    }
     self._session_factory = sessionmaker(bind=self.engine, expire_on_commit=False)
     event.listen(self.engine, "before_cursor_execute", self.before_cursor_execute)
     event.listen(self.engine, "after_cursor_execute", self.after_cursor_execute)
 
   @property
   def _read_logger(self) -> logging.Logger:
-    return self._logger_factory.getLogger("sigopt.sql.read")
+    return self._logger_factory.getLogger(SQL_READ_LOGGER)
 
   @property
   def _write_logger(self) -> logging.Logger:
-    return self._logger_factory.getLogger("sigopt.sql")
+    return self._logger_factory.getLogger(SQL_WRITE_LOGGER)
 
   # senstive_logger is what gets backed up and logged permanently
   # we are very careful to never log anything senstive to sensitive_logger, but where possible we still want
@@ -56,11 +101,7 @@ class DatabaseConnection:
   # happening in prod. so we use some heuristics below to try to detect sensitive values
   @property
   def _sensitive_logger(self) -> logging.Logger:
-    return self._logger_factory.getLogger("sigopt.rawsql")
-
-  @property
-  def _timing_logger(self) -> logging.Logger:
-    return self._logger_factory.getLogger("sigopt.rawsql.timing")
+    return self._logger_factory.getLogger(SQL_SENSITIVE_LOGGER)
 
   def test(self) -> None:
     session = self.create_session()
@@ -75,6 +116,10 @@ class DatabaseConnection:
   def close_session(self, session: Session) -> None:
     session.close()
 
+  def choose_replica(self) -> "DatabaseReplica | None":
+    available_replicas = [replica for replica in self.replicas if replica.is_available()]
+    return random.choice(available_replicas) if available_replicas else None
+
   def before_cursor_execute(
     self,
     conn: Connection,
@@ -85,9 +130,9 @@ class DatabaseConnection:
     executemany,
   ) -> None:
     del executemany
-    params_to_log = self.sanitized_params(parameters)
-    conn.info.setdefault("query_start_time", []).append(time.time())
-    self._sensitive_logger.debug("%s\n%s", statement, params_to_log)
+    if self._level_loggers[SQL_SENSITIVE_LOGGER].isEnabledFor(logging.DEBUG):
+      self._sensitive_logger.debug("%s\n%s", statement, self.sanitized_params(parameters))
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
 
   def after_cursor_execute(
     self,
@@ -99,11 +144,13 @@ class DatabaseConnection:
     executemany,
   ) -> None:
     del executemany
-    total = time.time() - conn.info["query_start_time"].pop(-1)
-    total_ms = total * 1000
-    query_logger = self._read_logger if statement.startswith("SELECT ") else self._write_logger
-    query_logger.info("%s", statement, extra={"query_time": total_ms})
-    self._timing_logger.debug("%s ms", total_ms)
+    total = time.perf_counter() - conn.info["query_start_time"].pop(-1)
+    is_read = statement.startswith("SELECT ")
+    if request_stats := current_request_stats():
+      request_stats.add_query(statement, is_read, total)
+    if self._level_loggers[SQL_READ_LOGGER if is_read else SQL_WRITE_LOGGER].isEnabledFor(logging.INFO):
+      query_logger = self._read_logger if is_read else self._write_logger
+      query_logger.info("%s", statement, extra={"query_time": total * 1000})
 
   def sanitized_params(self, params: Any) -> Any:
     def _sanitized_params(params_to_log):
@@ -120,9 +167,73 @@ class DatabaseConnection:
     return _sanitized_params(params)
 
 
+class DatabaseReplica:
+  """
+    A read-only copy of the primary database.
+    Its replication lag is measured every lag_check_interval seconds by a background thread, so that requests never
+    wait on it, and the replica is only used while the last measured lag is at most max_lag seconds.
+    """
+
+  def __init__(
+    self,
+    connection: DatabaseConnection,
+    primary_engine: Engine,
+    max_lag: float,
+    lag_check_interval: float,
+  ):
+    self.connection = connection
+    self.primary_engine = primary_engine
+    self.max_lag = max_lag
+    self.lag_check_interval = lag_check_interval
+    self._lag: float | None = None
+    self._stopped = threading.Event()
+
+  @property
+  def _logger(self) -> logging.Logger:
+    return self.connection._logger_factory.getLogger("sigopt.sql.replica")
+
+  def measure_lag(self) -> float:
+    # NOTE: The primary is read first, so that the replica is compared with a position it could already have reached
+    with self.primary_engine.connect() as conn:
+      primary_lsn = conn.execute(PRIMARY_WAL_LSN_QUERY).scalar()
+    with self.connection.engine.connect() as conn:
+      lag = conn.execute(REPLICA_LAG_QUERY, primary_lsn=primary_lsn).scalar()
+    return math.inf if lag is None else float(lag)
+
+  def refresh_lag(self) -> None:
+    try:
+      lag = self.measure_lag()
+    except _TOLERATED_ERRORS as e:
+      self._logger.warning("Unable to measure replica lag: %s", e)
+      self._lag = None
+    else:
+      if lag > self.max_lag:
+        self._logger.warning("Replica is %s seconds behind the primary", lag)
+      self._lag = lag
+
+  def start(self) -> None:
+    """
+        Measures the lag once, and then keeps measuring it in a daemon thread until stop is called.
+        """
+    self.refresh_lag()
+
+    def refresh_until_stopped():
+      while not self._stopped.wait(self.lag_check_interval):
+        self.refresh_lag()
+
+    threading.Thread(target=refresh_until_stopped, name="DatabaseReplica.refresh_lag", daemon=True).start()
+
+  def stop(self) -> None:
+    self._stopped.set()
+
+  def is_available(self) -> bool:
+    lag = self._lag
+    return lag is not None and lag <= self.max_lag
+
+
 class DatabaseConnectionService(GlobalService):
   @classmethod
-  def make_engine(cls, config: dict[str, Any], poolclass: type[Pool] | None = None, **kwargs) -> Engine:
+  def make_engine(cls, config: Mapping[str, Any], poolclass: type[Pool] | None = None, **kwargs) -> Engine:
     full_config: dict[str, Any] = {}
     extend_dict(full_config, config, kwargs)
     echo = full_config.get("echo", False)
@@ -167,14 +278,53 @@ class DatabaseConnectionService(GlobalService):
   def warmup_db(self) -> DatabaseConnection | None:
     if self.services.config_broker.get("db.enabled", True):
       config = self.services.config_broker.get("db")
+      engine = self.make_engine(config)
       db_connection = DatabaseConnection(
-        self.make_engine(config),
+        engine,
         logger_factory=self.services.logging_service,
+        replicas=self.make_replicas(config, engine),
+        query_cache_size=self.services.config_broker.get("db.query_cache_size", DEFAULT_QUERY_CACHE_SIZE),
       )
       db_connection.test()
+      for replica in db_connection.replicas:
+        replica.start()
       return db_connection
     return None
 
+  def make_replicas(self, config: Mapping[str, Any], primary_engine: Engine) -> list[DatabaseReplica]:
+    # NOTE: Each entry of db.replicas overrides the primary's config, so usually only needs a host and port
+    return [
+      DatabaseReplica(
+        DatabaseConnection(
+          self.make_engine(extend_dict({}, config, replica_config)),
+          logger_factory=self.services.logging_service,
+        ),
+        primary_engine,
+        max_lag=self.services.config_broker.get("db.replica_max_lag", DEFAULT_REPLICA_MAX_LAG),
+        lag_check_interval=self.services.config_broker.get(
+          "db.replica_lag_check_interval",
+          DEFAULT_REPLICA_LAG_CHECK_INTERVAL,
+        ),
+      )
+      for replica_config in config.get("replicas", [])
+    ]
+
+
+class CachedQuery:
+  """
+    A baked query along with the values of its bound parameters. It can be passed to the read methods of
+    DatabaseService in place of a Query.
+    """
+
+  def __init__(self, baked_query: BakedQuery, params: dict[str, Any], on_lookup: Callable[[], None]):
+    self.baked_query = baked_query
+    self.params = params
+    self.on_lookup = on_lookup
+
+  def with_session(self, session: Session) -> Result:
+    self.on_lookup()
+    return self.baked_query(session).params(**self.params)
+
 
 TParams = ParamSpec("TParams")
 TResult = TypeVar("TResult")
@@ -205,6 +355,9 @@ def retry_on_error(func: Callable[TParams, TResult]) -> Callable[TParams, TResul
   @wraps(func)
   def wrapper(*args, **kwargs) -> TResult:
     self: DatabaseService = args[0]
+    if self.in_transaction:
+      # NOTE: Retrying would roll back the earlier writes of the transaction and then carry on without them
+      return func(*args, **kwargs)
     with self.services.exception_logger.tolerate_exceptions(_TOLERATED_ERRORS):
       return func(*args, **kwargs)
     self.rollback_session()
@@ -220,27 +373,69 @@ class DatabaseService(Service):
   def __init__(self, services, connection: DatabaseConnection):
     super().__init__(services)
     self._session = None
+    self._replica_session: Session | None = None
     self._connection = connection
     self._in_transaction = False
-    self._flush_after_writes = True
+    self._after_commit: list[Callable[[], None]] = []
+    self._use_replica = False
+    self._has_written = False
 
   @property
   def engine(self) -> Engine:
     return self._connection.engine
 
+  @property
+  def in_transaction(self) -> bool:
+    return self._in_transaction
+
   def execute(self, stmt: str, **kwargs) -> ResultProxy:
+    self._has_written = True
+    if self._in_transaction:
+      assert self._session is not None
+      return self._session.execute(stmt, kwargs)
     return self.engine.execute(stmt, **kwargs)
 
-  def start_session(self) -> None:
+  def start_session(self, use_replica: bool = False) -> None:
+    """
+        When use_replica is True, reads are sent to a replica until the first write of the session, so that the
+        session always reads its own writes.
+        """
     if self._session is not None:
       raise Exception("Started redundant session")
     self._session = self._connection.create_session()
+    self._use_replica = use_replica
+    self._has_written = False
 
   def end_session(self) -> None:
     if self._session:
       self._connection.close_session(self._session)
+    self._close_replica_session()
     self._session = None
     self._in_transaction = False
+    self._after_commit = []
+    self._use_replica = False
+
+  def _close_replica_session(self) -> None:
+    if self._replica_session:
+      self._replica_session.close()
+    self._replica_session = None
+
+  def _read_session(self) -> Session:
+    assert self._session is not None
+    if not self._use_replica or self._in_transaction or self._has_written:
+      return self._session
+    if self._replica_session is None:
+      replica = self._connection.choose_replica()
+      if replica is None:
+        return self._session
+      self._replica_session = replica.connection.create_session()
+    return self._replica_session
+
+  def _end_read(self, session: Session) -> None:
+    if session is self._session:
+      self._rollback()
+    else:
+      session.rollback()
 
   # NOTE: Usually SQL databases will give you an error if you try to insert
   # duplicate items. SQLAlchemy was digesting detached ORM objects pulled from DB when we tried to
@@ -258,6 +453,82 @@ class DatabaseService(Service):
       )
       raise ValueError(msg)
 
+  @contextmanager
+  def transaction(self) -> Iterator[None]:
+    """
+        Commits all of the writes made inside the block together when it exits, instead of committing each write
+        on its own. Writes are still flushed as they are made, so reads inside the block see them. If the block
+        raises then all of its writes are rolled back. A transaction started inside another one joins the outer
+        transaction.
+        NOTE: Errors raised by a write, such as NoResultFound from update_one, leave the transaction unusable
+        unless the write was made inside a savepoint, so they should usually be allowed to end the transaction.
+        """
+    if self._in_transaction:
+      yield
+      return
+    assert self._session is not None
+    self._in_transaction = True
+    try:
+      yield
+      self._session.commit()
+    except BaseException:
+      self._session.rollback()
+      self._after_commit = []
+      raise
+    finally:
+      self._in_transaction = False
+      self._session.expunge_all()
+    after_commit, self._after_commit = self._after_commit, []
+    for callback in after_commit:
+      callback()
+
+  def after_commit(self, callback: Callable[[], None]) -> None:
+    """
+        Calls callback once the writes made so far are committed, ie. to invalidate a cache of them. Outside of a
+        transaction each write has already been committed on its own, so callback is called immediately.
+        Inside a transaction it is called after the transaction commits, and never if it is rolled back.
+        """
+    if self._in_transaction:
+      self._after_commit.append(callback)
+    else:
+      callback()
+
+  @contextmanager
+  def use_primary(self) -> Iterator[None]:
+    """
+        Sends the reads made inside the block to the primary even if the session reads from a replica, for reads that
+        must see every committed write, such as reads that rebuild a cache.
+        """
+    use_replica = self._use_replica
+    self._use_replica = False
+    try:
+      yield
+    finally:
+      self._use_replica = use_replica
+
+  @contextmanager
+  def savepoint(self) -> Iterator[None]:
+    """
+        Rolls back only the writes made inside the block if it raises, so that callers can recover from errors such
+        as an IntegrityError without losing the rest of the transaction. Outside of a transaction each write has
+        already been committed on its own, so the session is rolled back instead.
+        """
+    assert self._session is not None
+    if not self._in_transaction:
+      try:
+        yield
+      except Exception:
+        self.rollback_session()
+        raise
+      return
+    nested = self._session.begin_nested()
+    try:
+      yield
+    except Exception:
+      nested.rollback()
+      raise
+    nested.commit()
+
   @sanitize_errors
   def flush_session(self) -> None:
     assert self._session is not None
@@ -268,6 +539,8 @@ class DatabaseService(Service):
     assert self._session is not None
     self._session.rollback()
     self._session.expunge_all()
+    # NOTE: The next read chooses a replica again, in case this one has failed
+    self._close_replica_session()
 
   @sanitize_errors
   def insert(self, obj) -> None:
@@ -380,44 +653,77 @@ class DatabaseService(Service):
     assert self._session is not None
     return self._session.query(*args)
 
+  def cached_query(self, build: Callable[[Session], Query], *cache_key: Hashable, **params: Any) -> CachedQuery:
+    """
+        Only calls build, and compiles the query that it returns, the first time that the query is used. Later uses
+        reuse the compiled statement.
+        The cache is keyed on the code of build and on cache_key, so the query must only vary with cache_key. Values
+        that change between calls must be bindparams in the query, with their values given in params.
+        """
+    label = build.__qualname__
+    metrics_registry = self.services.metrics_registry
+
+    def record_miss(query: Query) -> Query:
+      metrics_registry.counter(QUERY_CACHE_MISSES, "Queries that were built and compiled", ("query",)).inc(
+        query=label,
+      )
+      return query
+
+    def record_lookup() -> None:
+      metrics_registry.counter(QUERY_CACHE_LOOKUPS, "Queries that were looked up in the cache", ("query",)).inc(
+        query=label,
+      )
+
+    baked_query = self._connection.query_cache(build, *cache_key)
+    baked_query += record_miss
+    return CachedQuery(baked_query, params, record_lookup)
+
   @sanitize_errors
   @retry_on_error
-  def first(self, q: Query) -> Any:
-    ret = q.first()
-    self._expunge(ret)
-    self._rollback()
+  def first(self, q: Query | CachedQuery) -> Any:
+    session = self._read_session()
+    ret = q.with_session(session).first()
+    self._expunge(ret, session)
+    self._end_read(session)
     return ret
 
   @sanitize_errors
   @retry_on_error
-  def all(self, q: Query) -> Sequence[Any]:
-    ret = q.all()
+  def all(self, q: Query | CachedQuery) -> Sequence[Any]:
+    session = self._read_session()
+    ret = q.with_session(session).all()
     for r in ret:
-      self._expunge(r)
-    self._rollback()
+      self._expunge(r, session)
+    self._end_read(session)
     return ret
 
   @sanitize_errors
   @retry_on_error
-  def one(self, q: Query) -> Any:
-    ret = q.one()
-    self._expunge_one(ret)
-    self._rollback()
+  def one(self, q: Query | CachedQuery) -> Any:
+    session = self._read_session()
+    ret = q.with_session(session).one()
+    self._expunge_one(ret, session)
+    self._end_read(session)
     return ret
 
   @sanitize_errors
   @retry_on_error
-  def one_or_none(self, q: Query) -> Any | None:
-    ret = q.one_or_none()
+  def one_or_none(self, q: Query | CachedQuery) -> Any | None:
+    session = self._read_session()
+    ret = q.with_session(session).one_or_none()
     if ret is not None:
-      self._expunge_one(ret)
-    self._rollback()
+      self._expunge_one(ret, session)
+    self._end_read(session)
     return ret
 
   @sanitize_errors
   @retry_on_error
-  def scalar(self, q: Query) -> Any:
-    return q.scalar()
+  def scalar(self, q: Query | CachedQuery) -> Any:
+    session = self._read_session()
+    ret = q.with_session(session).scalar()
+    if session is not self._session:
+      session.rollback()
+    return ret
 
   # NOTE: q is a nested query, self.query is required to execute the `exists` clause.
   def exists(self, q: Query) -> bool:
@@ -433,16 +739,18 @@ class DatabaseService(Service):
 
   @generator_to_safe_iterator
   def _stream_generator(self, batch_size: int, q: Query) -> Generator[Any, None, None]:
-    for r in q.yield_per(batch_size):
-      self._expunge(r)
+    session = self._read_session()
+    for r in q.with_session(session).yield_per(batch_size):
+      self._expunge(r, session)
       yield r
-    self._rollback()
+    self._end_read(session)
 
   @sanitize_errors
   @retry_on_error
-  def count(self, q: Query) -> int:
-    ret = q.count()
-    self._rollback()
+  def count(self, q: Query | CachedQuery) -> int:
+    session = self._read_session()
+    ret = q.with_session(session).count()
+    self._end_read(session)
     return ret
 
   @sanitize_errors
@@ -526,9 +834,9 @@ class DatabaseService(Service):
       raise NoResultFound("Expected exactly one result - none found")
 
   def _commit(self) -> None:
+    self._has_written = True
     if self._in_transaction:
-      if self._flush_after_writes:
-        self.flush_session()
+      self.flush_session()
     else:
       assert self._session is not None
       self._session.commit()
@@ -538,23 +846,25 @@ class DatabaseService(Service):
       assert self._session is not None
       self._session.rollback()
 
-  def _expunge(self, obj: Any | Sequence[Any]) -> None:
+  def _expunge(self, obj: Any | Sequence[Any], session: Session | None = None) -> None:
     if obj:
       if is_sequence(obj):
         for o in obj:
-          self._expunge_one(o)
+          self._expunge_one(o, session)
       else:
-        self._expunge_one(obj)
+        self._expunge_one(obj, session)
 
-  def _expunge_one(self, obj: Any) -> None:
-    if not self._in_transaction:
-      try:
-        instance_state(obj)
-      except NO_STATE:
-        # object not attached to ORM, can't be expunged?
-        # this can occur with the dynamically generated class definitions
-        # might be better to just make sure those classes' definitions are registered
-        pass
-      else:
-        assert self._session is not None
-        self._session.expunge(obj)
+  def _expunge_one(self, obj: Any, session: Session | None = None) -> None:
+    # NOTE: Objects stay detached inside a transaction too, so that changes made to them locally are not flushed.
+    # Writes are flushed as they are made, so nothing is lost by expunging them.
+    try:
+      instance_state(obj)
+    except NO_STATE:
+      # object not attached to ORM, can't be expunged?
+      # this can occur with the dynamically generated class definitions
+      # might be better to just make sure those classes' definitions are registered
+      pass
+    else:
+      session = session or self._session
+      assert session is not None
+      session.expunge(obj)
@@ -2,6 +2,7 @@
 #
 # SPDX-License-Identifier: Apache License 2.0
 import sys
+import threading
 import traceback
 
 from zigopt.common import *
@@ -55,11 +56,18 @@ class AlreadyLoggedException(Exception):
 class ExceptionLogger(Service):
   def __init__(self, services):
     super().__init__(services)
-    self._extra = {}
+    # NOTE: The extra context is thread local, so that messages processed concurrently do not share context
+    self._local = threading.local()
     self._tracer = None
 
+  @property
+  def _extra(self):
+    if not hasattr(self._local, "extra"):
+      self._local.extra = {}
+    return self._local.extra
+
   def reset_extra(self):
-    self._extra = {}
+    self._local.extra = {}
 
   def add_extra(self, **kwargs):
     extend_dict(self._extra, kwargs)
@@ -1,8 +1,11 @@
 # Copyright © 2022 Intel Corporation
 #
 # SPDX-License-Identifier: Apache License 2.0
-from zigopt.common import is_number, max_option, remove_nones_sequence
+import numpy
+
+from zigopt.common import remove_nones_sequence
 from zigopt.experiment.util import get_experiment_default_metric_name
+from zigopt.observation.table import ObservationTable
 from zigopt.services.base import Service
 
 from libsigopt.aux.constant import MULTISOLUTION_TOP_OBSERVATIONS_FRACTION
@@ -15,20 +18,27 @@ class ExperimentBestObservationService(Service):
 
   # NOTE: None can be used here because in the single metric case the observations are unused
   def best_from_valid_observations(self, experiment, observations):
-    default_metric_name = get_experiment_default_metric_name(experiment)
-    return max_option(observations, key=lambda o: o.value_for_maximization(experiment, default_metric_name))
+    table = ObservationTable(experiment, observations)
+    return self._best_from_table(experiment, table, numpy.ones(len(table), dtype=bool))
+
+  def _best_from_table(self, experiment, table, mask):
+    values = table.metric_values_for_maximization(get_experiment_default_metric_name(experiment))
+    candidates = numpy.flatnonzero(mask & ~numpy.isnan(values))
+    if not len(candidates):
+      return None
+    return table.observations[candidates[numpy.argmax(values[candidates])]]
 
   def pareto_frontier(self, experiment, observations):
-    valid_observations = self.services.observation_service.valid_observations(observations)
-    if not valid_observations:
-      return []
-    optimized_values_for_maximization = [
-      [m.value for m in o.get_optimized_measurements_for_maximization(experiment)] for o in valid_observations
-    ]
-    pareto_frontier_observations, _ = find_pareto_frontier_observations_for_maximization(
-      optimized_values_for_maximization, valid_observations
+    table = ObservationTable(experiment, observations)
+    return table.select(self._pareto_frontier_indices(table, numpy.flatnonzero(table.valid_mask())))
+
+  def _pareto_frontier_indices(self, table, indices):
+    if not len(indices):
+      return indices
+    frontier_indices, _ = find_pareto_frontier_observations_for_maximization(
+      table.optimized_values_for_maximization[indices], indices
     )
-    return pareto_frontier_observations
+    return numpy.sort(numpy.asarray(frontier_indices, dtype=int))
 
   def multiple_solutions_best(self, experiment, observations):
     best_observations = self.multi_metric_best(experiment, observations, pareto_frontier=False)
@@ -60,20 +70,18 @@ class ExperimentBestObservationService(Service):
     return [top_observations[i] for i in best_indices]
 
   def single_metric_best(self, experiment, observations, cost=None):
-    valid_observations = self.services.observation_service.valid_observations(observations, cost)
-    valid_observations = [o for o in valid_observations if o.within_metric_thresholds(experiment)]
-    return self.best_from_valid_observations(experiment, valid_observations)
+    table = ObservationTable(experiment, observations)
+    return self._best_from_table(experiment, table, table.valid_mask(cost) & table.within_metric_thresholds)
 
   def multi_metric_best(self, experiment, observations, pareto_frontier):
-    default_metric_name = get_experiment_default_metric_name(experiment)
-    best_observations = [o for o in observations if o.within_metric_thresholds(experiment)]
+    table = ObservationTable(experiment, observations)
+    best_indices = numpy.flatnonzero(table.within_metric_thresholds)
     if pareto_frontier:
-      best_observations = self.pareto_frontier(experiment, best_observations)
-    best_observations = [
-      o for o in best_observations if is_number(o.value_for_maximization(experiment, default_metric_name))
-    ]
-    best_observations.sort(key=lambda o: o.value_for_maximization(experiment, default_metric_name), reverse=True)
-    return best_observations
+      best_indices = self._pareto_frontier_indices(table, best_indices[~table.failures[best_indices]])
+    values = table.metric_values_for_maximization(get_experiment_default_metric_name(experiment))
+    best_indices = best_indices[numpy.isfinite(values[best_indices])]
+    best_indices = best_indices[numpy.argsort(-values[best_indices], kind="stable")]
+    return table.select(best_indices)
 
   def get_best_observations(self, experiment, observations):
     if experiment.requires_pareto_frontier_optimization:
@@ -5,7 +5,7 @@ import datetime
 from collections.abc import Sequence
 from typing import Any
 
-from sqlalchemy import Column, func
+from sqlalchemy import Column, bindparam, func
 from sqlalchemy.orm import Query
 
 from zigopt.common import *
@@ -29,6 +29,8 @@ from libsigopt.aux.samplers import generate_uniform_random_points_rejection_samp
 NUM_SAMPLES_FOR_FLAG = 10
 NUM_REJECTION_TRIALS_FOR_FLAG = 10000
 
+EXPERIMENTS_BY_PROJECT_COUNTER = "experiments_by_project"
+
 TimeInterval = tuple[datetime.datetime, datetime.datetime]
 
 
@@ -50,8 +52,13 @@ class ExperimentService(Service):
 
   def find_by_id(self, experiment_id: int, include_deleted: bool = False) -> Experiment | None:
     return self.services.database_service.one_or_none(
-      self._include_deleted_clause(
-        include_deleted, self.services.database_service.query(Experiment).filter(Experiment.id == experiment_id)
+      self.services.database_service.cached_query(
+        lambda session: self._include_deleted_clause(
+          include_deleted,
+          session.query(Experiment).filter(Experiment.id == bindparam("experiment_id")),
+        ),
+        bool(include_deleted),
+        experiment_id=experiment_id,
       )
     )
 
@@ -92,6 +99,14 @@ class ExperimentService(Service):
     return self.count_by_projects(client_id, [project_id]).get(project_id, 0)
 
   def count_by_projects(self, client_id: int, project_ids: Sequence[int]) -> dict[int, int]:
+    return self.services.counter_service.get_counts(
+      EXPERIMENTS_BY_PROJECT_COUNTER,
+      project_ids,
+      lambda missing_project_ids: self._count_by_projects(client_id, missing_project_ids),
+      scope=(client_id,),
+    )
+
+  def _count_by_projects(self, client_id: int, project_ids: Sequence[int]) -> dict[int, int]:
     return dict(
       self.services.database_service.all(
         self.services.database_service.query(Experiment.project_id, func.count(Experiment.id))
@@ -101,6 +116,9 @@ class ExperimentService(Service):
       )
     )
 
+  def invalidate_count_by_projects(self, client_id: int, project_ids: Sequence[int | None]) -> None:
+    self.services.counter_service.invalidate(EXPERIMENTS_BY_PROJECT_COUNTER, project_ids, scope=(client_id,))
+
   def _get_cached_count_by_organization_id_for_billing(
     self, organization_id: int, start_time: datetime.datetime | None
   ) -> int | None:
@@ -177,6 +195,11 @@ class ExperimentService(Service):
 
   def insert(self, experiment: Experiment) -> None:
     return_val = self.services.database_service.insert(experiment)
+    self.services.counter_service.increment(
+      EXPERIMENTS_BY_PROJECT_COUNTER,
+      {experiment.project_id: 1},
+      scope=(experiment.client_id,),
+    )
     if experiment.project_id is not None:
       self.services.project_service.mark_as_updated_by_experiment(
         experiment=experiment,
@@ -0,0 +1,202 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import datetime
+import json
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import numpy
+
+from zigopt.common import *
+from zigopt.experiment.model import Experiment
+from zigopt.observation.model import Observation
+from zigopt.observation.service import ObservationCounts
+from zigopt.observation.table import ObservationTable
+from zigopt.services.base import Service
+
+from libsigopt.aux.multimetric import find_pareto_frontier_observations_for_maximization
+
+
+# If there has been no change after 5D observations, start reporting possible stagnation
+LOOKBACK_FACTOR = 5
+
+# The number of best results to consider for measuring stagnation, rather than just the top result
+NUM_TOP_RESULTS_TO_CHECK = 5
+
+STAGNATION_STATE_EXPIRY = datetime.timedelta(days=7)
+
+
+@dataclass(frozen=True)
+class StoppingCriteria:
+  possible_stagnation: bool
+  observation_budget_reached: bool
+
+
+@dataclass(frozen=True)
+class StagnationState:
+  """
+    A summary of every observation older than the lookback window, as of an observation watermark.
+    For a single metric this is the top results, otherwise it is the pareto frontier.
+    Summaries are closed under adding more observations, so the state can be advanced without
+    revisiting observations that have already left the lookback window.
+    """
+
+  observation_count: int
+  max_observation_id: int
+  lookback_depth: int
+  metric_names: tuple[str, ...]
+  old_values: numpy.ndarray
+
+  def is_compatible(self, lookback_depth: int, metric_names: tuple[str, ...]) -> bool:
+    return self.lookback_depth == lookback_depth and self.metric_names == metric_names
+
+  def serialize(self) -> str:
+    return json.dumps(
+      {
+        "observation_count": self.observation_count,
+        "max_observation_id": self.max_observation_id,
+        "lookback_depth": self.lookback_depth,
+        "metric_names": list(self.metric_names),
+        "old_values": self.old_values.tolist(),
+      }
+    )
+
+  @classmethod
+  def deserialize(cls, serialized: bytes | str) -> "StagnationState":
+    data = json.loads(serialized)
+    metric_names = tuple(data["metric_names"])
+    return cls(
+      observation_count=data["observation_count"],
+      max_observation_id=data["max_observation_id"],
+      lookback_depth=data["lookback_depth"],
+      metric_names=metric_names,
+      old_values=numpy.array(data["old_values"], dtype=float).reshape(-1, len(metric_names)),
+    )
+
+
+def summarize_values(values: numpy.ndarray, multimetric: bool) -> numpy.ndarray:
+  if len(values) == 0:
+    return values
+  if multimetric:
+    frontier_indices, _ = find_pareto_frontier_observations_for_maximization(values, range(len(values)))
+    return values[sorted(frontier_indices)]
+  return values[numpy.argsort(values[:, 0], kind="stable")[-NUM_TOP_RESULTS_TO_CHECK:]]
+
+
+def check_possible_stagnation(old_summary: numpy.ndarray, window_values: numpy.ndarray, multimetric: bool) -> bool:
+  if multimetric:
+    old_frontier = {tuple(value) for value in old_summary}
+    current_frontier = {
+      tuple(value) for value in summarize_values(numpy.concatenate([old_summary, window_values]), True)
+    }
+    return old_frontier == current_frontier
+  if len(old_summary) < NUM_TOP_RESULTS_TO_CHECK or len(window_values) == 0:
+    return False
+  top_threshold_looking_back = sorted(old_summary[:, 0])[-NUM_TOP_RESULTS_TO_CHECK]
+  best_value_since_lookback = max(window_values[:, 0])
+  return bool(top_threshold_looking_back >= best_value_since_lookback)
+
+
+# TODO: Be more intelligent regarding how multisolution is handled when it exists
+class ExperimentStoppingCriteriaService(Service):
+  def get_stopping_criteria(self, experiment: Experiment) -> StoppingCriteria:
+    counts = self.services.observation_service.get_observation_counts(experiment.id)
+    lookback_depth = LOOKBACK_FACTOR * experiment.dimension
+    multimetric = experiment.requires_pareto_frontier_optimization or experiment.num_solutions > 1
+
+    observation_budget_reached = False
+    if experiment.observation_budget:
+      observation_budget_reached = counts.observation_count > experiment.observation_budget
+
+    possible_stagnation = False
+    if counts.observation_count >= lookback_depth + NUM_TOP_RESULTS_TO_CHECK:
+      # TODO: consider a proper stopping criteria for search. It's not trivial to compute one
+      # without calling into libsigopt.compute.
+      if not experiment.is_search and (observation_budget_reached or not multimetric):
+        state, window_values = self._advance_stagnation_state(experiment, counts, lookback_depth, multimetric)
+        if state.observation_count >= lookback_depth + NUM_TOP_RESULTS_TO_CHECK:
+          possible_stagnation = check_possible_stagnation(state.old_values, window_values, multimetric)
+
+    return StoppingCriteria(
+      possible_stagnation=possible_stagnation,
+      observation_budget_reached=observation_budget_reached,
+    )
+
+  def invalidate_stagnation_state(self, experiment_id: int) -> None:
+    redis_key = self.services.redis_key_service.create_stagnation_state_key(experiment_id)
+    with self.services.exception_logger.tolerate_exceptions(Exception):
+      self.services.redis_service.delete(redis_key)
+
+  def _values_for_maximization(self, experiment: Experiment, observations: Sequence[Observation]) -> numpy.ndarray:
+    table = ObservationTable(experiment, observations)
+    values = table.optimized_values_for_maximization
+    # Replace failed observations with values that cannot be the best found/on the frontier
+    values[table.failures] = -numpy.inf
+    return values
+
+  def _advance_stagnation_state(
+    self,
+    experiment: Experiment,
+    counts: ObservationCounts,
+    lookback_depth: int,
+    multimetric: bool,
+  ) -> tuple[StagnationState, numpy.ndarray]:
+    metric_names = tuple(m.name for m in experiment.optimized_metrics)
+    state = self._get_cached_stagnation_state(experiment.id)
+    if (
+      state is not None
+      and state.is_compatible(lookback_depth, metric_names)
+      and state.observation_count <= counts.observation_count
+    ):
+      num_new = counts.observation_count - state.observation_count
+      recent_observations = list(
+        reversed(self.services.observation_service.latest_observations(experiment, lookback_depth + num_new))
+      )
+      # NOTE: If anything other than num_new insertions happened since the watermark (deletions, restorations,
+      # or observations inserted after the counts were read) then we fall back to a full recomputation.
+      if (
+        len(recent_observations) == lookback_depth + num_new
+        and len([o for o in recent_observations if o.id > state.max_observation_id]) == num_new
+      ):
+        window_values = self._values_for_maximization(experiment, recent_observations[num_new:])
+        if num_new:
+          moved_values = self._values_for_maximization(experiment, recent_observations[:num_new])
+          state = StagnationState(
+            observation_count=counts.observation_count,
+            max_observation_id=recent_observations[-1].id,
+            lookback_depth=lookback_depth,
+            metric_names=metric_names,
+            old_values=summarize_values(numpy.concatenate([state.old_values, moved_values]), multimetric),
+          )
+          self._set_cached_stagnation_state(experiment.id, state)
+        return state, window_values
+
+    observations = list(reversed(self.services.observation_service.all_data(experiment)))
+    values = self._values_for_maximization(experiment, observations)
+    num_old = max(len(observations) - lookback_depth, 0)
+    state = StagnationState(
+      observation_count=len(observations),
+      max_observation_id=max_option([o.id for o in observations]) or 0,
+      lookback_depth=lookback_depth,
+      metric_names=metric_names,
+      old_values=summarize_values(values[:num_old], multimetric),
+    )
+    self._set_cached_stagnation_state(experiment.id, state)
+    return state, values[num_old:]
+
+  def _get_cached_stagnation_state(self, experiment_id: int) -> StagnationState | None:
+    redis_key = self.services.redis_key_service.create_stagnation_state_key(experiment_id)
+    serialized = None
+    with self.services.exception_logger.tolerate_exceptions(Exception):
+      serialized = self.services.redis_service.get(redis_key)
+    return napply(serialized, StagnationState.deserialize)
+
+  def _set_cached_stagnation_state(self, experiment_id: int, state: StagnationState) -> None:
+    redis_key = self.services.redis_key_service.create_stagnation_state_key(experiment_id)
+    with self.services.exception_logger.tolerate_exceptions(Exception):
+      self.services.redis_service.set(
+        redis_key,
+        state.serialize(),
+        int(STAGNATION_STATE_EXPIRY.total_seconds()),
+      )
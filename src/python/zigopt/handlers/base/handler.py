@@ -102,6 +102,16 @@ class Handler:
   # Endpoints can indicate that they accept tokens with the designated scope to allow access
   permitted_scopes = tuple([TokenMeta.ALL_ENDPOINTS])
 
+  # Whether GET requests to this endpoint may read from a database replica in handle(), which can lag behind the
+  # primary. Authentication and find_objects always read from the primary. Endpoints whose callers expect to see the
+  # results of their previous requests immediately, such as reading an object right after creating it, disable this.
+  use_read_replica = True
+
+  # Whether the writes made by handle() are committed together in a single transaction, instead of one at a time.
+  # Endpoints should only enable this if nothing outside of the database, such as a queued message, depends on
+  # their writes being visible before the request has finished.
+  use_transaction = False
+
   # Sentinel value for endpoints that take no parameters
   # If this is returned from parse_params, then no argument is provided
   # to the `handler()` method
@@ -11,6 +11,7 @@ from zigopt.protobuf.gen.token.tokenmeta_pb2 import READ
 class ExperimentsBestAssignmentsHandler(ExperimentHandler):
   authenticator = api_token_authentication
   required_permissions = READ
+  use_read_replica = False
 
   Params = ImmutableStruct(
     "Params",
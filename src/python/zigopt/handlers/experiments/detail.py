@@ -42,6 +42,7 @@ class ExperimentsDetailHandler(ExperimentHandler):
 
   authenticator = api_token_authentication
   required_permissions = READ
+  use_read_replica = False
   JsonBuilder = ExperimentJsonBuilder
   redirect_ai_experiments = True
 
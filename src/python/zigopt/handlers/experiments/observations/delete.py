@@ -38,6 +38,10 @@ class ObservationsDeleteAllHandler(ExperimentHandler):
   def handle(self):  # type: ignore
     assert self.experiment is not None
 
-    self.services.observation_service.delete_all_for_experiment(self.experiment)
-    self.services.aux_service.reset_hyperparameters(self.experiment)
-    return {}
+    # NOTE: Large experiments are deleted in the background, so their observations remain visible until the
+    # worker finishes. The worker resets the hyperparameters once the observations are gone, and the response
+    # tells the caller that the delete is eventually consistent.
+    deleted_in_background = self.services.observation_service.enqueue_delete_all_for_experiment(self.experiment)
+    if not deleted_in_background:
+      self.services.aux_service.reset_hyperparameters(self.experiment)
+    return {"deleted_in_background": deleted_in_background}
@@ -18,6 +18,7 @@ from libsigopt.aux.errors import SigoptValidationError
 class ObservationsDetailHandler(ObservationHandler):
   authenticator = api_token_authentication
   required_permissions = READ
+  use_read_replica = False
 
   def handle(self):  # type: ignore
     assert self.experiment is not None
@@ -29,6 +30,7 @@ class ObservationsDetailHandler(ObservationHandler):
 class ObservationsDetailMultiHandler(ExperimentHandler):
   authenticator = api_token_authentication
   required_permissions = READ
+  use_read_replica = False
 
   Args = ImmutableStruct("Args", ["paging", "sort", "deleted"])
   MAX_HISTORY_POINTS = 1000
@@ -54,6 +54,8 @@ class ObservationsUpdateHandler(CreatesObservationsMixin, ObservationHandler):
         Observation.data: new_observation_data,
       },
     )
+    self.services.observation_service.invalidate_cached_observation_counts(self.experiment.id)
+    self.services.experiment_stopping_criteria_service.invalidate_stagnation_state(self.experiment.id)
     self.services.experiment_service.mark_as_updated(self.experiment, now)
 
     self.observation.data = new_observation_data
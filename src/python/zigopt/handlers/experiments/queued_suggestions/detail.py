@@ -12,6 +12,7 @@ from zigopt.queued_suggestion.model import QueuedSuggestion
 class QueuedSuggestionsDetailHandler(QueuedSuggestionHandler):
   authenticator = api_token_authentication
   required_permissions = READ
+  use_read_replica = False
 
   def handle(self):  # type: ignore
     return QueuedSuggestionJsonBuilder.json(self.experiment, self.queued_suggestion)
@@ -20,6 +21,7 @@ class QueuedSuggestionsDetailHandler(QueuedSuggestionHandler):
 class QueuedSuggestionsDetailMultiHandler(ExperimentHandler):
   authenticator = api_token_authentication
   required_permissions = READ
+  use_read_replica = False
 
   def parse_params(self, request):
     return request.get_paging()
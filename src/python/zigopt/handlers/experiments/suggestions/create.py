@@ -19,6 +19,7 @@ from libsigopt.aux.errors import SigoptValidationError
 class SuggestionsCreateHandler(ExperimentHandler):
   authenticator = api_token_authentication
   required_permissions = WRITE
+  use_transaction = True
 
   def parse_params(self, request):
     return request.params()
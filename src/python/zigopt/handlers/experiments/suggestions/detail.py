@@ -17,6 +17,7 @@ from zigopt.suggestion.unprocessed.model import UnprocessedSuggestion
 class SuggestionsDetailHandler(SuggestionHandler):
   authenticator = api_token_authentication
   required_permissions = READ
+  use_read_replica = False
 
   def handle(self):  # type: ignore
     return SuggestionJsonBuilder.json(self.experiment, self.suggestion, self.auth)
@@ -25,6 +26,7 @@ class SuggestionsDetailHandler(SuggestionHandler):
 class SuggestionsDetailMultiHandler(ExperimentHandler):
   authenticator = api_token_authentication
   required_permissions = READ
+  use_read_replica = False
 
   def parse_params(self, request):
     return request
@@ -372,6 +372,11 @@ class ExperimentsUpdateHandler(ExperimentHandler):
         experiment=self.experiment,
         project_id=project.id,
       )
+    if Experiment.project_id in update_experiment_fields and (project and project.id) != original_project_id:
+      self.services.experiment_service.invalidate_count_by_projects(
+        self.experiment.client_id,
+        [original_project_id, project and project.id],
+      )
 
     if no_optimize is not True:
       self._reset_hyperparameters()
@@ -11,6 +11,7 @@ from zigopt.protobuf.gen.token.tokenmeta_pb2 import READ
 class TrainingRunsDetailHandler(TrainingRunHandler):
   authenticator = api_token_authentication
   required_permissions = READ
+  use_read_replica = False
 
   def handle(self):
     assert self.training_run is not None
@@ -202,6 +202,11 @@ class TrainingRunsUpdateHandler(CreatesObservationsMixin, TrainingRunHandler):
     if update_clause:
       update_clause[TrainingRun.updated] = now
       self.emit_update(update_clause)
+      if update_clause.get(TrainingRun.project_id, self.training_run.project_id) != self.training_run.project_id:
+        self.services.training_run_service.invalidate_count_by_projects(
+          self.training_run.client_id,
+          [self.training_run.project_id, update_clause[TrainingRun.project_id]],
+        )
 
     training_run = self.services.training_run_service.find_by_id(self.training_run.id)
     assert training_run
@@ -0,0 +1,186 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+from collections.abc import Sequence
+
+import numpy
+from sklearn.ensemble import ExtraTreesRegressor, HistGradientBoostingRegressor
+from sklearn.inspection import permutation_importance
+
+from zigopt.common import *
+
+
+# When a forest is warm started, this fraction of its trees (the oldest ones) is replaced by trees fit on the new
+# subsample. Each tree is kept for at most one more update, so importances follow the most recent data.
+WARM_START_REFIT_FRACTION = 0.5
+
+# The arrays that hold the nodes of a fitted tree, which is nearly all of the memory used by a forest
+_TREE_ARRAYS = (
+  "children_left",
+  "children_right",
+  "feature",
+  "threshold",
+  "impurity",
+  "n_node_samples",
+  "weighted_n_node_samples",
+  "value",
+)
+
+# The fraction of the sample that is held out to measure permutation importances
+PERMUTATION_HOLDOUT_FRACTION = 0.25
+
+# NOTE: Permutation importances are scored in the thread that fits the model, since the recorded timings only
+# include the CPU time of that thread.
+
+
+def _get_n_estimators(n_dimensions: int, n_observations: int) -> int:
+  if n_dimensions <= 50 and n_observations <= 10000:
+    n_estimators = 100
+  else:
+    n_estimators = 50
+  return n_estimators
+
+
+def make_importances_forest(n_dimensions: int, n_observations: int, n_jobs: int | None = None) -> ExtraTreesRegressor:
+  return ExtraTreesRegressor(
+    n_estimators=_get_n_estimators(n_dimensions, n_observations),
+    random_state=0,
+    n_jobs=n_jobs,
+    warm_start=True,
+  )
+
+
+def _replace_oldest_trees(forest: ExtraTreesRegressor) -> None:
+  estimators = getattr(forest, "estimators_", [])
+  if not estimators:
+    return
+  num_to_refit = max(int(len(estimators) * WARM_START_REFIT_FRACTION), 1)
+  forest.estimators_ = estimators[num_to_refit:]
+  forest.n_estimators = len(estimators)
+
+
+def get_forest_nbytes(forest: ExtraTreesRegressor) -> int:
+  return sum(getattr(tree.tree_, name).nbytes for tree in getattr(forest, "estimators_", []) for name in _TREE_ARRAYS)
+
+
+class ImportanceEstimator:
+  """
+    Computes the importance of each feature for predicting normalized metric values.
+    The importances are non-negative, but are not necessarily normalized.
+    """
+
+  NAME: str
+  # Approximate CPU seconds to fit a single metric, per sample and dimension.
+  # This is the cost model used to choose an estimator, so it should be tuned with the recorded timings.
+  COST_PER_SAMPLE_DIMENSION: float
+
+  def __init__(self, n_jobs: int | None = None):
+    self.n_jobs = n_jobs
+
+  @classmethod
+  def estimate_cost(cls, n_samples: int, n_dimensions: int) -> float:
+    return cls.COST_PER_SAMPLE_DIMENSION * n_samples * n_dimensions
+
+  def fit_importances(self, features: numpy.ndarray, values: numpy.ndarray) -> numpy.ndarray:
+    raise NotImplementedError()
+
+
+class ExtraTreesImportanceEstimator(ImportanceEstimator):
+  """
+    Impurity based importances of an extremely randomized forest.
+    When a previously fit forest is provided it is warm started: its oldest trees are replaced by trees fit on the
+    new sample instead of refitting every tree, and the forest is updated in place so that it can be reused for the
+    next update.
+    """
+
+  NAME = "extra_trees"
+  COST_PER_SAMPLE_DIMENSION = 4e-5
+
+  def __init__(self, n_jobs: int | None = None, forest: ExtraTreesRegressor | None = None):
+    super().__init__(n_jobs=n_jobs)
+    self.forest = forest
+
+  def fit_importances(self, features, values):
+    if self.forest is None:
+      self.forest = make_importances_forest(features.shape[1], len(values), n_jobs=self.n_jobs)
+    else:
+      _replace_oldest_trees(self.forest)
+    return self.forest.fit(features, values).feature_importances_
+
+
+class HistGradientBoostingImportanceEstimator(ImportanceEstimator):
+  """
+    Permutation importances of a histogram based gradient boosting model, measured on its training sample.
+    Binning the features makes this the cheapest estimator for large samples.
+    """
+
+  NAME = "hist_gradient_boosting"
+  COST_PER_SAMPLE_DIMENSION = 2.5e-5
+
+  def fit_importances(self, features, values):
+    model = HistGradientBoostingRegressor(max_iter=50, random_state=0).fit(features, values)
+    return permutation_importance(
+      model,
+      features,
+      values,
+      n_repeats=3,
+      random_state=0,
+    ).importances_mean
+
+
+class PermutationImportanceEstimator(ImportanceEstimator):
+  """
+    Permutation importances of an extremely randomized forest, measured on a held-out sample.
+    Unlike impurity based importances these are not biased towards features with many distinct values.
+    """
+
+  NAME = "permutation"
+  COST_PER_SAMPLE_DIMENSION = 5e-5
+
+  def fit_importances(self, features, values):
+    rng = numpy.random.default_rng(0)
+    indices = rng.permutation(len(values))
+    num_holdout = max(int(len(values) * PERMUTATION_HOLDOUT_FRACTION), 1)
+    holdout, train = indices[:num_holdout], indices[num_holdout:]
+    model = ExtraTreesRegressor(n_estimators=50, random_state=0, n_jobs=self.n_jobs)
+    model.fit(features[train], values[train])
+    return permutation_importance(
+      model,
+      features[holdout],
+      values[holdout],
+      n_repeats=5,
+      random_state=0,
+    ).importances_mean
+
+
+_ESTIMATOR_CLASSES: tuple[type[ImportanceEstimator], ...] = (
+  ExtraTreesImportanceEstimator,
+  HistGradientBoostingImportanceEstimator,
+  PermutationImportanceEstimator,
+)
+IMPORTANCE_ESTIMATORS: dict[str, type[ImportanceEstimator]] = {cls.NAME: cls for cls in _ESTIMATOR_CLASSES}
+
+
+def choose_importance_estimator(
+  names: Sequence[str],
+  n_samples: int,
+  n_dimensions: int,
+  n_metrics: int,
+  target_cpu_seconds: float,
+  min_sample_size: int,
+) -> tuple[type[ImportanceEstimator], int]:
+  """
+    Returns the first estimator in order of preference that is estimated to fit every metric within
+    target_cpu_seconds, along with the sample size to fit it on.
+    If none of them are then the cheapest estimator is used, on a sample small enough to meet the target.
+    The target is only used with the cost model of each estimator (COST_PER_SAMPLE_DIMENSION) and is not enforced,
+    so a fit that takes longer than estimated is not stopped.
+    """
+  candidates = [IMPORTANCE_ESTIMATORS[name] for name in names]
+  assert candidates
+  for candidate in candidates:
+    if n_metrics * candidate.estimate_cost(n_samples, n_dimensions) <= target_cpu_seconds:
+      return candidate, n_samples
+  cheapest = min(candidates, key=lambda c: c.COST_PER_SAMPLE_DIMENSION)
+  affordable_sample_size = int(target_cpu_seconds / (n_metrics * n_dimensions * cheapest.COST_PER_SAMPLE_DIMENSION))
+  return cheapest, min(n_samples, max(affordable_sample_size, min_sample_size))
@@ -1,46 +1,150 @@
 # Copyright © 2022 Intel Corporation
 #
 # SPDX-License-Identifier: Apache License 2.0
+import threading
+import time
+from collections import OrderedDict
 from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
 
 import numpy
 from sklearn.ensemble import ExtraTreesRegressor
 
 from zigopt.common import *
 from zigopt.experiment.model import Experiment
-from zigopt.services.base import Service
+from zigopt.importance.estimator import (
+  ExtraTreesImportanceEstimator,
+  ImportanceEstimator,
+  choose_importance_estimator,
+  get_forest_nbytes,
+)
+from zigopt.observation.block import ObservationBlock
+from zigopt.services.base import GlobalService, Service
 
 
-def compute_importances(features: Sequence[Sequence[float]], values: Sequence[float]) -> numpy.ndarray:
-  def _get_n_estimators(n_dimensions, n_observations):
-    if n_dimensions <= 50 and n_observations <= 10000:
-      n_estimators = 100
-    else:
-      n_estimators = 50
-    return n_estimators
+# The number of quantiles of the metric values used to stratify the subsample.
+# Stratifying keeps the tails of the distribution (ie. the best observations) in the subsample.
+NUM_SUBSAMPLE_STRATA = 20
+
+DEFAULT_FOREST_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_FOREST_CACHE_MAX_AGE_SECONDS = 60 * 60
+
 
+def stratified_subsample_indices(values: numpy.ndarray, max_sample_size: int, random_state: int = 0) -> numpy.ndarray:
+  """
+    Returns the sorted indices of at most max_sample_size values, with each quantile of the values equally represented.
+    """
+  n_values = len(values)
+  if n_values <= max_sample_size:
+    return numpy.arange(n_values)
+  rng = numpy.random.default_rng(random_state)
+  num_strata = min(NUM_SUBSAMPLE_STRATA, max_sample_size)
+  strata = numpy.array_split(numpy.argsort(values, kind="stable"), num_strata)
+  sizes = numpy.full(num_strata, max_sample_size // num_strata)
+  sizes[: max_sample_size % num_strata] += 1
+  return numpy.sort(
+    numpy.concatenate([rng.choice(stratum, size=size, replace=False) for stratum, size in zip(strata, sizes)])
+  )
+
+
+def compute_importances(
+  features: Sequence[Sequence[float]] | numpy.ndarray,
+  values: Sequence[float] | numpy.ndarray,
+  estimator: ImportanceEstimator | None = None,
+  max_sample_size: int | None = None,
+) -> numpy.ndarray:
   assert len(features) == len(values)
   np_features = numpy.asarray(features)
-  n_observations, n_dimensions = np_features.shape
+  np_values = numpy.asarray(values)
   assert len(np_features.shape) == 2
-  n_estimators = _get_n_estimators(*np_features.shape)
-  values_max, values_min = max(values), min(values)
+  n_dimensions = np_features.shape[1]
+  values_max, values_min = max(np_values), min(np_values)
 
-  # NOTE: Normalize the values before feeding them to the random forest model,
+  # NOTE: Normalize the values before feeding them to the model,
   # and output equal importances if the metric values are approaching a constant value
   if numpy.isclose(values_max, values_min):
     return numpy.ones(n_dimensions) / n_dimensions
 
-  values_normalized = (numpy.asarray(values) - values_min) / (values_max - values_min)
+  if max_sample_size is not None:
+    sample_indices = stratified_subsample_indices(np_values, max_sample_size)
+    np_features, np_values = np_features[sample_indices], np_values[sample_indices]
+
+  values_normalized = (np_values - values_min) / (values_max - values_min)
   # NOTE: We are not one-hot encoding categorical parameters. Oh well.
-  n_estimators = _get_n_estimators(n_dimensions, n_observations)
-  clf = ExtraTreesRegressor(n_estimators=n_estimators, random_state=0)
-  feature_importances = clf.fit(features, values_normalized).feature_importances_
+  estimator = estimator or ExtraTreesImportanceEstimator()
+  # NOTE: Permutation importances can be negative when a feature is uninformative, which is the same as no importance
+  feature_importances = numpy.maximum(estimator.fit_importances(np_features, values_normalized), 0)
 
   if (not numpy.all(numpy.isfinite(feature_importances))) or numpy.all(feature_importances == 0):
     return numpy.ones(n_dimensions) / n_dimensions
 
-  return feature_importances
+  return feature_importances / numpy.sum(feature_importances)
+
+
+class _CachedForest(NamedTuple):
+  forest: ExtraTreesRegressor
+  nbytes: int
+  stored_at: float
+
+
+class ImportancesForestCache(GlobalService):
+  """
+    Keeps the most recently used importances forests in memory, so that a worker that updates the importances of
+    the same experiment again can warm start from the trees it has already fit.
+    Disabled unless features.importancesForestCacheSize is set. Forests are evicted once they are older than
+    features.importancesForestCacheMaxAgeSeconds, and the least recently used forests are evicted to keep the cache
+    within features.importancesForestCacheMaxBytes.
+    """
+
+  def __init__(self, services):
+    super().__init__(services)
+    self._lock = threading.Lock()
+    self._forests: OrderedDict[tuple, _CachedForest] = OrderedDict()
+    self._nbytes = 0
+
+  @property
+  def max_size(self) -> int:
+    return self.services.config_broker.get("features.importancesForestCacheSize", 0)
+
+  @property
+  def max_bytes(self) -> int:
+    return self.services.config_broker.get("features.importancesForestCacheMaxBytes", DEFAULT_FOREST_CACHE_MAX_BYTES)
+
+  @property
+  def max_age(self) -> float:
+    return self.services.config_broker.get(
+      "features.importancesForestCacheMaxAgeSeconds",
+      DEFAULT_FOREST_CACHE_MAX_AGE_SECONDS,
+    )
+
+  def get(self, key: tuple) -> ExtraTreesRegressor | None:
+    with self._lock:
+      cached = self._forests.get(key)
+      if cached is None:
+        return None
+      if time.monotonic() - cached.stored_at > self.max_age:
+        self._evict(key)
+        return None
+      self._forests.move_to_end(key)
+      return cached.forest
+
+  def put(self, key: tuple, forest: ExtraTreesRegressor) -> None:
+    if self.max_size <= 0:
+      return
+    nbytes = get_forest_nbytes(forest)
+    with self._lock:
+      if key in self._forests:
+        self._evict(key)
+      if nbytes > self.max_bytes:
+        return
+      self._forests[key] = _CachedForest(forest, nbytes, time.monotonic())
+      self._nbytes += nbytes
+      while len(self._forests) > self.max_size or self._nbytes > self.max_bytes:
+        self._evict(next(iter(self._forests)))
+
+  def _evict(self, key: tuple) -> None:
+    self._nbytes -= self._forests.pop(key).nbytes
 
 
 class ImportancesService(Service):
@@ -65,7 +169,8 @@ class ImportancesService(Service):
     start_of_window = ImportancesService.minimum_valid_observations_to_compute_importances(experiment)
     end_of_window = experiment.observation_budget or 0
 
-    if observation_count > self.services.config_broker.get("features.importancesMaxObservations", 5000):
+    max_observations = self.services.config_broker.get("features.importancesMaxObservations")
+    if max_observations is not None and observation_count > max_observations:
       return False
 
     if observation_count < start_of_window:
@@ -88,34 +193,93 @@ class ImportancesService(Service):
     scaling_factor = 200
     return non_crypto_random.random() < probability_of_update * min([1, (scaling_factor / observation_count)])
 
-  def compute_parameter_importances(self, experiment: Experiment) -> int | None:
+  def compute_parameter_importances(
+    self,
+    experiment: Experiment,
+    timings: dict[str, float] | None = None,
+  ) -> int | None:
+    """
+        If provided, timings is updated with the total CPU seconds spent fitting with each estimator.
+        """
     valid_observations = self.services.observation_service.find_valid_observations(experiment)
     if not self.can_update_importances(experiment, len(valid_observations)):
       return None
 
-    features = [
-      [
-        o.get_assignment(p) if not p.has_log_transformation else numpy.log10(o.get_assignment(p))
-        for p in experiment.all_parameters
-      ]
-      for o in valid_observations
-    ]
+    # NOTE: The block decodes each observation once, instead of copying its protobuf for each parameter
+    observation_block = ObservationBlock.from_observations(experiment, valid_observations)
+    features = observation_block.points(experiment.all_parameters, log_scale=True)
 
-    # metric values for each observation sorted by metric name
-    metric_values_per_obs = [o.data.sorted_all_metric_values(experiment) for o in valid_observations]
+    metrics = experiment.all_metrics
+    max_sample_size = self.services.config_broker.get("features.importancesMaxSampleSize", 2000)
+    estimator_class, sample_size = choose_importance_estimator(
+      self.services.config_broker.get("features.importancesEstimators", [ExtraTreesImportanceEstimator.NAME]),
+      n_samples=min(len(valid_observations), max_sample_size),
+      n_dimensions=len(experiment.all_parameters),
+      n_metrics=len(metrics),
+      target_cpu_seconds=self.services.config_broker.get("features.importancesTargetCpuSeconds", 60),
+      min_sample_size=self.minimum_valid_observations_to_compute_importances(experiment),
+    )
 
-    importance_maps = {}
-    # Iterate through the metrics and calculate importances separately for each one
+    # Fit the metrics concurrently and calculate importances separately for each one.
+    # The models release the GIL while fitting, so threads are enough here.
     # NOTE: this expects that metric_importances/detail is also using all_metrics
-    for i, m in enumerate(experiment.all_metrics):
-      metric_values = [values[i] for values in metric_values_per_obs]
-      feature_importances = compute_importances(features, metric_values)
-      feature_importances_map = {p.name: fi for p, fi in zip(experiment.all_parameters, feature_importances)}
-      importance_maps[m.name] = feature_importances_map
+    max_workers = max(
+      min(len(metrics), self.services.config_broker.get("features.importancesMaxConcurrentFits", 4)),
+      1,
+    )
+    # NOTE: Concurrent fits are single threaded by default, so that they do not each start a thread per core
+    n_jobs = self.services.config_broker.get("features.importancesNumJobs", 1 if max_workers > 1 else -1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      futures = [
+        executor.submit(
+          self._compute_metric_importances,
+          experiment,
+          m.name,
+          estimator_class,
+          features,
+          observation_block.values[:, i],
+          sample_size,
+          n_jobs,
+        )
+        for i, m in enumerate(metrics)
+      ]
+      results = [future.result() for future in futures]
+    importance_maps = {m.name: importance_map for m, (importance_map, _) in zip(metrics, results)}
+    if timings is not None:
+      timings[estimator_class.NAME] = timings.get(estimator_class.NAME, 0) + sum(seconds for _, seconds in results)
 
     self.persist_importances(experiment, importance_maps)
 
     return max_option([o.id for o in valid_observations])
 
+  def _compute_metric_importances(
+    self,
+    experiment: Experiment,
+    metric_name: str,
+    estimator_class: type[ImportanceEstimator],
+    features: numpy.ndarray,
+    metric_values: numpy.ndarray,
+    sample_size: int,
+    n_jobs: int,
+  ) -> tuple[dict[str, float], float]:
+    """
+        Returns the importances of the metric and the CPU seconds spent computing them.
+        The CPU time is measured with thread_time, since process_time would include every other thread in the process.
+        It does not include the helper threads of fits with n_jobs other than 1.
+        """
+    start_time = time.thread_time()
+    parameter_names = tuple(p.name for p in experiment.all_parameters)
+    forest_key = (experiment.id, metric_name, parameter_names)
+    estimator: ImportanceEstimator
+    if estimator_class is ExtraTreesImportanceEstimator:
+      forest = self.services.importances_forest_cache.get(forest_key)
+      estimator = ExtraTreesImportanceEstimator(n_jobs=n_jobs, forest=forest)
+    else:
+      estimator = estimator_class(n_jobs=n_jobs)
+    feature_importances = compute_importances(features, metric_values, estimator=estimator, max_sample_size=sample_size)
+    if isinstance(estimator, ExtraTreesImportanceEstimator) and estimator.forest is not None:
+      self.services.importances_forest_cache.put(forest_key, estimator.forest)
+    return dict(zip(parameter_names, feature_importances)), time.thread_time() - start_time
+
   def persist_importances(self, experiment: Experiment, importance_maps: dict[str, dict[str, float]]) -> None:
     self.services.experiment_service.update_importance_maps(experiment, importance_maps)
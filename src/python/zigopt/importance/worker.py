@@ -14,5 +14,12 @@ class ImportancesWorker(ExperimentWorker):
   class MessageBody(ProtobufMessageBody):
     PROTOBUF_CLASS = ImportancesMessage
 
+  def __init__(self, services, message):
+    super().__init__(services, message)
+    self.estimator_timings = {}
+
   def process(self, experiment, message):
-    return self.services.importances_service.compute_parameter_importances(experiment)
+    return self.services.importances_service.compute_parameter_importances(experiment, timings=self.estimator_timings)
+
+  def get_process_timing_info(self):
+    return {f"time_{name}": seconds for name, seconds in self.estimator_timings.items()}
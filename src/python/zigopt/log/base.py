@@ -56,6 +56,9 @@ class JsonFormatter(logging.Formatter):
       except AttributeError:
         pass
 
+    if isinstance(request_stats := getattr(record, "request_stats", None), dict):
+      log_data.update(request_stats)
+
     if hasattr(record, "request") and record.request is not None:
       request = record.request
 
@@ -146,9 +149,10 @@ def configure_loggers(config_broker):
       "sigopt.config": logging.INFO,
       "sigopt.queue.workers": logging.INFO,
       "sigopt.rawsql": logging.INFO,
-      "sigopt.rawsql.timing": logging.INFO,
       "sigopt.requests": logging.INFO,
       "sigopt.sql": logging.INFO,
+      # NOTE: Reads are counted in the request logs instead of being logged one at a time
+      "sigopt.sql.read": logging.WARNING,
       "sigopt.timing": logging.INFO,
       "sigopt.www": logging.INFO,
       "urllib3": logging.INFO,
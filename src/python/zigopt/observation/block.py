@@ -0,0 +1,123 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+from collections.abc import Iterable, Iterator, Sequence
+
+import numpy
+
+from zigopt.common import *
+from zigopt.assignments.model import MissingValueException
+from zigopt.experiment.model import Experiment
+from zigopt.observation.model import Observation, ObservationDataProxy
+from zigopt.protobuf.gen.experiment.experimentmeta_pb2 import ExperimentParameter
+from zigopt.protobuf.gen.observation.observationdata_pb2 import ObservationData
+
+
+class ObservationBlock:
+  """
+    A read-only, columnar encoding of the observations used by one optimization run.
+    It is built by streaming over the observations exactly once, so the ORM objects do not need to be kept alive,
+    and it can be shared by every sampler and source that reads from the same optimization args.
+    Assignments are stored by parameter name so that the block can be read with any view of the experiment
+    (ie. the unconditioned experiment), values follow the order of `experiment.all_metrics`.
+    Missing assignments and values are NaN.
+    """
+
+  def __init__(
+    self,
+    assignment_names: Sequence[str],
+    assignments: numpy.ndarray,
+    values: numpy.ndarray,
+    value_vars: numpy.ndarray,
+    failures: numpy.ndarray,
+    task_costs: numpy.ndarray,
+  ):
+    self.assignment_names = tuple(assignment_names)
+    self.assignments = assignments
+    self.values = values
+    self.value_vars = value_vars
+    self.failures = failures
+    self.task_costs = task_costs
+    self._assignment_index = {name: j for j, name in enumerate(self.assignment_names)}
+    for array in (assignments, values, value_vars, failures, task_costs):
+      array.flags.writeable = False
+
+  @classmethod
+  def from_observations(cls, experiment: Experiment, observations: Iterable[Observation]) -> "ObservationBlock":
+    num_metrics = len(experiment.all_metrics)
+    assignment_index: dict[str, int] = {}
+    assignment_rows: list[list[tuple[int, float]]] = []
+    values: list[list[float] | None] = []
+    value_vars: list[list[float] | None] = []
+    failures: list[bool] = []
+    task_costs: list[float] = []
+    for observation in observations:
+      data = observation.data
+      assignment_rows.append(
+        [
+          (assignment_index.setdefault(name, len(assignment_index)), value)
+          for name, value in data.underlying.assignments_map.items()
+        ]
+      )
+      values.append(data.sorted_all_metric_values(experiment))
+      value_vars.append(data.sorted_all_metric_value_vars(experiment))
+      failures.append(bool(data.reported_failure))
+      task_costs.append(data.task.cost)
+
+    assignments = numpy.full((len(assignment_rows), len(assignment_index)), numpy.nan)
+    for i, row in enumerate(assignment_rows):
+      for j, value in row:
+        assignments[i, j] = value
+
+    def to_matrix(rows):
+      matrix = numpy.full((len(rows), num_metrics), numpy.nan)
+      for i, row in enumerate(rows):
+        if row is not None:
+          matrix[i, :] = row
+      return matrix
+
+    return cls(
+      assignment_names=list(assignment_index),
+      assignments=assignments,
+      values=to_matrix(values),
+      value_vars=to_matrix(value_vars),
+      failures=numpy.array(failures, dtype=bool),
+      task_costs=numpy.array(task_costs, dtype=float),
+    )
+
+  def __len__(self) -> int:
+    return len(self.failures)
+
+  def assignment_column(self, name: str) -> numpy.ndarray:
+    j = self._assignment_index.get(name)
+    if j is None:
+      return numpy.full(len(self), numpy.nan)
+    return self.assignments[:, j]
+
+  def points(self, parameters: Sequence[ExperimentParameter], log_scale: bool = False) -> numpy.ndarray:
+    """
+        Equivalent to calling `make_experiment_assignment_value_array` for each observation.
+        """
+    points = numpy.empty((len(self), len(parameters)))
+    for j, parameter in enumerate(parameters):
+      column = self.assignment_column(parameter.name)
+      missing = numpy.isnan(column)
+      if missing.any():
+        if not parameter.HasField("replacement_value_if_missing"):
+          raise MissingValueException("Missing value in has_assignments object")
+        column = numpy.where(missing, parameter.replacement_value_if_missing, column)
+      if log_scale and parameter.transformation == ExperimentParameter.TRANSFORMATION_LOG:
+        column = numpy.log10(column)
+      points[:, j] = column
+    return points
+
+  def iter_assignments(self) -> Iterator[ObservationDataProxy]:
+    """
+        Decodes the assignments of one observation at a time, for code that works with `get_assignments`.
+        """
+    for row in self.assignments:
+      yield ObservationDataProxy(
+        ObservationData(
+          assignments_map={name: value for name, value in zip(self.assignment_names, row) if not numpy.isnan(value)}
+        )
+      )
@@ -1,14 +1,16 @@
 # Copyright © 2022 Intel Corporation
 #
 # SPDX-License-Identifier: Apache License 2.0
-from collections.abc import Sequence
+import datetime
+from collections.abc import Mapping, Sequence
 from dataclasses import dataclass
 
-from sqlalchemy import case, desc, func
+from sqlalchemy import bindparam, case, desc, func
 from sqlalchemy.orm import Query
 
 from zigopt.common import *
 from zigopt.common.sigopt_datetime import current_datetime, datetime_to_seconds
+from zigopt.db.column import JsonPath, jsonb_set, unwind_json_path
 from zigopt.db.util import DeleteClause
 from zigopt.experiment.model import Experiment
 from zigopt.observation.data import *
@@ -16,15 +18,42 @@ from zigopt.observation.model import Observation
 from zigopt.profile.timing import *
 from zigopt.protobuf.gen.api.paging_pb2 import PagingMarker
 from zigopt.protobuf.lib import copy_protobuf
+from zigopt.queue.message_types import MessageType
 from zigopt.services.base import Service
 
 
+DEFAULT_OBSERVATION_COUNTS_CACHE_TTL = datetime.timedelta(hours=1)
+
+FAILURE_COUNT = "failure_count"
+OBSERVATION_COUNT = "observation_count"
+MAX_OBSERVATION_ID = "max_observation_id"
+
+
 @dataclass(frozen=True)
 class ObservationCounts:
   failure_count: int
   observation_count: int
   max_observation_id: int | None
 
+  # NOTE: Observation ids start at 1, so a stored max_observation_id of 0 means there are no observations
+  @classmethod
+  def from_redis_hash(cls, fields: Mapping[bytes, bytes]) -> "ObservationCounts | None":
+    decoded = {key.decode(): int(value) for key, value in fields.items()}
+    if any(field not in decoded for field in (FAILURE_COUNT, OBSERVATION_COUNT, MAX_OBSERVATION_ID)):
+      return None
+    return cls(
+      failure_count=decoded[FAILURE_COUNT],
+      observation_count=decoded[OBSERVATION_COUNT],
+      max_observation_id=decoded[MAX_OBSERVATION_ID] or None,
+    )
+
+  def to_redis_hash(self) -> dict[str, int]:
+    return {
+      FAILURE_COUNT: self.failure_count,
+      OBSERVATION_COUNT: self.observation_count,
+      MAX_OBSERVATION_ID: self.max_observation_id or 0,
+    }
+
 
 class ObservationService(Service):
   def validate_assignments_present(self, experiment: Experiment, observations: Sequence[Observation]) -> bool:
@@ -124,6 +153,8 @@ class ObservationService(Service):
           know if the count is greater than some threshold.
         :return: number of observations for this experiment
         """
+    if limit is None and after is None and deleted is DeleteClause.NOT_DELETED:
+      return self.get_observation_counts(experiment.id).observation_count
     q = self.services.database_service.query(Observation).filter(Observation.experiment_id == experiment.id)
     if after is not None:
       q = q.filter(Observation.id > after)
@@ -134,22 +165,124 @@ class ObservationService(Service):
 
   # TODO - Allow to include deleted observations
   def get_observation_counts(self, experiment_id: int) -> ObservationCounts:
-    failure_count, observation_count, max_observation_id = self.services.database_service.one_or_none(
-      self.services.database_service.query(
-        func.sum(case([(~~Observation.data.reported_failure, 1)], else_=0)),
-        func.count(Observation.id),
-        func.max(Observation.id),
-      )
-      .filter(~Observation.data.deleted)
-      .filter(Observation.experiment_id == experiment_id)
-      .group_by(Observation.experiment_id)
-    ) or (0, 0, None)
+    """
+        Counts are served from a per-experiment record in redis, which is rebuilt from the database when it is missing.
+        Inserts increment the record once they are committed, and other writes invalidate it. A rebuild is only stored
+        if no write has been committed since the rebuild started, see RedisService.SET_IF_VERSION_SCRIPT.
+        The record also expires periodically, so that it is reconciled with the database.
+        """
+    if not self._observation_counts_cache_enabled:
+      return self.query_observation_counts(experiment_id)
+    redis_key = self.services.redis_key_service.create_observation_counts_key(experiment_id)
+    version_key = self.services.redis_key_service.create_cache_version_key(redis_key)
+    cached = None
+    with self.services.exception_logger.tolerate_exceptions(Exception):
+      with self.services.redis_service.pipeline() as pipeline:
+        pipeline.get_all_hash_fields(redis_key)
+        pipeline.get(version_key)
+      cached = pipeline.results
+    if cached is None:
+      return self.query_observation_counts(experiment_id)
+    fields, version = cached
+    counts = ObservationCounts.from_redis_hash(fields)
+    if counts is None:
+      counts = self.query_observation_counts(experiment_id)
+      with self.services.exception_logger.tolerate_exceptions(Exception):
+        self.services.redis_service.set_if_version(
+          redis_key,
+          version_key,
+          version,
+          counts.to_redis_hash(),
+          expire=self._observation_counts_cache_ttl,
+        )
+    return counts
+
+  def query_observation_counts(self, experiment_id: int) -> ObservationCounts:
+    """
+        Counts the observations in the database, bypassing the cache of get_observation_counts.
+        """
+    with self.services.database_service.use_primary():
+      failure_count, observation_count, max_observation_id = self.services.database_service.one_or_none(
+        self.services.database_service.cached_query(
+          lambda session: session.query(
+            func.sum(case([(~~Observation.data.reported_failure, 1)], else_=0)),
+            func.count(Observation.id),
+            func.max(Observation.id),
+          )
+          .filter(~Observation.data.deleted)
+          .filter(Observation.experiment_id == bindparam("experiment_id"))
+          .group_by(Observation.experiment_id),
+          experiment_id=experiment_id,
+        )
+      ) or (0, 0, None)
     return ObservationCounts(
-      failure_count=failure_count,
+      failure_count=int(failure_count),
       observation_count=observation_count,
       max_observation_id=max_observation_id,
     )
 
+  @property
+  def _observation_counts_cache_enabled(self) -> bool:
+    return self.services.redis_service.enabled and self.services.config_broker.get(
+      "features.cacheObservationCounts", True
+    )
+
+  @property
+  def _observation_counts_cache_ttl(self) -> datetime.timedelta:
+    return datetime.timedelta(
+      seconds=self.services.config_broker.get(
+        "features.observationCountsCacheTtl",
+        DEFAULT_OBSERVATION_COUNTS_CACHE_TTL.total_seconds(),
+      )
+    )
+
+  def invalidate_cached_observation_counts(self, experiment_id: int) -> None:
+    """
+        Must be called whenever observations are inserted, deleted or edited. The record is invalidated after the write
+        is committed, so that a rebuild can not read the database before the write and store its counts after it.
+        """
+    if not self._observation_counts_cache_enabled:
+      return
+    redis_key = self.services.redis_key_service.create_observation_counts_key(experiment_id)
+
+    def invalidate():
+      with self.services.exception_logger.tolerate_exceptions(Exception):
+        self.services.redis_service.invalidate_versioned([redis_key], expire=self._observation_counts_cache_ttl)
+
+    self.services.database_service.after_commit(invalidate)
+
+  def increment_cached_observation_counts(self, experiment_id: int, observations: Sequence[Observation]) -> None:
+    """
+        Adds newly inserted observations to the record once they are committed, instead of invalidating it.
+        """
+    if not self._observation_counts_cache_enabled:
+      return
+    observations = [o for o in observations if not o.deleted]
+    if not observations:
+      return
+    # NOTE: The ids of the observations are needed to keep max_observation_id up to date
+    if any(o.id is None for o in observations):
+      self.invalidate_cached_observation_counts(experiment_id)
+      return
+    redis_key = self.services.redis_key_service.create_observation_counts_key(experiment_id)
+    increments = {
+      FAILURE_COUNT: sum(1 for o in observations if o.reported_failure),
+      OBSERVATION_COUNT: len(observations),
+    }
+    maxima = {MAX_OBSERVATION_ID: max(o.id for o in observations)}
+
+    def increment():
+      with self.services.exception_logger.tolerate_exceptions(Exception):
+        self.services.redis_service.increment_versioned(
+          redis_key,
+          self.services.redis_key_service.create_cache_version_key(redis_key),
+          increments,
+          expire=self._observation_counts_cache_ttl,
+          maxima=maxima,
+        )
+
+    self.services.database_service.after_commit(increment)
+
   def valid_observations(self, observations: Sequence[Observation], cost: float | None = None) -> Sequence[Observation]:
     return [o for o in observations if o.reported_failure is not True and (cost is None or o.data.task.cost == cost)]
 
@@ -162,8 +295,19 @@ class ObservationService(Service):
     )
 
   def latest_observation_id(self, experiment_id: int) -> int | None:
-    obs = self.latest_observation(experiment_id)
-    return obs and obs.id
+    return self.get_observation_counts(experiment_id).max_observation_id
+
+  def latest_observations(self, experiment: Experiment, limit: int) -> Sequence[Observation]:
+    """
+        :return: the most recent `limit` non-deleted observations for this experiment, newest first
+        """
+    return self.services.database_service.all(
+      self.services.database_service.query(Observation)
+      .filter(Observation.experiment_id == experiment.id)
+      .filter(~Observation.data.deleted)
+      .order_by(desc(Observation.id))
+      .limit(limit)
+    )
 
   def latest_observation(self, experiment_id: int, include_deleted: bool = False) -> Observation | None:
     return self.services.database_service.first(
@@ -185,27 +329,75 @@ class ObservationService(Service):
       self.services.database_service.query(Observation).filter(Observation.id == observation_id),
       {Observation.data: new_data},
     )
+    self.invalidate_cached_observation_counts(experiment.id)
     self.services.experiment_service.mark_as_updated(experiment, now)
 
-  def delete_all_for_experiment(self, experiment: Experiment) -> None:
+  def delete_all_for_experiment(
+    self,
+    experiment: Experiment,
+    chunk_size: int | None = None,
+    max_observation_id: int | None = None,
+  ) -> None:
+    """
+        Not a true DB delete, just sets the deleted flag with a set-based update.
+        When chunk_size is provided, rows are updated and committed in batches of at most chunk_size.
+        When max_observation_id is provided, observations with a higher id are not deleted.
+        """
     now = current_datetime()
-    updated_observations = []
-    for old_observation in self.services.database_service.all(
-      self._include_deleted_clause_deprecated(
-        False,
-        self.services.database_service.query(Observation).filter(Observation.experiment_id == experiment.id),
+    data_clause = jsonb_set(Observation.data, JsonPath(*unwind_json_path(Observation.data.deleted)), True)
+    data_clause = jsonb_set(
+      data_clause,
+      JsonPath(*unwind_json_path(Observation.data.timestamp)),
+      int(datetime_to_seconds(now)),
+    )
+    id_query = self.services.database_service.query(Observation.id).filter(Observation.experiment_id == experiment.id)
+    if max_observation_id is not None:
+      id_query = id_query.filter(Observation.id <= max_observation_id)
+    id_query = self._include_deleted_clause(DeleteClause.NOT_DELETED, id_query)
+    if chunk_size is None:
+      self.services.database_service.update(
+        self.services.database_service.query(Observation).filter(Observation.id.in_(id_query.subquery())),
+        {Observation.data: data_clause},
       )
-    ):
-      new_observation = copy_protobuf(old_observation.data)
-      new_observation.deleted = True
-      new_observation.timestamp = datetime_to_seconds(now)
-      updated_observations.append({"id": old_observation.id, "data": new_observation})
-    self.services.database_service.update_all(Observation, updated_observations)
+    else:
+      assert chunk_size > 0
+      while True:
+        chunk_ids = id_query.order_by(Observation.id).limit(chunk_size).subquery()
+        updated = self.services.database_service.update(
+          self.services.database_service.query(Observation).filter(Observation.id.in_(chunk_ids)),
+          {Observation.data: data_clause},
+        )
+        if updated < chunk_size:
+          break
+    self.invalidate_cached_observation_counts(experiment.id)
     self.services.experiment_service.mark_as_updated(experiment, now)
 
+  def enqueue_delete_all_for_experiment(self, experiment: Experiment) -> bool:
+    """
+        Deletes the observations in the background if the experiment has enough observations to make a
+        synchronous delete too slow. Returns True if the delete was enqueued, and False if it was run immediately.
+        Observations that are created after this is called are not deleted by the background delete.
+        """
+    min_observations = self.services.config_broker.get("features.backgroundDeleteObservationsThreshold")
+    counts = self.query_observation_counts(experiment.id)
+    if (
+      min_observations is not None
+      and counts.max_observation_id is not None
+      and counts.observation_count >= min_observations
+    ):
+      self.services.queue_service.make_and_enqueue_message(
+        MessageType.DELETE_OBSERVATIONS,
+        experiment_id=experiment.id,
+        max_observation_id=counts.max_observation_id,
+      )
+      return True
+    self.delete_all_for_experiment(experiment)
+    return False
+
   def insert_observations(self, experiment: Experiment, observations: Sequence[Observation]) -> None:
     self.validate_assignments_present(experiment, observations)
     self.services.database_service.insert_all(observations)
+    self.increment_cached_observation_counts(experiment.id, observations)
 
   def optimize(
     self,
@@ -0,0 +1,81 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+from collections.abc import Sequence
+
+import numpy
+
+from zigopt.common import *
+from zigopt.experiment.model import Experiment
+from zigopt.observation.model import Observation
+
+
+class ObservationTable:
+  """
+    A columnar view of the measurements of a sequence of observations, for one experiment.
+    Each observation is decoded exactly once, so that analytics can be computed as array operations
+    instead of repeatedly going through the protobuf proxies for each observation and each metric.
+    Rows are in the same order as the observations, columns follow `experiment.all_metrics`.
+    Missing values (including every value of a failed observation) are NaN.
+    """
+
+  def __init__(self, experiment: Experiment, observations: Sequence[Observation]):
+    self.observations = list(observations)
+    self.metric_names = [m.name for m in experiment.all_metrics]
+    self.optimized_metric_indices = numpy.array(
+      [i for i, m in enumerate(experiment.all_metrics) if m.is_optimized], dtype=int
+    )
+    self._metric_index = {name: i for i, name in enumerate(self.metric_names)}
+
+    num_observations, num_metrics = len(self.observations), len(self.metric_names)
+    self.values = numpy.full((num_observations, num_metrics), numpy.nan)
+    self.value_vars = numpy.full((num_observations, num_metrics), numpy.nan)
+    self.failures = numpy.zeros(num_observations, dtype=bool)
+    self.task_costs = numpy.zeros(num_observations)
+    for i, observation in enumerate(self.observations):
+      data = observation.data
+      self.failures[i] = bool(data.reported_failure)
+      self.task_costs[i] = data.task.cost
+      for measurement in data.get_all_measurements(experiment):
+        j = self._metric_index.get(measurement.name)
+        if j is None:
+          continue
+        if measurement.HasField("value"):
+          self.values[i, j] = measurement.value
+        if measurement.HasField("value_var"):
+          self.value_vars[i, j] = measurement.value_var
+
+    self.maximization_signs = numpy.array([-1.0 if m.is_minimized else 1.0 for m in experiment.all_metrics])
+    self.values_for_maximization = self.values * self.maximization_signs
+
+    thresholds_for_maximization = self.maximization_signs * numpy.array(
+      [numpy.nan if m.threshold is None else m.threshold for m in experiment.all_metrics]
+    )
+    with numpy.errstate(invalid="ignore"):
+      meets_thresholds = numpy.isnan(thresholds_for_maximization) | (
+        self.values_for_maximization >= thresholds_for_maximization
+      )
+    self.within_metric_thresholds = numpy.all(~numpy.isnan(self.values) & meets_thresholds, axis=1)
+
+  def __len__(self) -> int:
+    return len(self.observations)
+
+  @property
+  def optimized_values_for_maximization(self) -> numpy.ndarray:
+    return self.values_for_maximization[:, self.optimized_metric_indices]
+
+  def metric_values(self, name: str) -> numpy.ndarray:
+    return self.values[:, self._metric_index[name]]
+
+  def metric_values_for_maximization(self, name: str) -> numpy.ndarray:
+    return self.values_for_maximization[:, self._metric_index[name]]
+
+  def valid_mask(self, cost: float | None = None) -> numpy.ndarray:
+    """Equivalent to `ObservationService.valid_observations`, as a mask over the rows."""
+    mask = ~self.failures
+    if cost is not None:
+      mask &= self.task_costs == cost
+    return mask
+
+  def select(self, indices: Sequence[int] | numpy.ndarray) -> list[Observation]:
+    return [self.observations[i] for i in indices]
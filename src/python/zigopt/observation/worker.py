@@ -0,0 +1,31 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+from zigopt.protobuf.gen.queue.messages_pb2 import DeleteObservationsMessage
+from zigopt.queue.message import ProtobufMessageBody
+from zigopt.queue.message_groups import MessageGroup
+from zigopt.queue.message_types import MessageType
+from zigopt.queue.worker import QueueWorker
+
+
+DEFAULT_DELETE_CHUNK_SIZE = 5000
+
+
+class DeleteObservationsWorker(QueueWorker):
+  MESSAGE_GROUP = MessageGroup.ANALYTICS
+  MESSAGE_TYPE = MessageType.DELETE_OBSERVATIONS
+
+  class MessageBody(ProtobufMessageBody):
+    PROTOBUF_CLASS = DeleteObservationsMessage
+
+  def _handle_message(self, message):
+    experiment = self.services.experiment_service.find_by_id(message.experiment_id, include_deleted=True)
+    if experiment is None:
+      return
+    self.services.observation_service.delete_all_for_experiment(
+      experiment,
+      chunk_size=self.services.config_broker.get("features.deleteObservationsChunkSize", DEFAULT_DELETE_CHUNK_SIZE),
+      # NOTE: Messages enqueued before max_observation_id was added delete every observation
+      max_observation_id=message.max_observation_id if message.HasField("max_observation_id") else None,
+    )
+    self.services.aux_service.reset_hyperparameters(experiment)
@@ -4,12 +4,25 @@
 from collections.abc import Iterator, Sequence
 
 from zigopt.common import *
+from zigopt.experiment.model import Experiment
+from zigopt.observation.block import ObservationBlock
 from zigopt.observation.model import Observation
 from zigopt.optimization_aux.service import Hyperparams
 from zigopt.optimize.sources.base import OptimizationSource
 from zigopt.suggestion.model import Suggestion
 
 
+class _SharedObservations:
+  def __init__(self, observation_iterator: Iterator[Observation]):
+    self.iterator = safe_iterator(observation_iterator)
+    self.block: ObservationBlock | None = None
+
+  def get_block(self, experiment: Experiment) -> ObservationBlock:
+    if self.block is None:
+      self.block = ObservationBlock.from_observations(experiment, self.iterator)
+    return self.block
+
+
 class OptimizationArgs:  # pylint: disable=too-many-instance-attributes
   def __init__(
     self,
@@ -28,12 +41,19 @@ class OptimizationArgs:  # pylint: disable=too-many-instance-attributes
     self._old_hyperparameters = old_hyperparameters
     self._open_suggestions = open_suggestions
     self._max_observation_id = max_observation_id
-    self._observation_iter = safe_iterator(observation_iterator)
+    self._observations = _SharedObservations(observation_iterator)
     self._last_observation = last_observation
 
   @property
   def observation_iterator(self) -> Iterator[Observation]:
-    return self._observation_iter
+    return self._observations.iterator
+
+  def get_observation_block(self, experiment: Experiment) -> ObservationBlock:
+    """
+        The observations, encoded once and shared with every copy of these args made by `copy_and_set`.
+        Prefer this to `observation_iterator`, which can only be consumed once.
+        """
+    return self._observations.get_block(experiment)
 
   @property
   def source(self) -> OptimizationSource:
@@ -74,9 +94,9 @@ class OptimizationArgs:  # pylint: disable=too-many-instance-attributes
     open_suggestions: Sequence[Suggestion] | None = None,
     last_observation: Observation | None = None,
   ):
-    return OptimizationArgs(
+    args = OptimizationArgs(
       source=coalesce(source, self.source),
-      observation_iterator=coalesce(observation_iterator, self.observation_iterator),
+      observation_iterator=coalesce(observation_iterator, iter(())),
       observation_count=coalesce(observation_count, self.observation_count),
       failure_count=coalesce(failure_count, self.failure_count),
       max_observation_id=coalesce(max_observation_id, self.max_observation_id),
@@ -84,3 +104,6 @@ class OptimizationArgs:  # pylint: disable=too-many-instance-attributes
       open_suggestions=coalesce(open_suggestions, self.open_suggestions),
       last_observation=coalesce(last_observation, self.last_observation),
     )
+    if observation_iterator is None:
+      args._observations = self._observations
+    return args
@@ -35,13 +35,12 @@ class OptimizerService(Service):
     if not (experiment.conditionals or experiment.tasks) and self.services.config_broker.get(
       "features.severeDuplicateCheck", False
     ):
-      optimization_args_for_dedupe = self.fetch_optimization_args(experiment)
       self.services.logging_service.getLogger("sigopt.optimize.dedupe").info(
         "Before dedupe: %s",
         [s.id for s in suggestions],
       )
       suggestions = self.exclude_duplicate_suggestions(
-        optimization_args_for_dedupe,
+        optimization_args,
         suggestions,
         experiment,
       )
@@ -70,7 +69,9 @@ class OptimizerService(Service):
     return optimization_args.max_observation_id
 
   def fetch_observation_iter(self, experiment: Experiment) -> tuple[Iterator[Observation], ObservationCounts]:
-    counts = self.services.observation_service.get_observation_counts(experiment.id)
+    # NOTE: The counts bound the observations that are read, so they must come from the database rather than the cache.
+    # A cached record can still count observations whose delete has been committed but has not invalidated it yet.
+    counts = self.services.observation_service.query_observation_counts(experiment.id)
 
     query = (
       self.services.database_service.query(Observation)
@@ -179,10 +180,9 @@ class OptimizerService(Service):
     acceptable_logical_array_by_observations = numpy.full(len(suggestions), True, dtype=bool)
     acceptable_logical_array_by_open = numpy.full(len(suggestions), True, dtype=bool)
 
-    if optimization_args.observation_count:
-      observation_matrix = numpy.empty((optimization_args.observation_count, len(parameters)))
-      for row, o in enumerate(optimization_args.observation_iterator):
-        extract_array_for_computation_from_assignments(o.data, parameters, vals=observation_matrix[row, :])
+    observation_block = optimization_args.get_observation_block(experiment)
+    if len(observation_block):
+      observation_matrix = observation_block.points(parameters, log_scale=True)
 
       suggestion_observation_distance = compute_distance_matrix_squared(observation_matrix, suggestion_matrix)
       min_distance_each_suggestion = numpy.min(suggestion_observation_distance, axis=0)
@@ -200,7 +200,7 @@ class CategoricalOptimizationSource(OptimizationSource):
 
     suggestion_datas = self.services.sc_adapter.gp_next_points_categorical(
       experiment=self.experiment,
-      observations=list(optimization_args.observation_iterator),
+      observations=optimization_args.get_observation_block(self.experiment),
       hyperparameter_dict=self.extract_hyperparameter_dict(optimization_args),
       num_to_suggest=self.coalesce_num_to_suggest(self.default_limit(limit)),
       open_suggestion_datas=self.extract_open_suggestion_datas(optimization_args),
@@ -231,7 +231,7 @@ class CategoricalOptimizationSource(OptimizationSource):
     if self.should_force_default_hyperparameters(optimization_args, optimization_args.old_hyperparameters):
       hyperparameter_dict = self.default_hyperparameter_dict(optimization_args)
     else:
-      observations = list(optimization_args.observation_iterator)
+      observations = optimization_args.get_observation_block(self.experiment)
       hyperparameter_dict = self.extract_hyperparameter_dict(optimization_args)
       if self.should_execute_hyper_opt(optimization_args.observation_count - optimization_args.failure_count):
         hyperparameter_dict = self.services.sc_adapter.gp_hyper_opt_categorical(
@@ -250,7 +250,7 @@ class CategoricalOptimizationSource(OptimizationSource):
 
     expected_improvements = self.services.sc_adapter.gp_ei_categorical(
       experiment=self.experiment,
-      observations=list(optimization_args.observation_iterator),
+      observations=optimization_args.get_observation_block(self.experiment),
       hyperparameter_dict=self.extract_hyperparameter_dict(optimization_args),
       suggestion_datas_to_evaluate=[s.suggestion_meta.suggestion_data for s in all_suggestions],
       open_suggestion_datas=self.extract_open_suggestion_datas(optimization_args),
@@ -24,7 +24,7 @@ class SearchOptimizationSource(CategoricalOptimizationSource):
 
     suggestion_datas = self.services.sc_adapter.search_next_points(
       experiment=self.experiment,
-      observations=list(optimization_args.observation_iterator),
+      observations=optimization_args.get_observation_block(self.experiment),
       hyperparameter_dict=self.extract_hyperparameter_dict(optimization_args),
       num_to_suggest=self.coalesce_num_to_suggest(self.default_limit(limit)),
       open_suggestion_datas=self.extract_open_suggestion_datas(optimization_args),
@@ -24,9 +24,8 @@ class SPEOptimizationSource(OptimizationSource):
 
     immutable_suggestion_datas = self.services.sc_adapter.spe_next_points(
       experiment=self.experiment,
-      observation_iterator=optimization_args.observation_iterator,
+      observations=optimization_args.get_observation_block(self.experiment),
       num_to_suggest=self.coalesce_num_to_suggest(limit),
-      observation_count=optimization_args.observation_count,
       open_suggestion_datas=self.extract_open_suggestion_datas(optimization_args),
       tag=None,
     )
@@ -39,9 +38,8 @@ class SPEOptimizationSource(OptimizationSource):
   def get_search_suggestions(self, optimization_args, limit=None):
     immutable_suggestion_datas = self.services.sc_adapter.spe_search_next_points(
       experiment=self.experiment,
-      observation_iterator=optimization_args.observation_iterator,
+      observations=optimization_args.get_observation_block(self.experiment),
       num_to_suggest=self.coalesce_num_to_suggest(limit),
-      observation_count=optimization_args.observation_count,
       open_suggestion_datas=self.extract_open_suggestion_datas(optimization_args),
       tag=None,
     )
@@ -6,7 +6,6 @@ import time
 
 from zigopt.common import *
 from zigopt.common.sigopt_datetime import current_datetime
-from zigopt.db.util import DeleteClause
 from zigopt.protobuf.gen.queue.messages_pb2 import NextPointsMessage, OptimizeHyperparametersMessage
 from zigopt.queue.message import ProtobufMessageBody
 from zigopt.queue.message_groups import MessageGroup
@@ -59,11 +58,8 @@ class ExperimentWorker(QueueWorker):
       self.process(experiment, message)
       finish_time = time.time()
       timing_info["time_proc"] = finish_time - start_time
-      # NOTE: include deleted because this is a proxy for user actions and it makes the query much faster
-      observation_count = self.services.observation_service.count_by_experiment(
-        experiment,
-        deleted=DeleteClause.ALL,
-      )
+      timing_info.update(self.get_process_timing_info())
+      observation_count = self.services.observation_service.get_observation_counts(experiment.id).observation_count
       timing_info["obs_count"] = observation_count
       approx_time_between_observations = None
       if observation_count:
@@ -115,6 +111,12 @@ class ExperimentWorker(QueueWorker):
   def process(self, experiment, message):
     raise NotImplementedError()
 
+  def get_process_timing_info(self):
+    """
+        Additional timings measured by process, to be logged with the timing info of the message.
+        """
+    return {}
+
 
 class NextPointsWorker(ExperimentWorker):
   MESSAGE_TYPE = MessageType.NEXT_POINTS
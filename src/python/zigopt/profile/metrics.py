@@ -0,0 +1,255 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import bisect
+import math
+import os
+import threading
+from collections.abc import Callable, Sequence
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Generic, TypeVar
+
+from zigopt.common import *
+from zigopt.services.base import GlobalService
+
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latencies of queue messages range from milliseconds to the queue's alert threshold
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# Every API and queue worker process on a host serves its metrics on the first free port from the configured port,
+# so this many ports are reserved for them.
+DEFAULT_METRICS_NUM_PORTS = 32
+
+
+def _format_value(value: float) -> str:
+  if math.isinf(value):
+    return "+Inf" if value > 0 else "-Inf"
+  return repr(float(value))
+
+
+def _format_labels(labels: Sequence[tuple[str, str]]) -> str:
+  if not labels:
+    return ""
+  escaped = (
+    (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for name, value in labels
+  )
+  return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+MetricValue = TypeVar("MetricValue")
+Sample = tuple[str, list[tuple[str, str]], float]
+
+
+class Metric(Generic[MetricValue]):
+  """
+    A family of samples that share a name, keyed by the values of its labels.
+    Metrics are updated from many threads, so every update holds the metric's lock.
+    Values are replaced rather than modified, so that they can be rendered after the lock is released.
+    """
+
+  TYPE: str
+
+  def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self._lock = threading.Lock()
+    self._values: dict[tuple[str, ...], MetricValue] = {}
+
+  def _label_values(self, labels: dict[str, object]) -> tuple[str, ...]:
+    assert set(labels) == set(self.labelnames), f"Expected labels {self.labelnames} for {self.name}"
+    return tuple(str(labels[name]) for name in self.labelnames)
+
+  def _samples(self, label_values: tuple[str, ...], value: MetricValue) -> list[Sample]:
+    raise NotImplementedError()
+
+  def render(self) -> list[str]:
+    lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+    with self._lock:
+      values = sorted(self._values.items())
+    for label_values, value in values:
+      for name, labels, sample in self._samples(label_values, value):
+        lines.append(f"{name}{_format_labels(labels)} {_format_value(sample)}")
+    return lines
+
+
+class Counter(Metric[float]):
+  TYPE = "counter"
+
+  def inc(self, amount: float = 1, **labels) -> None:
+    assert amount >= 0
+    key = self._label_values(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def _samples(self, label_values: tuple[str, ...], value: float) -> list[Sample]:
+    return [(self.name, list(zip(self.labelnames, label_values)), value)]
+
+
+class Gauge(Metric[float]):
+  TYPE = "gauge"
+
+  def set(self, value: float, **labels) -> None:
+    key = self._label_values(labels)
+    with self._lock:
+      self._values[key] = value
+
+  def inc(self, amount: float = 1, **labels) -> None:
+    key = self._label_values(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def dec(self, amount: float = 1, **labels) -> None:
+    self.inc(-amount, **labels)
+
+  def _samples(self, label_values: tuple[str, ...], value: float) -> list[Sample]:
+    return [(self.name, list(zip(self.labelnames, label_values)), value)]
+
+
+class Histogram(Metric[tuple[tuple[int, ...], float]]):
+  """
+    The value of each label set is the count of observations in each bucket (plus one for +Inf) and their total.
+    """
+
+  TYPE = "histogram"
+
+  def __init__(
+    self,
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+  ):
+    super().__init__(name, documentation, labelnames)
+    self.buckets = tuple(sorted(buckets))
+
+  def observe(self, value: float, **labels) -> None:
+    key = self._label_values(labels)
+    index = bisect.bisect_left(self.buckets, value)
+    with self._lock:
+      counts, total = self._values.get(key, ((0,) * (len(self.buckets) + 1), 0.0))
+      self._values[key] = ((*counts[:index], counts[index] + 1, *counts[index + 1 :]), total + value)
+
+  def _samples(self, label_values: tuple[str, ...], value: tuple[tuple[int, ...], float]) -> list[Sample]:
+    counts, total = value
+    labels = list(zip(self.labelnames, label_values))
+    samples: list[Sample] = []
+    cumulative = 0
+    for bound, count in zip((*self.buckets, math.inf), counts):
+      cumulative += count
+      samples.append((f"{self.name}_bucket", [*labels, ("le", _format_value(bound))], cumulative))
+    samples.append((f"{self.name}_count", labels, cumulative))
+    samples.append((f"{self.name}_sum", labels, total))
+    return samples
+
+
+class MetricsRegistry(GlobalService):
+  """
+    In-process metrics, rendered in the Prometheus text format.
+    Every process has its own registry, and serves it on its own internal port so that each API and queue worker
+    process is scraped separately. Metrics are not served by the public API.
+    Collectors are called on each scrape to update metrics that are read from elsewhere, such as queue depths.
+    """
+
+  logger_name = "sigopt.metrics"
+
+  def __init__(self, services):
+    super().__init__(services)
+    self._lock = threading.Lock()
+    self._metrics: dict[str, Metric] = {}
+    self._collectors: list[Callable[["MetricsRegistry"], None]] = []
+    self._server: ThreadingHTTPServer | None = None
+
+  @property
+  def enabled(self) -> bool:
+    return self.services.config_broker.get("metrics.enabled", False)
+
+  def _get_or_create(self, metric_cls, name, documentation, labelnames, **kwargs):
+    with self._lock:
+      metric = self._metrics.get(name)
+      if metric is None:
+        metric = self._metrics[name] = metric_cls(name, documentation, labelnames, **kwargs)
+    assert isinstance(metric, metric_cls) and metric.labelnames == tuple(labelnames), f"Conflicting metric {name}"
+    return metric
+
+  def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return self._get_or_create(Counter, name, documentation, labelnames)
+
+  def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return self._get_or_create(Gauge, name, documentation, labelnames)
+
+  def histogram(
+    self,
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+  ) -> Histogram:
+    return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+  def add_collector(self, collector: Callable[["MetricsRegistry"], None]) -> None:
+    with self._lock:
+      self._collectors.append(collector)
+
+  def render(self) -> str:
+    with self._lock:
+      collectors = list(self._collectors)
+    for collector in collectors:
+      with self.services.exception_logger.tolerate_exceptions(Exception):
+        collector(self)
+    with self._lock:
+      metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+    return "".join(f"{line}\n" for metric in metrics for line in metric.render())
+
+  def serve_from_config(self, port_env_var: str, port_config_key: str) -> None:
+    """
+        Serves the metrics if they are enabled and a port is configured, with the environment variable taking
+        precedence over the config.
+        """
+    port = os.environ.get(port_env_var) or self.services.config_broker.get(port_config_key)
+    if port and self.enabled:
+      self.serve(int(port), num_ports=self.services.config_broker.get("metrics.num_ports", DEFAULT_METRICS_NUM_PORTS))
+
+  def serve(self, port: int, num_ports: int = 1) -> None:
+    """
+        Serves the metrics on a background thread, on a port that is separate from the public API.
+        The first free port of the num_ports ports from port is used, so that each process on a host gets its own.
+        If none of them are free the metrics are not served, rather than failing the process.
+        """
+    assert self._server is None
+    registry = self
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+      def do_GET(self):  # pylint: disable=invalid-name
+        body = registry.render().encode("utf-8")
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        del format, args
+
+    last_port = port + max(num_ports, 1) - 1
+    for candidate_port in range(port, last_port + 1):
+      try:
+        self._server = ThreadingHTTPServer(("", candidate_port), MetricsRequestHandler)
+        break
+      except OSError:
+        pass
+    if self._server is None:
+      self.logger.warning("Not serving metrics, no port is free from %s to %s", port, last_port)
+      return
+    self._server.daemon_threads = True
+    threading.Thread(target=self._server.serve_forever, name="MetricsRegistry.serve", daemon=True).start()
+    self.logger.info("Serving metrics on port %s", self._server.server_port)
+
+  def shutdown(self) -> None:
+    if self._server is not None:
+      self._server.shutdown()
+      self._server.server_close()
+      self._server = None
@@ -0,0 +1,121 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import threading
+from collections import Counter
+from collections.abc import Mapping
+from typing import Any
+
+from zigopt.common import *
+
+
+# Budget limits, as they are configured in request_stats.budgets
+MAX_QUERIES = "max_queries"
+MAX_QUERY_TIME_MS = "max_query_time_ms"
+MAX_REDIS_COMMANDS = "max_redis_commands"
+MAX_STATEMENT_REPEATS = "max_statement_repeats"
+
+
+class RequestStats:
+  """
+    Counts the SQL statements and Redis commands run while handling one request or queue message.
+    Statements are counted by their text, which holds placeholders for the bound values, so a statement that is
+    run many times with different values is counted as repeated. This is usually an N+1 query.
+    """
+
+  def __init__(self):
+    self.handler_name: str | None = None
+    self.read_count = 0
+    self.read_time = 0.0
+    self.write_count = 0
+    self.write_time = 0.0
+    self.redis_command_count = 0
+    self.statement_counts: Counter[str] = Counter()
+
+  @property
+  def query_count(self) -> int:
+    return self.read_count + self.write_count
+
+  @property
+  def query_time_ms(self) -> float:
+    return (self.read_time + self.write_time) * 1000
+
+  @property
+  def max_statement_repeats(self) -> int:
+    return max(self.statement_counts.values(), default=0)
+
+  def add_query(self, statement: str, is_read: bool, seconds: float) -> None:
+    if is_read:
+      self.read_count += 1
+      self.read_time += seconds
+    else:
+      self.write_count += 1
+      self.write_time += seconds
+    self.statement_counts[statement] += 1
+
+  def add_redis_command(self) -> None:
+    self.redis_command_count += 1
+
+  def repeated_statements(self) -> list[tuple[str, int]]:
+    return [(statement, count) for statement, count in self.statement_counts.most_common() if count > 1]
+
+  def log_extra(self) -> dict[str, Any]:
+    return {
+      "query_time": self.query_time_ms,
+      "request_stats": {
+        "queryCount": self.query_count,
+        "readQueryCount": self.read_count,
+        "writeQueryCount": self.write_count,
+        "redisCommandCount": self.redis_command_count,
+        "maxStatementRepeats": self.max_statement_repeats,
+      },
+    }
+
+  def headers(self) -> dict[str, str]:
+    return {
+      "X-Query-Count": str(self.query_count),
+      "X-Query-Time-Ms": f"{self.query_time_ms:.1f}",
+      "X-Redis-Command-Count": str(self.redis_command_count),
+      "X-Max-Statement-Repeats": str(self.max_statement_repeats),
+    }
+
+  def exceeded_budget(self, budget: Mapping[str, int | float]) -> list[str]:
+    """
+        Returns a description of each limit in the budget that has been exceeded.
+        """
+    values = {
+      MAX_QUERIES: self.query_count,
+      MAX_QUERY_TIME_MS: self.query_time_ms,
+      MAX_REDIS_COMMANDS: self.redis_command_count,
+      MAX_STATEMENT_REPEATS: self.max_statement_repeats,
+    }
+    exceeded = []
+    for limit_name, limit in budget.items():
+      assert limit_name in values, f"Unknown request budget limit: {limit_name}"
+      if values[limit_name] > limit:
+        exceeded.append(f"{limit_name}={limit} (was {values[limit_name]})")
+    if budget.get(MAX_STATEMENT_REPEATS) is not None:
+      exceeded.extend(
+        f"repeated {count} times: {statement}"
+        for statement, count in self.repeated_statements()
+        if count > budget[MAX_STATEMENT_REPEATS]
+      )
+    return exceeded
+
+
+_thread_request_stats = threading.local()
+
+
+def start_request_stats() -> RequestStats:
+  request_stats = _thread_request_stats.request_stats = RequestStats()
+  return request_stats
+
+
+def stop_request_stats() -> RequestStats | None:
+  request_stats = current_request_stats()
+  _thread_request_stats.request_stats = None
+  return request_stats
+
+
+def current_request_stats() -> RequestStats | None:
+  return getattr(_thread_request_stats, "request_stats", None)
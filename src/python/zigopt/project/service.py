@@ -86,9 +86,9 @@ class ProjectService(Service):
 
   def insert(self, project: Project) -> Project:
     try:
-      self.services.database_service.insert(project)
+      with self.services.database_service.savepoint():
+        self.services.database_service.insert(project)
     except sqlalchemy.exc.IntegrityError as ie:
-      self.services.database_service.rollback_session()
       if 'duplicate key value violates unique constraint "projects_client_id_reference_id_key"' in str(ie):
         raise ProjectExistsException(project.reference_id) from ie
       raise
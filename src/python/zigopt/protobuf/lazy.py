@@ -0,0 +1,84 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+from typing import Any
+
+from google.protobuf.message import Message
+
+from zigopt.common import *
+from zigopt.protobuf.dict import dict_to_protobuf
+from zigopt.protobuf.lib import BaseProxyClass, MessageT
+
+
+class LazyProtobuf(BaseProxyClass[MessageT]):
+  """
+    Holds the JSON of a protobuf and only parses the parts of it that are used.
+    Reading a field, or calling HasField on it, parses only that field. Anything else, such as CopyFrom or
+    ListFields, parses the whole protobuf into `underlying`. Like a Proxy, it must be copied with copy_protobuf
+    before it is modified.
+    """
+
+  def __init__(self, message_class: type[MessageT], json_value: dict[str, Any]):
+    object.__setattr__(self, "_message_class", message_class)
+    object.__setattr__(self, "_json_value", json_value)
+    object.__setattr__(self, "_partial_messages", {})
+
+  @property
+  def DESCRIPTOR(self):  # pylint: disable=invalid-name
+    return self._message_class.DESCRIPTOR
+
+  @property
+  def is_parsed(self) -> bool:
+    return "underlying" in self.__dict__
+
+  def _parse(self, json_value: dict[str, Any]) -> MessageT:
+    return dict_to_protobuf(self._message_class, json_value, ignore_unknown_fields=True)
+
+  def _partial_message(self, field_name: str) -> MessageT:
+    partial_message = self._partial_messages.get(field_name)
+    if partial_message is None:
+      field = self.DESCRIPTOR.fields_by_name[field_name]
+      # NOTE: Protobufs accept both the JSON name and the original name of a field when they are parsed
+      partial_message = self._partial_messages[field_name] = self._parse(
+        {key: self._json_value[key] for key in (field.json_name, field.name) if key in self._json_value}
+      )
+    return partial_message
+
+  def __getattr__(self, attr):
+    if attr in ("_message_class", "_json_value", "_partial_messages"):
+      # NOTE: Only reached while the object is being created without __init__, such as when it is unpickled
+      raise AttributeError(attr)
+    if attr == "underlying":
+      underlying = self._parse(self._json_value)
+      object.__setattr__(self, "underlying", underlying)
+      object.__setattr__(self, "_partial_messages", {})
+      return underlying
+    if attr in self.DESCRIPTOR.fields_by_name and not self.is_parsed:
+      return getattr(self._partial_message(attr), attr)
+    return getattr(self.underlying, attr)
+
+  def __setattr__(self, attr, val):
+    raise Exception(
+      "Attempting to override value on a lazily parsed protobuf, which is not safe. Must call"
+      " zigopt.protobuf.lib.copy_protobuf()"
+    )
+
+  def HasField(self, field_name: str) -> bool:  # pylint: disable=invalid-name
+    if field_name in self.DESCRIPTOR.fields_by_name and not self.is_parsed:
+      return self._partial_message(field_name).HasField(field_name)
+    return self.underlying.HasField(field_name)
+
+  def __eq__(self, other):
+    while isinstance(other, BaseProxyClass):
+      other = other.underlying
+    if not isinstance(other, Message):
+      return NotImplemented
+    return self.underlying == other
+
+  __hash__ = None  # type: ignore
+
+  def __str__(self):
+    return str(self.underlying)
+
+  def __repr__(self):
+    return f"{self.__class__.__name__}({self._message_class.__name__}, {self._json_value!r})"
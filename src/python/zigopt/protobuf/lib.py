@@ -21,10 +21,9 @@ def is_protobuf(val: Any) -> bool:
 
 
 def copy_protobuf(proto: MessageT | BaseProxyClass[MessageT]) -> MessageT:
-  if isinstance(proto, BaseProxyClass):
-    actual_proto = proto.underlying
-  else:
-    actual_proto = proto
+  actual_proto = proto
+  while isinstance(actual_proto, BaseProxyClass):
+    actual_proto = actual_proto.underlying
   copy = actual_proto.__class__()
   copy.CopyFrom(actual_proto)
   return copy
@@ -20,7 +20,7 @@ class Proxy(BaseProxyClass):
     raise TypeError("Cannot compare proxies")
 
   def __setattr__(self, attr, val):
-    if attr in self.underlying.__class__.DESCRIPTOR.fields_by_name:
+    if attr in self.underlying.DESCRIPTOR.fields_by_name:
       # Calling setattr of a protobuf field on a Proxy is unlikely to behave the way the caller wants.
       # It appears to work but actually sets the value on the Proxy object instead of the underlying.
       # This is likely to cause confusion, so we forbid it.
@@ -56,6 +56,7 @@ if __name__ == "__main__":
     )
     workers.test()
   else:
+    global_services.metrics_registry.serve_from_config("QWORKER_METRICS_PORT", "metrics.worker_port")
     try:
       workers.run()
     except WorkerInterruptedException:
@@ -1,7 +1,7 @@
 # Copyright © 2022 Intel Corporation
 #
 # SPDX-License-Identifier: Apache License 2.0
-from collections.abc import Sequence
+from collections.abc import Mapping, Sequence
 
 from zigopt.common import *
 from zigopt.common.sigopt_datetime import unix_timestamp
@@ -22,12 +22,21 @@ class BaseQueueService(Service):
     group_key: str | None = None,
     enqueue_time: int | None = None,
     message_score: float | None = None,
-  ) -> None:
-    self._enqueue_batch(
+    monitor_time: float | None = None,
+    tenant_key: str | None = None,
+  ) -> Mapping[str, Mapping[str, float]]:
+    """
+        When monitor_time is provided, queues whose provider supports_monitored_enqueue have their monitor status
+        updated along with the messages. Returns the updated status of those queues, by queue name.
+        The tenant_key (ie. the client) is used by queues whose provider supports_fair_share.
+        """
+    return self._enqueue_batch(
       queue_messages=queue_messages,
       group_key=group_key,
       enqueue_time=coalesce(enqueue_time, unix_timestamp()),
       message_score=message_score,
+      monitor_time=monitor_time,
+      tenant_key=tenant_key,
     )
 
   def _enqueue_batch(
@@ -36,9 +45,14 @@ class BaseQueueService(Service):
     group_key: str | None,
     enqueue_time: int | None,
     message_score: float | None,
-  ) -> None:
+    monitor_time: float | None,
+    tenant_key: str | None,
+  ) -> Mapping[str, Mapping[str, float]]:
     raise NotImplementedError()
 
+  def supports_monitored_enqueue(self, queue_name: str) -> bool:
+    return False
+
   def get_queue_name_from_message_type(self, message_type: str) -> str:
     return self.services.message_router.get_queue_name_from_message_type(message_type)
 
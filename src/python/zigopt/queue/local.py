@@ -26,10 +26,11 @@ class LocalQueueService(BaseQueueService):
   def count_queued_messages(self, queue_name):
     return 0
 
-  def _enqueue_batch(self, queue_messages, group_key, enqueue_time, message_score):
+  def _enqueue_batch(self, queue_messages, group_key, enqueue_time, message_score, monitor_time, tenant_key):
     for queue_message in queue_messages:
       self._buffer.append((queue_message, enqueue_time))
     self._consume_all_buffered()
+    return {}
 
   def _consume_all_buffered(self):
     if not self._corked:
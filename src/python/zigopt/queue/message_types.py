@@ -2,6 +2,7 @@
 #
 # SPDX-License-Identifier: Apache License 2.0
 class MessageType:
+  DELETE_OBSERVATIONS = "delete_observations_messages"
   EMAIL = "email_messages"
   IMPORTANCES = "importances_messages"
   NEXT_POINTS = "next_points_messages"
@@ -0,0 +1,75 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import contextlib
+import time
+
+from zigopt.common import *
+
+
+MESSAGE_LABELS = ("queue", "message_type")
+
+MESSAGES_ENQUEUED = "sigopt_queue_messages_enqueued_total"
+MESSAGE_WAIT_SECONDS = "sigopt_queue_message_wait_seconds"
+MESSAGE_PROCESSING_SECONDS = "sigopt_queue_message_processing_seconds"
+MESSAGES_IN_FLIGHT = "sigopt_queue_messages_in_flight"
+QUEUE_DEPTH = "sigopt_queue_depth"
+
+OUTCOME_PROCESSED = "processed"
+OUTCOME_REJECTED = "rejected"
+OUTCOME_ERROR = "error"
+
+
+def record_enqueue(metrics_registry, queue_name, message_type, count=1):
+  metrics_registry.counter(MESSAGES_ENQUEUED, "Messages enqueued by this process", MESSAGE_LABELS).inc(
+    count,
+    queue=queue_name,
+    message_type=message_type,
+  )
+
+
+class MessageOutcome:
+  def __init__(self):
+    self.outcome = OUTCOME_ERROR
+
+  def set(self, outcome):
+    self.outcome = outcome
+
+
+@contextlib.contextmanager
+def track_message(metrics_registry, queue_name, message):
+  """
+    Records how long a received message waited in the queue, and how long it took to process.
+    Yields a MessageOutcome that the caller sets once it knows whether the message was processed.
+    """
+  labels = dict(queue=queue_name, message_type=message.message_type)
+  metrics_registry.histogram(
+    MESSAGE_WAIT_SECONDS,
+    "Seconds between enqueueing a message and receiving it",
+    MESSAGE_LABELS,
+  ).observe(max(time.time() - message.enqueue_time, 0), **labels)
+  in_flight = metrics_registry.gauge(MESSAGES_IN_FLIGHT, "Messages being processed by this process", MESSAGE_LABELS)
+  outcome = MessageOutcome()
+  in_flight.inc(**labels)
+  start_time = time.perf_counter()
+  try:
+    yield outcome
+  finally:
+    in_flight.dec(**labels)
+    metrics_registry.histogram(
+      MESSAGE_PROCESSING_SECONDS,
+      "Seconds spent processing a received message",
+      (*MESSAGE_LABELS, "outcome"),
+    ).observe(time.perf_counter() - start_time, outcome=outcome.outcome, **labels)
+
+
+def make_queue_depth_collector(queue_service):
+  def collect(metrics_registry):
+    depth = metrics_registry.gauge(QUEUE_DEPTH, "Messages waiting in the queue", ("queue",))
+    for provider in queue_service.providers:
+      try:
+        depth.set(provider.count_queued_messages(), queue=provider.queue_name)
+      except NotImplementedError:
+        pass
+
+  return collect
@@ -1,10 +1,14 @@
 # Copyright © 2022 Intel Corporation
 #
 # SPDX-License-Identifier: Apache License 2.0
+from collections.abc import Sequence
 from datetime import timedelta
 
 from zigopt.common import *
+from zigopt.common.conversions import maybe_decode
 from zigopt.common.sigopt_datetime import unix_timestamp_with_microseconds
+from zigopt.experiment.model import Experiment
+from zigopt.queue.message import QueueMessage
 from zigopt.redis.service import RedisServiceError
 from zigopt.services.base import Service
 
@@ -19,8 +23,12 @@ LAST_ENQUEUE = "last_enqueue"
 LAST_EMPTY = "last_empty"
 
 
+def parse_queue_status(status):
+  return remove_nones_mapping({maybe_decode(key): napply(value, float) for key, value in status.items()})
+
+
 class QueueMonitor(Service):
-  def robust_enqueue(self, queue_messages, experiment):
+  def robust_enqueue(self, queue_messages: Sequence[QueueMessage], experiment: Experiment | None) -> None:
     """
         Enqueue an obeservation. If the queue is down, log an error and proceed in production.
 
@@ -43,15 +51,23 @@ class QueueMonitor(Service):
         queue_names = distinct(
           [self.services.queue_service.get_queue_name_from_message_type(m.message_type) for m in queue_message_batch]
         )
-        for queue_name in queue_names:
-          self.before_enqueue(queue_name, now)
+        monitored_queue_names = [queue_name for queue_name in queue_names if self.should_monitor(queue_name)]
+        # NOTE: Queues that support it update their monitor status as part of the enqueue, which saves
+        # several round trips to check if the queue is empty and update the status
+        for queue_name in monitored_queue_names:
+          if not self.services.queue_service.supports_monitored_enqueue(queue_name):
+            self.before_enqueue(queue_name, now)
         message_score = enqueue_time
-        self.services.queue_service.enqueue_batch(
+        statuses = self.services.queue_service.enqueue_batch(
           queue_messages=queue_message_batch,
           group_key=group_key,
           enqueue_time=enqueue_time,
           message_score=message_score,
+          monitor_time=now if monitored_queue_names else None,
+          tenant_key=napply(experiment, lambda e: str(e.client_id)),
         )
+        for queue_name, queue_status in statuses.items():
+          self.after_monitored_enqueue(queue_name, queue_status, now)
 
   def before_enqueue(self, queue_name, now):
     if self.should_monitor(queue_name):
@@ -75,6 +91,11 @@ class QueueMonitor(Service):
       if not is_empty:
         self.check_for_queue_backup(queue_name, now)
 
+  def after_monitored_enqueue(self, queue_name, queue_status, now):
+    # NOTE: LAST_EMPTY is only updated by the enqueue when the queue was empty
+    if queue_status.get(LAST_EMPTY) != now:
+      self._check_status_for_queue_backup(queue_name, queue_status, now)
+
   def after_dequeue(self, queue_name, message):
     if self.should_monitor(queue_name):
       now = unix_timestamp_with_microseconds()
@@ -85,15 +106,10 @@ class QueueMonitor(Service):
       self.inspect_message(queue_name, message, now)
 
   def _queue_monitor_name(self, queue_name):
-    return self.services.redis_key_service.create_queue_name_key("queue-monitor", queue_name, ":")
+    return self.services.redis_key_service.create_queue_monitor_key(queue_name)
 
   def _get_status(self, queue_name):
-    return remove_nones_mapping(
-      {
-        key.decode(): napply(value, float)
-        for key, value in self.services.redis_service.get_all_hash_fields(self._queue_monitor_name(queue_name)).items()
-      }
-    )
+    return parse_queue_status(self.services.redis_service.get_all_hash_fields(self._queue_monitor_name(queue_name)))
 
   def _update_status(self, queue_name, status):
     with self.services.exception_logger.tolerate_exceptions(RedisServiceError):
@@ -110,29 +126,31 @@ class QueueMonitor(Service):
 
   def check_for_queue_backup(self, queue_name, now):
     with self.services.exception_logger.tolerate_exceptions(RedisServiceError):
-      queue_status = self._get_status(queue_name)
-      last_progress = max_option(
-        remove_nones_sequence(
-          (
-            queue_status.get(LAST_DEQUEUE),
-            queue_status.get(LAST_EMPTY),
-          ),
-        )
+      self._check_status_for_queue_backup(queue_name, self._get_status(queue_name), now)
+
+  def _check_status_for_queue_backup(self, queue_name, queue_status, now):
+    last_progress = max_option(
+      remove_nones_sequence(
+        (
+          queue_status.get(LAST_DEQUEUE),
+          queue_status.get(LAST_EMPTY),
+        ),
       )
-      last_enqueue = queue_status.get(LAST_ENQUEUE)
-      delta_in_seconds = None
-      if last_enqueue is not None and last_progress is not None:
-        delta_in_seconds = last_enqueue - last_progress
-
-      if (
-        self._can_send_alert(queue_status, now)
-        and delta_in_seconds is not None
-        and delta_in_seconds > self.services.config_broker.get("qworker.maxEnqueueDelta", DEFAULT_MAX_ENQUEUE_DELTA)
-      ):
-        self.services.exception_logger.log_exception(
-          "The queues might be backed up - no messages have been processed for a long time.",
-        )
-        self._update_status(queue_name, {LAST_ALERT: now})
+    )
+    last_enqueue = queue_status.get(LAST_ENQUEUE)
+    delta_in_seconds = None
+    if last_enqueue is not None and last_progress is not None:
+      delta_in_seconds = last_enqueue - last_progress
+
+    if (
+      self._can_send_alert(queue_status, now)
+      and delta_in_seconds is not None
+      and delta_in_seconds > self.services.config_broker.get("qworker.maxEnqueueDelta", DEFAULT_MAX_ENQUEUE_DELTA)
+    ):
+      self.services.exception_logger.log_exception(
+        "The queues might be backed up - no messages have been processed for a long time.",
+      )
+      self._update_status(queue_name, {LAST_ALERT: now})
 
   def inspect_message(self, queue_name, message, now):
     enqueue_time = message.enqueue_time
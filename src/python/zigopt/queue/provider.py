@@ -1,18 +1,20 @@
 # Copyright © 2022 Intel Corporation
 #
 # SPDX-License-Identifier: Apache License 2.0
-from collections.abc import Sequence
+from collections.abc import Mapping, Sequence
 
 from zigopt.queue.message import QueueMessage
 
 
 class QueueProviderType:
   REDIS_OPTIMIZE = "redis-optimize"
+  REDIS_FAIR_SHARE = "redis-fair-share"
   REDIS_MESSAGE = "redis-message"
 
 
 class QueueProvider:
   queue_name: str
+  lease_seconds: float | None = None
 
   # Implemented by subclasses
   def __init__(self, services, queue_name: str):
@@ -23,6 +25,29 @@ class QueueProvider:
   def requires_group_key(self) -> bool:
     return False
 
+  @property
+  def supports_monitored_enqueue(self) -> bool:
+    """
+        If True, enqueue accepts a monitor_time and updates the queue monitor status along with the messages,
+        returning the updated status.
+        """
+    return False
+
+  @property
+  def supports_leases(self) -> bool:
+    """
+        If True, dequeued messages are leased for lease_seconds, and they are returned to the queue unless they are
+        deleted before the lease expires. Use extend_lease to keep the lease while the message is processed.
+        """
+    return False
+
+  @property
+  def supports_fair_share(self) -> bool:
+    """
+        If True, enqueue accepts a tenant_key, and messages are shared fairly between tenants when dequeued.
+        """
+    return False
+
   def warmup(self) -> None:
     pass
 
@@ -38,17 +63,44 @@ class QueueProvider:
     group_key: str,
     enqueue_time: int,
     message_score: float,
-  ) -> None:
+    monitor_time: float | None = None,
+  ) -> Mapping[str, float] | None:
     raise NotImplementedError()
 
   def dequeue(self, wait_time_seconds: float | None = None) -> QueueMessage:
     raise NotImplementedError()
 
+  def dequeue_batch(
+    self,
+    max_messages: int,
+    wait_time_seconds: float | None = None,
+    block: bool = True,
+  ) -> list[QueueMessage]:
+    """
+        Dequeues up to max_messages. If block is False, only returns messages that are immediately available.
+        """
+    if not block:
+      return []
+    message = self.dequeue(wait_time_seconds=wait_time_seconds)
+    return [message] if message else []
+
+  def extend_lease(self, received_message: QueueMessage) -> bool:
+    """
+        Returns False if the message is no longer leased, in which case it may be processed again.
+        """
+    return True
+
   def delete(self, received_message: QueueMessage) -> None:
     raise NotImplementedError()
 
   def reject(self, received_message: QueueMessage) -> None:
     raise NotImplementedError()
 
+  def release(self, received_message: QueueMessage) -> None:
+    """
+        Returns a message that was dequeued but never processed, so that it does not count as a failed attempt.
+        """
+    self.reject(received_message)
+
   def purge_queue(self) -> None:
     raise NotImplementedError()
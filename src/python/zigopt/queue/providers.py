@@ -3,6 +3,7 @@
 # SPDX-License-Identifier: Apache License 2.0
 from zigopt.common import *
 from zigopt.queue.provider import QueueProviderType
+from zigopt.queue.redis.fair_share import RedisFairShareQueueProvider
 from zigopt.queue.redis.message import RedisMessageQueueProvider
 from zigopt.queue.redis.optimize import RedisOptimizeQueueProvider
 
@@ -20,6 +21,25 @@ def make_providers(services):
         services,
         queue_name=queue_name,
         wait_time_seconds=queue_info.get("wait_time_seconds", 20),
+        debounce_seconds=queue_info.get("debounce_seconds"),
+        lease_seconds=queue_info.get("lease_seconds"),
+        max_attempts=queue_info.get("max_attempts"),
+        compression_min_bytes=queue_info.get("compression_min_bytes"),
+        legacy_body_encoding=queue_info.get("legacy_body_encoding", False),
+      )
+    elif provider == QueueProviderType.REDIS_FAIR_SHARE:
+      # NOTE: Fair share queues do not lease messages, so these must not be configured for them
+      for unsupported_key in ("lease_seconds", "max_attempts"):
+        assert queue_info.get(unsupported_key) is None, f"{unsupported_key} is not supported by {provider} queues"
+      yield RedisFairShareQueueProvider(
+        services,
+        queue_name=queue_name,
+        wait_time_seconds=queue_info.get("wait_time_seconds", 20),
+        debounce_seconds=queue_info.get("debounce_seconds"),
+        message_type_priorities=queue_info.get("message_type_priorities"),
+        tenant_weights=queue_info.get("tenant_weights"),
+        compression_min_bytes=queue_info.get("compression_min_bytes"),
+        legacy_body_encoding=queue_info.get("legacy_body_encoding", False),
       )
     else:
       assert provider == QueueProviderType.REDIS_MESSAGE
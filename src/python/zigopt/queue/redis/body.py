@@ -0,0 +1,50 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import base64
+import binascii
+import zlib
+
+
+# Persisted message bodies start with a version marker that says how the rest of the body is stored.
+# Legacy bodies are base64 encoded without a marker; the markers are not in the base64 alphabet, so they are
+# never confused with a legacy body.
+BODY_VERSION_RAW = b"\x01"
+BODY_VERSION_ZLIB = b"\x02"
+
+ZLIB_COMPRESSION_LEVEL = 6
+
+
+class MessageBodyDecodeError(Exception):
+  pass
+
+
+def encode_message_body(serialized_body: bytes, compression_min_bytes: int | None = None) -> bytes:
+  """
+    Stores the serialized body as raw bytes, compressed with zlib when it is at least compression_min_bytes long
+    and compressing it makes it smaller.
+    """
+  if compression_min_bytes is not None and len(serialized_body) >= compression_min_bytes:
+    compressed_body = zlib.compress(serialized_body, ZLIB_COMPRESSION_LEVEL)
+    if len(compressed_body) < len(serialized_body):
+      return BODY_VERSION_ZLIB + compressed_body
+  return BODY_VERSION_RAW + serialized_body
+
+
+def encode_legacy_message_body(serialized_body: bytes) -> bytes:
+  return base64.b64encode(serialized_body)
+
+
+def decode_message_body(stored_body: bytes) -> bytes:
+  """
+    Reads bodies in any stored format, so that messages written before an upgrade can still be processed.
+    """
+  version, body = stored_body[:1], stored_body[1:]
+  try:
+    if version == BODY_VERSION_RAW:
+      return body
+    if version == BODY_VERSION_ZLIB:
+      return zlib.decompress(body)
+    return base64.b64decode(stored_body, validate=True)
+  except (binascii.Error, zlib.error) as e:
+    raise MessageBodyDecodeError(f"Invalid persisted message body: {e}") from e
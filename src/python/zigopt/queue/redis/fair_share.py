@@ -0,0 +1,139 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import math
+import time
+
+from zigopt.common import *
+from zigopt.queue.message_types import MessageType
+from zigopt.queue.monitor import LAST_EMPTY, LAST_ENQUEUE, parse_queue_status
+from zigopt.queue.redis.optimize import RedisOptimizeQueueProvider
+
+
+DEFAULT_TENANT = "default"
+
+# Lower priorities are dequeued first
+DEFAULT_MESSAGE_TYPE_PRIORITIES = {
+  MessageType.NEXT_POINTS: 0,
+  MessageType.OPTIMIZE: 1,
+  MessageType.IMPORTANCES: 2,
+}
+
+
+class RedisFairShareQueueProvider(RedisOptimizeQueueProvider):
+  """
+    Redis-based optimization queue that is shared fairly between tenants (ie. clients)
+
+    Each tenant has its own sorted set of messages per priority. Every message of a higher priority message type
+    is dequeued before any message of a lower priority, and within a priority tenants take turns with weighted
+    deficit round robin, so a tenant with many queued messages does not hold up the other tenants.
+    Messages are otherwise stored and ordered the same way as the RedisOptimizeQueueProvider.
+    """
+
+  def __init__(
+    self,
+    services,
+    queue_name,
+    wait_time_seconds=None,
+    debounce_seconds=None,
+    message_type_priorities=None,
+    tenant_weights=None,
+    compression_min_bytes=None,
+    legacy_body_encoding=False,
+  ):
+    # NOTE: Leases are not supported, since expired messages would need to be returned to their tenant's queue
+    super().__init__(
+      services,
+      queue_name,
+      wait_time_seconds=wait_time_seconds,
+      debounce_seconds=debounce_seconds,
+      compression_min_bytes=compression_min_bytes,
+      legacy_body_encoding=legacy_body_encoding,
+    )
+    self.message_type_priorities = coalesce(message_type_priorities, DEFAULT_MESSAGE_TYPE_PRIORITIES)
+    assert all(priority >= 0 for priority in self.message_type_priorities.values())
+    self.tenant_weights = coalesce(tenant_weights, {})
+    assert all(weight > 0 for weight in self.tenant_weights.values())
+    # NOTE: Message types without a priority share the lowest priority
+    self.num_priorities = max(self.message_type_priorities.values(), default=0) + 1
+    self.ready_key = services.redis_key_service.create_fair_share_ready_key(self.redis_key)
+
+  @property
+  def supports_fair_share(self):
+    return True
+
+  def get_priority(self, message_type):
+    return self.message_type_priorities.get(message_type, self.num_priorities - 1)
+
+  def enqueue(self, queue_messages, group_key, enqueue_time, message_score, monitor_time=None, tenant_key=None):
+    tenant = str(coalesce(tenant_key, DEFAULT_TENANT))
+    member_priorities_and_scores = {
+      self._unparse_message_key(queue_message.message_type, group_key): (
+        self.get_priority(queue_message.message_type),
+        self.get_message_score(queue_message.message_type, enqueue_time, message_score),
+      )
+      for queue_message in queue_messages
+    }
+    status_key = None
+    if monitor_time is not None:
+      status_key = self.services.redis_key_service.create_queue_monitor_key(self.queue_name)
+    status = self.services.redis_service.enqueue_fair_share_members(
+      self.redis_key,
+      tenant=tenant,
+      weight=self.tenant_weights.get(tenant, 1),
+      num_priorities=self.num_priorities,
+      member_priorities_and_scores=member_priorities_and_scores,
+      persisted_values=self._get_persisted_message_contents(queue_messages, group_key),
+      expiry_time=self.services.config_broker.get("queue.redis_key_expiry_time", 4 * 60 * 60),
+      status_key=status_key,
+      status={LAST_ENQUEUE: monitor_time},
+      status_if_empty={LAST_EMPTY: monitor_time},
+    )
+    return napply(status, parse_queue_status)
+
+  def dequeue(self, wait_time_seconds=None):
+    return list_get(self.dequeue_batch(1, wait_time_seconds=wait_time_seconds), 0)
+
+  def dequeue_batch(self, max_messages, wait_time_seconds=None, block=True):
+    if self.polls_for_messages:
+      return super().dequeue_batch(max_messages, wait_time_seconds=wait_time_seconds, block=block)
+    popped = self._pop_fair_share(max_messages)
+    if not popped and block:
+      popped = self._wait_and_pop_fair_share(max_messages, coalesce(wait_time_seconds, self.wait_time_seconds))
+    return remove_nones_sequence(
+      [self._make_received_message(message_key, enqueue_time) for message_key, enqueue_time in popped]
+    )
+
+  def _wait_and_pop_fair_share(self, max_messages, wait_time_seconds):
+    # NOTE: The enqueue pushes to the ready list, so an idle consumer can block on it instead of polling.
+    # Another consumer can pop the messages first, so keep waiting until the wait time is up.
+    popped: list[tuple[bytes, float]] = []
+    deadline = time.monotonic() + wait_time_seconds
+    while not popped:
+      remaining_seconds = deadline - time.monotonic()
+      if remaining_seconds <= 0:
+        break
+      if not self.services.redis_service.blocking_list_pop([self.ready_key], timeout=math.ceil(remaining_seconds)):
+        break
+      popped = self._pop_fair_share(max_messages, num_ready_removed=1)
+    return popped
+
+  def _pop_fair_share(self, max_messages, num_ready_removed=0, max_score=None):
+    return self.services.redis_service.pop_fair_share_members(
+      self.redis_key,
+      count=max_messages,
+      num_priorities=self.num_priorities,
+      num_ready_removed=num_ready_removed,
+      max_score=max_score,
+    )
+
+  def _pop_due_from_queue(self, max_messages, max_score):
+    # NOTE: When messages are debounced, the ready list can not tell consumers when messages are due so it is not used
+    popped = self._pop_fair_share(max_messages, max_score=max_score)
+    return [(message_key, score, None) for message_key, score in popped], None
+
+  def count_queued_messages(self):
+    return self.services.redis_service.count_fair_share_members(self.redis_key, self.num_priorities)
+
+  def purge_queue(self):
+    self.services.redis_service.delete_fair_share_queue(self.redis_key, self.num_priorities)
@@ -21,7 +21,7 @@ class RedisMessageQueueProvider(BaseRedisQueueProvider):
   def requires_group_key(self):
     return False
 
-  def enqueue(self, queue_messages, group_key, enqueue_time, message_score):
+  def enqueue(self, queue_messages, group_key, enqueue_time, message_score, monitor_time=None):
     redis_messages = [
       MessageWithName(
         message_type=q.message_type,
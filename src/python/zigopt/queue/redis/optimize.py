@@ -1,17 +1,32 @@
 # Copyright © 2022 Intel Corporation
 #
 # SPDX-License-Identifier: Apache License 2.0
-import base64
+import time
 
 from zigopt.common import *
+from zigopt.common.sigopt_datetime import unix_timestamp_with_microseconds
 from zigopt.queue.message import ReceivedMessage
 from zigopt.queue.message_types import MessageType
+from zigopt.queue.monitor import LAST_EMPTY, LAST_ENQUEUE, parse_queue_status
 from zigopt.queue.redis.base import BaseRedisQueueProvider
+from zigopt.queue.redis.body import (
+  MessageBodyDecodeError,
+  decode_message_body,
+  encode_legacy_message_body,
+  encode_message_body,
+)
 from zigopt.redis.service import RedisServiceTimeoutError
 
 
 DIVIDER = ":"
 
+# While waiting for debounced messages to become due, the queue is checked at least this often so that
+# messages without a debounce are not held up.
+DEBOUNCE_POLLING_SECONDS = 1.0
+MIN_DEBOUNCE_POLLING_SECONDS = 0.05
+
+DEFAULT_MAX_ATTEMPTS = 3
+
 
 class RedisOptimizeQueueProvider(BaseRedisQueueProvider):
   """
@@ -20,42 +35,217 @@ class RedisOptimizeQueueProvider(BaseRedisQueueProvider):
     Uses Redis sorted sets to order messages by timestamp.
     Messages are stored uniquely in the queue by key.
     Key insertions do not overwrite existing values, so messages remain in queue with fixed timestamps until processed
+
+    Message types can be debounced: their score is the earliest time they can be processed, which is the enqueue time
+    plus the debounce. Since keys are not overwritten, a burst of enqueues within the debounce is processed once.
+    Messages are not dequeued before they are due.
+
+    When lease_seconds is set, dequeued messages are leased rather than removed: they are kept in an in-flight set
+    until they are deleted, and the lease must be extended while the message is processed. Expired leases are
+    returned to the queue by the next dequeue, so messages are not lost when a worker dies. Messages that have been
+    leased max_attempts times are moved to a dead letter set instead.
+
+    Persisted message bodies are stored as raw bytes behind a version marker, and bodies of at least
+    compression_min_bytes are compressed. Set legacy_body_encoding to keep writing base64 bodies while older
+    workers that can not read the new format are still running; bodies in either format are always readable.
     """
 
   redis_key_prefix = "queue"
 
+  def __init__(
+    self,
+    services,
+    queue_name,
+    wait_time_seconds=None,
+    debounce_seconds=None,
+    lease_seconds=None,
+    max_attempts=None,
+    compression_min_bytes=None,
+    legacy_body_encoding=False,
+  ):
+    super().__init__(services, queue_name, wait_time_seconds=wait_time_seconds)
+    self.compression_min_bytes = compression_min_bytes
+    self.legacy_body_encoding = legacy_body_encoding
+    self.debounce_seconds = coalesce(debounce_seconds, {})
+    assert all(seconds >= 0 for seconds in self.debounce_seconds.values())
+    self.lease_seconds = lease_seconds
+    assert lease_seconds is None or lease_seconds > 0
+    self.max_attempts = coalesce(max_attempts, DEFAULT_MAX_ATTEMPTS)
+    self.lease_keys = services.redis_key_service.create_queue_lease_keys(self.redis_key)
+
+  @property
+  def supports_leases(self):
+    return self.lease_seconds is not None
+
+  @property
+  def polls_for_messages(self):
+    # NOTE: Debounced and leased messages can not be waited for with a blocking pop, since it ignores scores and
+    # does not lease the message
+    return bool(self.debounce_seconds) or self.supports_leases
+
+  def get_message_score(self, message_type, enqueue_time, message_score):
+    return coalesce(message_score, enqueue_time) + self.debounce_seconds.get(message_type, 0)
+
   @property
   def requires_group_key(self):
     return True
 
-  def enqueue(self, queue_messages, group_key, enqueue_time, message_score):
+  @property
+  def supports_monitored_enqueue(self):
+    return True
+
+  def enqueue(self, queue_messages, group_key, enqueue_time, message_score, monitor_time=None):
     queue_messages_by_key = to_map_by_key(
       queue_messages,
       lambda queue_message: self._unparse_message_key(queue_message.message_type, group_key),
     )
     message_keys_to_scores = {
-      message_key: coalesce(message_score, enqueue_time) for message_key in queue_messages_by_key
+      message_key: self.get_message_score(queue_message.message_type, enqueue_time, message_score)
+      for message_key, queue_message in queue_messages_by_key.items()
     }
 
-    self._persist_message_contents(queue_messages, group_key)
-    self._add_to_queue(self.redis_key, message_keys_to_scores)
+    status_key = None
+    if monitor_time is not None:
+      status_key = self.services.redis_key_service.create_queue_monitor_key(self.queue_name)
+    # NOTE: The message contents, the queue and the queue monitor status are all updated in one round trip
+    status = self.services.redis_service.enqueue_sorted_set_members(
+      self.redis_key,
+      message_keys_to_scores,
+      self._get_persisted_message_contents(queue_messages, group_key),
+      expiry_time=self.services.config_broker.get("queue.redis_key_expiry_time", 4 * 60 * 60),
+      status_key=status_key,
+      status={LAST_ENQUEUE: monitor_time},
+      status_if_empty={LAST_EMPTY: monitor_time},
+    )
+    return napply(status, parse_queue_status)
 
   def dequeue(self, wait_time_seconds=None):
+    if self.polls_for_messages:
+      return list_get(self.dequeue_batch(1, wait_time_seconds=wait_time_seconds), 0)
     wait_time_seconds = coalesce(wait_time_seconds, self.wait_time_seconds)
     message_key, enqueue_time = self._pop_from_queue(self.redis_key, wait_time_seconds)
     if not message_key:
       return None
+    return self._make_received_message(message_key, enqueue_time)
+
+  def _make_received_message(self, message_key, score, lease=None):
     queue_message = self._retrieve_message_contents(message_key)
     if not queue_message:
+      if lease is not None:
+        self._end_lease(lease, requeue=False)
       return None
-    _, group_key = self._parse_message_key(message_key)
+    message_type, group_key = self._parse_message_key(message_key)
     return ReceivedMessage(
       queue_message,
-      handle=None,
-      enqueue_time=enqueue_time,
+      # NOTE: The handle of a leased message is its lease, which is used to extend and end the lease
+      handle=lease,
+      # NOTE: The score of a debounced message is when it is due, so the debounce is removed to recover when it was
+      # enqueued
+      enqueue_time=score - self.debounce_seconds.get(message_type, 0),
       group_key=group_key,
     )
 
+  def dequeue_batch(self, max_messages, wait_time_seconds=None, block=True):
+    if self.polls_for_messages:
+      wait_time_seconds = coalesce(wait_time_seconds, self.wait_time_seconds) if block else 0
+      return remove_nones_sequence(
+        [
+          self._make_received_message(message_key, score, lease=lease)
+          for message_key, score, lease in self._wait_and_pop_due_messages(max_messages, wait_time_seconds)
+        ]
+      )
+    # NOTE: Only blocks for a single message when nothing is immediately available
+    popped = self.services.redis_service.pop_min_from_sorted_set(self.redis_key, count=max_messages)
+    if not popped:
+      if not block:
+        return []
+      return remove_nones_sequence([self.dequeue(wait_time_seconds=wait_time_seconds)])
+    return remove_nones_sequence(
+      [self._make_received_message(message_key, enqueue_time) for message_key, enqueue_time in popped]
+    )
+
+  def _wait_and_pop_due_messages(self, max_messages, wait_time_seconds):
+    # NOTE: Messages can not be waited for with a blocking pop since it ignores the score, so poll until the
+    # earliest message is due instead
+    deadline = time.monotonic() + wait_time_seconds
+    while True:
+      now = unix_timestamp_with_microseconds()
+      popped, next_score = self._pop_due_from_queue(max_messages, now)
+      remaining_seconds = deadline - time.monotonic()
+      if popped or remaining_seconds <= 0:
+        return popped
+      sleep_seconds = min(remaining_seconds, DEBOUNCE_POLLING_SECONDS)
+      if next_score is not None:
+        sleep_seconds = max(min(sleep_seconds, next_score - now), MIN_DEBOUNCE_POLLING_SECONDS)
+      time.sleep(sleep_seconds)
+
+  def _pop_due_from_queue(self, max_messages, max_score):
+    """
+        Returns the popped (message key, score, lease) triples, where the lease is None unless the queue supports
+        leases, and the lowest score of the remaining messages.
+        """
+    if self.supports_leases:
+      return self._lease_due_from_queue(max_messages, max_score)
+    popped, next_score = self.services.redis_service.pop_sorted_set_members_by_max_score(
+      self.redis_key,
+      max_score=max_score,
+      count=max_messages,
+    )
+    return [(message_key, score, None) for message_key, score in popped], next_score
+
+  def _lease_due_from_queue(self, max_messages, now):
+    assert self.lease_seconds is not None
+    leased, next_score, dead_lettered = self.services.redis_service.lease_sorted_set_members(
+      self.lease_keys,
+      now=now,
+      max_score=now,
+      count=max_messages,
+      lease_deadline=now + self.lease_seconds,
+      max_attempts=self.max_attempts,
+    )
+    for message_key in dead_lettered:
+      self.services.exception_logger.soft_exception(
+        f"Message {message_key!r} was moved to the dead letter set after {self.max_attempts} attempts",
+      )
+    return [(message_key, score, lease) for message_key, lease, score, _ in leased], next_score
+
+  def _end_lease(self, lease, requeue, count_attempt=True):
+    ended = self.services.redis_service.end_lease(
+      self.lease_keys,
+      lease,
+      requeue=requeue,
+      max_attempts=self.max_attempts,
+      now=unix_timestamp_with_microseconds(),
+      count_attempt=count_attempt,
+    )
+    if ended == 2:
+      self.services.exception_logger.soft_exception(
+        f"Message with lease {lease!r} was moved to the dead letter set after {self.max_attempts} attempts",
+      )
+
+  def extend_lease(self, received_message):
+    if received_message.handle is None:
+      return True
+    assert self.lease_seconds is not None
+    return self.services.redis_service.extend_lease(
+      self.lease_keys,
+      received_message.handle,
+      lease_deadline=unix_timestamp_with_microseconds() + self.lease_seconds,
+    )
+
+  def delete(self, received_message):
+    if received_message.handle is not None:
+      self._end_lease(received_message.handle, requeue=False)
+
+  def reject(self, received_message):
+    # NOTE: Rejected messages are retried until they have been attempted max_attempts times
+    if received_message.handle is not None:
+      self._end_lease(received_message.handle, requeue=True)
+
+  def release(self, received_message):
+    if received_message.handle is not None:
+      self._end_lease(received_message.handle, requeue=True, count_attempt=False)
+
   def count_queued_messages(self):
     return self.services.redis_service.count_sorted_set(self.redis_key)
 
@@ -89,27 +279,25 @@ class RedisOptimizeQueueProvider(BaseRedisQueueProvider):
     return self.services.redis_key_service.get_key_value(redis_key)
 
   def _encode_serialized_body(self, serialized_body):
-    return base64.b64encode(serialized_body)
+    if self.legacy_body_encoding:
+      return encode_legacy_message_body(serialized_body)
+    return encode_message_body(serialized_body, compression_min_bytes=self.compression_min_bytes)
 
   def _decode_serialized_body(self, serialized_body):
-    return base64.b64decode(serialized_body)
+    return decode_message_body(serialized_body)
 
   def _get_redis_key(self, message_type, group_key):
     return self.services.redis_key_service.create_queue_message_key(message_type, group_key, DIVIDER)
 
-  def _persist_message_contents(self, queue_messages, group_key):
+  def _get_persisted_message_contents(self, queue_messages, group_key):
+    persisted_message_contents = {}
     for queue_message in queue_messages:
       if self._is_persisted_message_type(queue_message.message_type):
         redis_key = self._get_redis_key(queue_message.message_type, group_key)
-        serialized_body = self._encode_serialized_body(queue_message.serialized_body)
-        # TODO: Could use mset here, but need `set` if we want to set an expiry_time
-        self.services.redis_service.set(
-          redis_key,
-          serialized_body,
-          self.services.config_broker.get("queue.redis_key_expiry_time", 4 * 60 * 60),
-        )
+        persisted_message_contents[redis_key] = self._encode_serialized_body(queue_message.serialized_body)
       else:
         self._validate_unpersisted_deserialized_message(queue_message.deserialized_message, group_key)
+    return persisted_message_contents
 
   def _retrieve_message_contents(self, message_key):
     message_type, group_key = self._parse_message_key(message_key)
@@ -119,7 +307,11 @@ class RedisOptimizeQueueProvider(BaseRedisQueueProvider):
       if not persisted_redis_message:
         self.services.exception_logger.soft_exception(f"No persisted message was found for {message_key}")
         return None
-      serialized_body = self._decode_serialized_body(persisted_redis_message)
+      try:
+        serialized_body = self._decode_serialized_body(persisted_redis_message)
+      except MessageBodyDecodeError as e:
+        self.services.exception_logger.soft_exception(f"Could not decode the persisted message for {message_key}: {e}")
+        return None
       message = self.services.message_router.deserialize_message(message_type, serialized_body)
     else:
       message = self.services.message_router.make_queue_message(message_type)
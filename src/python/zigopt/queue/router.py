@@ -3,6 +3,7 @@
 # SPDX-License-Identifier: Apache License 2.0
 from zigopt.email.worker import EmailWorker
 from zigopt.importance.worker import ImportancesWorker
+from zigopt.observation.worker import DeleteObservationsWorker
 from zigopt.optimize.worker import HyperparameterOptimizationWorker, NextPointsWorker
 from zigopt.queue.message import QueueMessage
 from zigopt.queue.message_groups import MessageGroup
@@ -11,6 +12,7 @@ from zigopt.services.base import GlobalService
 
 
 WORKER_CLASSES = [
+  DeleteObservationsWorker,
   EmailWorker,
   HyperparameterOptimizationWorker,
   ImportancesWorker,
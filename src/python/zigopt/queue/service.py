@@ -5,6 +5,7 @@ from collections.abc import Sequence
 
 from zigopt.common import *
 from zigopt.queue.base import BaseQueueService
+from zigopt.queue.metrics import record_enqueue
 from zigopt.queue.provider import QueueProvider
 
 
@@ -30,19 +31,34 @@ class QueueService(BaseQueueService):
   def count_queued_messages(self, queue_name):
     return self.get_provider_from_queue_name(queue_name).count_queued_messages()
 
-  def _enqueue_batch(self, queue_messages, group_key, enqueue_time, message_score):
+  def _enqueue_batch(self, queue_messages, group_key, enqueue_time, message_score, monitor_time, tenant_key):
+    statuses = {}
     if self.enabled:
       for provider, queue_message_batch in as_grouped_dict(
         queue_messages,
         lambda m: self.get_provider_from_message_type(m.message_type),
       ).items():
         assert group_key or not provider.requires_group_key, "Group key not provided"
-        provider.enqueue(
+        provider_kwargs = {}
+        if provider.supports_monitored_enqueue:
+          provider_kwargs["monitor_time"] = monitor_time
+        if provider.supports_fair_share:
+          provider_kwargs["tenant_key"] = tenant_key
+        status = provider.enqueue(
           queue_message_batch,
           group_key=group_key,
           enqueue_time=enqueue_time,
           message_score=message_score,
+          **provider_kwargs,
         )
+        for message_type, messages in as_grouped_dict(queue_message_batch, lambda m: m.message_type).items():
+          record_enqueue(self.services.metrics_registry, provider.queue_name, message_type, len(messages))
+        if provider.supports_monitored_enqueue and status is not None:
+          statuses[provider.queue_name] = status
+    return statuses
+
+  def supports_monitored_enqueue(self, queue_name):
+    return self.enabled and self.get_provider_from_queue_name(queue_name).supports_monitored_enqueue
 
   def test(self, queue_name):
     if self.enabled:
@@ -53,6 +69,26 @@ class QueueService(BaseQueueService):
       return self.get_provider_from_queue_name(queue_name).dequeue(wait_time_seconds=wait_time_seconds)
     return None
 
+  def dequeue_batch(self, queue_name, max_messages, wait_time_seconds=None, block=True):
+    if self.enabled:
+      return self.get_provider_from_queue_name(queue_name).dequeue_batch(
+        max_messages,
+        wait_time_seconds=wait_time_seconds,
+        block=block,
+      )
+    return []
+
+  def get_lease_seconds(self, queue_name):
+    provider = self.get_provider_from_queue_name(queue_name)
+    if self.enabled and provider.supports_leases:
+      return provider.lease_seconds
+    return None
+
+  def extend_lease(self, message, queue_name):
+    if self.enabled:
+      return self.get_provider_from_queue_name(queue_name).extend_lease(message)
+    return True
+
   def delete(self, message, queue_name):
     if self.enabled:
       self.get_provider_from_queue_name(queue_name).delete(message)
@@ -61,6 +97,10 @@ class QueueService(BaseQueueService):
     if self.enabled:
       self.get_provider_from_queue_name(queue_name).reject(message)
 
+  def release(self, message, queue_name):
+    if self.enabled:
+      self.get_provider_from_queue_name(queue_name).release(message)
+
   def get_provider_from_queue_name(self, queue_name: str) -> QueueProvider:
     provider = find(self.providers, lambda p: p.queue_name == queue_name)
     assert provider
@@ -2,12 +2,17 @@
 #
 # SPDX-License-Identifier: Apache License 2.0
 import base64
+import contextlib
 import signal
+import threading
 import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 
 from zigopt.common import *
 from zigopt.common.sigopt_datetime import current_datetime
 from zigopt.exception.logger import AlreadyLoggedException
+from zigopt.profile.request_stats import start_request_stats, stop_request_stats
 from zigopt.profile.tracer import NullTracer
 from zigopt.queue.exceptions import (
   WorkerException,
@@ -15,11 +20,17 @@ from zigopt.queue.exceptions import (
   WorkerInterruptedException,
   WorkerKilledException,
 )
+from zigopt.queue.message import ReceivedMessage
 from zigopt.queue.message_groups import MessageGroup
+from zigopt.queue.metrics import OUTCOME_PROCESSED, OUTCOME_REJECTED, track_message
 
 from libsigopt.aux.errors import SigoptComputeError
 
 
+# Leases are extended this many times per lease, so that a slow extension does not lose the lease
+LEASE_EXTENSIONS_PER_LEASE = 3
+
+
 # A way for the queue workers to detect that it should stop processing messages and shut down.
 # Uses signals so that `sudo service workerd-multi stop` works as expected
 class SignalKillPolicy:
@@ -98,46 +109,60 @@ class QueueWorkers(QueueMessageHandler):
       self.global_services.config_broker.get(f"queue.{self.message_group.value}.max_messages"),
     )
     if max_messages_threshold is None:
-      should_process = True
-    else:
-      max_messages_threshold = max(max_messages_threshold, self.jitter * 2)
-      should_process = self.message_count < max_messages_threshold + self.jitter
-
-    if should_process:
-      return
+      return None
+    max_messages_threshold = max(max_messages_threshold, self.jitter * 2)
+    remaining_messages = max_messages_threshold + self.jitter - self.message_count
+    if remaining_messages > 0:
+      return remaining_messages
     raise WorkerFinishedException()
 
-  def _consume_and_process_one_message(self, queue_name, process_message, wait_time_seconds):
+  def _log_context(self, queue_name):
     consume_time = current_datetime()
-    consumed = False
     self.global_services.exception_logger.reset_extra()
     self.global_services.exception_logger.add_extra(
       consume_time=str(consume_time),
       queue_name=queue_name,
     )
     self.global_services.exception_logger.set_tracer(self.tracer)
+    return consume_time
+
+  def _log_fatal_exception(self, e, consume_time):
+    fail_time = current_datetime()
+    duration = fail_time - consume_time
+    self.global_services.exception_logger.log_exception(
+      e,
+      extra={
+        "time_failed_utc": str(fail_time),
+        "duration": str(duration),
+      },
+    )
+    # Treat unhandled exceptions as fatal, so the process dies and gets respawned.
+    # We want to clean up after unhandled errors (such as MemoryErrors) so that we
+    # are not proceeding in an unrecoverable state
+    self.logger.error("QueueWorkers shutting down due to fatal error")
+
+  def _consume_and_process_one_message(self, queue_name, process_message, wait_time_seconds):
+    consume_time = self._log_context(queue_name)
+    consumed = False
     try:
       consumed = self._consume_message_from_queue(queue_name, process_message, wait_time_seconds)
     except Exception as e:
-      fail_time = current_datetime()
-      duration = fail_time - consume_time
-      self.global_services.exception_logger.log_exception(
-        e,
-        extra={
-          "time_failed_utc": str(fail_time),
-          "duration": str(duration),
-        },
-      )
-      # Treat unhandled exceptions as fatal, so the process dies and gets respawned.
-      # We want to clean up after unhandled errors (such as MemoryErrors) so that we
-      # are not proceeding in an unrecoverable state
-      self.logger.error("QueueWorkers shutting down due to fatal error")
+      self._log_fatal_exception(e, consume_time)
       raise
     if not consumed:
       time.sleep(non_crypto_random.uniform(1, 2))
 
     return consumed
 
+  def _process_message_in_thread(self, queue_name, message, process_message):
+    # NOTE: The exception logger context is thread local, so it is set up again in each worker thread
+    consume_time = self._log_context(queue_name)
+    try:
+      return self._process_received_message(queue_name, message, process_message)
+    except Exception as e:
+      self._log_fatal_exception(e, consume_time)
+      raise
+
   def _consumption_loop(
     self,
     *,
@@ -159,6 +184,90 @@ class QueueWorkers(QueueMessageHandler):
       if exit_if_no_messages and not consumed:
         break
 
+  def _concurrent_consumption_loop(self, *, queue_name, process_message, max_messages, batch_size, concurrency):
+    """
+        Pops up to batch_size messages at a time and processes them on a pool of concurrency threads.
+        Messages with the same group key (ie. for the same experiment) are never processed at the same time.
+        Once a stop condition is reached no more messages are popped, and the messages that have already been
+        popped are processed before the WorkerException is raised.
+        Messages that are waiting for their group have their leases extended here, since _keep_lease only extends
+        the lease of a message once it is being processed.
+        """
+    pending: deque[ReceivedMessage] = deque()
+    in_flight: dict[Future, ReceivedMessage] = {}
+    lease_seconds = self.global_services.queue_service.get_lease_seconds(queue_name)
+    lease_extension_interval = None if lease_seconds is None else lease_seconds / LEASE_EXTENSIONS_PER_LEASE
+    pending_leases_extended_at = time.monotonic()
+    stop_exc: WorkerException | None = None
+    fatal_exc: BaseException | None = None
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="QueueWorkers") as executor:
+      while True:
+        if stop_exc is None and fatal_exc is None:
+          try:
+            remaining_messages = self._check_stop_conditions(base_max_messages=max_messages)
+          except WorkerException as e:
+            stop_exc = e
+
+        if stop_exc is None and fatal_exc is None:
+          num_to_dequeue = min(batch_size, concurrency - len(in_flight) - len(pending))
+          if remaining_messages is not None:
+            num_to_dequeue = min(num_to_dequeue, remaining_messages)
+          if num_to_dequeue > 0:
+            messages = None
+            self._log_context(queue_name)
+            with self.global_services.exception_logger.tolerate_exceptions(Exception):
+              # NOTE: Only block waiting for messages when there is nothing else to do
+              messages = self.global_services.queue_service.dequeue_batch(
+                queue_name,
+                num_to_dequeue,
+                block=not in_flight and not pending,
+              )
+            if messages is None and not in_flight:
+              time.sleep(non_crypto_random.uniform(1, 2))
+            self.message_count += len(messages or [])
+            pending.extend(messages or [])
+
+        if fatal_exc is None:
+          busy_group_keys = {message.group_key for message in in_flight.values() if message.group_key is not None}
+          for message in list(pending):
+            if message.group_key is None or message.group_key not in busy_group_keys:
+              pending.remove(message)
+              busy_group_keys.add(message.group_key)
+              future = executor.submit(self._process_message_in_thread, queue_name, message, process_message)
+              in_flight[future] = message
+
+        if lease_extension_interval is not None and pending:
+          now = time.monotonic()
+          if now - pending_leases_extended_at >= lease_extension_interval:
+            pending_leases_extended_at = now
+            self._extend_pending_leases(queue_name, pending)
+
+        if not in_flight:
+          if fatal_exc is not None:
+            raise fatal_exc
+          if stop_exc is not None and not pending:
+            raise stop_exc
+          continue
+
+        done, _ = wait(in_flight, timeout=min(1, lease_extension_interval or 1), return_when=FIRST_COMPLETED)
+        for future in done:
+          del in_flight[future]
+          future_exc = future.exception()
+          if future_exc is not None and fatal_exc is None:
+            fatal_exc = future_exc
+            # NOTE: The pending messages were never processed, so they are returned without counting an attempt
+            for message in pending:
+              self.global_services.queue_service.release(message, queue_name)
+            pending.clear()
+
+  def _extend_pending_leases(self, queue_name: str, pending: deque[ReceivedMessage]) -> None:
+    for message in list(pending):
+      with self.global_services.exception_logger.tolerate_exceptions(Exception):
+        if not self.global_services.queue_service.extend_lease(message, queue_name):
+          # NOTE: The message may already have been given to another worker, so it is not processed here
+          self.logger.warning("Lost the lease on a pending %s message, skipping it", message.message_type)
+          pending.remove(message)
+
   def run(self, max_messages=None, max_messages_jitter=None):
     self.tracer = NullTracer()
 
@@ -171,16 +280,28 @@ class QueueWorkers(QueueMessageHandler):
     self.message_count = 0
     self.profiler.enable()
 
+    batch_size = self.global_services.config_broker.get(f"queue.{self.message_group.value}.batch_size", 1)
+    concurrency = self.global_services.config_broker.get(f"queue.{self.message_group.value}.concurrency", batch_size)
+
     worker_exc = None
     try:
-      self._consumption_loop(
-        max_messages=max_messages,
-        queue_name=None,
-        process_message=self._process_worker_message,
-        wait_time_seconds=None,
-        message_count_increment=1,
-        exit_if_no_messages=False,
-      )
+      if batch_size > 1 or concurrency > 1:
+        self._concurrent_consumption_loop(
+          queue_name=self.pull_queue_name,
+          process_message=self._process_worker_message,
+          max_messages=max_messages,
+          batch_size=batch_size,
+          concurrency=concurrency,
+        )
+      else:
+        self._consumption_loop(
+          max_messages=max_messages,
+          queue_name=None,
+          process_message=self._process_worker_message,
+          wait_time_seconds=None,
+          message_count_increment=1,
+          exit_if_no_messages=False,
+        )
     except WorkerException as exc:
       worker_exc = exc
 
@@ -197,6 +318,30 @@ class QueueWorkers(QueueMessageHandler):
     if isinstance(worker_exc, WorkerInterruptedException):
       raise worker_exc
 
+  @contextlib.contextmanager
+  def _keep_lease(self, queue_name, message):
+    lease_seconds = self.global_services.queue_service.get_lease_seconds(queue_name)
+    if lease_seconds is None:
+      yield
+      return
+
+    stopped = threading.Event()
+
+    def extend_lease():
+      while not stopped.wait(lease_seconds / LEASE_EXTENSIONS_PER_LEASE):
+        with self.global_services.exception_logger.tolerate_exceptions(Exception):
+          if not self.global_services.queue_service.extend_lease(message, queue_name):
+            self.logger.warning("Lost the lease on a %s message, it may be processed again", message.message_type)
+            return
+
+    thread = threading.Thread(target=extend_lease, name="QueueWorkers.extend_lease", daemon=True)
+    thread.start()
+    try:
+      yield
+    finally:
+      stopped.set()
+      thread.join()
+
   def _process_worker_message(self, worker, services, message):
     self.submit(worker, services, message)
 
@@ -208,6 +353,10 @@ class QueueWorkers(QueueMessageHandler):
       message = self.global_services.queue_service.dequeue(queue_name, wait_time_seconds=wait_time_seconds)
     if not message:
       return False
+    return self._process_received_message(queue_name, message, process_message)
+
+  def _process_received_message(self, queue_name, message, process_message):
+    assert self.tracer is not None
 
     message_type = message.message_type
     self.global_services.exception_logger.add_extra(message_type=message_type)
@@ -243,20 +392,34 @@ class QueueWorkers(QueueMessageHandler):
 
       services = self.request_local_services_factory(self.global_services)
       services.database_service.start_session()
-      try:
-        with self.monitor_message(services, queue_name, message):
-          process_message(WorkerClass, services, message)
-      except SigoptComputeError as e:
-        self.global_services.queue_service.reject(message, queue_name)
-        raise AlreadyLoggedException(e) from e
-      except AssertionError:
-        raise
-      except Exception as e:
-        self.global_services.exception_logger.log_exception(e)
-        self.global_services.queue_service.reject(message, queue_name)
-        raise AlreadyLoggedException(e) from e
-      else:
-        self.global_services.queue_service.delete(message, queue_name)
-      finally:
-        services.database_service.end_session()
+      start_request_stats()
+      with track_message(self.global_services.metrics_registry, queue_name, message) as outcome:
+        try:
+          with self.monitor_message(services, queue_name, message), self._keep_lease(queue_name, message):
+            process_message(WorkerClass, services, message)
+        except SigoptComputeError as e:
+          self.global_services.queue_service.reject(message, queue_name)
+          outcome.set(OUTCOME_REJECTED)
+          raise AlreadyLoggedException(e) from e
+        except AssertionError:
+          raise
+        except Exception as e:
+          self.global_services.exception_logger.log_exception(e)
+          self.global_services.queue_service.reject(message, queue_name)
+          outcome.set(OUTCOME_REJECTED)
+          raise AlreadyLoggedException(e) from e
+        else:
+          self.global_services.queue_service.delete(message, queue_name)
+          outcome.set(OUTCOME_PROCESSED)
+        finally:
+          services.database_service.end_session()
+          if request_stats := stop_request_stats():
+            self.logger.info(
+              "Processed %s message with %d queries in %dms, %d redis commands",
+              message_type,
+              request_stats.query_count,
+              request_stats.query_time_ms,
+              request_stats.redis_command_count,
+              extra=request_stats.log_extra(),
+            )
     return True
@@ -1,10 +1,12 @@
 # Copyright © 2022 Intel Corporation
 #
 # SPDX-License-Identifier: Apache License 2.0
-import datetime as dt
+import threading
+import time
 from typing import Any
 
 from zigopt.common import *
+from zigopt.redis.service import RedisKeyService
 from zigopt.services.base import GlobalService
 
 
@@ -16,12 +18,85 @@ OBJECT_ENUMERATION_RATE_LIMIT = "object-enumeration"
 
 TEN_MINUTES_IN_SECONDS = 60 * 10
 
+FIXED_WINDOW_ALGORITHM = "fixed_window"
+SLIDING_WINDOW_LOG_ALGORITHM = "sliding_window_log"
+GCRA_ALGORITHM = "gcra"
+RATE_LIMIT_ALGORITHMS = (FIXED_WINDOW_ALGORITHM, SLIDING_WINDOW_LOG_ALGORITHM, GCRA_ALGORITHM)
+
+RATE_LIMIT_CONFIG_SECTIONS = {
+  LOGIN_RATE_LIMIT: "login",
+  API_TOKEN_NON_MUTATING_RATE_LIMIT: "token_non_mutating",
+  API_TOKEN_MUTATING_RATE_LIMIT: "token_mutating",
+  OBJECT_ENUMERATION_RATE_LIMIT: "object_enumeration",
+}
+
+# Expired reservations are dropped once this many keys have reservations
+MAX_RESERVATION_KEYS = 10000
+
+
+class LocalReservations:
+  """
+    Attempts that this process has reserved in Redis ahead of time, by rate limit key.
+    The reserved attempts have already been counted against the rate limit, so they can be spent without checking
+    Redis until the window that they were reserved in ends.
+    """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._reservations: dict[str, tuple[int, float]] = {}
+
+  def take(self, key: str) -> bool:
+    with self._lock:
+      remaining, expires_at = self._reservations.get(key, (0, 0.0))
+      if remaining <= 0 or expires_at <= time.monotonic():
+        self._reservations.pop(key, None)
+        return False
+      self._reservations[key] = (remaining - 1, expires_at)
+      return True
+
+  def add(self, key: str, count: int, seconds: float) -> None:
+    now = time.monotonic()
+    with self._lock:
+      if len(self._reservations) >= MAX_RESERVATION_KEYS:
+        self._reservations = {k: v for k, v in self._reservations.items() if v[0] > 0 and v[1] > now}
+        if len(self._reservations) >= MAX_RESERVATION_KEYS:
+          self._reservations.clear()
+      self._reservations[key] = (count, now + seconds)
+
+  def clear(self, key: str) -> None:
+    with self._lock:
+      self._reservations.pop(key, None)
+
 
 class RateLimiter(GlobalService):
+  """
+    Counts attempts in Redis with a single script call per check.
+
+    The fixed_window algorithm (the default) counts the attempts in each window of window_length seconds.
+    sliding_window_log and gcra are smoother: sliding_window_log counts the attempts in the window_length seconds
+    before each attempt, and gcra allows a burst of max_attempts and then spaces attempts evenly.
+
+    With the fixed_window algorithm, a caller that is using less than half of its limit can reserve
+    ratelimit.local_reservation attempts, which this process spends without checking Redis for the rest of the window.
+    Reserved attempts are counted when they are reserved, so the limit is never exceeded, but callers can be limited
+    slightly earlier if reserved attempts go unused across several processes.
+    """
+
+  def __init__(self, services):
+    super().__init__(services)
+    self.local_reservations = LocalReservations()
+
   @property
   def enabled(self) -> bool:
     return self.services.config_broker.get("ratelimit.enabled", True)
 
+  @property
+  def local_reservation(self) -> int:
+    return self._get_value(
+      config_key="ratelimit.local_reservation",
+      default=0,
+    )
+
   def _get_value(self, config_key: str, default: Any) -> Any:
     return self.services.config_broker.get(config_key, default)
 
@@ -97,27 +172,47 @@ class RateLimiter(GlobalService):
       OBJECT_ENUMERATION_RATE_LIMIT: self.object_enumeration_window_length_seconds,
     }[rate_limit_type]
 
-  def _get_snapped_time(self, rate_limit_type: str) -> int:
-    now = self.services.redis_service.get_time()
-    window_length = self.window_length_seconds(rate_limit_type)
-    return now - (now % window_length)
+  def algorithm(self, rate_limit_type: str) -> str:
+    algorithm = self._get_value(
+      config_key=f"ratelimit.{RATE_LIMIT_CONFIG_SECTIONS[rate_limit_type]}.algorithm",
+      default=self._get_value(config_key="ratelimit.algorithm", default=FIXED_WINDOW_ALGORITHM),
+    )
+    assert algorithm in RATE_LIMIT_ALGORITHMS, f"Unknown rate limit algorithm {algorithm}"
+    return algorithm
 
-  def _key(self, rate_limit_type: str, identifier: Any, time: int) -> str:
-    return self.services.redis_key_service.create_rate_limit_key(rate_limit_type, identifier, time)
+  def _key(self, rate_limit_type: str, algorithm: str, identifier: Any) -> RedisKeyService._RedisKey:
+    return self.services.redis_key_service.create_rate_limit_key(rate_limit_type, algorithm, identifier)
 
   def still_within_rate_limit(self, rate_limit_type: str, identifier: Any, increment: bool = True) -> bool:
-    time = self._get_snapped_time(rate_limit_type)
-    key = self._key(rate_limit_type, identifier, time)
-    if increment:
-      count = self.services.redis_service.increment(key)
-    else:
-      count = napply(self.services.redis_service.get(key), int) or 0
-    expiry = 2 * dt.timedelta(seconds=self.window_length_seconds(rate_limit_type))
-    self.services.redis_service.set_expire(key, expiry)
+    algorithm = self.algorithm(rate_limit_type)
+    key = self._key(rate_limit_type, algorithm, identifier)
+    window_length = self.window_length_seconds(rate_limit_type)
     max_attempts = self.max_attempts(rate_limit_type)
-    return count <= max_attempts
+    if algorithm == SLIDING_WINDOW_LOG_ALGORITHM:
+      return self.services.redis_service.sliding_window_log_rate_limit(key, window_length, max_attempts, increment)
+    if algorithm == GCRA_ALGORITHM:
+      return self.services.redis_service.gcra_rate_limit(key, window_length, max_attempts, increment)
+
+    key_value = self.services.redis_key_service.get_key_value(key)
+    if increment and self.local_reservations.take(key_value):
+      return True
+    within_limit, reserved, seconds_left = self.services.redis_service.fixed_window_rate_limit(
+      key,
+      window_length,
+      max_attempts,
+      increment,
+      reserve=self.local_reservation if increment else 0,
+    )
+    if reserved:
+      self.local_reservations.add(key_value, reserved, seconds_left)
+    return within_limit
 
   def clear_rate_limit(self, rate_limit_type: str, identifier: Any) -> None:
-    time = self._get_snapped_time(rate_limit_type)
-    key = self._key(rate_limit_type, identifier, time)
+    algorithm = self.algorithm(rate_limit_type)
+    key = self._key(rate_limit_type, algorithm, identifier)
+    if algorithm == FIXED_WINDOW_ALGORITHM:
+      self.local_reservations.clear(self.services.redis_key_service.get_key_value(key))
+      now = self.services.redis_service.get_time()
+      window_length = self.window_length_seconds(rate_limit_type)
+      key = self.services.redis_key_service.create_rate_limit_window_key(key, now - (now % window_length))
     self.services.redis_service.delete(key)
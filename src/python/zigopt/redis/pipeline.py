@@ -0,0 +1,203 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import datetime
+from collections.abc import Callable, Mapping, Sequence
+from typing import TYPE_CHECKING, Any
+
+from zigopt.common import *
+
+
+if TYPE_CHECKING:
+  from zigopt.redis.service import RedisKeyService, RedisService
+
+
+# Queues a command on a redis-py pipeline, and parses its reply
+PipelineCommand = tuple[Callable[[Any], Any], Callable[[Any], Any]]
+
+
+class RedisPipeline:
+  """
+    Batches commands to be sent to Redis in a single round trip.
+    Commands take the same keys and arguments as the RedisService methods of the same name, and their results are
+    returned from execute in the order that they were queued. When used as a context manager the pipeline is executed
+    on exit, and its results are available from results.
+
+    When transaction is True the commands are wrapped in MULTI/EXEC, so no other client sees a partial batch.
+    The batch is retried on failure like the RedisService methods only if every command in it is idempotent.
+    """
+
+  def __init__(self, redis_service: "RedisService", transaction: bool = False):
+    self.redis_service = redis_service
+    self.transaction = transaction
+    self.idempotent = True
+    self.results: list[Any] | None = None
+    self._commands: list[PipelineCommand] = []
+
+  def __enter__(self) -> "RedisPipeline":
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb) -> None:
+    if exc_type is None and self.results is None:
+      self.execute()
+
+  def __len__(self) -> int:
+    return len(self._commands)
+
+  def execute(self) -> list[Any]:
+    assert self.results is None, "RedisPipeline has already been executed"
+    self.results = self.redis_service.execute_pipeline(
+      self._commands,
+      transaction=self.transaction,
+      retry=self.idempotent,
+    )
+    return self.results
+
+  def _key_value(self, redis_key: "RedisKeyService._RedisKey") -> str:
+    return self.redis_service.services.redis_key_service.get_key_value(redis_key)
+
+  def _queue(
+    self,
+    command: Callable[[Any], Any],
+    parse: Callable[[Any], Any] = identity,
+    idempotent: bool = True,
+  ) -> "RedisPipeline":
+    assert self.results is None, "RedisPipeline has already been executed"
+    self._commands.append((command, parse))
+    self.idempotent = self.idempotent and idempotent
+    return self
+
+  def get(self, redis_key: "RedisKeyService._RedisKey") -> "RedisPipeline":
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.get(key_value))
+
+  def set(self, redis_key: "RedisKeyService._RedisKey", value: Any, expiry_time: int | None = None) -> "RedisPipeline":
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.set(key_value, value=value, ex=expiry_time))
+
+  def increment(self, redis_key: "RedisKeyService._RedisKey") -> "RedisPipeline":
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.incr(key_value), idempotent=False)
+
+  def set_expire_at(self, redis_key: "RedisKeyService._RedisKey", expire_at: datetime.datetime) -> "RedisPipeline":
+    assert isinstance(expire_at, datetime.datetime)
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.expireat(key_value, expire_at))
+
+  def set_expire(self, redis_key: "RedisKeyService._RedisKey", expire: datetime.timedelta) -> "RedisPipeline":
+    assert isinstance(expire, datetime.timedelta)
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.expire(key_value, expire))
+
+  def exists(self, redis_key: "RedisKeyService._RedisKey") -> "RedisPipeline":
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.exists(key_value), parse=bool)
+
+  def count_sorted_set(self, redis_key: "RedisKeyService._RedisKey") -> "RedisPipeline":
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.zcard(key_value))
+
+  def add_sorted_set_new(
+    self,
+    redis_key: "RedisKeyService._RedisKey",
+    member_score_tuples: Mapping[str, float] | Sequence[tuple[str, float]],
+  ) -> "RedisPipeline":
+    key_value = self._key_value(redis_key)
+    mapping = dict(member_score_tuples)
+    return self._queue(lambda p: p.zadd(key_value, mapping, ch=True, nx=True))
+
+  def get_sorted_set_range(
+    self,
+    redis_key: "RedisKeyService._RedisKey",
+    min_index: int,
+    max_index: int,
+    reverse: bool = False,
+    withscores: bool = False,
+  ) -> "RedisPipeline":
+    key_value = self._key_value(redis_key)
+    if reverse:
+      return self._queue(lambda p: p.zrevrange(key_value, min_index, max_index, withscores=withscores))
+    return self._queue(lambda p: p.zrange(key_value, min_index, max_index, withscores=withscores))
+
+  def remove_from_sorted_set(self, redis_key: "RedisKeyService._RedisKey", *members: bytes | str) -> "RedisPipeline":
+    assert members
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.zrem(key_value, *members))
+
+  def add_to_set(self, redis_key: "RedisKeyService._RedisKey", *members: bytes | str) -> "RedisPipeline":
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.sadd(key_value, *members))
+
+  def get_set_members(self, redis_key: "RedisKeyService._RedisKey") -> "RedisPipeline":
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.smembers(key_value), parse=list)
+
+  def set_hash_fields(
+    self,
+    redis_key: "RedisKeyService._RedisKey",
+    mapping: Mapping[str, bytes | str] | Mapping[bytes | str, bytes | str],
+  ) -> "RedisPipeline":
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.hset(key_value, mapping=mapping))
+
+  def get_all_hash_fields(self, redis_key: "RedisKeyService._RedisKey") -> "RedisPipeline":
+    # NOTE: Unlike RedisService.get_all_hash_fields this reads the hash with HGETALL, since HSCAN can not be pipelined
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.hgetall(key_value), parse=dict)
+
+  def remove_from_hash(self, redis_key: "RedisKeyService._RedisKey", *fields: bytes | str) -> "RedisPipeline":
+    assert fields
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.hdel(key_value, *fields))
+
+  def list_push(self, redis_key: "RedisKeyService._RedisKey", *members: bytes | str) -> "RedisPipeline":
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.rpush(key_value, *members))
+
+  def delete(self, redis_key: "RedisKeyService._RedisKey") -> "RedisPipeline":
+    key_value = self._key_value(redis_key)
+    return self._queue(lambda p: p.delete(key_value))
+
+  def set_if_version(
+    self,
+    redis_key: "RedisKeyService._RedisKey",
+    version_key: "RedisKeyService._RedisKey",
+    version: bytes | None,
+    value: bytes | str | int | Mapping[str, bytes | str | int],
+    expire: datetime.timedelta,
+  ) -> "RedisPipeline":
+    key_values = [self._key_value(redis_key), self._key_value(version_key)]
+    args = self.redis_service.make_set_if_version_args(version, value, expire)
+    return self._queue(
+      lambda p: self.redis_service.get_script("SET_IF_VERSION_SCRIPT")(keys=key_values, args=args, client=p),
+      parse=bool,
+    )
+
+  def increment_versioned(
+    self,
+    redis_key: "RedisKeyService._RedisKey",
+    version_key: "RedisKeyService._RedisKey",
+    increments: int | Mapping[str, int],
+    expire: datetime.timedelta,
+    maxima: Mapping[str, int] | None = None,
+  ) -> "RedisPipeline":
+    key_values = [self._key_value(redis_key), self._key_value(version_key)]
+    args = self.redis_service.make_increment_versioned_args(increments, expire, maxima)
+    return self._queue(
+      lambda p: self.redis_service.get_script("INCREMENT_VERSIONED_SCRIPT")(keys=key_values, args=args, client=p),
+      parse=bool,
+      idempotent=False,
+    )
+
+  def run_script(
+    self,
+    script_name: str,
+    keys: Sequence["RedisKeyService._RedisKey"],
+    args: Sequence[Any],
+    idempotent: bool = False,
+  ) -> "RedisPipeline":
+    key_values = [self._key_value(k) for k in keys]
+    return self._queue(
+      lambda p: self.redis_service.get_script(script_name)(keys=key_values, args=args, client=p),
+      idempotent=idempotent,
+    )
@@ -3,17 +3,21 @@
 # SPDX-License-Identifier: Apache License 2.0
 import datetime
 import functools
+import uuid
 from collections.abc import Callable, Mapping, Sequence
-from typing import Any, ParamSpec, TypeVar
+from typing import Any, NamedTuple, ParamSpec, TypeVar
 
 import backoff
 import redis
+from redis.commands.core import Script
 
 from zigopt.common import *
 from zigopt.common.conversions import maybe_decode
 from zigopt.common.lists import distinct, list_get
 from zigopt.common.sigopt_datetime import datetime_to_seconds
 from zigopt.common.strings import is_string
+from zigopt.profile.request_stats import current_request_stats
+from zigopt.redis.pipeline import PipelineCommand, RedisPipeline
 from zigopt.services.base import GlobalService
 
 
@@ -69,6 +73,8 @@ def ensure_redis(func: TWrapped) -> TWrapped:
       if not self.redis or not self.blocking_conn_redis:
         uri = self.get_redis_uri()
         raise RedisServiceError(f"Attempting to access Redis but failed to connect to {uri}")
+    if request_stats := current_request_stats():
+      request_stats.add_redis_command()
     return func(self, *args, **kwargs)
 
   return wrapper
@@ -88,6 +94,7 @@ class RedisKeyService(GlobalService):
   # Keeps track of all methods used to generate redis keys to ensure that there are no collisions
 
   DIVIDER = ":"
+  QUEUE_MONITOR_PREFIX = "queue-monitor"
   QUEUE_TRACKING_PREFIX = "tracking"
 
   key_value: str
@@ -150,6 +157,21 @@ class RedisKeyService(GlobalService):
       f"optimized_run_count{self.DIVIDER}organization{self.DIVIDER}{int(organization_id)}{window_start_str}"
     )
 
+  @decode_args
+  def create_observation_counts_key(self, experiment_id: int) -> _RedisKey:
+    return self._RedisKey(f"observation_counts{self.DIVIDER}experiment{self.DIVIDER}{int(experiment_id)}")
+
+  def create_cache_version_key(self, redis_key: _RedisKey) -> _RedisKey:
+    # NOTE: See RedisService.SET_IF_VERSION_SCRIPT
+    return self._RedisKey(f"{self.get_key_value(redis_key)}{self.DIVIDER}version")
+
+  @decode_args
+  def create_counter_key(self, counter_name: str, *scope: Any) -> _RedisKey:
+    return self._RedisKey(self.DIVIDER.join(["counter", counter_name, *(str(s) for s in scope)]))
+
+  def create_stagnation_state_key(self, experiment_id: int) -> _RedisKey:
+    return self._RedisKey(f"stagnation_state{self.DIVIDER}experiment{self.DIVIDER}{int(experiment_id)}")
+
   def _assemble_queue_key(self, prefix: str, suffix: str, divider: str) -> _RedisKey:
     assert divider not in prefix
     return self._RedisKey(f"{prefix}{divider}{suffix}")
@@ -159,6 +181,24 @@ class RedisKeyService(GlobalService):
     assert divider not in queue_name
     return self._assemble_queue_key(redis_key_prefix, queue_name, divider)
 
+  def create_fair_share_ready_key(self, queue_key: _RedisKey) -> _RedisKey:
+    # NOTE: Must match the key used by RedisService.ENQUEUE_FAIR_SHARE_MEMBERS_SCRIPT
+    return self._RedisKey(f"{self.get_key_value(queue_key)}{self.DIVIDER}ready")
+
+  def create_queue_lease_keys(self, queue_key: _RedisKey) -> "QueueLeaseKeys":
+    queue_key_value = self.get_key_value(queue_key)
+    return QueueLeaseKeys(
+      queue=queue_key,
+      in_flight=self._RedisKey(f"{queue_key_value}{self.DIVIDER}in-flight"),
+      scores=self._RedisKey(f"{queue_key_value}{self.DIVIDER}leased-scores"),
+      attempts=self._RedisKey(f"{queue_key_value}{self.DIVIDER}attempts"),
+      dead_letter=self._RedisKey(f"{queue_key_value}{self.DIVIDER}dead-letter"),
+    )
+
+  @decode_args
+  def create_queue_monitor_key(self, queue_name: str) -> _RedisKey:
+    return self._assemble_queue_key(self.QUEUE_MONITOR_PREFIX, queue_name, self.DIVIDER)
+
   @decode_args
   def create_queue_tracking_key(self, queue_name: str) -> _RedisKey:
     return self._assemble_queue_key(self.QUEUE_TRACKING_PREFIX, queue_name, self.DIVIDER)
@@ -168,8 +208,22 @@ class RedisKeyService(GlobalService):
     return self._assemble_queue_key(message_type, group_key, divider)
 
   @decode_args
-  def create_rate_limit_key(self, rate_limit_type: str, time: int, identifier: Any) -> _RedisKey:
-    return self._RedisKey(f"rate-limit{self.DIVIDER}{rate_limit_type}{self.DIVIDER}{time}{self.DIVIDER}{identifier}")
+  def create_rate_limit_key(self, rate_limit_type: str, algorithm: str, identifier: Any) -> _RedisKey:
+    return self._RedisKey(
+      f"rate-limit{self.DIVIDER}{rate_limit_type}{self.DIVIDER}{algorithm}{self.DIVIDER}{identifier}"
+    )
+
+  def create_rate_limit_window_key(self, rate_limit_key: _RedisKey, window_start: int) -> _RedisKey:
+    # NOTE: Must match the key used by RedisService.FIXED_WINDOW_RATE_LIMIT_SCRIPT
+    return self._RedisKey(f"{self.get_key_value(rate_limit_key)}{self.DIVIDER}{window_start}")
+
+
+class QueueLeaseKeys(NamedTuple):
+  queue: RedisKeyService._RedisKey
+  in_flight: RedisKeyService._RedisKey
+  scores: RedisKeyService._RedisKey
+  attempts: RedisKeyService._RedisKey
+  dead_letter: RedisKeyService._RedisKey
 
 
 class RedisService(GlobalService):
@@ -178,10 +232,472 @@ class RedisService(GlobalService):
   SHORT_TIMEOUT = 1.0  # in seconds
   POLLING_TIMEOUT = 30.0  # in seconds
 
+  # NOTE: A versioned cache stores a value at KEYS[1] and a version at KEYS[2], which writers increment with
+  # INVALIDATE_VERSIONED_SCRIPT after they change the source of truth. Readers read the version before they compute a
+  # missing value from its source of truth, and then store the value only if the version has not changed, so that a
+  # value computed before a write is never stored after the write has invalidated it.
+  # ARGV is the version that was read (empty if it was missing), the expiry in seconds and whether the value is a hash
+  # (1 or 0), followed by either the value or the (field, value) pairs of the hash.
+  # Returns 1 if the value was stored and 0 otherwise.
+  SET_IF_VERSION_SCRIPT = """
+    if (redis.call("GET", KEYS[2]) or "") ~= ARGV[1] then
+      return 0
+    end
+    redis.call("DEL", KEYS[1])
+    if ARGV[3] == "1" then
+      for i = 4, #ARGV, 2 do
+        redis.call("HSET", KEYS[1], ARGV[i], ARGV[i + 1])
+      end
+    else
+      redis.call("SET", KEYS[1], ARGV[4])
+    end
+    redis.call("EXPIRE", KEYS[1], ARGV[2])
+    return 1
+  """
+
+  # NOTE: KEYS are (value, version) pairs of versioned caches, see SET_IF_VERSION_SCRIPT. ARGV[1] is the expiry of
+  # the versions in seconds, which must be longer than it takes to compute a value.
+  INVALIDATE_VERSIONED_SCRIPT = """
+    for i = 1, #KEYS, 2 do
+      redis.call("DEL", KEYS[i])
+      redis.call("INCR", KEYS[i + 1])
+      redis.call("EXPIRE", KEYS[i + 1], ARGV[1])
+    end
+  """
+
+  # NOTE: KEYS are the value and version of a versioned cache, see SET_IF_VERSION_SCRIPT. Writers whose write is an
+  # increment call this instead of INVALIDATE_VERSIONED_SCRIPT after they change the source of truth. The version is
+  # incremented, so that a value computed before the write is never stored after it, and a cached value is updated
+  # rather than deleted. A missing value is left missing, to be rebuilt from its source of truth.
+  # ARGV is the expiry of the version in seconds and whether the value is a hash (1 or 0), followed by either the
+  # increment of the value or (field, amount, operation) triples of the hash. The operation is "incr" to increment
+  # the field by the amount, or "max" to set the field to the amount if it is greater.
+  # Returns 1 if the value was updated and 0 if it was missing.
+  INCREMENT_VERSIONED_SCRIPT = """
+    redis.call("INCR", KEYS[2])
+    redis.call("EXPIRE", KEYS[2], ARGV[1])
+    if redis.call("EXISTS", KEYS[1]) == 0 then
+      return 0
+    end
+    if ARGV[2] == "1" then
+      for i = 3, #ARGV, 3 do
+        if ARGV[i + 2] == "max" then
+          local current = tonumber(redis.call("HGET", KEYS[1], ARGV[i]) or ARGV[i + 1])
+          if tonumber(ARGV[i + 1]) > current then
+            redis.call("HSET", KEYS[1], ARGV[i], ARGV[i + 1])
+          end
+        else
+          redis.call("HINCRBY", KEYS[1], ARGV[i], ARGV[i + 1])
+        end
+      end
+    else
+      redis.call("INCRBY", KEYS[1], ARGV[3])
+    end
+    return 1
+  """
+
+  # NOTE: The rate limit scripts read the time from Redis so that every server agrees on it, and ARGV starts with
+  # the window length in seconds, the maximum attempts in a window and whether to increment (1 or 0).
+  # Returns 1 if the caller is within the rate limit and 0 otherwise.
+  RATE_LIMIT_SCRIPT_PREAMBLE = """
+    local window = tonumber(ARGV[1])
+    local max_attempts = tonumber(ARGV[2])
+    local increment = ARGV[3] == "1"
+    local time = redis.call("TIME")
+  """
+
+  # NOTE: Counts attempts in fixed windows: the key of the current window is KEYS[1]:<window start>.
+  # ARGV[4] is the number of attempts to reserve for the caller, which are only reserved if the caller is using less
+  # than half of the limit. Returns whether the caller is within the rate limit, the number of reserved attempts and
+  # the number of seconds left in the window.
+  FIXED_WINDOW_RATE_LIMIT_SCRIPT = (
+    RATE_LIMIT_SCRIPT_PREAMBLE
+    + """
+    local now = tonumber(time[1])
+    local window_start = now - (now % window)
+    local key = KEYS[1] .. ":" .. window_start
+    local count
+    local reserved = 0
+    if increment then
+      count = redis.call("INCR", key)
+      local reserve = tonumber(ARGV[4])
+      if reserve > 0 and 2 * (count + reserve) <= max_attempts then
+        redis.call("INCRBY", key, reserve)
+        reserved = reserve
+      end
+    else
+      count = tonumber(redis.call("GET", key) or "0")
+    end
+    redis.call("EXPIRE", key, 2 * window)
+    return {count <= max_attempts and 1 or 0, reserved, window_start + window - now}
+  """
+  )
+
+  # NOTE: KEYS[1] is a sorted set of the times of the attempts in the last window.
+  # Attempts that exceed the rate limit are not recorded, so that they do not extend it.
+  SLIDING_WINDOW_LOG_RATE_LIMIT_SCRIPT = (
+    RATE_LIMIT_SCRIPT_PREAMBLE
+    + """
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now - window)
+    local count = redis.call("ZCARD", KEYS[1])
+    if not increment then
+      return count <= max_attempts and 1 or 0
+    end
+    if count + 1 > max_attempts then
+      return 0
+    end
+    redis.call("ZADD", KEYS[1], now, time[1] .. "." .. time[2] .. ":" .. count)
+    redis.call("PEXPIRE", KEYS[1], math.ceil(window * 1000))
+    return 1
+  """
+  )
+
+  # NOTE: Generic cell rate algorithm: KEYS[1] is the theoretical arrival time of the next attempt, which moves
+  # forward by window / max_attempts for each attempt. Bursts of up to max_attempts are allowed, after which attempts
+  # are spaced evenly. Attempts that exceed the rate limit are not recorded.
+  GCRA_RATE_LIMIT_SCRIPT = (
+    RATE_LIMIT_SCRIPT_PREAMBLE
+    + """
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local interval = window / max_attempts
+    local tat = math.max(tonumber(redis.call("GET", KEYS[1]) or "0"), now)
+    if not increment then
+      return tat - now <= window and 1 or 0
+    end
+    local next_tat = tat + interval
+    -- NOTE: Tolerates rounding errors, so that exactly max_attempts are allowed in a burst
+    if next_tat - now > window + 1e-6 then
+      return 0
+    end
+    redis.call("SET", KEYS[1], string.format("%.6f", next_tat), "PX", math.ceil((next_tat - now) * 1000))
+    return 1
+  """
+  )
+
+  # NOTE: KEYS are the sorted set, the keys to persist values at and optionally a status hash.
+  # ARGV is the expiry of the persisted values, the number of persisted values, the values,
+  # the number of members followed by (score, member) pairs, and then when there is a status hash:
+  # the number of status fields followed by (field, value) pairs, then (field, value) pairs that are only
+  # set if the sorted set was empty.
+  # Returns the contents of the status hash after the update.
+  ENQUEUE_SORTED_SET_MEMBERS_SCRIPT = """
+    local was_empty = redis.call("ZCARD", KEYS[1]) == 0
+    local num_values = tonumber(ARGV[2])
+    local i = 3
+    for k = 2, num_values + 1 do
+      redis.call("SET", KEYS[k], ARGV[i], "EX", ARGV[1])
+      i = i + 1
+    end
+    local num_members = tonumber(ARGV[i])
+    i = i + 1
+    for _ = 1, num_members do
+      redis.call("ZADD", KEYS[1], "NX", ARGV[i], ARGV[i + 1])
+      i = i + 2
+    end
+    local status_key = KEYS[num_values + 2]
+    if not status_key then
+      return nil
+    end
+    local num_status_fields = tonumber(ARGV[i])
+    i = i + 1
+    for _ = 1, num_status_fields do
+      redis.call("HSET", status_key, ARGV[i], ARGV[i + 1])
+      i = i + 2
+    end
+    while i <= #ARGV do
+      if was_empty then
+        redis.call("HSET", status_key, ARGV[i], ARGV[i + 1])
+      end
+      i = i + 2
+    end
+    return redis.call("HGETALL", status_key)
+  """
+
+  # NOTE: KEYS[1] is the sorted set, ARGV is the maximum score and the maximum number of members to pop.
+  # Returns the popped members and scores, flattened, and the lowest score that remains (if any).
+  POP_SORTED_SET_MEMBERS_BY_MAX_SCORE_SCRIPT = """
+    local popped = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "WITHSCORES", "LIMIT", 0, ARGV[2])
+    for i = 1, #popped, 2 do
+      redis.call("ZREM", KEYS[1], popped[i])
+    end
+    local next_member = redis.call("ZRANGE", KEYS[1], 0, 0, "WITHSCORES")
+    return {popped, next_member[2] or false}
+  """
+
+  # NOTE: The lease scripts share KEYS: the queue sorted set, the in-flight sorted set of leases (scored by lease
+  # deadline), a hash of the queue scores of leases, a hash of attempt counts and the dead letter sorted set.
+  # Each lease is the member followed by "|" and a token that is unique to the lease, so that a member that is
+  # enqueued again while it is leased can be leased by another consumer without sharing the lease.
+  # The attempt counts are kept by lease while a member is leased, and by member while a member that was returned to
+  # the queue waits to be leased again. A member that is enqueued again is not returned to the queue, so its next lease
+  # starts counting from the first attempt.
+  # An expired lease is returned to the queue with its original score, unless the member has been leased
+  # max_attempts times, in which case it is moved to the dead letter set. A lease that is ended without counting
+  # the attempt (ie. because the member was never processed) is always returned to the queue.
+  LEASE_SCRIPT_FUNCTIONS = """
+    local function end_lease(lease, requeue, count_attempt, max_attempts, now)
+      if redis.call("ZREM", KEYS[2], lease) == 0 then
+        return 0
+      end
+      local score = redis.call("HGET", KEYS[3], lease)
+      local attempts = tonumber(redis.call("HGET", KEYS[4], lease) or "0")
+      redis.call("HDEL", KEYS[3], lease)
+      redis.call("HDEL", KEYS[4], lease)
+      if not requeue then
+        return 1
+      end
+      local member = string.match(lease, "^(.*)|[^|]*$")
+      if not count_attempt then
+        attempts = attempts - 1
+      elseif attempts >= max_attempts then
+        redis.call("ZADD", KEYS[5], now, member)
+        return 2
+      end
+      -- NOTE: When the member has been enqueued again in the meantime, its attempts are not carried over
+      if redis.call("ZADD", KEYS[1], "NX", score or now, member) == 1 and attempts > 0 then
+        redis.call("HSET", KEYS[4], member, attempts)
+      end
+      return 1
+    end
+  """
+
+  # NOTE: ARGV is the current time, the maximum score, the maximum number of members to lease, the lease deadline,
+  # max_attempts, the maximum number of expired leases to reap and a lease token for each member to lease.
+  # Returns the leased (member, lease, score, attempts) tuples flattened, the lowest remaining score (if any)
+  # and the members that were moved to the dead letter set.
+  LEASE_SORTED_SET_MEMBERS_SCRIPT = (
+    LEASE_SCRIPT_FUNCTIONS
+    + """
+    local now = ARGV[1]
+    local max_attempts = tonumber(ARGV[5])
+    local dead_lettered = {}
+    for _, lease in ipairs(redis.call("ZRANGEBYSCORE", KEYS[2], "-inf", now, "LIMIT", 0, ARGV[6])) do
+      if end_lease(lease, true, true, max_attempts, now) == 2 then
+        table.insert(dead_lettered, string.match(lease, "^(.*)|[^|]*$"))
+      end
+    end
+    local popped = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[2], "WITHSCORES", "LIMIT", 0, ARGV[3])
+    local leased = {}
+    for i = 1, #popped, 2 do
+      local member = popped[i]
+      local lease = member .. "|" .. ARGV[6 + (i + 1) / 2]
+      local attempts = tonumber(redis.call("HGET", KEYS[4], member) or "0") + 1
+      redis.call("ZREM", KEYS[1], member)
+      redis.call("HDEL", KEYS[4], member)
+      redis.call("ZADD", KEYS[2], ARGV[4], lease)
+      redis.call("HSET", KEYS[3], lease, popped[i + 1])
+      redis.call("HSET", KEYS[4], lease, attempts)
+      table.insert(leased, member)
+      table.insert(leased, lease)
+      table.insert(leased, popped[i + 1])
+      table.insert(leased, attempts)
+    end
+    local next_member = redis.call("ZRANGE", KEYS[1], 0, 0, "WITHSCORES")
+    return {leased, next_member[2] or false, dead_lettered}
+  """
+  )
+
+  # NOTE: ARGV is the lease, whether to requeue its member (1 or 0), whether to count the attempt (1 or 0),
+  # max_attempts and the current time.
+  # Returns 0 if the lease had already ended, 2 if its member was moved to the dead letter set and 1 otherwise.
+  END_LEASE_SCRIPT = (
+    LEASE_SCRIPT_FUNCTIONS
+    + """
+    return end_lease(ARGV[1], ARGV[2] == "1", ARGV[3] == "1", tonumber(ARGV[4]), ARGV[5])
+  """
+  )
+
+  # NOTE: A fair share queue is made of priority bands, each of which has a sorted set of members per tenant
+  # and a list of the tenants with members, in round robin order. The keys of a fair share queue are derived from
+  # KEYS[1] inside the scripts, so they are only suitable for a single (non-clustered) Redis instance.
+  FAIR_SHARE_QUEUE_KEYS_SCRIPT = """
+    local function tenants_key(base, priority)
+      return base .. ":p" .. priority .. ":tenants"
+    end
+    local function tenant_queue_key(base, priority, tenant)
+      return base .. ":p" .. priority .. ":t:" .. tenant
+    end
+  """
+
+  # NOTE: KEYS are the base key of the queue, the keys to persist values at and optionally a status hash.
+  # ARGV is the expiry of the persisted values, the number of persisted values, the values, the tenant, its weight,
+  # the number of priorities, the number of members followed by (priority, score, member) triples,
+  # and then the status arguments of ENQUEUE_SORTED_SET_MEMBERS_SCRIPT.
+  # A tenant is added to the round robin of a priority when its sorted set for that priority was empty.
+  # Returns the contents of the status hash after the update.
+  ENQUEUE_FAIR_SHARE_MEMBERS_SCRIPT = (
+    FAIR_SHARE_QUEUE_KEYS_SCRIPT
+    + """
+    local base = KEYS[1]
+    local num_values = tonumber(ARGV[2])
+    local i = 3
+    for k = 2, num_values + 1 do
+      redis.call("SET", KEYS[k], ARGV[i], "EX", ARGV[1])
+      i = i + 1
+    end
+    local tenant = ARGV[i]
+    redis.call("HSET", base .. ":weights", tenant, ARGV[i + 1])
+    local num_priorities = tonumber(ARGV[i + 2])
+    local was_empty = true
+    for priority = 0, num_priorities - 1 do
+      if redis.call("EXISTS", tenants_key(base, priority)) == 1 then
+        was_empty = false
+      end
+    end
+    local num_members = tonumber(ARGV[i + 3])
+    i = i + 4
+    for _ = 1, num_members do
+      local queue_key = tenant_queue_key(base, ARGV[i], tenant)
+      if redis.call("ZCARD", queue_key) == 0 then
+        redis.call("RPUSH", tenants_key(base, ARGV[i]), tenant)
+      end
+      redis.call("ZADD", queue_key, "NX", ARGV[i + 1], ARGV[i + 2])
+      i = i + 3
+    end
+    -- Wakes up a blocked consumer for each member, see RedisKeyService.create_fair_share_ready_key
+    for _ = 1, num_members do
+      redis.call("RPUSH", base .. ":ready", 1)
+    end
+    redis.call("LTRIM", base .. ":ready", -1000, -1)
+    local status_key = KEYS[num_values + 2]
+    if not status_key then
+      return nil
+    end
+    local num_status_fields = tonumber(ARGV[i])
+    i = i + 1
+    for _ = 1, num_status_fields do
+      redis.call("HSET", status_key, ARGV[i], ARGV[i + 1])
+      i = i + 2
+    end
+    while i <= #ARGV do
+      if was_empty then
+        redis.call("HSET", status_key, ARGV[i], ARGV[i + 1])
+      end
+      i = i + 2
+    end
+    return redis.call("HGETALL", status_key)
+  """
+  )
+
+  # NOTE: KEYS[1] is the base key of the queue, ARGV is the maximum number of members to pop, the number
+  # of priorities, the number of entries of the ready list that were already removed by the caller and the maximum
+  # score of the members to pop. Lower priorities are drained first. Within a priority, tenants take turns with
+  # deficit round robin: each turn adds the tenant's weight to its deficit, and it pops one member per unit of deficit.
+  # Tenants whose lowest score is above the maximum score skip their turn without adding to their deficit.
+  # One entry of the ready list is removed for each popped member, so that it stays close to the number of members.
+  # Returns the popped (member, score) pairs, flattened.
+  POP_FAIR_SHARE_MEMBERS_SCRIPT = (
+    FAIR_SHARE_QUEUE_KEYS_SCRIPT
+    + """
+    local base = KEYS[1]
+    local count = tonumber(ARGV[1])
+    local num_priorities = tonumber(ARGV[2])
+    local max_score = ARGV[4]
+    local deficits_key = base .. ":deficits"
+    local popped = {}
+    for priority = 0, num_priorities - 1 do
+      local round_robin_key = tenants_key(base, priority)
+      local num_skipped = 0
+      while #popped < 2 * count do
+        local tenant = redis.call("LINDEX", round_robin_key, 0)
+        if not tenant or num_skipped >= redis.call("LLEN", round_robin_key) then
+          break
+        end
+        local queue_key = tenant_queue_key(base, priority, tenant)
+        if #redis.call("ZRANGEBYSCORE", queue_key, "-inf", max_score, "LIMIT", 0, 1) == 0 then
+          redis.call("RPUSH", round_robin_key, redis.call("LPOP", round_robin_key))
+          num_skipped = num_skipped + 1
+        else
+          num_skipped = 0
+          local deficit_field = priority .. ":" .. tenant
+          local deficit = tonumber(redis.call("HGET", deficits_key, deficit_field) or "0")
+          if deficit < 1 then
+            deficit = deficit + tonumber(redis.call("HGET", base .. ":weights", tenant) or "1")
+          end
+          while deficit >= 1 and #popped < 2 * count do
+            local item = redis.call("ZRANGEBYSCORE", queue_key, "-inf", max_score, "WITHSCORES", "LIMIT", 0, 1)
+            if #item == 0 then
+              break
+            end
+            redis.call("ZREM", queue_key, item[1])
+            table.insert(popped, item[1])
+            table.insert(popped, item[2])
+            deficit = deficit - 1
+          end
+          if redis.call("ZCARD", queue_key) == 0 then
+            redis.call("LPOP", round_robin_key)
+            redis.call("HDEL", deficits_key, deficit_field)
+          else
+            redis.call("HSET", deficits_key, deficit_field, deficit)
+            if deficit < 1 then
+              redis.call("RPUSH", round_robin_key, redis.call("LPOP", round_robin_key))
+            end
+          end
+        end
+      end
+    end
+    local num_ready_to_remove = #popped / 2 - tonumber(ARGV[3])
+    if num_ready_to_remove > 0 then
+      redis.call("LTRIM", base .. ":ready", num_ready_to_remove, -1)
+    end
+    return popped
+  """
+  )
+
+  # NOTE: KEYS[1] is the base key of the queue, ARGV[1] is the number of priorities.
+  # Returns the number of members in the queue.
+  COUNT_FAIR_SHARE_MEMBERS_SCRIPT = (
+    FAIR_SHARE_QUEUE_KEYS_SCRIPT
+    + """
+    local count = 0
+    for priority = 0, tonumber(ARGV[1]) - 1 do
+      for _, tenant in ipairs(redis.call("LRANGE", tenants_key(KEYS[1], priority), 0, -1)) do
+        count = count + redis.call("ZCARD", tenant_queue_key(KEYS[1], priority, tenant))
+      end
+    end
+    return count
+  """
+  )
+
+  # NOTE: KEYS[1] is the base key of the queue, ARGV[1] is the number of priorities.
+  DELETE_FAIR_SHARE_QUEUE_SCRIPT = (
+    FAIR_SHARE_QUEUE_KEYS_SCRIPT
+    + """
+    for priority = 0, tonumber(ARGV[1]) - 1 do
+      for _, tenant in ipairs(redis.call("LRANGE", tenants_key(KEYS[1], priority), 0, -1)) do
+        redis.call("DEL", tenant_queue_key(KEYS[1], priority, tenant))
+      end
+      redis.call("DEL", tenants_key(KEYS[1], priority))
+    end
+    redis.call("DEL", KEYS[1] .. ":deficits", KEYS[1] .. ":weights", KEYS[1] .. ":ready")
+  """
+  )
+
+  # The scripts that can be run with get_script. They are loaded into Redis on warmup, and then run by their SHA1
+  # so that the script source is not sent with every call.
+  SCRIPTS: dict[str, str] = {
+    "SET_IF_VERSION_SCRIPT": SET_IF_VERSION_SCRIPT,
+    "INVALIDATE_VERSIONED_SCRIPT": INVALIDATE_VERSIONED_SCRIPT,
+    "INCREMENT_VERSIONED_SCRIPT": INCREMENT_VERSIONED_SCRIPT,
+    "ENQUEUE_SORTED_SET_MEMBERS_SCRIPT": ENQUEUE_SORTED_SET_MEMBERS_SCRIPT,
+    "POP_SORTED_SET_MEMBERS_BY_MAX_SCORE_SCRIPT": POP_SORTED_SET_MEMBERS_BY_MAX_SCORE_SCRIPT,
+    "LEASE_SORTED_SET_MEMBERS_SCRIPT": LEASE_SORTED_SET_MEMBERS_SCRIPT,
+    "END_LEASE_SCRIPT": END_LEASE_SCRIPT,
+    "ENQUEUE_FAIR_SHARE_MEMBERS_SCRIPT": ENQUEUE_FAIR_SHARE_MEMBERS_SCRIPT,
+    "POP_FAIR_SHARE_MEMBERS_SCRIPT": POP_FAIR_SHARE_MEMBERS_SCRIPT,
+    "COUNT_FAIR_SHARE_MEMBERS_SCRIPT": COUNT_FAIR_SHARE_MEMBERS_SCRIPT,
+    "DELETE_FAIR_SHARE_QUEUE_SCRIPT": DELETE_FAIR_SHARE_QUEUE_SCRIPT,
+    "FIXED_WINDOW_RATE_LIMIT_SCRIPT": FIXED_WINDOW_RATE_LIMIT_SCRIPT,
+    "SLIDING_WINDOW_LOG_RATE_LIMIT_SCRIPT": SLIDING_WINDOW_LOG_RATE_LIMIT_SCRIPT,
+    "GCRA_RATE_LIMIT_SCRIPT": GCRA_RATE_LIMIT_SCRIPT,
+  }
+
   def __init__(self, services):
     super().__init__(services)
     self.redis = None
     self.blocking_conn_redis = None
+    self._scripts: dict[str, tuple[redis.Redis, Script]] = {}
 
   @property
   def enabled(self) -> bool:
@@ -265,6 +781,7 @@ class RedisService(GlobalService):
           self.services.config_broker.get("redis"),
           socket_timeout=self.POLLING_TIMEOUT,
         )
+        self._load_scripts()
       except AssertionError:
         raise
       except Exception:  # pylint: disable=broad-except
@@ -277,6 +794,52 @@ class RedisService(GlobalService):
     else:
       self.logger.warning("redis disabled")
 
+  def _load_scripts(self) -> None:
+    assert self.redis is not None
+    for script_source in self.SCRIPTS.values():
+      self.redis.script_load(script_source)
+
+  def get_script(self, script_name: str) -> Script:
+    """
+        Returns the script registered on the current connection.
+        If the script has been flushed from Redis then it is loaded again when it is next run.
+        """
+    script_source = self.SCRIPTS.get(script_name)
+    if script_source is None:
+      raise ValueError(f"Unknown script {script_name}")
+    assert self.redis is not None
+    registered = self._scripts.get(script_name)
+    if registered is not None:
+      registered_client, script = registered
+      if registered_client is self.redis:
+        return script
+    script = self.redis.register_script(script_source)
+    self._scripts[script_name] = (self.redis, script)
+    return script
+
+  def pipeline(self, transaction: bool = False) -> RedisPipeline:
+    return RedisPipeline(self, transaction=transaction)
+
+  def execute_pipeline(self, commands: Sequence[PipelineCommand], transaction: bool, retry: bool) -> list[Any]:
+    if retry:
+      return self._execute_pipeline_with_retry(commands, transaction)
+    return self._execute_pipeline(commands, transaction)
+
+  @retry_on_failure
+  def _execute_pipeline_with_retry(self, commands: Sequence[PipelineCommand], transaction: bool) -> list[Any]:
+    return self._execute_pipeline(commands, transaction)
+
+  @ensure_redis
+  def _execute_pipeline(self, commands: Sequence[PipelineCommand], transaction: bool) -> list[Any]:
+    assert self.redis is not None
+    if not commands:
+      return []
+    with self.redis.pipeline(transaction=transaction) as pipeline:
+      for command, _ in commands:
+        command(pipeline)
+      replies = pipeline.execute()
+    return [parse(reply) for (_, parse), reply in zip(commands, replies)]
+
   @retry_on_failure
   @ensure_redis
   def get(self, redis_key: RedisKeyService._RedisKey) -> bytes:
@@ -338,6 +901,113 @@ class RedisService(GlobalService):
       nx=True,
     )
 
+  @retry_on_failure
+  @ensure_redis
+  def enqueue_sorted_set_members(
+    self,
+    redis_key: RedisKeyService._RedisKey,
+    member_scores: Mapping[str, float],
+    persisted_values: Mapping[RedisKeyService._RedisKey, bytes],
+    expiry_time: int,
+    status_key: RedisKeyService._RedisKey | None = None,
+    status: Mapping[str, float] | None = None,
+    status_if_empty: Mapping[str, float] | None = None,
+  ) -> Mapping[bytes, bytes] | None:
+    """
+        In a single round trip: sets persisted_values with an expiry, adds the new members of member_scores to the
+        sorted set, and updates the status hash (if provided). Fields of status_if_empty are only set if
+        the sorted set was empty before the members were added.
+        Returns the contents of the status hash after the update.
+        """
+    assert self.redis is not None
+    keys = [redis_key, *persisted_values.keys()]
+    args: list[bytes | str | int | float] = [int(expiry_time), len(persisted_values), *persisted_values.values()]
+    args.append(len(member_scores))
+    for member, score in member_scores.items():
+      args.extend([score, member])
+    if status_key is not None:
+      keys.append(status_key)
+      status = status or {}
+      args.append(len(status))
+      for field, value in [*status.items(), *(status_if_empty or {}).items()]:
+        args.extend([field, value])
+    script = self.get_script("ENQUEUE_SORTED_SET_MEMBERS_SCRIPT")
+    response = script(keys=[self.services.redis_key_service.get_key_value(k) for k in keys], args=args)
+    if response is None:
+      return None
+    return dict(zip(response[::2], response[1::2]))
+
+  @retry_on_failure
+  @ensure_redis
+  def enqueue_fair_share_members(
+    self,
+    redis_key: RedisKeyService._RedisKey,
+    tenant: str,
+    weight: float,
+    num_priorities: int,
+    member_priorities_and_scores: Mapping[str, tuple[int, float]],
+    persisted_values: Mapping[RedisKeyService._RedisKey, bytes],
+    expiry_time: int,
+    status_key: RedisKeyService._RedisKey | None = None,
+    status: Mapping[str, float] | None = None,
+    status_if_empty: Mapping[str, float] | None = None,
+  ) -> Mapping[bytes, bytes] | None:
+    """
+        The fair share equivalent of enqueue_sorted_set_members. Members are added to the tenant's sorted set for
+        their priority, and the tenant's weight is recorded for pop_fair_share_members.
+        """
+    assert self.redis is not None
+    assert weight > 0
+    assert all(0 <= priority < num_priorities for priority, _ in member_priorities_and_scores.values())
+    keys = [redis_key, *persisted_values.keys()]
+    args: list[bytes | str | int | float] = [int(expiry_time), len(persisted_values), *persisted_values.values()]
+    args.extend([tenant, weight, num_priorities, len(member_priorities_and_scores)])
+    for member, (priority, score) in member_priorities_and_scores.items():
+      args.extend([priority, score, member])
+    if status_key is not None:
+      keys.append(status_key)
+      status = status or {}
+      args.append(len(status))
+      for field, value in [*status.items(), *(status_if_empty or {}).items()]:
+        args.extend([field, value])
+    script = self.get_script("ENQUEUE_FAIR_SHARE_MEMBERS_SCRIPT")
+    response = script(keys=[self.services.redis_key_service.get_key_value(k) for k in keys], args=args)
+    if response is None:
+      return None
+    return dict(zip(response[::2], response[1::2]))
+
+  @ensure_redis
+  def pop_fair_share_members(
+    self,
+    redis_key: RedisKeyService._RedisKey,
+    count: int,
+    num_priorities: int,
+    num_ready_removed: int = 0,
+    max_score: float | None = None,
+  ) -> list[tuple[bytes, float]]:
+    assert self.redis is not None
+    # NOTE: Not retried, since a retry after a successful pop would lose the popped members
+    script = self.get_script("POP_FAIR_SHARE_MEMBERS_SCRIPT")
+    response = script(
+      keys=[self.services.redis_key_service.get_key_value(redis_key)],
+      args=[count, num_priorities, num_ready_removed, "+inf" if max_score is None else max_score],
+    )
+    return [(member, float(score)) for member, score in zip(response[::2], response[1::2])]
+
+  @retry_on_failure
+  @ensure_redis
+  def count_fair_share_members(self, redis_key: RedisKeyService._RedisKey, num_priorities: int) -> int:
+    assert self.redis is not None
+    script = self.get_script("COUNT_FAIR_SHARE_MEMBERS_SCRIPT")
+    return script(keys=[self.services.redis_key_service.get_key_value(redis_key)], args=[num_priorities])
+
+  @retry_on_failure
+  @ensure_redis
+  def delete_fair_share_queue(self, redis_key: RedisKeyService._RedisKey, num_priorities: int) -> None:
+    assert self.redis is not None
+    script = self.get_script("DELETE_FAIR_SHARE_QUEUE_SCRIPT")
+    script(keys=[self.services.redis_key_service.get_key_value(redis_key)], args=[num_priorities])
+
   @retry_on_failure
   @ensure_redis
   def get_sorted_set_range(
@@ -375,6 +1045,104 @@ class RedisService(GlobalService):
       timeout = int(self.POLLING_TIMEOUT - 1)
     return max(1, timeout)
 
+  @ensure_redis
+  def pop_sorted_set_members_by_max_score(
+    self,
+    redis_key: RedisKeyService._RedisKey,
+    max_score: float,
+    count: int,
+  ) -> tuple[list[tuple[bytes, float]], float | None]:
+    """
+        Pops up to count of the lowest scoring members with a score of at most max_score.
+        Returns the popped members with their scores, and the lowest score of the remaining members.
+        """
+    assert self.redis is not None
+    # NOTE: Not retried, since a retry after a successful pop would lose the popped members
+    script = self.get_script("POP_SORTED_SET_MEMBERS_BY_MAX_SCORE_SCRIPT")
+    popped, next_score = script(
+      keys=[self.services.redis_key_service.get_key_value(redis_key)], args=[max_score, count]
+    )
+    return [(member, float(score)) for member, score in zip(popped[::2], popped[1::2])], napply(next_score, float)
+
+  @ensure_redis
+  def lease_sorted_set_members(
+    self,
+    lease_keys: "QueueLeaseKeys",
+    now: float,
+    max_score: float,
+    count: int,
+    lease_deadline: float,
+    max_attempts: int,
+    max_reaped: int = 100,
+  ) -> tuple[list[tuple[bytes, bytes, float, int]], float | None, list[bytes]]:
+    """
+        Returns expired leases to the queue, then leases up to count of the lowest scoring members with a score of at
+        most max_score until lease_deadline.
+        Returns the leased members with their leases, scores and attempt counts, the lowest score of the remaining
+        members and the members that have been moved to the dead letter set. The lease is used to extend and end it.
+        """
+    assert self.redis is not None
+    # NOTE: Not retried, since a retry after a successful lease would lose the leased members until they expire
+    script = self.get_script("LEASE_SORTED_SET_MEMBERS_SCRIPT")
+    tokens = [uuid.uuid4().hex for _ in range(count)]
+    leased, next_score, dead_lettered = script(
+      keys=[self.services.redis_key_service.get_key_value(k) for k in lease_keys],
+      args=[now, max_score, count, lease_deadline, max_attempts, max_reaped, *tokens],
+    )
+    return (
+      [
+        (member, lease, float(score), int(attempts))
+        for member, lease, score, attempts in zip(leased[::4], leased[1::4], leased[2::4], leased[3::4])
+      ],
+      napply(next_score, float),
+      dead_lettered,
+    )
+
+  @retry_on_failure
+  @ensure_redis
+  def extend_lease(self, lease_keys: "QueueLeaseKeys", lease: bytes | str, lease_deadline: float) -> bool:
+    """
+        Returns False if the lease has ended, ie. because it expired and was reaped.
+        """
+    assert self.redis is not None
+    return bool(
+      self.redis.zadd(
+        self.services.redis_key_service.get_key_value(lease_keys.in_flight),
+        {lease: lease_deadline},
+        xx=True,
+        ch=True,
+      )
+    )
+
+  @ensure_redis
+  def end_lease(
+    self,
+    lease_keys: "QueueLeaseKeys",
+    lease: bytes | str,
+    requeue: bool,
+    max_attempts: int,
+    now: float,
+    count_attempt: bool = True,
+  ) -> int:
+    """
+        Ends a lease from lease_sorted_set_members. If requeue is True then the member is returned to the queue, or
+        moved to the dead letter set when it has been leased max_attempts times. If count_attempt is False then the
+        lease does not count towards max_attempts.
+        Returns 0 if the lease had already ended, 2 if the member was moved to the dead letter set and 1 otherwise.
+        """
+    assert self.redis is not None
+    script = self.get_script("END_LEASE_SCRIPT")
+    return script(
+      keys=[self.services.redis_key_service.get_key_value(k) for k in lease_keys],
+      args=[lease, int(requeue), int(count_attempt), max_attempts, now],
+    )
+
+  @ensure_redis
+  def pop_min_from_sorted_set(self, redis_key: RedisKeyService._RedisKey, count: int = 1) -> list[tuple[bytes, float]]:
+    assert self.redis is not None
+    # NOTE: Not retried, since a retry after a successful pop would lose the popped members
+    return self.redis.zpopmin(self.services.redis_key_service.get_key_value(redis_key), count=count)
+
   @ensure_redis
   def blocking_pop_min_from_sorted_set(
     self, redis_keys: Sequence[RedisKeyService._RedisKey], timeout: int | None = None
@@ -418,9 +1186,181 @@ class RedisService(GlobalService):
 
   @retry_on_failure
   @ensure_redis
-  def set_hash_fields(self, redis_key: RedisKeyService._RedisKey, mapping: Mapping[bytes | str, bytes | str]) -> int:
+  def set_hash_fields(
+    self,
+    redis_key: RedisKeyService._RedisKey,
+    mapping: Mapping[bytes | str, bytes | str],
+    expire: datetime.timedelta | None = None,
+  ) -> int:
+    assert self.redis is not None
+    key_value = self.services.redis_key_service.get_key_value(redis_key)
+    if expire is None:
+      return self.redis.hset(key_value, mapping=mapping)
+    assert isinstance(expire, datetime.timedelta)
+    pipeline = self.redis.pipeline(transaction=True)
+    pipeline.hset(key_value, mapping=mapping)
+    pipeline.expire(key_value, expire)
+    num_added, _ = pipeline.execute()
+    return num_added
+
+  @staticmethod
+  def make_set_if_version_args(
+    version: bytes | None,
+    value: bytes | str | int | Mapping[str, bytes | str | int],
+    expire: datetime.timedelta,
+  ) -> list[bytes | str | int]:
+    assert isinstance(expire, datetime.timedelta)
+    args: list[bytes | str | int] = [version or b"", int(expire.total_seconds())]
+    if isinstance(value, Mapping):
+      assert value, "Redis hashes can not be empty"
+      args.append(1)
+      for field, field_value in value.items():
+        args.extend([field, field_value])
+    else:
+      args.extend([0, value])
+    return args
+
+  @retry_on_failure
+  @ensure_redis
+  def set_if_version(
+    self,
+    redis_key: RedisKeyService._RedisKey,
+    version_key: RedisKeyService._RedisKey,
+    version: bytes | None,
+    value: bytes | str | int | Mapping[str, bytes | str | int],
+    expire: datetime.timedelta,
+  ) -> bool:
+    """
+        Stores value (a string, or a hash if it is a mapping) at redis_key with an expiry, unless the cache has been
+        invalidated since version was read from version_key. See SET_IF_VERSION_SCRIPT.
+        """
     assert self.redis is not None
-    return self.redis.hset(self.services.redis_key_service.get_key_value(redis_key), mapping=mapping)
+    script = self.get_script("SET_IF_VERSION_SCRIPT")
+    return bool(
+      script(
+        keys=[self.services.redis_key_service.get_key_value(k) for k in (redis_key, version_key)],
+        args=self.make_set_if_version_args(version, value, expire),
+      )
+    )
+
+  @staticmethod
+  def make_increment_versioned_args(
+    increments: int | Mapping[str, int],
+    expire: datetime.timedelta,
+    maxima: Mapping[str, int] | None = None,
+  ) -> list[str | int]:
+    assert isinstance(expire, datetime.timedelta)
+    args: list[str | int] = [int(expire.total_seconds())]
+    if isinstance(increments, Mapping):
+      args.append(1)
+      for field, amount in increments.items():
+        args.extend([field, int(amount), "incr"])
+      for field, maximum in (maxima or {}).items():
+        args.extend([field, int(maximum), "max"])
+    else:
+      assert not maxima, "Only the fields of a hash can be maxima"
+      args.extend([0, int(increments)])
+    return args
+
+  @ensure_redis
+  def increment_versioned(
+    self,
+    redis_key: RedisKeyService._RedisKey,
+    version_key: RedisKeyService._RedisKey,
+    increments: int | Mapping[str, int],
+    expire: datetime.timedelta,
+    maxima: Mapping[str, int] | None = None,
+  ) -> bool:
+    """
+        Increments the value of a versioned cache (or the fields of a hash), and raises the fields of maxima to at
+        least the given values, if the value is cached. See INCREMENT_VERSIONED_SCRIPT.
+        Unlike invalidate_versioned this is not retried, since retrying an increment could apply it twice.
+        """
+    assert self.redis is not None
+    script = self.get_script("INCREMENT_VERSIONED_SCRIPT")
+    return bool(
+      script(
+        keys=[self.services.redis_key_service.get_key_value(k) for k in (redis_key, version_key)],
+        args=self.make_increment_versioned_args(increments, expire, maxima),
+      )
+    )
+
+  @retry_on_failure
+  @ensure_redis
+  def invalidate_versioned(
+    self,
+    redis_keys: Sequence[RedisKeyService._RedisKey],
+    expire: datetime.timedelta,
+  ) -> None:
+    """
+        Deletes the values of versioned caches and increments their versions, see SET_IF_VERSION_SCRIPT.
+        Retrying is safe, since incrementing a version twice only invalidates it twice.
+        """
+    assert self.redis is not None
+    assert isinstance(expire, datetime.timedelta)
+    if not redis_keys:
+      return
+    keys = []
+    for redis_key in redis_keys:
+      keys.extend([redis_key, self.services.redis_key_service.create_cache_version_key(redis_key)])
+    script = self.get_script("INVALIDATE_VERSIONED_SCRIPT")
+    script(
+      keys=[self.services.redis_key_service.get_key_value(k) for k in keys],
+      args=[int(expire.total_seconds())],
+    )
+
+  @ensure_redis
+  def fixed_window_rate_limit(
+    self,
+    redis_key: RedisKeyService._RedisKey,
+    window_length: int,
+    max_attempts: int,
+    increment: bool,
+    reserve: int = 0,
+  ) -> tuple[bool, int, int]:
+    """
+        Returns whether the caller is within the rate limit, the number of attempts that were reserved for the caller
+        and the number of seconds until the window ends.
+        """
+    assert self.redis is not None
+    # NOTE: Not retried, since a retry after a successful increment would count the attempt twice
+    within_limit, reserved, seconds_left = self.get_script("FIXED_WINDOW_RATE_LIMIT_SCRIPT")(
+      keys=[self.services.redis_key_service.get_key_value(redis_key)],
+      args=[window_length, max_attempts, int(increment), reserve],
+    )
+    return bool(within_limit), int(reserved), int(seconds_left)
+
+  @ensure_redis
+  def sliding_window_log_rate_limit(
+    self,
+    redis_key: RedisKeyService._RedisKey,
+    window_length: int,
+    max_attempts: int,
+    increment: bool,
+  ) -> bool:
+    assert self.redis is not None
+    return bool(
+      self.get_script("SLIDING_WINDOW_LOG_RATE_LIMIT_SCRIPT")(
+        keys=[self.services.redis_key_service.get_key_value(redis_key)],
+        args=[window_length, max_attempts, int(increment)],
+      )
+    )
+
+  @ensure_redis
+  def gcra_rate_limit(
+    self,
+    redis_key: RedisKeyService._RedisKey,
+    window_length: int,
+    max_attempts: int,
+    increment: bool,
+  ) -> bool:
+    assert self.redis is not None
+    return bool(
+      self.get_script("GCRA_RATE_LIMIT_SCRIPT")(
+        keys=[self.services.redis_key_service.get_key_value(redis_key)],
+        args=[window_length, max_attempts, int(increment)],
+      )
+    )
 
   @retry_on_failure
   @ensure_redis
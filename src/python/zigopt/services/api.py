@@ -7,6 +7,7 @@ from zigopt.common import *
 from zigopt.best_practices.service import BestPracticesService
 from zigopt.checkpoint.service import CheckpointService
 from zigopt.client.service import ClientService
+from zigopt.counter.service import CounterService
 from zigopt.db.service import DatabaseConnectionService, DatabaseService
 from zigopt.email.list import EmailTemplates
 from zigopt.email.queue import EmailQueueService
@@ -18,10 +19,11 @@ from zigopt.experiment.best import ExperimentBestObservationService
 from zigopt.experiment.progress import ExperimentProgressService
 from zigopt.experiment.segmenter import ExperimentParameterSegmenter
 from zigopt.experiment.service import ExperimentService
+from zigopt.experiment.stopping_criteria import ExperimentStoppingCriteriaService
 from zigopt.file.s3_user_upload_service import S3UserUploadService
 from zigopt.file.service import FileService
 from zigopt.iam_logging.service import IamLoggingService
-from zigopt.importance.service import ImportancesService
+from zigopt.importance.service import ImportancesForestCache, ImportancesService
 from zigopt.invite.service import InviteService
 from zigopt.log.service import LoggingService
 from zigopt.membership.service import MembershipService
@@ -35,10 +37,12 @@ from zigopt.organization.service import OrganizationService
 from zigopt.pagination.query import QueryPager
 from zigopt.permission.pending.service import PendingPermissionService
 from zigopt.permission.service import PermissionService
+from zigopt.profile.metrics import MetricsRegistry
 from zigopt.project.service import ProjectService
 from zigopt.queue.base import BaseQueueService
 from zigopt.queue.grouper import QueueMessageGrouper
 from zigopt.queue.local import LocalQueueService
+from zigopt.queue.metrics import make_queue_depth_collector
 from zigopt.queue.monitor import QueueMonitor
 from zigopt.queue.providers import make_providers
 from zigopt.queue.router import MessageRouter
@@ -68,9 +72,11 @@ class ApiServiceBagProtocol:
   email_router: EmailRouterService
   exception_logger: ExceptionLogger
   immediate_email_sender: EmailSenderService
+  importances_forest_cache: ImportancesForestCache
   logging_service: LoggingService
   message_router: MessageRouter
   message_tracking_service: MessageTrackingService
+  metrics_registry: MetricsRegistry
   queue_message_grouper: QueueMessageGrouper
   rate_limiter: RateLimiter
   redis_service: RedisService
@@ -92,9 +98,11 @@ class ApiServiceBag(ServiceBag, ApiServiceBagProtocol):  # pylint: disable=too-m
     self.email_router = EmailRouterService(self, is_qworker=self.is_qworker)
     self.exception_logger = ExceptionLogger(self)
     self.immediate_email_sender = EmailSenderService(self)
+    self.importances_forest_cache = ImportancesForestCache(self)
     self.logging_service = LoggingService(self)
     self.message_router = MessageRouter(self)
     self.message_tracking_service = MessageTrackingService(self)
+    self.metrics_registry = MetricsRegistry(self)
     self.queue_message_grouper = QueueMessageGrouper(self)
     self.rate_limiter = RateLimiter(self)
     self.redis_service = RedisService(self)
@@ -107,6 +115,9 @@ class ApiServiceBag(ServiceBag, ApiServiceBagProtocol):  # pylint: disable=too-m
       queue_service = LocalQueueService(self, request_local_cls=ApiRequestLocalServiceBag)
     else:
       queue_service = QueueService(self, make_providers(self))
+      if self.is_qworker and queue_service.enabled:
+        # NOTE: Queue depths are read from Redis on each scrape, so only the queue workers collect them
+        self.metrics_registry.add_collector(make_queue_depth_collector(queue_service))
     self.queue_service = queue_service
 
     s3_user_upload_service: DisabledService | S3UserUploadService
@@ -135,6 +146,7 @@ class ApiRequestLocalServiceBag(
     self.best_practices_service = BestPracticesService(self)
     self.checkpoint_service = CheckpointService(self)
     self.client_service = ClientService(self)
+    self.counter_service = CounterService(self)
     self.database_service = DatabaseService(self, self._db_connection)
     self.email_templates = EmailTemplates(self)
     self.email_verification_service = EmailVerificationService(self)
@@ -142,6 +154,7 @@ class ApiRequestLocalServiceBag(
     self.experiment_parameter_segmenter = ExperimentParameterSegmenter(self)
     self.experiment_progress_service = ExperimentProgressService(self)
     self.experiment_service = ExperimentService(self)
+    self.experiment_stopping_criteria_service = ExperimentStoppingCriteriaService(self)
     self.iam_logging_service = IamLoggingService(self)
     self.importances_service = ImportancesService(self)
     self.invite_service = InviteService(self)
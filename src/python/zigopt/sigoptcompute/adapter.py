@@ -9,6 +9,7 @@ from zigopt.common import *
 from zigopt.assignments.model import MissingValueException, extract_array_for_computation_from_assignments
 from zigopt.experiment.constant import METRIC_OBJECTIVE_TYPE_TO_NAME
 from zigopt.experiment.constraints import parse_experiment_constraints_to_func_list
+from zigopt.observation.block import ObservationBlock
 from zigopt.protobuf.gen.experiment.experimentmeta_pb2 import Prior
 from zigopt.protobuf.gen.suggest.suggestion_pb2 import SuggestionData
 from zigopt.protobuf.lib import copy_protobuf
@@ -306,13 +307,12 @@ class SCAdapter(Service):
   def spe_next_points(
     self,
     experiment,
-    observation_iterator,
+    observations,
     num_to_suggest,
-    observation_count,
     open_suggestion_datas=None,
     tag=None,
   ):
-    points_sampled = self._make_points_sampled(experiment, observation_iterator, observation_count)
+    points_sampled = self._make_points_sampled(experiment, observations)
     view_input = {
       "domain_info": self.generate_domain_info(experiment),
       "num_to_sample": num_to_suggest,
@@ -342,13 +342,12 @@ class SCAdapter(Service):
   def spe_search_next_points(
     self,
     experiment,
-    observation_iterator,
+    observations,
     num_to_suggest,
-    observation_count,
     open_suggestion_datas=None,
     tag=None,
   ):
-    points_sampled = self._make_points_sampled(experiment, observation_iterator, observation_count)
+    points_sampled = self._make_points_sampled(experiment, observations)
     view_input = {
       "domain_info": self.generate_domain_info(experiment),
       "num_to_sample": num_to_suggest,
@@ -617,38 +616,26 @@ class SCAdapter(Service):
   def _make_points_sampled(
     experiment,
     observations,
-    observation_count,
+    observation_count=None,
   ):
-    parameters = [copy_protobuf(p) for p in experiment.all_parameters]
+    if not isinstance(observations, ObservationBlock):
+      observations = ObservationBlock.from_observations(experiment, observations)
+    assert observation_count is None or observation_count == len(observations)
 
-    points = numpy.empty((observation_count, experiment.dimension))
-    values = numpy.zeros((observation_count, len(experiment.all_metrics)))
-    value_vars = numpy.ones((observation_count, len(experiment.all_metrics)))
-    failures = numpy.zeros(observation_count, dtype=bool)
-    task_costs = numpy.ones(observation_count)
-    k = 0
-    for k, observation in enumerate(observations):
-      observation_data = observation.data
-      try:
-        extract_array_for_computation_from_assignments(observation_data, parameters, points[k, :])
-      except MissingValueException as e:
-        raise MissingValueException(f"{str(e)} - experiment {experiment.id}") from e
-      values[k, :] = observation_data.sorted_all_metric_values(experiment)
-      failures[k] = bool(observation_data.reported_failure)
-      task_costs[k] = observation_data.task.cost
+    try:
+      points = observations.points(experiment.all_parameters, log_scale=True)
+    except MissingValueException as e:
+      raise MissingValueException(f"{str(e)} - experiment {experiment.id}") from e
 
-      value_var = observation_data.sorted_all_metric_value_vars(experiment)
-      if value_var is None or any(numpy.isnan(value_var)):
-        value_var = [MINIMUM_VALUE_VAR] * len(experiment.all_metrics)
-      value_vars[k, :] = numpy.fmax(value_var, MINIMUM_VALUE_VAR)
-    assert observation_count == k + 1
+    value_vars = numpy.fmax(observations.value_vars, MINIMUM_VALUE_VAR)
+    value_vars[numpy.isnan(observations.value_vars).any(axis=1)] = MINIMUM_VALUE_VAR
 
     return PointsContainer(
       points=points,
-      values=values,
+      values=numpy.array(observations.values),
       value_vars=value_vars,
-      failures=failures,
-      task_costs=task_costs if experiment.is_multitask else None,
+      failures=numpy.array(observations.failures),
+      task_costs=numpy.array(observations.task_costs) if experiment.is_multitask else None,
     )
 
   # TODO: Is there a reason/benefit to passing these as proxies?  Or casting them as proxies inside?
@@ -164,16 +164,6 @@ class BaseBroker(Service):
 
     return LatinHypercubeSampler(self.services, experiment, optimization_args)
 
-  # This is required because each entry in the SequentialSampler requires its own args
-  # Another option is itertools.tee, but I do not think there will really be any difference here
-  # WARNING - This may execute a DB call and store the observations in a list
-  #           Use only for small number of observations if memory concerns exist
-  def duplicate_optimization_args(self, optimization_args):
-    observations = list(optimization_args.observation_iterator)
-    first_args_copy = optimization_args.copy_and_set(observation_iterator=observations)
-    second_args_copy = optimization_args.copy_and_set(observation_iterator=observations)
-    return first_args_copy, second_args_copy
-
   # NOTE: If we ever reorganize fetch_args, we could change the broker to be able to fetch inside here
   def next_sampler(self, experiment, optimization_args):
     sampler: SuggestionSampler
@@ -192,8 +182,8 @@ class BaseBroker(Service):
 
       samplers_with_counts: tuple[tuple[SuggestionSampler, int], ...] = ()
       if lds_count > 0:
-        optimization_args, lds_optimization_args = self.duplicate_optimization_args(optimization_args)
-        low_discrepancy_sampler = self._low_discrepancy_sampler(experiment, lds_optimization_args)
+        # NOTE: The samplers can share the args because the encoded observations are shared and read-only
+        low_discrepancy_sampler = self._low_discrepancy_sampler(experiment, optimization_args)
         samplers_with_counts = tuple([(low_discrepancy_sampler, lds_count)])
       elif self.only_positive_lds:
         return None
@@ -3,9 +3,9 @@
 # SPDX-License-Identifier: Apache License 2.0
 from collections.abc import Sequence
 
-from sqlalchemy import desc
+from sqlalchemy import bindparam, desc
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Query
+from sqlalchemy.orm import Query, Session
 
 from zigopt.common import *
 from zigopt.db.util import DeleteClause
@@ -38,6 +38,19 @@ class ProcessedSuggestionService(Service):
       self.query_by_experiment(experiment_id, include_deleted).outerjoin(Observation).filter(Observation.id.is_(None))
     )
 
+  def _cached_query_open_by_experiment(self, session: Session, include_deleted: DeleteClause | bool) -> Query:
+    """
+        Builds query_open_by_experiment from the session of a cached query, with experiment_id as a bindparam.
+        """
+    return (
+      self._include_deleted_clause(
+        include_deleted,
+        session.query(ProcessedSuggestion).filter(ProcessedSuggestion.experiment_id == bindparam("experiment_id")),
+      )
+      .outerjoin(Observation)
+      .filter(Observation.id.is_(None))
+    )
+
   def query_by_experiment(self, experiment_id: int, include_deleted: DeleteClause | bool) -> Query:
     return self._include_deleted_clause(
       include_deleted,
@@ -50,7 +63,13 @@ class ProcessedSuggestionService(Service):
     self, experiment_id: int, include_deleted: DeleteClause | bool = False
   ) -> Sequence[ProcessedSuggestion]:
     return self.services.database_service.all(
-      self.query_open_by_experiment(experiment_id, include_deleted).order_by(desc(ProcessedSuggestion.processed_time))
+      self.services.database_service.cached_query(
+        lambda session: self._cached_query_open_by_experiment(session, include_deleted).order_by(
+          desc(ProcessedSuggestion.processed_time)
+        ),
+        include_deleted,
+        experiment_id=experiment_id,
+      )
     )
 
   def find_matching_suggestion(self, experiment: Experiment, suggestion: Suggestion) -> ProcessedSuggestion | None:
@@ -98,7 +117,13 @@ class ProcessedSuggestionService(Service):
   def count_open_by_experiment(
     self, experiment_id: int, include_deleted: DeleteClause | bool = DeleteClause.NOT_DELETED
   ) -> int:
-    return self.services.database_service.count(self.query_open_by_experiment(experiment_id, include_deleted))
+    return self.services.database_service.count(
+      self.services.database_service.cached_query(
+        lambda session: self._cached_query_open_by_experiment(session, include_deleted),
+        include_deleted,
+        experiment_id=experiment_id,
+      )
+    )
 
   def find_by_id(self, suggestion_id: int, include_deleted: DeleteClause | bool = False) -> ProcessedSuggestion | None:
     return list_get(self.find_by_ids([suggestion_id], include_deleted), 0)
@@ -125,11 +150,8 @@ class ProcessedSuggestionService(Service):
 
   def insert_all(self, processed_suggestions: Sequence[ProcessedSuggestion]) -> bool:
     if processed_suggestions:
-      try:
+      with self.services.database_service.savepoint():
         self.services.database_service.insert_all(processed_suggestions)
-      except IntegrityError:
-        self.services.database_service.rollback_session()
-        raise
     return True
 
   def delete_all_for_experiment(self, experiment: Experiment) -> None:
@@ -15,7 +15,10 @@ class CategoricalOnlySampler(SuggestionSampler):
     all_combos = all_categorical_value_combos(self.experiment.all_parameters)
 
     open_combos = [s.get_assignments(self.experiment) for s in self.optimization_args.open_suggestions]
-    observed_combos = [o.get_assignments(self.experiment) for o in self.optimization_args.observation_iterator]
+    observed_combos = [
+      o.get_assignments(self.experiment)
+      for o in self.optimization_args.get_observation_block(self.experiment).iter_assignments()
+    ]
     sampled_combos = [frozenset(assignments_map.items()) for assignments_map in open_combos + observed_combos]
 
     unsampled = list(set(all_combos).difference(set(sampled_combos)))
@@ -1,6 +1,8 @@
 # Copyright © 2022 Intel Corporation
 #
 # SPDX-License-Identifier: Apache License 2.0
+import itertools
+
 from zigopt.common import *
 from zigopt.assignments.build import set_assignments_map_from_dict
 from zigopt.conditionals.util import convert_to_unconditioned_experiment
@@ -11,7 +13,7 @@ from zigopt.suggestion.unprocessed.model import SuggestionDataProxy, Unprocessed
 
 
 # TODO: Think on if we want some more interesting task management in the LHC phase
-# NOTE - Creating self.observations may require a DB call which is executed when this sampler is created
+# NOTE - Creating self.observation_block may require a DB call which is executed when this sampler is created
 class LatinHypercubeSampler(SuggestionSampler):
   source = UnprocessedSuggestion.Source.LATIN_HYPERCUBE
 
@@ -23,7 +25,7 @@ class LatinHypercubeSampler(SuggestionSampler):
       self._conditioned_experiment = experiment
       self.is_conditional = True
     self.stencil_length = get_low_discrepancy_stencil_length_from_experiment(self.experiment)
-    self.observations = list(self.optimization_args.observation_iterator)
+    self.observation_block = self.optimization_args.get_observation_block(self.experiment)
 
   def build_intervals(self, open_suggestions):
     intervals_by_parameter = {
@@ -37,7 +39,7 @@ class LatinHypercubeSampler(SuggestionSampler):
 
     self.services.experiment_parameter_segmenter.prune_intervals(
       self.experiment,
-      self.observations + open_suggestions,
+      itertools.chain(self.observation_block.iter_assignments(), open_suggestions),
       intervals_by_parameter,
     )
 
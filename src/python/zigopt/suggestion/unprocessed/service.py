@@ -10,6 +10,7 @@ from sqlalchemy.orm import Query
 
 from zigopt.common import *
 from zigopt.common.sigopt_datetime import unix_timestamp_with_microseconds
+from zigopt.db.column import JsonPath, jsonb_set, unwind_json_path
 from zigopt.exception.logger import AlreadyLoggedException
 from zigopt.experiment.model import Experiment
 from zigopt.profile.timing import time_function
@@ -37,48 +38,62 @@ class UnprocessedSuggestionService(Service):
   ):
     assert experiment.id == unprocessed_suggestion.experiment_id
 
-    if unprocessed_suggestion.id is None:
-      try:
-        self.services.unprocessed_suggestion_service.insert_suggestions_to_be_processed([unprocessed_suggestion])
-      except DuplicateUnprocessedSuggestionError:
-        unprocessed_suggestion = self.services.database_service.one(
-          self.services.database_service.query(UnprocessedSuggestion).filter(
-            UnprocessedSuggestion.uuid_value == unprocessed_suggestion.uuid_value
+    # NOTE: The suggestion is only processed if all of these writes succeed
+    with self.services.database_service.transaction():
+      if unprocessed_suggestion.id is None:
+        try:
+          self.services.unprocessed_suggestion_service.insert_suggestions_to_be_processed([unprocessed_suggestion])
+        except DuplicateUnprocessedSuggestionError:
+          unprocessed_suggestion = self.services.database_service.one(
+            self.services.database_service.query(UnprocessedSuggestion).filter(
+              UnprocessedSuggestion.uuid_value == unprocessed_suggestion.uuid_value
+            )
           )
-        )
 
-    processed_suggestion = ProcessedSuggestion(
-      experiment_id=experiment.id,
-      processed_suggestion_meta=processed_suggestion_meta,
-      queued_id=queued_id,
-      suggestion_id=unprocessed_suggestion.id,
-      automatic=automatic,
-    )
+      processed_suggestion = ProcessedSuggestion(
+        experiment_id=experiment.id,
+        processed_suggestion_meta=processed_suggestion_meta,
+        queued_id=queued_id,
+        suggestion_id=unprocessed_suggestion.id,
+        automatic=automatic,
+      )
 
-    self.services.processed_suggestion_service.insert(processed_suggestion)
-    self.remove_from_available_suggestions(unprocessed_suggestion)
+      self.services.processed_suggestion_service.insert(processed_suggestion)
+      # NOTE: The suggestion stays available until it has been processed, so that a rolled back process does not
+      # lose it
+      self.services.database_service.after_commit(
+        lambda: self.remove_from_available_suggestions(unprocessed_suggestion)
+      )
 
-    if processed_suggestion.queued_id:
-      self.services.queued_suggestion_service.delete_by_id(
-        processed_suggestion.experiment_id,
-        processed_suggestion.queued_id,
+      if processed_suggestion.queued_id:
+        self.services.queued_suggestion_service.delete_by_id(
+          processed_suggestion.experiment_id,
+          processed_suggestion.queued_id,
+        )
+      return Suggestion(
+        processed=processed_suggestion,
+        unprocessed=unprocessed_suggestion,
       )
-    return Suggestion(
-      processed=processed_suggestion,
-      unprocessed=unprocessed_suggestion,
-    )
 
   def delete_all_for_experiment(self, experiment: Experiment) -> None:
-    updated_suggestions = []
-    for old_suggestion in self.services.database_service.all(
-      self.services.database_service.query(UnprocessedSuggestion).filter(
-        UnprocessedSuggestion.experiment_id == experiment.id
-      )
-    ):
-      new_suggestion_meta = copy_protobuf(old_suggestion.suggestion_meta)
-      new_suggestion_meta.deleted = True
-      updated_suggestions.append({"id": old_suggestion.id, "suggestion_meta": new_suggestion_meta})
-    self.services.database_service.update_all(UnprocessedSuggestion, updated_suggestions)
+    """
+        Not a true DB delete, just sets the deleted flag with a set-based update.
+        """
+    self.services.database_service.update(
+      self._include_deleted_clause(
+        False,
+        self.services.database_service.query(UnprocessedSuggestion).filter(
+          UnprocessedSuggestion.experiment_id == experiment.id
+        ),
+      ),
+      {
+        UnprocessedSuggestion.suggestion_meta: jsonb_set(
+          UnprocessedSuggestion.suggestion_meta,
+          JsonPath(*unwind_json_path(UnprocessedSuggestion.suggestion_meta.deleted)),
+          True,
+        ),
+      },
+    )
 
   def delete_by_id(self, experiment: Experiment, suggestion_id: int) -> None:
     if suggestion := self.find_by_id(suggestion_id):
@@ -130,6 +145,8 @@ class UnprocessedSuggestionService(Service):
 
   def insert_suggestions_to_be_processed(self, generated_suggestions: Sequence[UnprocessedSuggestion]) -> None:
     if generated_suggestions := list(generated_suggestions):
+      # NOTE: Suggestion ids are reserved from the sequence when the suggestions are inserted, because clients page
+      # through suggestions by id and would skip suggestions with ids that are lower than ones they have already seen
       generated_ids = self.services.database_service.reserve_ids(
         SUGGESTIONS_ID_SEQUENCE_NAME,
         len(generated_suggestions),
@@ -139,9 +156,9 @@ class UnprocessedSuggestionService(Service):
         suggestion.id = suggestion_id
 
       try:
-        self.services.database_service.insert_all(generated_suggestions, return_defaults=False)
+        with self.services.database_service.savepoint():
+          self.services.database_service.insert_all(generated_suggestions, return_defaults=False)
       except IntegrityError as e:
-        self.services.database_service.rollback_session()
         uuid_msg = f'duplicate key value violates unique constraint "{SUGGESTIONS_UUID_CONSTRAINT_NAME}"'
         if uuid_msg in str(e):
           raise DuplicateUnprocessedSuggestionError("UnprocessedSuggestion already exists") from e
@@ -166,16 +183,21 @@ class UnprocessedSuggestionService(Service):
     if len(sources) == 0:
       return []
 
-    unprocessed_suggestions = []
-    for source in sources:
-      timestamps_by_uuid = {}
-      timestamp_key = self.services.redis_key_service.create_suggestion_timestamp_key(experiment.id, source)
-      uuid_timestamp_tuples = self.services.redis_service.get_sorted_set_range(timestamp_key, 0, -1, withscores=True)
-      timestamps_by_uuid.update(dict(uuid_timestamp_tuples))
-
-      suggestion_protobuf_key = self.services.redis_key_service.create_suggestion_protobuf_key(experiment.id, source)
-      suggestions_by_uuid = self.services.redis_service.get_all_hash_fields(suggestion_protobuf_key)
+    with self.services.redis_service.pipeline() as pipeline:
+      for source in sources:
+        timestamp_key = self.services.redis_key_service.create_suggestion_timestamp_key(experiment.id, source)
+        pipeline.get_sorted_set_range(timestamp_key, 0, -1, withscores=True)
+        suggestion_protobuf_key = self.services.redis_key_service.create_suggestion_protobuf_key(experiment.id, source)
+        pipeline.get_all_hash_fields(suggestion_protobuf_key)
+    assert pipeline.results is not None
 
+    unprocessed_suggestions = []
+    for source, uuid_timestamp_tuples, suggestions_by_uuid in zip(
+      sources,
+      pipeline.results[::2],
+      pipeline.results[1::2],
+    ):
+      timestamps_by_uuid = dict(uuid_timestamp_tuples)
       for suggestion_uuid, suggestion_meta_protobuf in suggestions_by_uuid.items():
         generated_time = timestamps_by_uuid.get(suggestion_uuid, None)
         unprocessed_suggestions.append(
@@ -200,8 +222,9 @@ class UnprocessedSuggestionService(Service):
     # suggestions are sorted by time created/added; this grabs the oldest ones
     if suggestions_to_drop := self.services.redis_service.get_sorted_set_range(suggestion_timestamp_key, 0, stop_index):
       suggestion_protobuf_key = self.services.redis_key_service.create_suggestion_protobuf_key(experiment_id, source)
-      self.services.redis_service.remove_from_hash(suggestion_protobuf_key, *suggestions_to_drop)
-      self.services.redis_service.remove_from_sorted_set(suggestion_timestamp_key, *suggestions_to_drop)
+      with self.services.redis_service.pipeline() as pipeline:
+        pipeline.remove_from_hash(suggestion_protobuf_key, *suggestions_to_drop)
+        pipeline.remove_from_sorted_set(suggestion_timestamp_key, *suggestions_to_drop)
 
   def _store_unprocessed_suggestions(
     self, experiment_id: int, unprocessed_suggestions: Sequence[UnprocessedSuggestion], timestamp: float | None = None
@@ -212,25 +235,27 @@ class UnprocessedSuggestionService(Service):
     timestamp = timestamp or unix_timestamp_with_microseconds()
     expiry = timedelta(days=31)
 
-    for source, suggestions in suggestions_by_source.items():
-      self.services.redis_service.add_to_set(sources_key, source)
-      self.services.redis_service.set_expire(sources_key, expiry)
-      suggestion_protobuf_key = self.services.redis_key_service.create_suggestion_protobuf_key(experiment_id, source)
-      suggestion_meta_protobufs_by_uuid = {
-        str(suggestion.uuid_value or uuid.uuid4()): suggestion.suggestion_meta.SerializeToString()
-        for suggestion in suggestions
-      }
-      self.services.redis_service.set_hash_fields(suggestion_protobuf_key, suggestion_meta_protobufs_by_uuid)
-      self.services.redis_service.set_expire(suggestion_protobuf_key, expiry)
-
-      suggestion_timestamp_key = self.services.redis_key_service.create_suggestion_timestamp_key(
-        experiment_id,
-        source,
-      )
-      suggestion_timestamps = [(suggestion_uuid, timestamp) for suggestion_uuid in suggestion_meta_protobufs_by_uuid]
-      self.services.redis_service.add_sorted_set_new(suggestion_timestamp_key, suggestion_timestamps)
-      self.services.redis_service.set_expire(suggestion_timestamp_key, expiry)
+    with self.services.redis_service.pipeline() as pipeline:
+      for source, suggestions in suggestions_by_source.items():
+        pipeline.add_to_set(sources_key, source)
+        pipeline.set_expire(sources_key, expiry)
+        suggestion_protobuf_key = self.services.redis_key_service.create_suggestion_protobuf_key(experiment_id, source)
+        suggestion_meta_protobufs_by_uuid = {
+          str(suggestion.uuid_value or uuid.uuid4()): suggestion.suggestion_meta.SerializeToString()
+          for suggestion in suggestions
+        }
+        pipeline.set_hash_fields(suggestion_protobuf_key, suggestion_meta_protobufs_by_uuid)
+        pipeline.set_expire(suggestion_protobuf_key, expiry)
+
+        suggestion_timestamp_key = self.services.redis_key_service.create_suggestion_timestamp_key(
+          experiment_id,
+          source,
+        )
+        suggestion_timestamps = [(suggestion_uuid, timestamp) for suggestion_uuid in suggestion_meta_protobufs_by_uuid]
+        pipeline.add_sorted_set_new(suggestion_timestamp_key, suggestion_timestamps)
+        pipeline.set_expire(suggestion_timestamp_key, expiry)
 
+    for source, suggestions in suggestions_by_source.items():
       backlog_multiplier = max(self.services.config_broker.get("model.backlog_multiplier", default=3), 1)
       default_generation_size = self.services.config_broker.get("model.num_suggestions", default=5)
       num_to_keep = max(len(suggestions), default_generation_size) * backlog_multiplier
@@ -11,6 +11,9 @@ from zigopt.services.base import Service
 from zigopt.tag.model import Tag
 
 
+TAGS_BY_CLIENT_COUNTER = "tags_by_client"
+
+
 class TagExistsException(Exception):
   def __init__(self, name: str):
     self.name = name
@@ -41,16 +44,19 @@ class TagService(Service):
     )
 
   def count_by_client_id(self, client_id: int) -> int:
-    return self.services.database_service.count(
-      self.tag_query.filter_by(client_id=client_id),
-    )
+    return self.services.counter_service.get_counts(
+      TAGS_BY_CLIENT_COUNTER,
+      [client_id],
+      lambda _: {client_id: self.services.database_service.count(self.find_by_client_id_query(client_id))},
+    )[client_id]
 
   def insert(self, tag: Tag) -> Tag:
     try:
-      self.services.database_service.insert(tag)
+      with self.services.database_service.savepoint():
+        self.services.database_service.insert(tag)
     except sqlalchemy.exc.IntegrityError as ie:
-      self.services.database_service.rollback_session()
       if f'duplicate key value violates unique constraint "{Tag.UNIQUE_NAME_INDEX_NAME}"' in str(ie):
         raise TagExistsException(tag.name) from ie
       raise
+    self.services.counter_service.increment(TAGS_BY_CLIENT_COUNTER, {tag.client_id: 1})
     return tag
@@ -3,6 +3,8 @@
 # SPDX-License-Identifier: Apache License 2.0
 from collections.abc import Sequence
 
+from sqlalchemy import bindparam
+
 from zigopt.common import *
 from zigopt.common.sigopt_datetime import unix_timestamp
 from zigopt.db.column import JsonPath, jsonb_set, unwind_json_path
@@ -22,7 +24,10 @@ class TokenService(Service):
 
   def find_by_token(self, token: str, include_expired: bool = False) -> Token | None:
     token_obj = self.services.database_service.one_or_none(
-      self.services.database_service.query(Token).filter(Token.token == token)
+      self.services.database_service.cached_query(
+        lambda session: session.query(Token).filter(Token.token == bindparam("token")),
+        token=token,
+      )
     )
     if include_expired or self._reject_expired([token_obj]):
       return token_obj
@@ -65,7 +65,7 @@ class TrainingRun(Base):
   deleted = Column(Boolean, name="deleted", default=False, nullable=False)
   completed = Column(ImpliedUTCDateTime, name="completed")
 
-  training_run_data = ProtobufColumn(TrainingRunData, nullable=False, name="data")
+  training_run_data = ProtobufColumn(TrainingRunData, nullable=False, name="data", lazy=True)
 
   __table_args__ = tuple(
     [
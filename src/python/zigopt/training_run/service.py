@@ -19,10 +19,18 @@ from zigopt.training_run.model import TrainingRun
 
 _NO_ARG = object()
 
+TRAINING_RUNS_BY_PROJECT_COUNTER = "training_runs_by_project"
+
 
 class TrainingRunService(Service):
   def insert_training_runs(self, training_runs: Sequence[TrainingRun]) -> None:
     self.services.database_service.insert_all(training_runs)
+    for client_id, client_training_runs in as_grouped_dict(training_runs, lambda tr: tr.client_id).items():
+      self.services.counter_service.increment(
+        TRAINING_RUNS_BY_PROJECT_COUNTER,
+        map_dict(len, as_grouped_dict([tr for tr in client_training_runs if not tr.deleted], lambda tr: tr.project_id)),
+        scope=(client_id,),
+      )
 
   def find_by_id(self, training_run_id: int) -> TrainingRun | None:
     return self.services.database_service.one_or_none(
@@ -39,7 +47,15 @@ class TrainingRunService(Service):
   def count_by_project(self, client_id: int, project_id: int) -> int:
     return self.count_by_projects(client_id, [project_id]).get(project_id, 0)
 
-  def count_by_projects(self, client_id, project_ids: Sequence[int]) -> Mapping[int, int]:
+  def count_by_projects(self, client_id: int, project_ids: Sequence[int]) -> Mapping[int, int]:
+    return self.services.counter_service.get_counts(
+      TRAINING_RUNS_BY_PROJECT_COUNTER,
+      project_ids,
+      lambda missing_project_ids: self._count_by_projects(client_id, missing_project_ids),
+      scope=(client_id,),
+    )
+
+  def _count_by_projects(self, client_id: int, project_ids: Sequence[int]) -> Mapping[int, int]:
     return dict(
       self.services.database_service.all(
         self.services.database_service.query(TrainingRun.project_id, func.count(TrainingRun.id))
@@ -50,6 +66,9 @@ class TrainingRunService(Service):
       )
     )
 
+  def invalidate_count_by_projects(self, client_id: int, project_ids: Sequence[int | None]) -> None:
+    self.services.counter_service.invalidate(TRAINING_RUNS_BY_PROJECT_COUNTER, project_ids, scope=(client_id,))
+
   def mark_as_updated(self, training_run: TrainingRun, timestamp: datetime.datetime | None = None) -> None:
     if timestamp is None:
       timestamp = current_datetime()
@@ -74,20 +93,34 @@ class TrainingRunService(Service):
       if tr.observation_id:
         self.services.observation_service.set_delete(exp, tr.observation_id, deleted=deleted)
 
-    self.services.database_service.update_one_or_none(
-      self.services.database_service.query(TrainingRun).filter(TrainingRun.id == training_run_id),
+    # NOTE: Only a run whose deleted flag changes is updated, so that concurrent deletes only count it once
+    if self.services.database_service.update_one_or_none(
+      self.services.database_service.query(TrainingRun)
+      .filter(TrainingRun.id == training_run_id)
+      .filter(TrainingRun.deleted.isnot(deleted)),
       {
         TrainingRun.deleted: deleted,
       },
-    )
+    ):
+      self.services.counter_service.increment(
+        TRAINING_RUNS_BY_PROJECT_COUNTER,
+        {tr.project_id: -1 if deleted else 1},
+        scope=(tr.client_id,),
+      )
 
   def delete_runs_in_experiment(self, experiment: Experiment) -> None:
+    project_ids = self.services.database_service.all(
+      self.services.database_service.query(TrainingRun.project_id)
+      .filter(TrainingRun.experiment_id == experiment.id)
+      .distinct()
+    )
     self.services.database_service.update(
       self.services.database_service.query(TrainingRun).filter(TrainingRun.experiment_id == experiment.id),
       {TrainingRun.deleted: True},
     )
+    self.invalidate_count_by_projects(experiment.client_id, [project_id for (project_id,) in project_ids])
     self.services.processed_suggestion_service.delete_all_for_experiment(experiment)
-    self.services.observation_service.delete_all_for_experiment(experiment)
+    self.services.observation_service.enqueue_delete_all_for_experiment(experiment)
 
   def assert_is_training_run_query(self, query: Query) -> Query:
     assert any(
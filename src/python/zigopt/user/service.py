@@ -54,9 +54,9 @@ class UserService(Service):
 
   def create_new_user(self, user: User) -> None:
     try:
-      self.insert(user)
+      with self.services.database_service.savepoint():
+        self.insert(user)
     except IntegrityError as e:
-      self.services.database_service.rollback_session()
       preexisting_user = self.find_by_email(user.email, include_deleted=True)
       assert preexisting_user
       if not preexisting_user.deleted:
@@ -0,0 +1,123 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import pytest
+from mock import patch
+
+from zigopt.observation.model import Observation
+from zigopt.protobuf.gen.observation.observationdata_pb2 import ObservationData, ObservationValue
+
+from integration.service.experiment.test_base import ExperimentServiceTestBase
+
+
+class TestObservationCountsCache(ExperimentServiceTestBase):
+  @pytest.fixture
+  def inserted_experiment(self, services, experiment):
+    services.experiment_service.insert(experiment)
+    return experiment
+
+  def make_observation(self, experiment, failed=False):
+    return Observation(
+      experiment_id=experiment.id,
+      data=ObservationData(
+        assignments_map=dict(p1=0),
+        values=[] if failed else [ObservationValue(value=1)],
+        reported_failure=failed,
+      ),
+    )
+
+  def get_cached_fields(self, services, experiment):
+    redis_key = services.redis_key_service.create_observation_counts_key(experiment.id)
+    return services.redis_service.get_all_hash_fields(redis_key)
+
+  def test_counts_are_cached(self, services, inserted_experiment):
+    assert self.get_cached_fields(services, inserted_experiment) == {}
+    counts = services.observation_service.get_observation_counts(inserted_experiment.id)
+    assert counts.observation_count == 0
+    assert counts.failure_count == 0
+    assert counts.max_observation_id is None
+    assert self.get_cached_fields(services, inserted_experiment) != {}
+
+    with patch.object(services.database_service, "one_or_none") as one_or_none_mock:
+      assert services.observation_service.get_observation_counts(inserted_experiment.id) == counts
+      assert one_or_none_mock.call_count == 0
+
+  def test_insert_increments(self, services, inserted_experiment):
+    services.observation_service.get_observation_counts(inserted_experiment.id)
+    observations = [
+      self.make_observation(inserted_experiment),
+      self.make_observation(inserted_experiment, failed=True),
+    ]
+    services.observation_service.insert_observations(inserted_experiment, observations)
+
+    with patch.object(services.database_service, "one_or_none") as one_or_none_mock:
+      counts = services.observation_service.get_observation_counts(inserted_experiment.id)
+      assert one_or_none_mock.call_count == 0
+    assert counts.observation_count == 2
+    assert counts.failure_count == 1
+    assert counts.max_observation_id == max(o.id for o in observations)
+    assert services.observation_service.query_observation_counts(inserted_experiment.id) == counts
+
+  def test_rebuild_started_before_insert(self, services, inserted_experiment):
+    query_observation_counts = services.observation_service.query_observation_counts
+
+    def insert_during_rebuild(experiment_id):
+      counts = query_observation_counts(experiment_id)
+      services.observation_service.insert_observations(
+        inserted_experiment,
+        [self.make_observation(inserted_experiment)],
+      )
+      return counts
+
+    with patch.object(services.observation_service, "query_observation_counts", side_effect=insert_during_rebuild):
+      assert services.observation_service.get_observation_counts(inserted_experiment.id).observation_count == 0
+    assert self.get_cached_fields(services, inserted_experiment) == {}
+    assert services.observation_service.get_observation_counts(inserted_experiment.id).observation_count == 1
+
+  def test_incremented_after_commit(self, services, inserted_experiment):
+    services.observation_service.get_observation_counts(inserted_experiment.id)
+    with services.database_service.transaction():
+      services.observation_service.insert_observations(
+        inserted_experiment,
+        [self.make_observation(inserted_experiment)],
+      )
+      assert self.get_cached_fields(services, inserted_experiment)[b"observation_count"] == b"0"
+    assert self.get_cached_fields(services, inserted_experiment)[b"observation_count"] == b"1"
+
+  def test_rolled_back_insert(self, services, inserted_experiment):
+    services.observation_service.get_observation_counts(inserted_experiment.id)
+    with pytest.raises(ValueError), services.database_service.transaction():
+      services.observation_service.insert_observations(
+        inserted_experiment,
+        [self.make_observation(inserted_experiment)],
+      )
+      raise ValueError()
+    assert self.get_cached_fields(services, inserted_experiment)[b"observation_count"] == b"0"
+
+  def test_delete_invalidates(self, services, inserted_experiment):
+    observations = [self.make_observation(inserted_experiment), self.make_observation(inserted_experiment)]
+    services.observation_service.insert_observations(inserted_experiment, observations)
+    services.observation_service.get_observation_counts(inserted_experiment.id)
+
+    services.observation_service.set_delete(inserted_experiment, observations[1].id)
+    assert self.get_cached_fields(services, inserted_experiment) == {}
+    counts = services.observation_service.get_observation_counts(inserted_experiment.id)
+    assert counts.observation_count == 1
+    assert counts.max_observation_id == observations[0].id
+
+  def test_delete_all(self, services, inserted_experiment):
+    services.observation_service.insert_observations(inserted_experiment, [self.make_observation(inserted_experiment)])
+    services.observation_service.get_observation_counts(inserted_experiment.id)
+    services.observation_service.delete_all_for_experiment(inserted_experiment)
+    assert self.get_cached_fields(services, inserted_experiment) == {}
+    counts = services.observation_service.get_observation_counts(inserted_experiment.id)
+    assert counts.observation_count == 0
+    assert counts.max_observation_id is None
+
+  def test_redis_down(self, services, inserted_experiment):
+    services.observation_service.insert_observations(inserted_experiment, [self.make_observation(inserted_experiment)])
+    services.config_broker.data.setdefault("features", {})["raiseSoftExceptions"] = False
+    with patch.object(services.redis_service, "execute_pipeline") as execute_mock:
+      execute_mock.side_effect = Exception
+      assert services.observation_service.get_observation_counts(inserted_experiment.id).observation_count == 1
+      assert execute_mock.call_count == 1
@@ -0,0 +1,106 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+from copy import deepcopy
+
+import pytest
+from mock import patch
+
+from zigopt.db.util import DeleteClause
+from zigopt.observation.model import Observation
+from zigopt.protobuf.gen.observation.observationdata_pb2 import ObservationData, ObservationValue
+
+from integration.service.experiment.test_base import ExperimentServiceTestBase
+
+
+class TestDeleteAllObservationsForExperiment(ExperimentServiceTestBase):
+  NUM_OBSERVATIONS = 7
+
+  @pytest.fixture
+  def other_experiment(self, services, experiment):
+    other_experiment = deepcopy(experiment)
+    services.experiment_service.insert(other_experiment)
+    return other_experiment
+
+  @pytest.fixture
+  def inserted_experiment(self, services, experiment, other_experiment):
+    services.experiment_service.insert(experiment)
+    return experiment
+
+  @pytest.fixture
+  def observations(self, services, inserted_experiment):
+    observations = [
+      Observation(
+        experiment_id=inserted_experiment.id,
+        data=ObservationData(assignments_map=dict(p1=i), values=[ObservationValue(value=i)]),
+      )
+      for i in range(self.NUM_OBSERVATIONS)
+    ]
+    services.observation_service.insert_observations(inserted_experiment, observations)
+    return observations
+
+  def assert_all_deleted(self, services, experiment, observations):
+    assert services.observation_service.count_by_experiment(experiment) == 0
+    assert (
+      services.observation_service.count_by_experiment(experiment, deleted=DeleteClause.DELETED) == len(observations)
+    )
+    for observation in services.observation_service.find_by_ids([o.id for o in observations], include_deleted=True):
+      assert observation.deleted is True
+      assert observation.data.timestamp > 0
+
+  @pytest.mark.parametrize("chunk_size", [None, 1, 3, 100])
+  def test_delete_all(self, services, inserted_experiment, observations, chunk_size):
+    with patch.object(services.database_service, "update_all") as update_all_mock:
+      services.observation_service.delete_all_for_experiment(inserted_experiment, chunk_size=chunk_size)
+      assert update_all_mock.call_count == 0
+    self.assert_all_deleted(services, inserted_experiment, observations)
+
+  @pytest.mark.parametrize("chunk_size", [None, 2])
+  def test_max_observation_id(self, services, inserted_experiment, observations, chunk_size):
+    max_observation_id = max(o.id for o in observations)
+    later_observation = Observation(
+      experiment_id=inserted_experiment.id,
+      data=ObservationData(assignments_map=dict(p1=0), values=[ObservationValue(value=0)]),
+    )
+    services.observation_service.insert_observations(inserted_experiment, [later_observation])
+    services.observation_service.delete_all_for_experiment(
+      inserted_experiment,
+      chunk_size=chunk_size,
+      max_observation_id=max_observation_id,
+    )
+    deleted_count = services.observation_service.count_by_experiment(inserted_experiment, deleted=DeleteClause.DELETED)
+    assert deleted_count == len(observations)
+    (remaining,) = services.observation_service.all_data(inserted_experiment)
+    assert remaining.id == later_observation.id
+
+  def test_leaves_other_experiments(self, services, inserted_experiment, observations, other_experiment):
+    other_observation = Observation(
+      experiment_id=other_experiment.id,
+      data=ObservationData(assignments_map=dict(p1=0), values=[ObservationValue(value=0)]),
+    )
+    services.observation_service.insert_observations(other_experiment, [other_observation])
+    services.observation_service.delete_all_for_experiment(inserted_experiment, chunk_size=2)
+    self.assert_all_deleted(services, inserted_experiment, observations)
+    assert services.observation_service.count_by_experiment(other_experiment) == 1
+
+  def test_enqueue_delete_all_below_threshold(self, services, inserted_experiment, observations):
+    services.config_broker.data.setdefault("features", {})["backgroundDeleteObservationsThreshold"] = (
+      self.NUM_OBSERVATIONS + 1
+    )
+    with patch.object(services.queue_service, "make_and_enqueue_message") as enqueue_mock:
+      assert services.observation_service.enqueue_delete_all_for_experiment(inserted_experiment) is False
+      assert enqueue_mock.call_count == 0
+    self.assert_all_deleted(services, inserted_experiment, observations)
+
+  def test_enqueue_delete_all_above_threshold(self, services, inserted_experiment, observations):
+    services.config_broker.data.setdefault("features", {})["backgroundDeleteObservationsThreshold"] = (
+      self.NUM_OBSERVATIONS
+    )
+    with patch.object(services.queue_service, "make_and_enqueue_message") as enqueue_mock:
+      assert services.observation_service.enqueue_delete_all_for_experiment(inserted_experiment) is True
+      assert enqueue_mock.call_count == 1
+      assert enqueue_mock.call_args[1] == dict(
+        experiment_id=inserted_experiment.id,
+        max_observation_id=max(o.id for o in observations),
+      )
+    assert services.observation_service.count_by_experiment(inserted_experiment) == len(observations)
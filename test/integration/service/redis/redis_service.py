@@ -2,6 +2,7 @@
 #
 # SPDX-License-Identifier: Apache License 2.0
 import datetime
+import time
 
 import pytest
 
@@ -252,3 +253,317 @@ class TestRedisService(ServiceBase):
     assert services.redis_service.exists(expire_key) is True
     services.redis_service.set_expire(expire_key, -one_second_timedelta)
     assert services.redis_service.exists(expire_key) is False
+
+  def test_enqueue_sorted_set_members(self, services, sorted_set_key, hash_key):
+    value_key = self.make_redis_key(services, "enqueued_value_key")
+    status = services.redis_service.enqueue_sorted_set_members(
+      sorted_set_key,
+      {"member1": 1.0},
+      {value_key: b"value1"},
+      expiry_time=60,
+      status_key=hash_key,
+      status={"last": 1.0},
+      status_if_empty={"empty": 1.0},
+    )
+    assert status == {b"last": b"1.0", b"empty": b"1.0"}
+    assert services.redis_service.get(value_key) == b"value1"
+    assert services.redis_service.get_sorted_set_range(sorted_set_key, 0, -1, withscores=True) == [(b"member1", 1.0)]
+
+    # existing members keep their score, and the status fields that require an empty set are not updated
+    status = services.redis_service.enqueue_sorted_set_members(
+      sorted_set_key,
+      {"member1": 2.0, "member2": 2.0},
+      {value_key: b"value2"},
+      expiry_time=60,
+      status_key=hash_key,
+      status={"last": 2.0},
+      status_if_empty={"empty": 2.0},
+    )
+    assert status == {b"last": b"2.0", b"empty": b"1.0"}
+    assert services.redis_service.get(value_key) == b"value2"
+    assert services.redis_service.get_sorted_set_range(sorted_set_key, 0, -1, withscores=True) == [
+      (b"member1", 1.0),
+      (b"member2", 2.0),
+    ]
+
+    assert services.redis_service.enqueue_sorted_set_members(sorted_set_key, {"member3": 3.0}, {}, 60) is None
+    assert services.redis_service.count_sorted_set(sorted_set_key) == 3
+
+  def test_fair_share_members(self, services, hash_key):
+    queue_key = self.make_redis_key(services, "fair_share_queue_key")
+    services.redis_service.delete_fair_share_queue(queue_key, num_priorities=2)
+    for tenant, weight, members in (("big", 2, ["b1", "b2", "b3", "b4"]), ("small", 1, ["s1", "s2"])):
+      services.redis_service.enqueue_fair_share_members(
+        queue_key,
+        tenant=tenant,
+        weight=weight,
+        num_priorities=2,
+        member_priorities_and_scores={member: (1, float(i)) for i, member in enumerate(members)},
+        persisted_values={},
+        expiry_time=60,
+      )
+    status = services.redis_service.enqueue_fair_share_members(
+      queue_key,
+      tenant="small",
+      weight=1,
+      num_priorities=2,
+      member_priorities_and_scores={"s0": (0, 10.0)},
+      persisted_values={},
+      expiry_time=60,
+      status_key=hash_key,
+      status={"last": 1.0},
+      status_if_empty={"empty": 1.0},
+    )
+    assert status == {b"last": b"1.0"}
+    assert services.redis_service.count_fair_share_members(queue_key, num_priorities=2) == 7
+
+    # the higher priority is drained first, then the tenants take turns in proportion to their weights
+    popped = services.redis_service.pop_fair_share_members(queue_key, count=4, num_priorities=2)
+    assert [member for member, _ in popped] == [b"s0", b"b1", b"b2", b"s1"]
+    popped = services.redis_service.pop_fair_share_members(queue_key, count=4, num_priorities=2)
+    assert [member for member, _ in popped] == [b"b3", b"b4", b"s2"]
+    assert services.redis_service.count_fair_share_members(queue_key, num_priorities=2) == 0
+    services.redis_service.delete_fair_share_queue(queue_key, num_priorities=2)
+
+  def test_pop_sorted_set_members_by_max_score(self, services, sorted_set_key):
+    services.redis_service.add_sorted_set_new(sorted_set_key, {"member1": 1.0, "member2": 2.0, "member3": 3.0})
+    popped, next_score = services.redis_service.pop_sorted_set_members_by_max_score(sorted_set_key, 2.5, count=1)
+    assert popped == [(b"member1", 1.0)]
+    assert next_score == 2.0
+    popped, next_score = services.redis_service.pop_sorted_set_members_by_max_score(sorted_set_key, 2.5, count=5)
+    assert popped == [(b"member2", 2.0)]
+    assert next_score == 3.0
+    popped, next_score = services.redis_service.pop_sorted_set_members_by_max_score(sorted_set_key, 3.0, count=5)
+    assert popped == [(b"member3", 3.0)]
+    assert next_score is None
+
+  def test_lease_sorted_set_members(self, services, sorted_set_key):
+    lease_keys = services.redis_key_service.create_queue_lease_keys(sorted_set_key)
+    for key in lease_keys:
+      services.redis_service.delete(key)
+    services.redis_service.add_sorted_set_new(sorted_set_key, {"member1": 1.0, "member2": 2.0})
+
+    leased, next_score, dead_lettered = services.redis_service.lease_sorted_set_members(
+      lease_keys, now=10, max_score=1.5, count=5, lease_deadline=20, max_attempts=2
+    )
+    ((member, lease1, score, attempts),) = leased
+    assert (member, score, attempts) == (b"member1", 1.0, 1)
+    assert next_score == 2.0
+    assert dead_lettered == []
+    assert services.redis_service.extend_lease(lease_keys, lease1, lease_deadline=30) is True
+    assert services.redis_service.extend_lease(lease_keys, "member2|token", lease_deadline=30) is False
+
+    # the lease has not expired yet
+    leased, _, _ = services.redis_service.lease_sorted_set_members(
+      lease_keys, now=25, max_score=1.5, count=5, lease_deadline=35, max_attempts=2
+    )
+    assert leased == []
+
+    # the expired lease is returned to the queue with its original score, and leased again
+    leased, _, _ = services.redis_service.lease_sorted_set_members(
+      lease_keys, now=31, max_score=1.5, count=5, lease_deadline=41, max_attempts=2
+    )
+    ((member, lease2, score, attempts),) = leased
+    assert (member, score, attempts) == (b"member1", 1.0, 2)
+    assert lease2 != lease1
+    assert services.redis_service.extend_lease(lease_keys, lease1, lease_deadline=50) is False
+    assert services.redis_service.end_lease(lease_keys, lease1, requeue=True, max_attempts=2, now=32) == 0
+
+    # the member has been attempted max_attempts times, so it is dead lettered
+    assert services.redis_service.end_lease(lease_keys, lease2, requeue=True, max_attempts=2, now=32) == 2
+    assert services.redis_service.get_sorted_set_range(lease_keys.dead_letter, 0, -1) == [b"member1"]
+    assert services.redis_service.end_lease(lease_keys, lease2, requeue=True, max_attempts=2, now=32) == 0
+
+    leased, next_score, _ = services.redis_service.lease_sorted_set_members(
+      lease_keys, now=40, max_score=40, count=5, lease_deadline=50, max_attempts=2
+    )
+    ((member, lease, score, attempts),) = leased
+    assert (member, score, attempts) == (b"member2", 2.0, 1)
+    assert next_score is None
+
+    # a lease that is ended without counting the attempt is returned to the queue with the same attempts
+    assert (
+      services.redis_service.end_lease(lease_keys, lease, requeue=True, max_attempts=1, now=41, count_attempt=False)
+      == 1
+    )
+    leased, _, _ = services.redis_service.lease_sorted_set_members(
+      lease_keys, now=42, max_score=42, count=5, lease_deadline=52, max_attempts=2
+    )
+    ((member, lease, score, attempts),) = leased
+    assert (member, score, attempts) == (b"member2", 2.0, 1)
+    assert services.redis_service.end_lease(lease_keys, lease, requeue=False, max_attempts=2, now=43) == 1
+    assert services.redis_service.count_sorted_set(lease_keys.in_flight) == 0
+    for key in lease_keys:
+      services.redis_service.delete(key)
+
+  def test_lease_member_enqueued_again(self, services, sorted_set_key):
+    lease_keys = services.redis_key_service.create_queue_lease_keys(sorted_set_key)
+    for key in lease_keys:
+      services.redis_service.delete(key)
+    services.redis_service.add_sorted_set_new(sorted_set_key, {"member": 1.0})
+    ((_, first_lease, _, _),), _, _ = services.redis_service.lease_sorted_set_members(
+      lease_keys, now=10, max_score=10, count=5, lease_deadline=20, max_attempts=2
+    )
+
+    # the member is enqueued again while it is leased, and leased by another consumer as a first attempt
+    services.redis_service.add_sorted_set_new(sorted_set_key, {"member": 11.0})
+    ((_, second_lease, score, attempts),), _, _ = services.redis_service.lease_sorted_set_members(
+      lease_keys, now=12, max_score=12, count=5, lease_deadline=30, max_attempts=2
+    )
+    assert (score, attempts) == (11.0, 1)
+
+    # ending the first lease does not end the second lease
+    assert services.redis_service.end_lease(lease_keys, first_lease, requeue=False, max_attempts=2, now=13) == 1
+    assert services.redis_service.extend_lease(lease_keys, second_lease, lease_deadline=40) is True
+    assert services.redis_service.end_lease(lease_keys, second_lease, requeue=False, max_attempts=2, now=14) == 1
+    for key in lease_keys:
+      assert services.redis_service.exists(key) is False
+
+  def test_pipeline(self, services, sorted_set_key, hash_key, hash_mapping, hash_bytes_mapping):
+    incr_key = self.make_redis_key(services, "pipeline_incr_key")
+    services.redis_service.delete(incr_key)
+    pipeline = services.redis_service.pipeline()
+    pipeline.increment(incr_key).increment(incr_key).exists(incr_key)
+    pipeline.add_sorted_set_new(sorted_set_key, {"member1": 1.0, "member2": 2.0})
+    pipeline.get_sorted_set_range(sorted_set_key, 0, -1, withscores=True)
+    pipeline.set_hash_fields(hash_key, hash_mapping)
+    pipeline.get_all_hash_fields(hash_key)
+    assert not pipeline.idempotent
+    assert pipeline.execute() == [
+      1,
+      2,
+      True,
+      2,
+      [(b"member1", 1.0), (b"member2", 2.0)],
+      len(hash_mapping),
+      hash_bytes_mapping,
+    ]
+    with pytest.raises(AssertionError):
+      pipeline.execute()
+    services.redis_service.delete(incr_key)
+
+  def test_pipeline_transaction(self, services, hash_key, hash_mapping):
+    version_key = services.redis_key_service.create_cache_version_key(hash_key)
+    with services.redis_service.pipeline(transaction=True) as pipeline:
+      pipeline.set_hash_fields(hash_key, {"count": 1})
+      pipeline.run_script("INVALIDATE_VERSIONED_SCRIPT", [hash_key, version_key], [60])
+      pipeline.exists(hash_key)
+      pipeline.get(version_key)
+      pipeline.delete(version_key)
+    assert pipeline.results == [1, None, False, b"1", 1]
+    assert services.redis_service.exists(hash_key) is False
+
+    with pytest.raises(ValueError), services.redis_service.pipeline() as pipeline:
+      pipeline.set_hash_fields(hash_key, hash_mapping)
+      raise ValueError()
+    assert pipeline.results is None
+    assert services.redis_service.exists(hash_key) is False
+
+  def test_get_script(self, services, hash_key):
+    version_key = services.redis_key_service.create_cache_version_key(hash_key)
+    script = services.redis_service.get_script("SET_IF_VERSION_SCRIPT")
+    assert services.redis_service.get_script("SET_IF_VERSION_SCRIPT") is script
+    assert services.redis_service.redis.script_exists(script.sha) == [True]
+    services.redis_service.redis.script_flush()
+    assert services.redis_service.set_if_version(
+      hash_key, version_key, None, {"count": 1}, expire=datetime.timedelta(seconds=60)
+    )
+    services.redis_service.delete(hash_key)
+    with pytest.raises(ValueError):
+      services.redis_service.get_script("FAIR_SHARE_QUEUE_KEYS_SCRIPT")
+
+  def test_versioned_cache(self, services, hash_key):
+    version_key = services.redis_key_service.create_cache_version_key(hash_key)
+    value_key = self.make_redis_key(services, "versioned_value")
+    value_version_key = services.redis_key_service.create_cache_version_key(value_key)
+    expire = datetime.timedelta(seconds=60)
+    version = services.redis_service.get(version_key)
+    assert version is None
+    assert services.redis_service.set_if_version(hash_key, version_key, version, {"a": 1, "b": 2}, expire=expire)
+    assert services.redis_service.get_all_hash_fields(hash_key) == {b"a": b"1", b"b": b"2"}
+    assert services.redis_service.set_if_version(hash_key, version_key, version, {"a": 3}, expire=expire)
+    assert services.redis_service.get_all_hash_fields(hash_key) == {b"a": b"3"}
+
+    services.redis_service.invalidate_versioned([hash_key, value_key], expire=expire)
+    assert services.redis_service.exists(hash_key) is False
+    assert services.redis_service.get(version_key) == b"1"
+    assert services.redis_service.get(value_version_key) == b"1"
+    # NOTE: A value computed before the invalidation is not stored
+    assert not services.redis_service.set_if_version(hash_key, version_key, version, {"a": 4}, expire=expire)
+    assert services.redis_service.exists(hash_key) is False
+
+    with services.redis_service.pipeline() as pipeline:
+      pipeline.set_if_version(value_key, value_version_key, None, 5, expire=expire)
+      pipeline.set_if_version(value_key, value_version_key, b"1", 6, expire=expire)
+    assert pipeline.results == [False, True]
+    assert services.redis_service.get(value_key) == b"6"
+    for key in (hash_key, version_key, value_key, value_version_key):
+      services.redis_service.delete(key)
+
+  def test_increment_versioned(self, services, hash_key):
+    version_key = services.redis_key_service.create_cache_version_key(hash_key)
+    value_key = self.make_redis_key(services, "versioned_value")
+    value_version_key = services.redis_key_service.create_cache_version_key(value_key)
+    expire = datetime.timedelta(seconds=60)
+
+    # NOTE: A missing value is left missing, but a value computed before the increment is not stored
+    assert not services.redis_service.increment_versioned(value_key, value_version_key, 1, expire=expire)
+    assert services.redis_service.exists(value_key) is False
+    assert not services.redis_service.set_if_version(value_key, value_version_key, None, 5, expire=expire)
+    assert services.redis_service.set_if_version(value_key, value_version_key, b"1", 5, expire=expire)
+    assert services.redis_service.increment_versioned(value_key, value_version_key, -2, expire=expire)
+    assert services.redis_service.get(value_key) == b"3"
+    assert services.redis_service.get(value_version_key) == b"2"
+
+    assert services.redis_service.set_if_version(hash_key, version_key, None, {"a": 1, "b": 5}, expire=expire)
+    with services.redis_service.pipeline() as pipeline:
+      pipeline.increment_versioned(hash_key, version_key, {"a": 2}, expire=expire, maxima={"b": 3})
+      pipeline.increment_versioned(hash_key, version_key, {"a": 1}, expire=expire, maxima={"b": 7})
+    assert pipeline.results == [True, True]
+    assert services.redis_service.get_all_hash_fields(hash_key) == {b"a": b"4", b"b": b"7"}
+    assert 0 < services.redis_service.redis.ttl(services.redis_key_service.get_key_value(hash_key)) <= 60
+    for key in (hash_key, version_key, value_key, value_version_key):
+      services.redis_service.delete(key)
+
+  def test_fixed_window_rate_limit(self, services):
+    rate_limit_key = self.make_redis_key(services, "fixed_window_rate_limit")
+    window_length = 100
+    now = services.redis_service.get_time()
+    window_key = services.redis_key_service.create_rate_limit_window_key(rate_limit_key, now - (now % window_length))
+    services.redis_service.delete(window_key)
+
+    within_limit, reserved, seconds_left = services.redis_service.fixed_window_rate_limit(
+      rate_limit_key, window_length, max_attempts=10, increment=True, reserve=3
+    )
+    assert (within_limit, reserved) == (True, 3)
+    assert 0 < seconds_left <= window_length
+    assert services.redis_service.get(window_key) == b"4"
+
+    # the caller is not far enough under the limit to reserve again
+    assert services.redis_service.fixed_window_rate_limit(
+      rate_limit_key, window_length, max_attempts=10, increment=True, reserve=3
+    )[:2] == (True, 0)
+    for _ in range(5):
+      assert services.redis_service.fixed_window_rate_limit(rate_limit_key, window_length, 10, increment=True)[0]
+    assert services.redis_service.fixed_window_rate_limit(rate_limit_key, window_length, 10, increment=False)[0]
+    assert not services.redis_service.fixed_window_rate_limit(rate_limit_key, window_length, 10, increment=True)[0]
+    assert not services.redis_service.fixed_window_rate_limit(rate_limit_key, window_length, 10, increment=False)[0]
+    services.redis_service.delete(window_key)
+
+  @pytest.mark.parametrize("method_name", ["sliding_window_log_rate_limit", "gcra_rate_limit"])
+  def test_smooth_rate_limit(self, services, method_name):
+    rate_limit_key = self.make_redis_key(services, method_name)
+    services.redis_service.delete(rate_limit_key)
+    rate_limit = getattr(services.redis_service, method_name)
+
+    assert rate_limit(rate_limit_key, 1, max_attempts=3, increment=False) is True
+    assert [rate_limit(rate_limit_key, 1, max_attempts=3, increment=True) for _ in range(4)] == [
+      True,
+      True,
+      True,
+      False,
+    ]
+    assert rate_limit(rate_limit_key, 1, max_attempts=3, increment=False) is True
+    time.sleep(1.1)
+    assert rate_limit(rate_limit_key, 1, max_attempts=3, increment=True) is True
+    services.redis_service.delete(rate_limit_key)
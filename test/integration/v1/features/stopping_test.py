@@ -5,7 +5,7 @@ from typing import Any
 
 import pytest
 
-from zigopt.handlers.experiments.stopping_criteria import LOOKBACK_FACTOR, NUM_TOP_RESULTS_TO_CHECK
+from zigopt.experiment.stopping_criteria import LOOKBACK_FACTOR, NUM_TOP_RESULTS_TO_CHECK
 
 from integration.utils.make_values import make_values
 from integration.utils.random_assignment import random_assignments
@@ -0,0 +1,118 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import datetime
+from collections.abc import Callable
+
+import mock
+import pytest
+from sigopt_config.broker import ConfigBroker
+
+from zigopt.counter.service import CounterService
+from zigopt.exception.logger import ExceptionLogger
+from zigopt.redis.pipeline import RedisPipeline
+from zigopt.redis.service import RedisKeyService
+
+
+class TestCounterService:
+  @pytest.fixture
+  def services(self):
+    services = mock.Mock()
+    services.config_broker = ConfigBroker({"features": {"raiseSoftExceptions": True, "countersCacheTtl": 60}})
+    services.exception_logger = ExceptionLogger(services)
+    services.redis_key_service = RedisKeyService(services)
+    services.database_service = mock.MagicMock()
+    services.redis_service.enabled = True
+    services.redis_service.services = services
+    services.redis_service.pipeline.side_effect = lambda transaction=False: RedisPipeline(
+      services.redis_service,
+      transaction=transaction,
+    )
+    return services
+
+  @pytest.fixture
+  def counter_service(self, services):
+    return CounterService(services)
+
+  def test_get_counts(self, counter_service, services):
+    services.redis_service.execute_pipeline.side_effect = [[b"3", b"1", None, b"2", None, None], [True, False]]
+    count_missing = mock.Mock(return_value={2: 5})
+    counts = counter_service.get_counts("things", [1, 2, 3, 1], count_missing, scope=(7,))
+    assert counts == {1: 3, 2: 5, 3: 0}
+    count_missing.assert_called_once_with([2, 3])
+    services.database_service.use_primary.assert_called_once_with()
+    assert services.redis_service.execute_pipeline.call_count == 2
+    set_commands = services.redis_service.execute_pipeline.call_args_list[1][0][0]
+    assert len(set_commands) == 2
+    pipeline = mock.Mock()
+    for command, _ in set_commands:
+      command(pipeline)
+    assert services.redis_service.make_set_if_version_args.call_args_list == [
+      mock.call(b"2", 5, datetime.timedelta(seconds=60)),
+      mock.call(None, 0, datetime.timedelta(seconds=60)),
+    ]
+
+  def test_get_counts_all_cached(self, counter_service, services):
+    services.redis_service.execute_pipeline.return_value = [b"3", None, b"0", b"4"]
+    count_missing = mock.Mock()
+    assert counter_service.get_counts("things", [1, 2], count_missing) == {1: 3, 2: 0}
+    count_missing.assert_not_called()
+    assert services.redis_service.execute_pipeline.call_count == 1
+
+  def test_get_counts_disabled(self, counter_service, services):
+    services.config_broker.data["features"]["cacheCounters"] = False
+    count_missing = mock.Mock(return_value={1: 4})
+    assert counter_service.get_counts("things", [1, 2], count_missing) == {1: 4, 2: 0}
+    count_missing.assert_called_once_with([1, 2])
+    services.redis_service.execute_pipeline.assert_not_called()
+
+  def test_get_counts_redis_down(self, counter_service, services):
+    services.config_broker.data["features"]["raiseSoftExceptions"] = False
+    services.redis_service.execute_pipeline.side_effect = Exception
+    count_missing = mock.Mock(return_value={1: 4})
+    assert counter_service.get_counts("things", [1], count_missing) == {1: 4}
+    count_missing.assert_called_once_with([1])
+    assert services.redis_service.execute_pipeline.call_count == 1
+
+  def test_increment(self, counter_service, services):
+    callbacks: list[Callable[[], None]] = []
+    services.database_service.after_commit.side_effect = callbacks.append
+    counter_service.increment("things", {1: 2, None: 1, 2: -1, 3: 0}, scope=(7,))
+    services.redis_service.execute_pipeline.assert_not_called()
+    (callback,) = callbacks
+    callback()
+    increment_commands = services.redis_service.execute_pipeline.call_args[0][0]
+    pipeline = mock.Mock()
+    for command, _ in increment_commands:
+      command(pipeline)
+    assert services.redis_service.make_increment_versioned_args.call_args_list == [
+      mock.call(2, datetime.timedelta(seconds=60), None),
+      mock.call(-1, datetime.timedelta(seconds=60), None),
+    ]
+    services.redis_service.get_script.assert_called_with("INCREMENT_VERSIONED_SCRIPT")
+    assert [kwargs["keys"] for _, kwargs in services.redis_service.get_script.return_value.call_args_list] == [
+      ["counter:things:7:1", "counter:things:7:1:version"],
+      ["counter:things:7:2", "counter:things:7:2:version"],
+    ]
+
+  def test_increment_nothing(self, counter_service, services):
+    counter_service.increment("things", {None: 1, 1: 0})
+    services.database_service.after_commit.assert_not_called()
+
+  def test_invalidate(self, counter_service, services):
+    callbacks: list[Callable[[], None]] = []
+    services.database_service.after_commit.side_effect = callbacks.append
+    counter_service.invalidate("things", [1, None, 1, 2], scope=(7,))
+    services.redis_service.invalidate_versioned.assert_not_called()
+    (callback,) = callbacks
+    callback()
+    ((redis_keys,), kwargs) = services.redis_service.invalidate_versioned.call_args
+    assert [services.redis_key_service.get_key_value(k) for k in redis_keys] == [
+      "counter:things:7:1",
+      "counter:things:7:2",
+    ]
+    assert kwargs == {"expire": datetime.timedelta(seconds=60)}
+
+  def test_invalidate_nothing(self, counter_service, services):
+    counter_service.invalidate("things", [None])
+    services.database_service.after_commit.assert_not_called()
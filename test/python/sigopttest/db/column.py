@@ -3,10 +3,12 @@
 # SPDX-License-Identifier: Apache License 2.0
 import pytest
 from sqlalchemy import BigInteger, Column
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.declarative import declarative_base
 
 from zigopt.db.column import *
 from zigopt.protobuf.gen.test.message_pb2 import Child, Parent
+from zigopt.protobuf.lazy import LazyProtobuf
 
 
 Base: type = declarative_base()
@@ -16,6 +18,7 @@ class Model(Base):
   __tablename__ = "model"
   test_other_column = Column(BigInteger, primary_key=True)
   protobuf_column = ProtobufColumn(Parent)
+  lazy_protobuf_column = ProtobufColumn(Parent, lazy=True)
 
 
 class TestDbColumn:
@@ -234,3 +237,28 @@ class TestDbColumn:
       adapt_for_jsonb(Parent(optional_composite_field=Child(value=1.0))) == '{"optional_composite_field":{"value":1.0}}'
     )
     assert adapt_for_jsonb({"a": Parent()}) == '{"a":{}}'
+
+  def test_lazy_result_value(self):
+    column_type = Model.lazy_protobuf_column.type
+    value = column_type.process_result_value({"optional_double_field": 1.0, "serialized_name": "a"}, None)
+    assert isinstance(value, LazyProtobuf)
+    assert value.variable_name == "a"
+    assert not value.is_parsed
+    assert value == Parent(optional_double_field=1.0, variable_name="a")
+    assert column_type.process_result_value(None, None) == Parent()
+    assert isinstance(column_type.copy().process_result_value({}, None), LazyProtobuf)
+    assert isinstance(Model.protobuf_column.type.process_result_value({}, None), Parent)
+
+  def test_with_only_fields(self):
+    clause = Model.protobuf_column.with_only_fields("optional_double_field", "variable_name")
+    assert clause.type is Model.protobuf_column.type
+    compiled = str(clause.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    assert compiled.startswith("jsonb_build_object('optional_double_field', ")
+    assert "'serialized_name', " in compiled
+    assert "variable_name" not in compiled
+    with pytest.raises(AttributeError):
+      Model.protobuf_column.with_only_fields("serialized_name")
+    with pytest.raises(AttributeError):
+      Model.protobuf_column.with_only_fields("fake_field")
+    with pytest.raises(ValueError):
+      Model.protobuf_column.optional_double_field.with_only_fields("value")
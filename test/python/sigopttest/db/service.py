@@ -1,12 +1,30 @@
 # Copyright © 2022 Intel Corporation
 #
 # SPDX-License-Identifier: Apache License 2.0
+import itertools
+import logging
+import math
+import time
+
 import mock
 import pytest
 from sigopt_config.broker import ConfigBroker
+from sqlalchemy import Column, Integer, bindparam, create_engine, event
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.declarative import DeclarativeMeta, declarative_base
 
 from zigopt.common import *
-from zigopt.db.service import DatabaseConnection, DatabaseConnectionService
+from zigopt.db.service import (
+  QUERY_CACHE_LOOKUPS,
+  QUERY_CACHE_MISSES,
+  DatabaseConnection,
+  DatabaseConnectionService,
+  DatabaseReplica,
+  DatabaseService,
+)
+from zigopt.exception.logger import ExceptionLogger
+from zigopt.profile.metrics import MetricsRegistry
+from zigopt.profile.request_stats import current_request_stats, start_request_stats, stop_request_stats
 
 
 USERNAME = "fakeproduser"
@@ -85,3 +103,283 @@ class TestDatabaseConnectionService:
     with mock.patch("pg8000.connect", side_effect=OurException()):
       with pytest.raises(OurException):
         service.warmup_db()
+
+
+ReplicaTestBase: DeclarativeMeta = declarative_base()
+
+
+class Thing(ReplicaTestBase):
+  __tablename__ = "things"
+  id = Column(Integer, primary_key=True)
+
+
+class TestDatabaseReplicas:
+  @pytest.fixture
+  def services(self):
+    services = mock.Mock()
+    services.config_broker = ConfigBroker({"features": {"raiseSoftExceptions": True}})
+    services.exception_logger = ExceptionLogger(services)
+    return services
+
+  def make_connection(self, num_things, replicas=()):
+    engine = create_engine("sqlite://")
+    ReplicaTestBase.metadata.create_all(engine)
+    engine.execute(Thing.__table__.insert(), [{"id": i} for i in range(1, num_things + 1)])
+    return DatabaseConnection(engine, replicas=replicas)
+
+  @pytest.fixture
+  def replica(self):
+    replica = DatabaseReplica(self.make_connection(3), create_engine("sqlite://"), max_lag=1, lag_check_interval=60)
+    with mock.patch.object(replica, "measure_lag", return_value=0.5):
+      replica.refresh_lag()
+      yield replica
+
+  @pytest.fixture
+  def database_service(self, services, replica):
+    database_service = DatabaseService(services, self.make_connection(1, replicas=[replica]))
+    yield database_service
+    database_service.end_session()
+
+  def test_reads_from_replica(self, database_service):
+    database_service.start_session(use_replica=True)
+    assert database_service.count(database_service.query(Thing)) == 3
+    assert len(database_service.all(database_service.query(Thing))) == 3
+    assert database_service.one_or_none(database_service.query(Thing).filter(Thing.id == 3)).id == 3
+    assert database_service.exists(database_service.query(Thing).filter(Thing.id == 2))
+
+  def test_reads_own_writes(self, database_service):
+    database_service.start_session(use_replica=True)
+    assert database_service.count(database_service.query(Thing)) == 3
+    database_service.insert(Thing(id=10))
+    assert [t.id for t in database_service.all(database_service.query(Thing))] == [1, 10]
+
+  def test_use_primary(self, database_service):
+    database_service.start_session(use_replica=True)
+    with database_service.use_primary():
+      assert database_service.count(database_service.query(Thing)) == 1
+    assert database_service.count(database_service.query(Thing)) == 3
+
+  def test_without_replica(self, database_service):
+    database_service.start_session()
+    assert database_service.count(database_service.query(Thing)) == 1
+
+  def test_lagging_replica(self, database_service, replica):
+    replica.measure_lag.return_value = 5
+    replica.refresh_lag()
+    database_service.start_session(use_replica=True)
+    assert database_service.count(database_service.query(Thing)) == 1
+
+  def test_refresh_lag(self, replica):
+    assert replica.is_available()
+    replica.measure_lag.return_value = 5
+    assert replica.is_available()
+    assert replica.measure_lag.call_count == 1
+    replica.refresh_lag()
+    assert not replica.is_available()
+    replica.measure_lag.return_value = 0
+    replica.refresh_lag()
+    assert replica.is_available()
+    replica.measure_lag.return_value = math.inf
+    replica.refresh_lag()
+    assert not replica.is_available()
+    replica.measure_lag.return_value = 0
+    replica.refresh_lag()
+    assert replica.is_available()
+    replica.measure_lag.side_effect = OperationalError("SELECT", {}, Exception())
+    replica.refresh_lag()
+    assert not replica.is_available()
+
+  def test_refreshes_in_background(self, replica):
+    replica.lag_check_interval = 0.01
+    replica.measure_lag.side_effect = itertools.chain([5], itertools.repeat(0.5))
+    replica.start()
+    try:
+      deadline = time.monotonic() + 5
+      while replica.measure_lag.call_count < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+      assert replica.measure_lag.call_count >= 4
+      assert replica.is_available()
+    finally:
+      replica.stop()
+
+
+class TestDatabaseTransactions:
+  @pytest.fixture
+  def database_service(self):
+    services = mock.Mock()
+    services.config_broker = ConfigBroker({"features": {"raiseSoftExceptions": True}})
+    services.exception_logger = ExceptionLogger(services)
+    engine = create_engine("sqlite://")
+
+    # NOTE: pysqlite manages transactions itself by default, which breaks savepoints
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+      dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+      connection.execute("BEGIN")
+
+    ReplicaTestBase.metadata.create_all(engine)
+    database_service = DatabaseService(services, DatabaseConnection(engine))
+    database_service.start_session()
+    yield database_service
+    database_service.end_session()
+
+  def thing_ids(self, database_service):
+    with database_service.engine.connect() as connection:
+      return sorted(row[0] for row in connection.execute(Thing.__table__.select()))
+
+  def test_commits_once(self, database_service):
+    with mock.patch.object(database_service._session, "commit", wraps=database_service._session.commit) as commit:
+      with database_service.transaction():
+        assert database_service.in_transaction
+        database_service.insert(Thing(id=1))
+        database_service.insert_all([Thing(id=2), Thing(id=3)])
+        database_service.delete_one(database_service.query(Thing).filter(Thing.id == 3))
+        assert database_service.count(database_service.query(Thing)) == 2
+        commit.assert_not_called()
+    assert commit.call_count == 1
+    assert not database_service.in_transaction
+    assert self.thing_ids(database_service) == [1, 2]
+
+  def test_rolls_back_on_error(self, database_service):
+    database_service.insert(Thing(id=1))
+    with pytest.raises(ValueError):
+      with database_service.transaction():
+        database_service.insert(Thing(id=2))
+        raise ValueError()
+    assert not database_service.in_transaction
+    assert self.thing_ids(database_service) == [1]
+
+  def test_nested_transaction_joins(self, database_service):
+    with pytest.raises(ValueError):
+      with database_service.transaction():
+        with database_service.transaction():
+          database_service.insert(Thing(id=1))
+        assert database_service.in_transaction
+        raise ValueError()
+    assert self.thing_ids(database_service) == []
+
+  def test_after_commit(self, database_service):
+    callback = mock.Mock()
+    database_service.after_commit(callback)
+    assert callback.call_count == 1
+    with database_service.transaction():
+      database_service.insert(Thing(id=1))
+      database_service.after_commit(callback)
+      with database_service.transaction():
+        database_service.after_commit(callback)
+      assert callback.call_count == 1
+    assert callback.call_count == 3
+    with pytest.raises(ValueError):
+      with database_service.transaction():
+        database_service.after_commit(callback)
+        raise ValueError()
+    with database_service.transaction():
+      pass
+    assert callback.call_count == 3
+
+  def test_savepoint(self, database_service):
+    with database_service.transaction():
+      database_service.insert(Thing(id=1))
+      with pytest.raises(IntegrityError):
+        with database_service.savepoint():
+          database_service.insert(Thing(id=2))
+          database_service.insert(Thing(id=1))
+      database_service.insert(Thing(id=3))
+    assert self.thing_ids(database_service) == [1, 3]
+
+  def test_savepoint_outside_transaction(self, database_service):
+    database_service.insert(Thing(id=1))
+    with pytest.raises(IntegrityError):
+      with database_service.savepoint():
+        database_service.insert(Thing(id=1))
+    database_service.insert(Thing(id=2))
+    assert self.thing_ids(database_service) == [1, 2]
+
+
+class TestDatabaseQueryCache:
+  @pytest.fixture
+  def services(self):
+    services = mock.Mock()
+    services.config_broker = ConfigBroker({"features": {"raiseSoftExceptions": True}})
+    services.exception_logger = ExceptionLogger(services)
+    services.metrics_registry = MetricsRegistry(services)
+    return services
+
+  @pytest.fixture
+  def database_service(self, services):
+    engine = create_engine("sqlite://")
+    ReplicaTestBase.metadata.create_all(engine)
+    engine.execute(Thing.__table__.insert(), [{"id": i} for i in range(1, 4)])
+    database_service = DatabaseService(services, DatabaseConnection(engine))
+    database_service.start_session()
+    yield database_service
+    database_service.end_session()
+
+  def test_cached_query(self, database_service, services):
+    built = []
+
+    def build(session):
+      built.append(session)
+      return session.query(Thing).filter(Thing.id > bindparam("min_id")).order_by(Thing.id)
+
+    for min_id, expected_ids in [(0, [1, 2, 3]), (1, [2, 3]), (2, [3])]:
+      things = database_service.all(database_service.cached_query(build, min_id=min_id))
+      assert [t.id for t in things] == expected_ids
+    assert database_service.one(database_service.cached_query(build, min_id=2)).id == 3
+    assert len(built) == 1
+    # NOTE: first and count modify the query, so they are cached separately
+    assert database_service.first(database_service.cached_query(build, min_id=3)) is None
+    assert database_service.first(database_service.cached_query(build, min_id=1)).id == 2
+    assert database_service.count(database_service.cached_query(build, min_id=1)) == 2
+    assert len(built) == 3
+
+    rendered = services.metrics_registry.render().splitlines()
+    label = f'{{query="{build.__qualname__}"}}'
+    assert f"{QUERY_CACHE_LOOKUPS}{label} 7.0" in rendered
+    assert f"{QUERY_CACHE_MISSES}{label} 3.0" in rendered
+
+  def test_cache_key(self, database_service):
+    def build(session, descending):
+      return session.query(Thing).order_by(Thing.id.desc() if descending else Thing.id)
+
+    for descending in (True, False):
+      things = database_service.all(
+        database_service.cached_query(lambda session: build(session, descending), descending),
+      )
+      assert [t.id for t in things] == sorted([1, 2, 3], reverse=descending)
+
+
+class TestDatabaseConnectionLogging:
+  @pytest.fixture
+  def connection(self):
+    engine = create_engine("sqlite://")
+    ReplicaTestBase.metadata.create_all(engine)
+    return DatabaseConnection(engine)
+
+  def test_request_stats(self, connection):
+    assert current_request_stats() is None
+    request_stats = start_request_stats()
+    connection.engine.execute(Thing.__table__.insert(), [{"id": 1}, {"id": 2}])
+    connection.engine.execute(Thing.__table__.select())
+    connection.engine.execute(Thing.__table__.select())
+    assert stop_request_stats() is request_stats
+    assert current_request_stats() is None
+    assert (request_stats.read_count, request_stats.write_count) == (2, 1)
+    assert request_stats.max_statement_repeats == 2
+    connection.engine.execute(Thing.__table__.select())
+    assert request_stats.query_count == 3
+
+  @pytest.mark.parametrize("level,sanitized", [(logging.INFO, False), (logging.DEBUG, True)])
+  def test_params_only_sanitized_when_logged(self, connection, level, sanitized):
+    sensitive_logger = logging.getLogger("sigopt.rawsql")
+    previous_level = sensitive_logger.level
+    sensitive_logger.setLevel(level)
+    try:
+      with mock.patch.object(connection, "sanitized_params", wraps=connection.sanitized_params) as sanitized_params:
+        connection.engine.execute(Thing.__table__.select())
+      assert sanitized_params.called is sanitized
+    finally:
+      sensitive_logger.setLevel(previous_level)
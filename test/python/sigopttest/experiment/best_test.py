@@ -7,64 +7,80 @@ import pytest
 from mock import Mock
 
 from zigopt.experiment.best import ExperimentBestObservationService
+from zigopt.experiment.model import Experiment
 from zigopt.experiment.util import get_experiment_default_metric_name
+from zigopt.observation.model import Observation
+from zigopt.protobuf.gen.experiment.experimentmeta_pb2 import MAXIMIZE, MINIMIZE, ExperimentMeta, ExperimentMetric
+from zigopt.protobuf.gen.observation.observationdata_pb2 import ObservationData
 
 from libsigopt.aux.constant import MULTISOLUTION_TOP_OBSERVATIONS_FRACTION
 from libsigopt.aux.errors import SigoptComputeError
 
 
 class TestExperimentBestObservationService:
-  def create_mock_from_list(self, input_list):
-    if input_list:
-      return [
-        Mock(
-          id=i,
-          data=value,
-          value=value,
-          metric_value=Mock(return_value=value),
-          metric_value_var=Mock(return_value=value),
-        )
-        for i, value in enumerate(input_list)
-      ]
-    return None
+  def make_experiment(self, metrics, num_solutions=1):
+    experiment_meta = ExperimentMeta(num_solutions=num_solutions)
+    experiment_meta.metrics.extend(metrics)
+    return Experiment(experiment_meta=experiment_meta)
+
+  def make_observation(self, values, reported_failure=False, cost=None):
+    data = ObservationData(reported_failure=reported_failure)
+    for name, value in values.items():
+      if value is None:
+        data.values.add(name=name)
+      else:
+        data.values.add(name=name, value=value)
+    if cost is not None:
+      data.task.cost = cost
+    return Observation(data=data)
+
+  def get_value(self, observation):
+    return next(v.value for v in observation.data.values if v.name == "a")
 
   @pytest.mark.parametrize(
-    "var_list",
+    "value_list",
     [
       [1e-3],
       [None, 0.5, None],
       [None, None, None, 1e-8],
+      [0.0, 2.0, 2.0, -1.0],
     ],
   )
-  def test_single_metric_best(self, var_list):
-    services = Mock()
-    experiment = Mock(optimized_metrics=[Mock(name="")], is_search=False)
-    observations = self.create_mock_from_list(var_list)
-
-    services.observation_service = Mock()
-    services.observation_service.valid_observations = Mock(return_value=observations)
-
-    experiment_best_observation_service = ExperimentBestObservationService(services)
-    experiment_best_observation_service.best_from_valid_observations = Mock(return_value=1)  # type: ignore
+  def test_single_metric_best(self, value_list):
+    experiment = self.make_experiment([ExperimentMetric(name="a")])
+    observations = [self.make_observation({"a": value}) for value in value_list]
 
+    experiment_best_observation_service = ExperimentBestObservationService(Mock())
     best = experiment_best_observation_service.single_metric_best(experiment, observations)
-    assert experiment_best_observation_service.best_from_valid_observations.called  # type: ignore
-    assert best == 1
-
-  @pytest.mark.parametrize("var_list", [[], [None, 0], [None, None, None], [0.0, 0.00000], [0.0, None]])
-  def test_single_metric_best_when_var_was_not_reported(self, var_list):
-    services = Mock()
-    experiment = Mock(optimized_metrics=[Mock(name="")], is_search=False)
-    observations = self.create_mock_from_list(var_list) if var_list else var_list
-
-    services.observation_service = Mock()
-    services.observation_service.valid_observations = Mock(return_value=observations)
+    expected_value = max(v for v in value_list if v is not None)
+    assert best is observations[value_list.index(expected_value)]
+
+  @pytest.mark.parametrize("value_list", [[], [None], [None, None, None]])
+  def test_single_metric_best_when_value_was_not_reported(self, value_list):
+    experiment = self.make_experiment([ExperimentMetric(name="a")])
+    observations = [self.make_observation({"a": value}) for value in value_list]
+
+    experiment_best_observation_service = ExperimentBestObservationService(Mock())
+    assert experiment_best_observation_service.single_metric_best(experiment, observations) is None
+
+  def test_single_metric_best_excludes_invalid_observations(self):
+    experiment = self.make_experiment(
+      [
+        ExperimentMetric(name="a", objective=MINIMIZE),
+        ExperimentMetric(name="b", strategy=ExperimentMetric.CONSTRAINT, threshold=0, objective=MAXIMIZE),
+      ]
+    )
+    observations = [
+      self.make_observation({"a": 4, "b": 1}, cost=1),
+      self.make_observation({"a": 1, "b": -1}, cost=1),
+      self.make_observation({"a": 0}, reported_failure=True, cost=1),
+      self.make_observation({"a": 2, "b": 1}, cost=0.5),
+      self.make_observation({"a": 3, "b": 0}, cost=1),
+    ]
 
-    experiment_best_observation_service = ExperimentBestObservationService(services)
-    experiment_best_observation_service.best_from_valid_observations = Mock(return_value=1)  # type: ignore
-    best = experiment_best_observation_service.single_metric_best(experiment, observations)
-    assert experiment_best_observation_service.best_from_valid_observations.called  # type: ignore
-    assert best == 1
+    experiment_best_observation_service = ExperimentBestObservationService(Mock())
+    assert experiment_best_observation_service.single_metric_best(experiment, observations, cost=1) is observations[4]
+    assert experiment_best_observation_service.single_metric_best(experiment, observations) is observations[3]
 
   @pytest.mark.parametrize("return_value", [1, None])
   def test_get_best_observations_single_metric(self, return_value):
@@ -95,23 +111,27 @@ class TestExperimentBestObservationService:
     ],
   )
   def test_get_best_observations_multimetric(self, values, sorted_values):
-    services = Mock()
-    first_metric = Mock()
-    first_metric.name = "a"
-    experiment = Mock(
-      optimized_metrics=[first_metric, Mock(name="b")],
-      requires_pareto_frontier_optimization=True,
-      is_search=False,
-    )
-    observations = [Mock(value_for_maximization=Mock(return_value=val)) for val in values]
-    best_observation_service = ExperimentBestObservationService(services)
-    best_observation_service.pareto_frontier = Mock(return_value=observations)  # type: ignore
+    experiment = self.make_experiment([ExperimentMetric(name="a"), ExperimentMetric(name="b")])
+    # NOTE: b is decreasing in a, so every observation with both values is on the pareto frontier
+    observations = [self.make_observation({"a": val, "b": -val if val is not None else None}) for val in values]
+    best_observation_service = ExperimentBestObservationService(Mock())
     sorted_observations = best_observation_service.get_best_observations(experiment, observations)
-    assert best_observation_service.pareto_frontier.called  # type: ignore
     default_metric_name = get_experiment_default_metric_name(experiment)
     assert default_metric_name == "a"
-    for o, val in zip(sorted_observations, sorted_values):
-      assert o.value_for_maximization() == val
+    assert [self.get_value(o) for o in sorted_observations] == sorted_values
+
+  def test_get_best_observations_multimetric_pareto_frontier(self):
+    experiment = self.make_experiment([ExperimentMetric(name="a"), ExperimentMetric(name="b", objective=MINIMIZE)])
+    observations = [
+      self.make_observation({"a": 1, "b": 1}),
+      self.make_observation({"a": 2, "b": 2}),
+      self.make_observation({"a": 1, "b": 3}),
+      self.make_observation({"a": 3, "b": 1}, reported_failure=True),
+      self.make_observation({"a": 0, "b": 0}),
+    ]
+    best_observation_service = ExperimentBestObservationService(Mock())
+    sorted_observations = best_observation_service.get_best_observations(experiment, observations)
+    assert sorted_observations == [observations[1], observations[0], observations[4]]
 
   @pytest.mark.parametrize(
     "values, expected_sorted_values, within_metric_thresholds",
@@ -125,27 +145,21 @@ class TestExperimentBestObservationService:
     ],
   )
   def test_get_best_observations_search(self, values, expected_sorted_values, within_metric_thresholds):
-    services = Mock()
-    first_metric = Mock()
-    first_metric.name = "a"
-    experiment = Mock(
-      constraint_metrics=[first_metric, Mock(name="b")],
-      requires_pareto_frontier_optimization=False,
-      is_search=True,
+    experiment = self.make_experiment(
+      [
+        ExperimentMetric(name="a", strategy=ExperimentMetric.CONSTRAINT),
+        ExperimentMetric(name="b", strategy=ExperimentMetric.CONSTRAINT, threshold=0),
+      ]
     )
     observations = [
-      Mock(
-        value_for_maximization=Mock(return_value=val),
-        within_metric_thresholds=Mock(return_value=within),
-      )
+      self.make_observation({"a": val, "b": 1 if within else -1})
       for val, within in zip(values, within_metric_thresholds)
     ]
-    best_observation_service = ExperimentBestObservationService(services)
+    best_observation_service = ExperimentBestObservationService(Mock())
     sorted_observations = best_observation_service.get_best_observations(experiment, observations)
     default_metric_name = get_experiment_default_metric_name(experiment)
     assert default_metric_name == "a"
-    for o, val in zip(sorted_observations, expected_sorted_values):
-      assert o.value_for_maximization() == val
+    assert [self.get_value(o) for o in sorted_observations] == expected_sorted_values
 
   @pytest.mark.parametrize("num_observations", [1, 12, 25, 50, 100])
   @pytest.mark.parametrize("num_solutions", [2, 3, 50, 99])
@@ -163,21 +177,8 @@ class TestExperimentBestObservationService:
     services.sc_adapter.multisolution_best_assignments = Mock(return_value=best_assignments_mock_indices)
     services.exception_logger.soft_exception = Mock()
 
-    first_metric = Mock()
-    first_metric.name = "a"
-    experiment = Mock(
-      optimized_metrics=[first_metric, Mock(name="b")],
-      requires_pareto_frontier_optimization=False,
-      is_search=False,
-      num_solutions=num_solutions,
-    )
-    observations = [
-      Mock(
-        value_for_maximization=Mock(return_value=val),
-        within_metric_thresholds=Mock(return_value=True),
-      )
-      for val in values
-    ]
+    experiment = self.make_experiment([ExperimentMetric(name="a")], num_solutions=num_solutions)
+    observations = [self.make_observation({"a": val}) for val in values]
 
     best_observation_service = ExperimentBestObservationService(services)
     best_observations = best_observation_service.get_best_observations(experiment, observations)
@@ -191,8 +192,7 @@ class TestExperimentBestObservationService:
     default_metric_name = get_experiment_default_metric_name(experiment)
     assert default_metric_name == "a"
     assert len(best_observations) == len(best_values)
-    for o, val in zip(best_observations, best_values):
-      assert o.value_for_maximization() == val
+    assert [self.get_value(o) for o in best_observations] == best_values
 
   def test_multisolution_best_assignments_soft_exception(self):
     num_observations = 30
@@ -205,21 +205,8 @@ class TestExperimentBestObservationService:
     services.sc_adapter.multisolution_best_assignments = Mock(side_effect=SigoptComputeError("SigoptComputeError Test"))
     services.exception_logger.soft_exception = Mock()
 
-    first_metric = Mock()
-    first_metric.name = "a"
-    experiment = Mock(
-      optimized_metrics=[first_metric, Mock(name="b")],
-      requires_pareto_frontier_optimization=False,
-      is_search=False,
-      num_solutions=num_solutions,
-    )
-    observations = [
-      Mock(
-        value_for_maximization=Mock(return_value=val),
-        within_metric_thresholds=Mock(return_value=True),
-      )
-      for val in values
-    ]
+    experiment = self.make_experiment([ExperimentMetric(name="a")], num_solutions=num_solutions)
+    observations = [self.make_observation({"a": val}) for val in values]
     best_observation_service = ExperimentBestObservationService(services)
 
     best_observations = best_observation_service.get_best_observations(experiment, observations)
@@ -230,8 +217,7 @@ class TestExperimentBestObservationService:
     default_metric_name = get_experiment_default_metric_name(experiment)
     assert default_metric_name == "a"
     assert len(best_observations) == len(best_values) == num_solutions
-    for o, val in zip(best_observations, best_values):
-      assert o.value_for_maximization() == val
+    assert [self.get_value(o) for o in best_observations] == best_values
 
   @pytest.mark.parametrize("num_observations", [2, 5, 30, 50])
   def test_multiple_solutions_best(self, num_observations):
@@ -0,0 +1,53 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import numpy
+import pytest
+
+from zigopt.experiment.stopping_criteria import (
+  NUM_TOP_RESULTS_TO_CHECK,
+  StagnationState,
+  check_possible_stagnation,
+  summarize_values,
+)
+
+
+class TestStoppingCriteria:
+  @pytest.mark.parametrize("multimetric,num_metrics", [(False, 1), (True, 2)])
+  def test_incremental_summary_matches_full_summary(self, multimetric, num_metrics):
+    rng = numpy.random.default_rng(0)
+    values = rng.random((60, num_metrics))
+    values[7] = -numpy.inf
+    summary = summarize_values(values[:10], multimetric)
+    for start in range(10, 60, 7):
+      summary = summarize_values(numpy.concatenate([summary, values[start : start + 7]]), multimetric)
+    full_summary = summarize_values(values, multimetric)
+    assert {tuple(v) for v in summary} == {tuple(v) for v in full_summary}
+
+  def test_single_metric_stagnation(self):
+    old_values = numpy.array([[v] for v in range(10)], dtype=float)
+    old_summary = summarize_values(old_values, False)
+    assert len(old_summary) == NUM_TOP_RESULTS_TO_CHECK
+    assert check_possible_stagnation(old_summary, numpy.array([[1.0], [5.0]]), False) is True
+    assert check_possible_stagnation(old_summary, numpy.array([[1.0], [5.5]]), False) is False
+    assert check_possible_stagnation(old_summary[:-1], numpy.array([[1.0]]), False) is False
+
+  def test_multimetric_stagnation(self):
+    old_summary = summarize_values(numpy.array([[1.0, 0.0], [0.0, 1.0], [0.2, 0.2]]), True)
+    assert check_possible_stagnation(old_summary, numpy.array([[0.1, 0.1]]), True) is True
+    assert check_possible_stagnation(old_summary, numpy.array([[0.4, 0.4]]), True) is False
+
+  def test_state_serialization(self):
+    state = StagnationState(
+      observation_count=12,
+      max_observation_id=104,
+      lookback_depth=10,
+      metric_names=("a", "b"),
+      old_values=numpy.array([[1.0, -numpy.inf], [0.5, 2.0]]),
+    )
+    deserialized = StagnationState.deserialize(state.serialize().encode())
+    assert deserialized.observation_count == 12
+    assert deserialized.max_observation_id == 104
+    assert deserialized.is_compatible(10, ("a", "b"))
+    assert not deserialized.is_compatible(10, ("a",))
+    numpy.testing.assert_array_equal(deserialized.old_values, state.old_values)
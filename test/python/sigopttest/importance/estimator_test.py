@@ -0,0 +1,80 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import numpy
+import pytest
+from sklearn import datasets
+
+from zigopt.importance.estimator import (
+  IMPORTANCE_ESTIMATORS,
+  ExtraTreesImportanceEstimator,
+  HistGradientBoostingImportanceEstimator,
+  PermutationImportanceEstimator,
+  choose_importance_estimator,
+  get_forest_nbytes,
+)
+
+
+class TestImportanceEstimators:
+  @pytest.mark.parametrize("estimator_class", list(IMPORTANCE_ESTIMATORS.values()))
+  def test_informative_features(self, estimator_class):
+    features, values, coef = datasets.make_regression(
+      n_samples=300,
+      n_features=4,
+      n_informative=2,
+      noise=0.2,
+      coef=True,
+      random_state=0,
+    )
+    importances = estimator_class().fit_importances(features, values)
+    assert importances.shape == (4,)
+    assert numpy.all(numpy.isfinite(importances))
+    assert numpy.min(importances[coef != 0]) > numpy.max(importances[coef == 0])
+
+  def test_extra_trees_warm_start(self):
+    # pylint: disable=unbalanced-tuple-unpacking
+    features, values = datasets.make_regression(n_samples=400, n_features=4, noise=0.2, random_state=0)
+    estimator = ExtraTreesImportanceEstimator()
+    estimator.fit_importances(features[:200], values[:200])
+    forest = estimator.forest
+    assert forest is not None
+    first_trees = list(forest.estimators_)
+
+    estimator = ExtraTreesImportanceEstimator(forest=forest)
+    estimator.fit_importances(features, values)
+    assert estimator.forest is forest
+    assert len(forest.estimators_) == len(first_trees)
+    num_kept = len(first_trees) // 2
+    assert forest.estimators_[:num_kept] == first_trees[-num_kept:]
+    estimator.fit_importances(features, values)
+    assert len(forest.estimators_) == len(first_trees)
+    assert not set(first_trees) & set(forest.estimators_)
+
+  def test_forest_nbytes(self):
+    # pylint: disable=unbalanced-tuple-unpacking
+    features, values = datasets.make_regression(n_samples=200, n_features=4, noise=0.2, random_state=0)
+    estimator = ExtraTreesImportanceEstimator()
+    estimator.fit_importances(features, values)
+    assert estimator.forest is not None
+    node_count = sum(tree.tree_.node_count for tree in estimator.forest.estimators_)
+    assert node_count * 50 < get_forest_nbytes(estimator.forest) < node_count * 100
+
+
+class TestChooseImportanceEstimator:
+  def test_preference_within_budget(self):
+    names = [PermutationImportanceEstimator.NAME, ExtraTreesImportanceEstimator.NAME]
+    assert choose_importance_estimator(names, 1000, 10, 2, 60, 50) == (PermutationImportanceEstimator, 1000)
+    cost = 2 * ExtraTreesImportanceEstimator.estimate_cost(1000, 10)
+    assert choose_importance_estimator(names, 1000, 10, 2, cost, 50) == (ExtraTreesImportanceEstimator, 1000)
+
+  def test_shrinks_sample_over_budget(self):
+    names = [ExtraTreesImportanceEstimator.NAME, HistGradientBoostingImportanceEstimator.NAME]
+    cost = HistGradientBoostingImportanceEstimator.estimate_cost(500, 10)
+    estimator_class, sample_size = choose_importance_estimator(names, 2000, 10, 1, cost, 50)
+    assert estimator_class is HistGradientBoostingImportanceEstimator
+    assert sample_size == 500
+    assert choose_importance_estimator(names, 2000, 10, 1, 0, 50) == (HistGradientBoostingImportanceEstimator, 50)
+
+  def test_unknown_estimator(self):
+    with pytest.raises(KeyError):
+      choose_importance_estimator(["not_an_estimator"], 100, 2, 1, 60, 10)
@@ -4,9 +4,27 @@
 import numpy
 import pytest
 from flaky import flaky
+from mock import Mock, patch
+from sigopt_config.broker import ConfigBroker
 from sklearn import datasets
+from sklearn.ensemble import ExtraTreesRegressor
 
-from zigopt.importance.service import compute_importances
+from zigopt.experiment.model import Experiment
+from zigopt.importance.estimator import IMPORTANCE_ESTIMATORS, get_forest_nbytes
+from zigopt.importance.service import (
+  ImportancesForestCache,
+  ImportancesService,
+  compute_importances,
+  stratified_subsample_indices,
+)
+from zigopt.observation.model import Observation
+from zigopt.protobuf.gen.experiment.experimentmeta_pb2 import (
+  PARAMETER_DOUBLE,
+  ExperimentMeta,
+  ExperimentMetric,
+  ExperimentParameter,
+)
+from zigopt.protobuf.gen.observation.observationdata_pb2 import ObservationData, ObservationValue
 
 
 class TestImportancesComputation:
@@ -52,3 +70,161 @@ class TestImportancesComputation:
     assert len(importances) == n_features
     assert numpy.isclose(sum(importances), 1, rtol=1e-9)
     assert numpy.allclose(importances, numpy.full_like(importances, 1 / n_features), rtol=1e-9)
+
+  def test_stratified_subsample(self):
+    values = numpy.random.default_rng(1).random(5000)
+    indices = stratified_subsample_indices(values, 500)
+    assert len(indices) == 500
+    assert len(numpy.unique(indices)) == 500
+    assert numpy.all(numpy.diff(indices) > 0)
+    # each decile of the values is equally represented
+    deciles = numpy.searchsorted(numpy.quantile(values, numpy.linspace(0.1, 0.9, 9)), values[indices])
+    assert numpy.all(numpy.bincount(deciles) == 50)
+    numpy.testing.assert_array_equal(stratified_subsample_indices(values[:400], 500), numpy.arange(400))
+
+  def test_subsampled_importances(self):
+    # pylint: disable=unbalanced-tuple-unpacking
+    features, values = datasets.make_regression(n_samples=3000, n_features=5, noise=0.2, random_state=0)
+    importances = compute_importances(features, values, max_sample_size=300)
+    assert len(importances) == 5
+    assert numpy.isclose(sum(importances), 1, rtol=1e-9)
+
+
+class TestImportancesService:
+  @pytest.fixture
+  def services(self):
+    services = Mock()
+    services.config_broker = ConfigBroker({"features": {"importancesMaxSampleSize": 100}})
+    services.importances_forest_cache = ImportancesForestCache(services)
+    return services
+
+  @pytest.fixture
+  def experiment(self):
+    experiment_meta = ExperimentMeta(observation_budget=500)
+    experiment_meta.all_parameters_unsorted.extend(
+      [
+        ExperimentParameter(name="x", param_type=PARAMETER_DOUBLE),
+        ExperimentParameter(
+          name="y",
+          param_type=PARAMETER_DOUBLE,
+          transformation=ExperimentParameter.TRANSFORMATION_LOG,
+        ),
+        ExperimentParameter(name="z", param_type=PARAMETER_DOUBLE),
+      ]
+    )
+    experiment_meta.metrics.extend([ExperimentMetric(name="f"), ExperimentMetric(name="g")])
+    return Experiment(id=1, experiment_meta=experiment_meta)
+
+  @pytest.fixture
+  def observations(self):
+    rng = numpy.random.default_rng(0)
+    points = rng.uniform(1, 10, size=(300, 3))
+    return [
+      Observation(
+        id=i + 1,
+        data=ObservationData(
+          assignments_map=dict(zip("xyz", point)),
+          values=[
+            ObservationValue(name="f", value=point[0]),
+            ObservationValue(name="g", value=numpy.log10(point[1]) ** 2),
+          ],
+        ),
+      )
+      for i, point in enumerate(points)
+    ]
+
+  @pytest.mark.parametrize("estimator_name", list(IMPORTANCE_ESTIMATORS))
+  def test_compute_parameter_importances(self, services, experiment, observations, estimator_name):
+    services.config_broker = ConfigBroker(
+      {"features": {"importancesMaxSampleSize": 100, "importancesEstimators": [estimator_name]}}
+    )
+    services.observation_service.find_valid_observations.return_value = observations
+    timings: dict[str, float] = {}
+    assert ImportancesService(services).compute_parameter_importances(experiment, timings=timings) == 300
+    assert list(timings) == [estimator_name]
+    assert timings[estimator_name] > 0
+
+    ((_, importance_maps), _) = services.experiment_service.update_importance_maps.call_args
+    assert set(importance_maps) == {"f", "g"}
+    assert max(importance_maps["f"], key=importance_maps["f"].get) == "x"
+    assert max(importance_maps["g"], key=importance_maps["g"].get) == "y"
+    for importance_map in importance_maps.values():
+      assert set(importance_map) == {"x", "y", "z"}
+      assert numpy.isclose(sum(importance_map.values()), 1)
+
+  @pytest.mark.parametrize("max_concurrent_fits,n_jobs", [(4, 1), (1, -1)])
+  def test_num_jobs(self, services, experiment, observations, max_concurrent_fits, n_jobs):
+    services.config_broker.data["features"].update(
+      importancesForestCacheSize=4,
+      importancesMaxConcurrentFits=max_concurrent_fits,
+    )
+    services.observation_service.find_valid_observations.return_value = observations
+    ImportancesService(services).compute_parameter_importances(experiment)
+    assert services.importances_forest_cache.get((1, "f", ("x", "y", "z"))).n_jobs == n_jobs
+
+  def test_refits_without_forest_cache(self, services, experiment, observations):
+    services.observation_service.find_valid_observations.return_value = observations
+    ImportancesService(services).compute_parameter_importances(experiment)
+    assert services.importances_forest_cache.get((1, "f", ("x", "y", "z"))) is None
+
+  def test_warm_start(self, services, experiment, observations):
+    services.config_broker.data["features"]["importancesForestCacheSize"] = 4
+    services.observation_service.find_valid_observations.return_value = observations
+    importances_service = ImportancesService(services)
+    importances_service.compute_parameter_importances(experiment)
+    forest = services.importances_forest_cache.get((1, "f", ("x", "y", "z")))
+    first_trees = list(forest.estimators_)
+    importances_service.compute_parameter_importances(experiment)
+    assert services.importances_forest_cache.get((1, "f", ("x", "y", "z"))) is forest
+    assert len(forest.estimators_) == len(first_trees)
+    assert forest.estimators_[: len(first_trees) // 2] == first_trees[len(first_trees) // 2 :]
+
+
+class TestImportancesForestCache:
+  @pytest.fixture
+  def forest(self):
+    # pylint: disable=unbalanced-tuple-unpacking
+    features, values = datasets.make_regression(n_samples=100, n_features=3, random_state=0)
+    return ExtraTreesRegressor(n_estimators=5, random_state=0).fit(features, values)
+
+  def make_cache(self, **features):
+    services = Mock()
+    services.config_broker = ConfigBroker({"features": features})
+    return ImportancesForestCache(services)
+
+  def test_disabled_by_default(self, forest):
+    cache = self.make_cache()
+    cache.put(("a",), forest)
+    assert cache.get(("a",)) is None
+
+  def test_evicts_least_recently_used(self, forest):
+    cache = self.make_cache(importancesForestCacheSize=2)
+    for key in ("a", "b"):
+      cache.put((key,), forest)
+    assert cache.get(("a",)) is forest
+    cache.put(("c",), forest)
+    assert cache.get(("a",)) is forest
+    assert cache.get(("b",)) is None
+    assert cache.get(("c",)) is forest
+
+  def test_evicts_by_bytes(self, forest):
+    nbytes = get_forest_nbytes(forest)
+    cache = self.make_cache(importancesForestCacheSize=10, importancesForestCacheMaxBytes=2 * nbytes)
+    for key in ("a", "b", "a", "c"):
+      cache.put((key,), forest)
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) is forest
+    assert cache.get(("c",)) is forest
+
+    cache = self.make_cache(importancesForestCacheSize=10, importancesForestCacheMaxBytes=nbytes - 1)
+    cache.put(("a",), forest)
+    assert cache.get(("a",)) is None
+
+  def test_evicts_stale_forests(self, forest):
+    cache = self.make_cache(importancesForestCacheSize=2, importancesForestCacheMaxAgeSeconds=60)
+    with patch("zigopt.importance.service.time.monotonic", return_value=1000):
+      cache.put(("a",), forest)
+    with patch("zigopt.importance.service.time.monotonic", return_value=1060):
+      assert cache.get(("a",)) is forest
+    with patch("zigopt.importance.service.time.monotonic", return_value=1061):
+      assert cache.get(("a",)) is None
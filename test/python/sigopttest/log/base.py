@@ -145,6 +145,11 @@ class TestSyslogFormatter:
     mock_record.query_time = 52
     assert self.as_json(SyslogFormatter().format(mock_record))["queryTime"] == 52
 
+  def test_request_stats(self, mock_record):
+    mock_record.request_stats = {"queryCount": 3, "redisCommandCount": 2}
+    formatted = self.as_json(SyslogFormatter().format(mock_record))
+    assert (formatted["queryCount"], formatted["redisCommandCount"]) == (3, 2)
+
   def test_status(self, mock_record):
     mock_record.status = 404
     assert self.as_json(SyslogFormatter().format(mock_record))["status"] == 404
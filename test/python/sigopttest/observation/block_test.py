@@ -0,0 +1,100 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import numpy
+import pytest
+
+from zigopt.assignments.model import MissingValueException, extract_array_for_computation_from_assignments
+from zigopt.experiment.model import Experiment
+from zigopt.observation.block import ObservationBlock
+from zigopt.observation.model import Observation
+from zigopt.protobuf.gen.experiment.experimentmeta_pb2 import (
+  MINIMIZE,
+  PARAMETER_CATEGORICAL,
+  PARAMETER_DOUBLE,
+  PARAMETER_INT,
+  ExperimentMeta,
+  ExperimentParameter,
+)
+from zigopt.protobuf.gen.observation.observationdata_pb2 import ObservationData
+
+
+class TestObservationBlock:
+  @pytest.fixture
+  def experiment(self):
+    meta = ExperimentMeta()
+    p = meta.all_parameters_unsorted.add(name="x", param_type=PARAMETER_DOUBLE)
+    p.bounds.minimum, p.bounds.maximum = 0, 1
+    p = meta.all_parameters_unsorted.add(
+      name="l", param_type=PARAMETER_DOUBLE, transformation=ExperimentParameter.TRANSFORMATION_LOG
+    )
+    p.bounds.minimum, p.bounds.maximum = 1e-3, 1
+    p = meta.all_parameters_unsorted.add(name="c", param_type=PARAMETER_CATEGORICAL)
+    p.all_categorical_values.add(enum_index=1, name="a")
+    p.all_categorical_values.add(enum_index=2, name="b")
+    p = meta.all_parameters_unsorted.add(name="r", param_type=PARAMETER_INT, replacement_value_if_missing=3)
+    p.bounds.minimum, p.bounds.maximum = 0, 5
+    meta.metrics.add(name="m2")
+    meta.metrics.add(name="m1", objective=MINIMIZE)
+    return Experiment(experiment_meta=meta)
+
+  @pytest.fixture
+  def observations(self):
+    observations = []
+    for i in range(12):
+      data = ObservationData(assignments_map={"x": i / 12, "l": 10 ** (-i / 6), "c": 1 + i % 2})
+      if i % 3:
+        data.assignments_map["r"] = i % 5
+      if i == 4:
+        data.reported_failure = True
+      else:
+        data.values.add(name="m1", value=i, **({"value_var": 0.1} if i % 2 else {}))
+        data.values.add(name="m2", value=-i, value_var=0.2)
+      if i == 5:
+        data.task.cost = 0.5
+      observations.append(Observation(data=data))
+    return observations
+
+  def test_matches_observations(self, experiment, observations):
+    block = ObservationBlock.from_observations(experiment, iter(observations))
+    assert len(block) == len(observations)
+
+    expected_points = numpy.array(
+      [
+        extract_array_for_computation_from_assignments(o.data, experiment.all_parameters, numpy.empty(4))
+        for o in observations
+      ]
+    )
+    numpy.testing.assert_array_equal(block.points(experiment.all_parameters, log_scale=True), expected_points)
+    numpy.testing.assert_array_equal(
+      block.values,
+      [o.data.sorted_all_metric_values(experiment) or [numpy.nan] * 2 for o in observations],
+    )
+    numpy.testing.assert_array_equal(block.failures, [o.data.reported_failure for o in observations])
+    numpy.testing.assert_array_equal(block.task_costs, [o.data.task.cost for o in observations])
+    assert numpy.isnan(block.value_vars[0]).tolist() == [True, True]
+    assert numpy.isnan(block.value_vars[1]).tolist() == [False, False]
+    assert [b.get_assignments(experiment) for b in block.iter_assignments()] == [
+      o.data.get_assignments(experiment) for o in observations
+    ]
+
+  def test_read_only(self, experiment, observations):
+    block = ObservationBlock.from_observations(experiment, observations)
+    with pytest.raises(ValueError):
+      block.values[0, 0] = 1
+    with pytest.raises(ValueError):
+      block.assignments[0, 0] = 1
+
+  def test_missing_value(self, experiment, observations):
+    del observations[0].data.underlying.assignments_map["x"]
+    block = ObservationBlock.from_observations(experiment, observations)
+    assert numpy.isnan(block.assignment_column("x")[0])
+    with pytest.raises(MissingValueException):
+      block.points(experiment.all_parameters)
+
+  def test_empty(self, experiment):
+    block = ObservationBlock.from_observations(experiment, [])
+    assert len(block) == 0
+    assert not block
+    assert block.points(experiment.all_parameters).shape == (0, 4)
+    assert block.values.shape == (0, 2)
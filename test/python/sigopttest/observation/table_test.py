@@ -0,0 +1,111 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import numpy
+import pytest
+
+from zigopt.experiment.model import Experiment
+from zigopt.observation.model import Observation
+from zigopt.observation.table import ObservationTable
+from zigopt.protobuf.gen.experiment.experimentmeta_pb2 import MAXIMIZE, MINIMIZE, ExperimentMeta, ExperimentMetric
+from zigopt.protobuf.gen.observation.observationdata_pb2 import ObservationData, ObservationValue
+
+
+class TestObservationTable:
+  @pytest.fixture
+  def experiment(self):
+    experiment_meta = ExperimentMeta()
+    experiment_meta.metrics.extend(
+      [
+        ExperimentMetric(name="b", objective=MINIMIZE, threshold=2),
+        ExperimentMetric(name="a", objective=MAXIMIZE),
+        ExperimentMetric(name="c", objective=MAXIMIZE, strategy=ExperimentMetric.CONSTRAINT, threshold=0),
+      ]
+    )
+    return Experiment(experiment_meta=experiment_meta)
+
+  @pytest.fixture
+  def observations(self):
+    return [
+      Observation(
+        data=ObservationData(
+          values=[
+            ObservationValue(name="c", value=1),
+            ObservationValue(name="a", value=5, value_var=0.1),
+            ObservationValue(name="b", value=1),
+          ],
+        )
+      ),
+      Observation(
+        data=ObservationData(
+          values=[
+            ObservationValue(name="a", value=2),
+            ObservationValue(name="b", value=3),
+            ObservationValue(name="c", value=1),
+          ],
+        )
+      ),
+      Observation(data=ObservationData(reported_failure=True)),
+      Observation(
+        data=ObservationData(
+          values=[
+            ObservationValue(name="a", value=1),
+            ObservationValue(name="b"),
+            ObservationValue(name="c", value=0),
+          ],
+        )
+      ),
+    ]
+
+  def test_columns(self, experiment, observations):
+    table = ObservationTable(experiment, observations)
+    assert len(table) == 4
+    assert table.metric_names == ["a", "b", "c"]
+    numpy.testing.assert_array_equal(
+      table.values,
+      numpy.array([[5, 1, 1], [2, 3, 1], [numpy.nan] * 3, [1, numpy.nan, 0]], dtype=float),
+    )
+    numpy.testing.assert_array_equal(table.metric_values("a"), [5, 2, numpy.nan, 1])
+    numpy.testing.assert_array_equal(table.metric_values_for_maximization("b"), [-1, -3, numpy.nan, numpy.nan])
+    numpy.testing.assert_array_equal(
+      table.optimized_values_for_maximization,
+      numpy.array([[5, -1], [2, -3], [numpy.nan] * 2, [1, numpy.nan]], dtype=float),
+    )
+    numpy.testing.assert_array_equal(table.value_vars[:, 0], [0.1, numpy.nan, numpy.nan, numpy.nan])
+    numpy.testing.assert_array_equal(table.failures, [False, False, True, False])
+    numpy.testing.assert_array_equal(table.valid_mask(), [True, True, False, True])
+
+  def test_matches_observation_accessors(self, experiment, observations):
+    table = ObservationTable(experiment, observations)
+    for i, observation in enumerate(observations):
+      assert table.within_metric_thresholds[i] == observation.within_metric_thresholds(experiment)
+      if observation.reported_failure:
+        continue
+      for metric in experiment.all_metrics:
+        value = observation.metric_value(experiment, metric.name)
+        if value is None:
+          assert numpy.isnan(table.metric_values(metric.name)[i])
+        else:
+          assert table.metric_values(metric.name)[i] == value
+          assert table.metric_values_for_maximization(metric.name)[i] == observation.value_for_maximization(
+            experiment, metric.name
+          )
+
+  def test_valid_mask_with_cost(self, experiment, observations):
+    observations[0].data.task.cost = 0.5
+    observations[1].data.task.cost = 0.25
+    table = ObservationTable(experiment, observations)
+    numpy.testing.assert_array_equal(table.valid_mask(cost=1), [False, False, False, True])
+    assert table.select(numpy.flatnonzero(table.valid_mask(cost=0.5))) == [observations[0]]
+
+  def test_single_unnamed_metric(self):
+    experiment = Experiment(experiment_meta=ExperimentMeta())
+    observations = [Observation(data=ObservationData(values=[ObservationValue(value=v)])) for v in (1, 3, 2)]
+    table = ObservationTable(experiment, observations)
+    numpy.testing.assert_array_equal(table.values, [[1], [3], [2]])
+    assert table.within_metric_thresholds.all()
+
+  def test_empty(self, experiment):
+    table = ObservationTable(experiment, [])
+    assert table.values.shape == (0, 3)
+    assert table.within_metric_thresholds.shape == (0,)
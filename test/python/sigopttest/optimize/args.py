@@ -4,8 +4,10 @@
 import pytest
 
 from zigopt.common import *
+from zigopt.experiment.model import Experiment
 from zigopt.observation.model import *
 from zigopt.optimize.args import *
+from zigopt.protobuf.gen.experiment.experimentmeta_pb2 import ExperimentMeta
 
 
 class TestOptimizationArgs:
@@ -34,3 +36,13 @@ class TestOptimizationArgs:
     list(iterator)
     with pytest.raises(ValueError):
       list(iterator)
+
+  def test_observation_block_is_shared(self, ids):
+    experiment = Experiment(experiment_meta=ExperimentMeta())
+    args = self.make_args(ids)
+    copied_args = args.copy_and_set(observation_count=len(ids))
+    block = copied_args.get_observation_block(experiment)
+    assert len(block) == len(ids)
+    assert args.get_observation_block(experiment) is block
+    assert args.copy_and_set().get_observation_block(experiment) is block
+    assert len(args.copy_and_set(observation_iterator=iter([])).get_observation_block(experiment)) == 0
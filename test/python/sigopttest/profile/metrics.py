@@ -0,0 +1,133 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import urllib.request
+
+import mock
+import pytest
+from sigopt_config.broker import ConfigBroker
+
+from zigopt.exception.logger import ExceptionLogger
+from zigopt.profile.metrics import MetricsRegistry
+from zigopt.queue.metrics import (
+  MESSAGE_PROCESSING_SECONDS,
+  MESSAGE_WAIT_SECONDS,
+  MESSAGES_IN_FLIGHT,
+  OUTCOME_ERROR,
+  OUTCOME_PROCESSED,
+  QUEUE_DEPTH,
+  make_queue_depth_collector,
+  track_message,
+)
+
+
+class TestMetricsRegistry:
+  @pytest.fixture
+  def registry(self):
+    services = mock.Mock()
+    services.config_broker = ConfigBroker({"features": {"raiseSoftExceptions": True}})
+    services.exception_logger = ExceptionLogger(services)
+    return MetricsRegistry(services)
+
+  def test_counter(self, registry):
+    counter = registry.counter("requests_total", "Requests", ("method",))
+    counter.inc(method="GET")
+    registry.counter("requests_total", "Requests", ("method",)).inc(2, method="GET")
+    counter.inc(method='P"O\nST')
+    lines = registry.render().splitlines()
+    assert lines == [
+      "# HELP requests_total Requests",
+      "# TYPE requests_total counter",
+      'requests_total{method="GET"} 3.0',
+      'requests_total{method="P\\"O\\nST"} 1.0',
+    ]
+
+  def test_conflicting_metrics(self, registry):
+    registry.counter("things", "Things", ("a",))
+    with pytest.raises(AssertionError):
+      registry.gauge("things", "Things", ("a",))
+    with pytest.raises(AssertionError):
+      registry.counter("things", "Things", ("b",))
+    with pytest.raises(AssertionError):
+      registry.counter("things", "Things", ("a",)).inc(b=1)
+
+  def test_histogram(self, registry):
+    histogram = registry.histogram("latency_seconds", "Latency", buckets=(1, 5))
+    for value in (0.5, 1, 3, 10):
+      histogram.observe(value)
+    assert registry.render().splitlines()[2:] == [
+      'latency_seconds_bucket{le="1.0"} 2.0',
+      'latency_seconds_bucket{le="5.0"} 3.0',
+      'latency_seconds_bucket{le="+Inf"} 4.0',
+      "latency_seconds_count 4.0",
+      "latency_seconds_sum 14.5",
+    ]
+
+  def test_collectors(self, registry):
+    registry.add_collector(lambda r: r.gauge("depth", "Depth").set(7))
+    assert "depth 7.0" in registry.render().splitlines()
+
+  def test_track_message(self, registry):
+    message = mock.Mock(message_type="optimize_messages", enqueue_time=0)
+    with track_message(registry, "optimize", message) as outcome:
+      assert 'sigopt_queue_messages_in_flight{queue="optimize",message_type="optimize_messages"} 1.0' in (
+        registry.render().splitlines()
+      )
+      outcome.set(OUTCOME_PROCESSED)
+    with pytest.raises(ValueError), track_message(registry, "optimize", message):
+      raise ValueError()
+    rendered = registry.render()
+    labels = 'queue="optimize",message_type="optimize_messages"'
+    assert f"{MESSAGES_IN_FLIGHT}{{{labels}}} 0.0" in rendered
+    assert f"{MESSAGE_WAIT_SECONDS}_count{{{labels}}} 2.0" in rendered
+    assert f'{MESSAGE_PROCESSING_SECONDS}_count{{{labels},outcome="{OUTCOME_PROCESSED}"}} 1.0' in rendered
+    assert f'{MESSAGE_PROCESSING_SECONDS}_count{{{labels},outcome="{OUTCOME_ERROR}"}} 1.0' in rendered
+
+  def test_queue_depth_collector(self, registry):
+    provider = mock.Mock(queue_name="optimize")
+    provider.count_queued_messages.return_value = 12
+    unsupported_provider = mock.Mock(queue_name="analytics")
+    unsupported_provider.count_queued_messages.side_effect = NotImplementedError()
+    registry.add_collector(make_queue_depth_collector(mock.Mock(providers=[unsupported_provider, provider])))
+    assert f'{QUEUE_DEPTH}{{queue="optimize"}} 12.0' in registry.render().splitlines()
+
+  def test_serve(self, registry):
+    registry.counter("served_total", "Served").inc()
+    registry.serve(0)
+    try:
+      port = registry._server.server_port
+      with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        assert "served_total 1.0" in response.read().decode("utf-8").splitlines()
+    finally:
+      registry.shutdown()
+
+  def test_serve_next_free_port(self, registry):
+    other = MetricsRegistry(registry.services)
+    other.serve(0)
+    try:
+      assert other._server is not None
+      port = other._server.server_port
+      registry.serve(port, num_ports=2)
+      assert registry._server is not None
+      assert registry._server.server_port == port + 1
+      registry.shutdown()
+      with mock.patch.object(MetricsRegistry, "logger") as logger:
+        registry.serve(port)
+      assert registry._server is None
+      logger.warning.assert_called_once()
+    finally:
+      registry.shutdown()
+      other.shutdown()
+
+  def test_serve_from_config(self, registry):
+    with mock.patch.object(registry, "serve") as serve:
+      registry.serve_from_config("TEST_METRICS_PORT", "metrics.port")
+      registry.services.config_broker = ConfigBroker({"metrics": {"port": 9100}})
+      registry.serve_from_config("TEST_METRICS_PORT", "metrics.port")
+      serve.assert_not_called()
+      registry.services.config_broker = ConfigBroker({"metrics": {"enabled": True, "port": 9100}})
+      registry.serve_from_config("TEST_METRICS_PORT", "metrics.port")
+      serve.assert_called_once_with(9100, num_ports=32)
+      with mock.patch.dict("os.environ", {"TEST_METRICS_PORT": "9200"}):
+        registry.serve_from_config("TEST_METRICS_PORT", "metrics.port")
+      serve.assert_called_with(9200, num_ports=32)
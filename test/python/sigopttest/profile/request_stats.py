@@ -0,0 +1,96 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import pytest
+
+from zigopt.profile.request_stats import (
+  MAX_QUERIES,
+  MAX_QUERY_TIME_MS,
+  MAX_REDIS_COMMANDS,
+  MAX_STATEMENT_REPEATS,
+  RequestStats,
+  current_request_stats,
+  start_request_stats,
+  stop_request_stats,
+)
+
+
+SELECT_STATEMENT = "SELECT things.id FROM things WHERE things.id = %(id_1)s"
+INSERT_STATEMENT = "INSERT INTO things (id) VALUES (%(id)s)"
+
+
+class TestRequestStats:
+  @pytest.fixture
+  def request_stats(self):
+    request_stats = RequestStats()
+    for _ in range(3):
+      request_stats.add_query(SELECT_STATEMENT, is_read=True, seconds=0.002)
+    request_stats.add_query(INSERT_STATEMENT, is_read=False, seconds=0.004)
+    request_stats.add_redis_command()
+    return request_stats
+
+  def test_counts(self, request_stats):
+    assert request_stats.query_count == 4
+    assert (request_stats.read_count, request_stats.write_count) == (3, 1)
+    assert request_stats.query_time_ms == pytest.approx(10)
+    assert request_stats.redis_command_count == 1
+    assert request_stats.max_statement_repeats == 3
+    assert request_stats.repeated_statements() == [(SELECT_STATEMENT, 3)]
+
+  def test_empty(self):
+    request_stats = RequestStats()
+    assert request_stats.max_statement_repeats == 0
+    assert request_stats.repeated_statements() == []
+    assert request_stats.exceeded_budget({MAX_QUERIES: 0, MAX_STATEMENT_REPEATS: 1}) == []
+
+  def test_log_extra(self, request_stats):
+    log_extra = request_stats.log_extra()
+    assert log_extra["query_time"] == request_stats.query_time_ms
+    assert log_extra["request_stats"] == {
+      "queryCount": 4,
+      "readQueryCount": 3,
+      "writeQueryCount": 1,
+      "redisCommandCount": 1,
+      "maxStatementRepeats": 3,
+    }
+
+  def test_headers(self, request_stats):
+    assert request_stats.headers() == {
+      "X-Query-Count": "4",
+      "X-Query-Time-Ms": "10.0",
+      "X-Redis-Command-Count": "1",
+      "X-Max-Statement-Repeats": "3",
+    }
+
+  def test_within_budget(self, request_stats):
+    assert (
+      request_stats.exceeded_budget(
+        {
+          MAX_QUERIES: 4,
+          MAX_QUERY_TIME_MS: 100,
+          MAX_REDIS_COMMANDS: 1,
+          MAX_STATEMENT_REPEATS: 3,
+        }
+      )
+      == []
+    )
+
+  def test_exceeded_budget(self, request_stats):
+    exceeded = request_stats.exceeded_budget({MAX_QUERIES: 3, MAX_REDIS_COMMANDS: 0})
+    assert exceeded == [f"{MAX_QUERIES}=3 (was 4)", f"{MAX_REDIS_COMMANDS}=0 (was 1)"]
+
+  def test_exceeded_statement_repeats(self, request_stats):
+    exceeded = request_stats.exceeded_budget({MAX_STATEMENT_REPEATS: 2})
+    assert exceeded == [f"{MAX_STATEMENT_REPEATS}=2 (was 3)", f"repeated 3 times: {SELECT_STATEMENT}"]
+
+  def test_unknown_limit(self, request_stats):
+    with pytest.raises(AssertionError):
+      request_stats.exceeded_budget({"max_something": 1})
+
+  def test_thread_local(self):
+    assert current_request_stats() is None
+    request_stats = start_request_stats()
+    assert current_request_stats() is request_stats
+    assert stop_request_stats() is request_stats
+    assert current_request_stats() is None
+    assert stop_request_stats() is None
@@ -0,0 +1,81 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import pytest
+
+from zigopt.protobuf.dict import protobuf_to_dict
+from zigopt.protobuf.gen.test.message_pb2 import Child, Parent
+from zigopt.protobuf.lazy import LazyProtobuf
+from zigopt.protobuf.lib import copy_protobuf, is_protobuf
+from zigopt.protobuf.proxy import Proxy
+
+
+class TestLazyProtobuf:
+  @pytest.fixture
+  def message(self):
+    return Parent(
+      optional_double_field=1.5,
+      optional_composite_field=Child(name="child", value=2.0),
+      repeated_string_field=["a", "b"],
+      variable_name="serialized",
+      map_field={"key": 3.0},
+    )
+
+  @pytest.fixture
+  def lazy(self, message):
+    return LazyProtobuf(Parent, protobuf_to_dict(message))
+
+  def test_fields(self, lazy, message):
+    assert is_protobuf(lazy)
+    assert lazy.optional_double_field == 1.5
+    assert lazy.optional_composite_field == Child(name="child", value=2.0)
+    assert list(lazy.repeated_string_field) == ["a", "b"]
+    assert lazy.variable_name == "serialized"
+    assert dict(lazy.map_field) == {"key": 3.0}
+    assert lazy.optional_string_field == ""
+    assert lazy.optional_recursive_field == Parent()
+    assert not lazy.is_parsed
+    assert lazy == message
+
+  def test_has_field(self, lazy):
+    assert lazy.HasField("optional_composite_field")
+    assert not lazy.HasField("optional_recursive_field")
+    assert not lazy.is_parsed
+
+  def test_original_field_names(self, message):
+    lazy = LazyProtobuf(Parent, protobuf_to_dict(message, preserving_proto_field_name=True))
+    assert lazy.variable_name == "serialized"
+    assert lazy == message
+
+  def test_parses_whole_message(self, lazy, message):
+    assert lazy.ListFields() == message.ListFields()
+    assert lazy.is_parsed
+    assert lazy.underlying == message
+    assert lazy.optional_double_field == 1.5
+    assert lazy.HasField("optional_composite_field")
+
+  def test_copy(self, lazy, message):
+    copy = copy_protobuf(lazy)
+    assert isinstance(copy, Parent)
+    assert copy == message
+    copy.optional_double_field = 3
+    assert lazy.optional_double_field == 1.5
+
+  def test_immutable(self, lazy):
+    with pytest.raises(Exception):
+      lazy.optional_double_field = 3
+
+  def test_proxy(self, lazy, message):
+    proxy = Proxy(lazy)
+    assert proxy.underlying is lazy
+    assert proxy.optional_composite_field.name == "child"
+    assert not lazy.is_parsed
+    assert copy_protobuf(proxy) == message
+    assert lazy == proxy
+    with pytest.raises(Exception):
+      proxy.optional_double_field = 3
+
+  def test_unknown_fields(self):
+    lazy = LazyProtobuf(Parent, {"optional_double_field": 2, "unknown_field": True})
+    assert lazy.optional_double_field == 2
+    assert lazy == Parent(optional_double_field=2)
@@ -0,0 +1,51 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import base64
+
+import pytest
+
+from zigopt.queue.redis.body import (
+  BODY_VERSION_RAW,
+  BODY_VERSION_ZLIB,
+  MessageBodyDecodeError,
+  decode_message_body,
+  encode_legacy_message_body,
+  encode_message_body,
+)
+
+
+SMALL_BODY = b"\x08\x01\x12\x03abc"
+LARGE_BODY = b"\x0a\x10" + b"repeated content " * 100
+
+
+class TestMessageBody:
+  @pytest.mark.parametrize("body", [b"", SMALL_BODY, LARGE_BODY, bytes(range(256))])
+  @pytest.mark.parametrize("compression_min_bytes", [None, 0, 1024])
+  def test_round_trip(self, body, compression_min_bytes):
+    assert decode_message_body(encode_message_body(body, compression_min_bytes=compression_min_bytes)) == body
+
+  def test_raw(self):
+    assert encode_message_body(SMALL_BODY) == BODY_VERSION_RAW + SMALL_BODY
+    assert encode_message_body(LARGE_BODY) == BODY_VERSION_RAW + LARGE_BODY
+
+  def test_compression(self):
+    assert encode_message_body(SMALL_BODY, compression_min_bytes=1024) == BODY_VERSION_RAW + SMALL_BODY
+    encoded = encode_message_body(LARGE_BODY, compression_min_bytes=1024)
+    assert encoded.startswith(BODY_VERSION_ZLIB)
+    assert len(encoded) < len(LARGE_BODY)
+
+  def test_incompressible_body_is_not_compressed(self):
+    body = bytes(range(256))
+    assert encode_message_body(body, compression_min_bytes=0) == BODY_VERSION_RAW + body
+
+  @pytest.mark.parametrize("body", [SMALL_BODY, LARGE_BODY, bytes(range(256))])
+  def test_legacy(self, body):
+    encoded = encode_legacy_message_body(body)
+    assert encoded == base64.b64encode(body)
+    assert decode_message_body(encoded) == body
+
+  @pytest.mark.parametrize("stored_body", [b"not base64!", BODY_VERSION_ZLIB + b"not zlib"])
+  def test_invalid(self, stored_body):
+    with pytest.raises(MessageBodyDecodeError):
+      decode_message_body(stored_body)
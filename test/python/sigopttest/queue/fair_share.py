@@ -0,0 +1,112 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import mock
+import pytest
+from sigopt_config.broker import ConfigBroker
+
+from zigopt.queue.message import QueueMessage
+from zigopt.queue.message_types import MessageType
+from zigopt.queue.provider import QueueProviderType
+from zigopt.queue.providers import make_providers
+from zigopt.queue.redis.fair_share import DEFAULT_TENANT, RedisFairShareQueueProvider
+from zigopt.redis.service import RedisKeyService
+
+
+class TestRedisFairShareQueueProvider:
+  @pytest.fixture
+  def services(self):
+    services = mock.Mock()
+    services.config_broker = ConfigBroker({})
+    services.redis_key_service = RedisKeyService(services)
+    services.redis_service.enqueue_fair_share_members.return_value = None
+    return services
+
+  @pytest.fixture
+  def provider(self, services):
+    provider = RedisFairShareQueueProvider(services, "optimize", tenant_weights={"1": 3})
+    with mock.patch.object(provider, "_get_persisted_message_contents", return_value={}):
+      yield provider
+
+  def make_message(self, message_type):
+    message = mock.Mock(spec=QueueMessage)
+    message.message_type = message_type
+    return message
+
+  def test_priorities(self, provider):
+    assert provider.num_priorities == 3
+    assert provider.get_priority(MessageType.NEXT_POINTS) == 0
+    assert provider.get_priority(MessageType.IMPORTANCES) == 2
+    assert provider.get_priority("unknown_messages") == 2
+
+  def test_enqueue(self, provider, services):
+    provider.enqueue(
+      [self.make_message(MessageType.NEXT_POINTS), self.make_message(MessageType.IMPORTANCES)],
+      group_key="5",
+      enqueue_time=100,
+      message_score=None,
+      tenant_key="1",
+    )
+    kwargs = services.redis_service.enqueue_fair_share_members.call_args.kwargs
+    assert kwargs["tenant"] == "1"
+    assert kwargs["weight"] == 3
+    assert kwargs["num_priorities"] == 3
+    assert kwargs["member_priorities_and_scores"] == {
+      f"{MessageType.NEXT_POINTS}:5": (0, 100),
+      f"{MessageType.IMPORTANCES}:5": (2, 100),
+    }
+    assert kwargs["status_key"] is None
+
+  def test_enqueue_without_tenant(self, provider, services):
+    provider.enqueue([self.make_message(MessageType.OPTIMIZE)], group_key="5", enqueue_time=100, message_score=50)
+    kwargs = services.redis_service.enqueue_fair_share_members.call_args.kwargs
+    assert kwargs["tenant"] == DEFAULT_TENANT
+    assert kwargs["weight"] == 1
+    assert kwargs["member_priorities_and_scores"] == {f"{MessageType.OPTIMIZE}:5": (1, 50)}
+
+  def test_enqueue_debounced(self, services):
+    provider = RedisFairShareQueueProvider(services, "optimize", debounce_seconds={MessageType.OPTIMIZE: 30})
+    with mock.patch.object(provider, "_get_persisted_message_contents", return_value={}):
+      provider.enqueue(
+        [self.make_message(MessageType.NEXT_POINTS), self.make_message(MessageType.OPTIMIZE)],
+        group_key="5",
+        enqueue_time=100,
+        message_score=None,
+      )
+    kwargs = services.redis_service.enqueue_fair_share_members.call_args.kwargs
+    assert kwargs["member_priorities_and_scores"] == {
+      f"{MessageType.NEXT_POINTS}:5": (0, 100),
+      f"{MessageType.OPTIMIZE}:5": (1, 130),
+    }
+
+  def test_dequeue_debounced(self, services):
+    provider = RedisFairShareQueueProvider(services, "optimize", debounce_seconds={MessageType.OPTIMIZE: 30})
+    services.redis_service.pop_fair_share_members.return_value = []
+    assert provider.dequeue_batch(5, block=False) == []
+    assert services.redis_service.pop_fair_share_members.call_args.kwargs["max_score"] is not None
+    services.redis_service.blocking_list_pop.assert_not_called()
+
+  def test_dequeue_debounced_enqueue_time(self, services):
+    provider = RedisFairShareQueueProvider(services, "optimize", debounce_seconds={MessageType.OPTIMIZE: 30})
+    services.redis_service.pop_fair_share_members.return_value = [
+      (f"{MessageType.NEXT_POINTS}:5".encode(), 100.0),
+      (f"{MessageType.OPTIMIZE}:6".encode(), 130.0),
+    ]
+    with mock.patch.object(provider, "_retrieve_message_contents", return_value=mock.Mock(spec=QueueMessage)):
+      messages = provider.dequeue_batch(5, block=False)
+    assert [(m.group_key, m.enqueue_time) for m in messages] == [("5", 100), ("6", 100)]
+
+  def test_dequeue_batch_without_blocking(self, provider, services):
+    services.redis_service.pop_fair_share_members.return_value = []
+    assert provider.dequeue_batch(5, block=False) == []
+    services.redis_service.blocking_list_pop.assert_not_called()
+
+  @pytest.mark.parametrize("unsupported_key", ["lease_seconds", "max_attempts"])
+  def test_make_providers_rejects_leases(self, services, unsupported_key):
+    queue_info = {"name": "optimize", "provider": QueueProviderType.REDIS_FAIR_SHARE}
+    services.config_broker = ConfigBroker({"queues": [queue_info]})
+    (provider,) = make_providers(services)
+    assert isinstance(provider, RedisFairShareQueueProvider)
+    services.config_broker = ConfigBroker({"queues": [{**queue_info, unsupported_key: 3}]})
+    with pytest.raises(AssertionError):
+      make_providers(services)
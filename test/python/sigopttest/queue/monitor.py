@@ -0,0 +1,66 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import mock
+import pytest
+from sigopt_config.broker import ConfigBroker
+
+from zigopt.exception.logger import ExceptionLogger
+from zigopt.queue.monitor import LAST_DEQUEUE, LAST_EMPTY, LAST_ENQUEUE, QueueMonitor, parse_queue_status
+
+
+NOW = 10000.5
+
+
+@pytest.fixture(name="services")
+def fixture_services():
+  services = mock.Mock()
+  services.config_broker = ConfigBroker(
+    {"features": {"raiseSoftExceptions": True}, "qworker": {"maxEnqueueDelta": 100}},
+  )
+  services.exception_logger = ExceptionLogger(services)
+  services.queue_service.get_queue_name_from_message_type.return_value = "optimize"
+  services.queue_message_grouper.group_key_for_queue_message.return_value = "1"
+  return services
+
+
+@pytest.fixture(name="queue_monitor")
+def fixture_queue_monitor(services):
+  queue_monitor = QueueMonitor(services)
+  with mock.patch.object(queue_monitor, "before_enqueue"):
+    yield queue_monitor
+
+
+def test_parse_queue_status():
+  assert parse_queue_status({b"last_enqueue": b"1.5", "last_empty": None}) == {LAST_ENQUEUE: 1.5}
+
+
+@mock.patch("zigopt.queue.monitor.unix_timestamp_with_microseconds", return_value=NOW)
+def test_monitored_enqueue(_, services, queue_monitor):
+  services.queue_service.supports_monitored_enqueue.return_value = True
+  services.queue_service.enqueue_batch.return_value = {"optimize": {LAST_ENQUEUE: NOW, LAST_DEQUEUE: NOW - 1000}}
+  with mock.patch.object(services.exception_logger, "log_exception") as log_exception:
+    queue_monitor.robust_enqueue([mock.Mock()], None)
+  queue_monitor.before_enqueue.assert_not_called()
+  assert services.queue_service.enqueue_batch.call_args.kwargs["monitor_time"] == NOW
+  log_exception.assert_called_once()
+  services.redis_service.get_all_hash_fields.assert_not_called()
+
+
+@mock.patch("zigopt.queue.monitor.unix_timestamp_with_microseconds", return_value=NOW)
+def test_monitored_enqueue_to_empty_queue(_, services, queue_monitor):
+  services.queue_service.supports_monitored_enqueue.return_value = True
+  services.queue_service.enqueue_batch.return_value = {
+    "optimize": {LAST_ENQUEUE: NOW, LAST_EMPTY: NOW, LAST_DEQUEUE: NOW - 1000},
+  }
+  with mock.patch.object(services.exception_logger, "log_exception") as log_exception:
+    queue_monitor.robust_enqueue([mock.Mock()], None)
+  log_exception.assert_not_called()
+
+
+@mock.patch("zigopt.queue.monitor.unix_timestamp_with_microseconds", return_value=NOW)
+def test_unmonitored_enqueue(_, services, queue_monitor):
+  services.queue_service.supports_monitored_enqueue.return_value = False
+  services.queue_service.enqueue_batch.return_value = {}
+  queue_monitor.robust_enqueue([mock.Mock()], None)
+  queue_monitor.before_enqueue.assert_called_once_with("optimize", NOW)
@@ -0,0 +1,198 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import threading
+import time
+
+import mock
+import pytest
+from sigopt_config.broker import ConfigBroker
+
+from zigopt.exception.logger import ExceptionLogger
+from zigopt.profile.tracer import NullTracer
+from zigopt.queue.exceptions import WorkerFinishedException
+from zigopt.queue.message_groups import MessageGroup
+from zigopt.queue.workers import QueueWorkers
+
+
+class TestConcurrentConsumption:
+  @pytest.fixture
+  def services(self):
+    services = mock.Mock()
+    services.config_broker = ConfigBroker({"features": {"raiseSoftExceptions": True}})
+    services.exception_logger = ExceptionLogger(services)
+    services.message_router.get_queue_name_from_message_group.return_value = "optimize"
+    services.queue_service.get_lease_seconds.return_value = None
+    return services
+
+  @pytest.fixture
+  def queue_workers(self, services):
+    queue_workers = QueueWorkers(MessageGroup.OPTIMIZATION, services, mock.Mock(), mock.Mock())
+    queue_workers.tracer = NullTracer()
+    return queue_workers
+
+  def make_messages(self, group_keys):
+    messages = []
+    for group_key in group_keys:
+      message = mock.Mock()
+      message.group_key = group_key
+      messages.append(message)
+    return messages
+
+  def run_loop(self, queue_workers, services, batches, max_messages, batch_size, concurrency, process_seconds=0.05):
+    lock = threading.Lock()
+    running_group_keys = []
+    processed = []
+    overlaps = []
+
+    def dequeue_batch(queue_name, num_messages, block=True):
+      assert queue_name == "optimize"
+      assert num_messages <= batch_size
+      del block
+      return batches.pop(0) if batches else []
+
+    def process(queue_name, message, process_message):
+      del queue_name, process_message
+      with lock:
+        if message.group_key in running_group_keys:
+          overlaps.append(message.group_key)
+        running_group_keys.append(message.group_key)
+      time.sleep(process_seconds)
+      with lock:
+        running_group_keys.remove(message.group_key)
+        processed.append(message)
+      return True
+
+    services.queue_service.dequeue_batch.side_effect = dequeue_batch
+    queue_workers._process_received_message = process
+    with pytest.raises(WorkerFinishedException):
+      queue_workers._concurrent_consumption_loop(
+        queue_name="optimize",
+        process_message=mock.Mock(),
+        max_messages=max_messages,
+        batch_size=batch_size,
+        concurrency=concurrency,
+      )
+    return processed, overlaps
+
+  def test_processes_every_message(self, queue_workers, services):
+    messages = self.make_messages(["1", "2", "3", "4", "5"])
+    processed, overlaps = self.run_loop(
+      queue_workers,
+      services,
+      [messages[:3], messages[3:]],
+      max_messages=5,
+      batch_size=3,
+      concurrency=4,
+    )
+    assert sorted(m.group_key for m in processed) == ["1", "2", "3", "4", "5"]
+    assert not overlaps
+    assert queue_workers.message_count == 5
+
+  def test_serializes_messages_in_the_same_group(self, queue_workers, services):
+    messages = self.make_messages(["1", "1", "2", "1"])
+    processed, overlaps = self.run_loop(
+      queue_workers,
+      services,
+      [messages],
+      max_messages=4,
+      batch_size=4,
+      concurrency=4,
+    )
+    assert len(processed) == 4
+    assert not overlaps
+    assert [m for m in processed if m.group_key == "1"] == [messages[0], messages[1], messages[3]]
+
+  def test_fatal_exception_stops_consumption(self, queue_workers, services):
+    services.queue_service.dequeue_batch.return_value = self.make_messages(["1", "1"])
+
+    def process(queue_name, message, process_message):
+      del queue_name, message, process_message
+      raise ValueError()
+
+    queue_workers._process_received_message = process
+    with mock.patch.object(services.exception_logger, "log_exception"), pytest.raises(ValueError):
+      queue_workers._concurrent_consumption_loop(
+        queue_name="optimize",
+        process_message=mock.Mock(),
+        max_messages=None,
+        batch_size=2,
+        concurrency=2,
+      )
+    services.queue_service.dequeue_batch.assert_called_once()
+    services.queue_service.release.assert_called_once()
+    services.queue_service.reject.assert_not_called()
+
+  def test_extends_leases_of_pending_messages(self, queue_workers, services):
+    services.queue_service.get_lease_seconds.return_value = 0.06
+    services.queue_service.extend_lease.return_value = True
+    messages = self.make_messages(["1", "1"])
+    processed, overlaps = self.run_loop(
+      queue_workers,
+      services,
+      [messages],
+      max_messages=2,
+      batch_size=2,
+      concurrency=2,
+      process_seconds=0.2,
+    )
+    assert processed == messages
+    assert not overlaps
+    extended = [c.args[0] for c in services.queue_service.extend_lease.call_args_list]
+    assert len(extended) >= 2
+    assert set(extended) == {messages[1]}
+
+  def test_skips_pending_messages_with_lost_leases(self, queue_workers, services):
+    services.queue_service.get_lease_seconds.return_value = 0.06
+    services.queue_service.extend_lease.return_value = False
+    messages = self.make_messages(["1", "1"])
+    processed, _ = self.run_loop(
+      queue_workers,
+      services,
+      [messages],
+      max_messages=2,
+      batch_size=2,
+      concurrency=2,
+      process_seconds=0.2,
+    )
+    assert processed == messages[:1]
+    services.queue_service.extend_lease.assert_called_once_with(messages[1], "optimize")
+
+
+class TestKeepLease:
+  @pytest.fixture
+  def services(self):
+    services = mock.Mock()
+    services.config_broker = ConfigBroker({"features": {"raiseSoftExceptions": True}})
+    services.exception_logger = ExceptionLogger(services)
+    services.message_router.get_queue_name_from_message_group.return_value = "optimize"
+    return services
+
+  @pytest.fixture
+  def queue_workers(self, services):
+    return QueueWorkers(MessageGroup.OPTIMIZATION, services, mock.Mock(), mock.Mock())
+
+  def test_extends_lease_while_processing(self, queue_workers, services):
+    services.queue_service.get_lease_seconds.return_value = 0.06
+    services.queue_service.extend_lease.return_value = True
+    message = mock.Mock()
+    with queue_workers._keep_lease("optimize", message):
+      time.sleep(0.2)
+    num_extensions = services.queue_service.extend_lease.call_count
+    assert num_extensions >= 2
+    services.queue_service.extend_lease.assert_called_with(message, "optimize")
+    time.sleep(0.1)
+    assert services.queue_service.extend_lease.call_count == num_extensions
+
+  def test_stops_extending_lost_lease(self, queue_workers, services):
+    services.queue_service.get_lease_seconds.return_value = 0.03
+    services.queue_service.extend_lease.return_value = False
+    with queue_workers._keep_lease("optimize", mock.Mock()):
+      time.sleep(0.1)
+    services.queue_service.extend_lease.assert_called_once()
+
+  def test_without_lease(self, queue_workers, services):
+    services.queue_service.get_lease_seconds.return_value = None
+    with queue_workers._keep_lease("optimize", mock.Mock()):
+      pass
+    services.queue_service.extend_lease.assert_not_called()
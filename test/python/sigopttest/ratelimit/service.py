@@ -0,0 +1,92 @@
+# Copyright © 2023 Intel Corporation
+#
+# SPDX-License-Identifier: Apache License 2.0
+import mock
+import pytest
+from sigopt_config.broker import ConfigBroker
+
+from zigopt.ratelimit.service import (
+  API_TOKEN_MUTATING_RATE_LIMIT,
+  GCRA_ALGORITHM,
+  LOGIN_RATE_LIMIT,
+  LocalReservations,
+  RateLimiter,
+)
+from zigopt.redis.service import RedisKeyService
+
+
+class TestLocalReservations:
+  def test_take(self):
+    reservations = LocalReservations()
+    assert not reservations.take("key")
+    reservations.add("key", 2, seconds=10)
+    assert reservations.take("key")
+    assert reservations.take("key")
+    assert not reservations.take("key")
+
+  def test_expired(self):
+    reservations = LocalReservations()
+    reservations.add("key", 2, seconds=0)
+    assert not reservations.take("key")
+
+  def test_clear(self):
+    reservations = LocalReservations()
+    reservations.add("key", 2, seconds=10)
+    reservations.clear("key")
+    assert not reservations.take("key")
+
+
+class TestRateLimiter:
+  @pytest.fixture
+  def services(self):
+    services = mock.Mock()
+    services.config_broker = ConfigBroker(
+      {
+        "ratelimit": {
+          "local_reservation": 5,
+          "login": {"algorithm": GCRA_ALGORITHM},
+        },
+      }
+    )
+    services.redis_key_service = RedisKeyService(services)
+    return services
+
+  @pytest.fixture
+  def rate_limiter(self, services):
+    return RateLimiter(services)
+
+  def test_reserved_attempts_skip_redis(self, rate_limiter, services):
+    services.redis_service.fixed_window_rate_limit.return_value = (True, 2, 1)
+    assert rate_limiter.still_within_rate_limit(API_TOKEN_MUTATING_RATE_LIMIT, "token")
+    assert services.redis_service.fixed_window_rate_limit.call_args.kwargs["reserve"] == 5
+    assert rate_limiter.still_within_rate_limit(API_TOKEN_MUTATING_RATE_LIMIT, "token")
+    assert rate_limiter.still_within_rate_limit(API_TOKEN_MUTATING_RATE_LIMIT, "token")
+    assert services.redis_service.fixed_window_rate_limit.call_count == 1
+
+    services.redis_service.fixed_window_rate_limit.return_value = (False, 0, 1)
+    assert not rate_limiter.still_within_rate_limit(API_TOKEN_MUTATING_RATE_LIMIT, "token")
+    assert services.redis_service.fixed_window_rate_limit.call_count == 2
+
+  def test_check_without_increment(self, rate_limiter, services):
+    services.redis_service.fixed_window_rate_limit.return_value = (True, 0, 1)
+    assert rate_limiter.still_within_rate_limit(API_TOKEN_MUTATING_RATE_LIMIT, "token", increment=False)
+    assert services.redis_service.fixed_window_rate_limit.call_args.kwargs["reserve"] == 0
+
+  def test_algorithm(self, rate_limiter, services):
+    services.redis_service.gcra_rate_limit.return_value = False
+    assert rate_limiter.algorithm(LOGIN_RATE_LIMIT) == GCRA_ALGORITHM
+    assert not rate_limiter.still_within_rate_limit(LOGIN_RATE_LIMIT, "user@example.com")
+    services.redis_service.fixed_window_rate_limit.assert_not_called()
+    rate_limiter.clear_rate_limit(LOGIN_RATE_LIMIT, "user@example.com")
+    services.redis_service.get_time.assert_not_called()
+    services.redis_service.delete.assert_called_once()
+
+  def test_clear_fixed_window(self, rate_limiter, services):
+    services.redis_service.fixed_window_rate_limit.return_value = (True, 2, 1)
+    services.redis_service.get_time.return_value = 1005
+    rate_limiter.still_within_rate_limit(API_TOKEN_MUTATING_RATE_LIMIT, "token")
+    rate_limiter.clear_rate_limit(API_TOKEN_MUTATING_RATE_LIMIT, "token")
+    (window_key,) = services.redis_service.delete.call_args.args
+    assert services.redis_key_service.get_key_value(window_key) == "rate-limit:token-mutating:fixed_window:token:1005"
+    rate_limiter.still_within_rate_limit(API_TOKEN_MUTATING_RATE_LIMIT, "token")
+    assert services.redis_service.fixed_window_rate_limit.call_count == 2